@@ -6,6 +6,7 @@ import sys
 
 if __name__ == "__main__":
     subcommands = {
+        "batch",
         "generate",
         "convert",
         "chat",
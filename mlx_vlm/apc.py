@@ -51,13 +51,17 @@ import time
 from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
 
 import mlx.core as mx
 import numpy as np
 
 logger = logging.getLogger("mlx_vlm.apc")
 
+# An APC salt is either one value for every block or one value per block
+# (see ``image_block_salts``).
+ExtraHash = Union[int, Sequence[int]]
+
 DEFAULT_BLOCK_SIZE = 16
 DEFAULT_NUM_BLOCKS = 2048
 SEED_PARENT_HASH = 0
@@ -97,11 +101,188 @@ def tenant_scoped_hash(tenant: Optional[str], payload_hash: int = 0) -> int:
     return int.from_bytes(h.digest()[:8], "little", signed=True)
 
 
+def _block_extra(extra_hash: ExtraHash, block_idx: int) -> int:
+    """Salt for block ``block_idx`` under a scalar or per-block ``extra_hash``."""
+    if isinstance(extra_hash, (int, np.integer)):
+        return int(extra_hash)
+    if not extra_hash:
+        return 0
+    return int(extra_hash[min(block_idx, len(extra_hash) - 1)])
+
+
+def _prefix_extra(extra_hash: ExtraHash, num_tokens: int, block_size: int) -> int:
+    """Salt for a whole ``num_tokens`` prefix (the salt of its last block)."""
+    return _block_extra(extra_hash, max(0, int(num_tokens) - 1) // block_size)
+
+
+def image_block_salts(
+    token_ids: Sequence[int],
+    block_size: int,
+    image_token_ids: Iterable[int],
+    image_hashes: Sequence[int],
+    salt: int = 0,
+) -> Optional[List[int]]:
+    """Per-block APC salts that only cover the images a block can attend to.
+
+    Each image in ``token_ids`` is a contiguous run of image placeholder
+    tokens. Block ``i`` is salted with ``salt`` chained with the content
+    hashes of every image whose run starts before the block ends, so a text
+    prefix ahead of the first image is shared across requests with different
+    images, while blocks at or after an image only match the same pixels.
+
+    Returns ``None`` when the placeholder runs don't line up one-to-one with
+    ``image_hashes`` (e.g. adjacent images with no separator); callers should
+    then salt every block with the whole-request image hash instead.
+    """
+    placeholders = {int(t) for t in image_token_ids if t is not None}
+    run_starts: List[int] = []
+    prev_image = False
+    for pos, tok in enumerate(token_ids):
+        is_image = int(tok) in placeholders
+        if is_image and not prev_image:
+            run_starts.append(pos)
+        prev_image = is_image
+    if len(run_starts) != len(image_hashes):
+        return None
+
+    chained = [int(salt)]
+    for image_hash in image_hashes:
+        chained.append(_stable_int_hash(chained[-1], int(image_hash)))
+
+    salts: List[int] = []
+    seen = 0
+    num_blocks = -(-len(token_ids) // block_size)
+    for i in range(num_blocks):
+        end = min((i + 1) * block_size, len(token_ids))
+        while seen < len(run_starts) and run_starts[seen] < end:
+            seen += 1
+        salts.append(chained[seen])
+    return salts
+
+
 def _copy_mlx_array(x: mx.array) -> mx.array:
     """Materialize ``x`` into a fresh MLX-owned contiguous buffer."""
     return mx.contiguous(mx.array(x, dtype=x.dtype))
 
 
+# K/V slabs are either a float array, a uniform ``mx.quantize`` tuple
+# ``(packed, scales, biases)`` or a TurboQuant state NamedTuple. Every array
+# leaf is laid out ``(B, H, T, ...)``, so the token axis is always 2.
+
+
+def _kv_map(x: Any, fn) -> Any:
+    """Apply ``fn`` to every array leaf of a K/V slab, keeping its structure."""
+    if x is None:
+        return None
+    if isinstance(x, mx.array):
+        return fn(x)
+    parts = [_kv_map(part, fn) for part in x]
+    return type(x)(*parts) if hasattr(x, "_fields") else type(x)(parts)
+
+
+def _kv_leaves(x: Any) -> List[mx.array]:
+    out: List[mx.array] = []
+    _collect_mx_arrays(x, out)
+    return out
+
+
+def _kv_concat(slabs: Sequence[Any], axis: int) -> Any:
+    """Concatenate same-structured K/V slabs leaf by leaf along ``axis``."""
+    first = slabs[0]
+    if isinstance(first, mx.array):
+        return mx.concatenate(list(slabs), axis=axis)
+    parts = [_kv_concat([s[i] for s in slabs], axis) for i in range(len(first))]
+    return type(first)(*parts) if hasattr(first, "_fields") else type(first)(parts)
+
+
+def _kv_tokens(x: Any, start: int, end: Optional[int] = None) -> Any:
+    return _kv_map(x, lambda a: a[:, :, start:end])
+
+
+def _kv_length(x: Any) -> int:
+    leaves = _kv_leaves(x)
+    return int(leaves[0].shape[2]) if leaves else 0
+
+
+def _kv_zeros(like: Any, tokens: int) -> Any:
+    """A single-row slab of ``tokens`` zero tokens shaped like ``like``."""
+    return _kv_map(
+        like,
+        lambda a: mx.zeros((1, a.shape[1], tokens, *a.shape[3:]), dtype=a.dtype),
+    )
+
+
+def _kv_is_compressed(x: Any) -> bool:
+    return x is not None and not isinstance(x, mx.array)
+
+
+def _kv_structure(x: Any) -> Any:
+    """JSON-able description of a slab's nesting, for disk round-trips."""
+    if isinstance(x, mx.array):
+        return None
+    return {
+        "type": type(x).__name__ if hasattr(x, "_fields") else "tuple",
+        "parts": [_kv_structure(part) for part in x],
+    }
+
+
+def _kv_rebuild(structure: Any, leaves: Iterable[mx.array]) -> Any:
+    """Inverse of ``_kv_structure`` over leaves in ``_kv_leaves`` order."""
+    from . import turboquant
+
+    leaves = iter(leaves)
+
+    def build(node):
+        if node is None:
+            return next(leaves)
+        parts = [build(part) for part in node["parts"]]
+        if node["type"] == "tuple":
+            return tuple(parts)
+        cls = getattr(turboquant, node["type"], None)
+        if cls is None or not hasattr(cls, "_fields"):
+            raise ValueError(f"unknown K/V state type {node['type']!r}")
+        return cls(*parts)
+
+    return build(structure)
+
+
+def kv_cache_format(c: Any) -> Optional[Tuple[Any, ...]]:
+    """Storage format of a (batch) KV cache: ``None`` for float K/V,
+    ``("uniform", group_size, bits)`` or ``("turboquant", bits, seed)``."""
+    from mlx_lm.models import cache as lm_cache
+
+    from .models.cache import BatchQuantizedKVCache
+    from .turboquant import BatchTurboQuantKVCache, TurboQuantKVCache
+
+    if isinstance(c, (BatchTurboQuantKVCache, TurboQuantKVCache)):
+        return ("turboquant", float(c.bits), int(c.seed))
+    if isinstance(c, (BatchQuantizedKVCache, lm_cache.QuantizedKVCache)):
+        return ("uniform", int(c.group_size), int(c.bits))
+    return None
+
+
+def _make_single_row_kv_cache(
+    fmt: Optional[Tuple[Any, ...]], keys: Any, values: Any, length: int
+) -> Any:
+    """Wrap ``length`` tokens of K/V in the single-row cache for ``fmt``."""
+    from mlx_lm.models import cache as lm_cache
+
+    if fmt is None:
+        c = lm_cache.KVCache()
+    elif fmt[0] == "uniform":
+        c = lm_cache.QuantizedKVCache(group_size=int(fmt[1]), bits=int(fmt[2]))
+    else:
+        from .turboquant import TurboQuantKVCache
+
+        c = TurboQuantKVCache(bits=float(fmt[1]), seed=int(fmt[2]))
+        c.state = (keys, values)
+        return c
+    c.keys = keys
+    c.values = values
+    c.offset = int(length)
+    return c
+
+
 def _pad_kv_for_capacity(
     keys: mx.array,
     values: mx.array,
@@ -221,6 +402,14 @@ def _clone_cache_entry_for_apc(
             return None
         return tuple(copied)
 
+    fmt = kv_cache_format(c)
+    if fmt is not None and not hasattr(c, "left_padding"):
+        if c.empty():
+            return _make_single_row_kv_cache(fmt, None, None, 0)
+        keys, values = (_kv_map(x, _copy_mlx_array) for x in c.state)
+        eval_targets.extend(_kv_leaves((keys, values)))
+        return _make_single_row_kv_cache(fmt, keys, values, _kv_length(keys))
+
     return None
 
 
@@ -337,10 +526,33 @@ def hash_image_payload(
         return int.from_bytes(
             hashlib.sha256(image_ref).digest()[:8], "little", signed=True
         )
+    if hasattr(image_ref, "tobytes") and hasattr(image_ref, "mode"):
+        # In-memory PIL image: its repr holds an object address, which can be
+        # reused by a different image once this one is freed.
+        h = hashlib.sha256(f"{image_ref.mode}:{image_ref.size}".encode("utf-8"))
+        h.update(image_ref.tobytes())
+        return int.from_bytes(h.digest()[:8], "little", signed=True)
     digest = hashlib.sha256(repr(image_ref).encode("utf-8")).digest()
     return int.from_bytes(digest[:8], "little", signed=True)
 
 
+def image_prompt_kwargs(images, pixel_values=None) -> dict:
+    """APC image identity for a request: a whole-request hash plus one hash
+    per image so text ahead of an image can be shared across requests."""
+    if images is not None:
+        kwargs = {"_apc_image_hash": hash_image_payload(image_ref=images)}
+        if isinstance(images, (list, tuple)):
+            kwargs["_apc_image_hashes"] = [
+                hash_image_payload(image_ref=image) for image in images
+            ]
+        else:
+            kwargs["_apc_image_hashes"] = [kwargs["_apc_image_hash"]]
+        return kwargs
+    if pixel_values is not None:
+        return {"_apc_image_hash": hash_image_payload(pixel_values=pixel_values)}
+    return {}
+
+
 @dataclass
 class APCBlock:
     """One fixed-size KV block. Holds per-layer K/V slabs once committed."""
@@ -505,6 +717,12 @@ def _safetensors_dtype_info(dtype: str):
     mapping = {
         "F16": (np.dtype("<f2"), mx.float16, None),
         "F32": (np.dtype("<f4"), mx.float32, None),
+        # Packed indices / signs of quantized K/V.
+        "U8": (np.dtype("u1"), mx.uint8, None),
+        "U16": (np.dtype("<u2"), mx.uint16, None),
+        "U32": (np.dtype("<u4"), mx.uint32, None),
+        "I8": (np.dtype("i1"), mx.int8, None),
+        "I32": (np.dtype("<i4"), mx.int32, None),
     }
     return mapping.get(dtype)
 
@@ -1100,9 +1318,10 @@ class DiskBlockStore:
         self,
         token_ids: Sequence[int],
         *,
-        extra_hash: int = 0,
+        extra_hash: ExtraHash = 0,
         max_prefix_tokens: Optional[int] = None,
         min_prefix_tokens: int = 0,
+        block_size: int = DEFAULT_BLOCK_SIZE,
     ) -> Optional[Tuple[int, int]]:
         token_tuple = tuple(int(t) for t in token_ids)
         max_len = len(token_tuple) - 1
@@ -1131,7 +1350,7 @@ class DiskBlockStore:
                 continue
             prefix_len = len(stored_tokens)
             if (
-                stored_extra != extra_hash
+                stored_extra != _prefix_extra(extra_hash, prefix_len, block_size)
                 or prefix_len <= min_prefix_tokens
                 or prefix_len > max_len
                 or token_tuple[:prefix_len] != stored_tokens
@@ -1343,6 +1562,37 @@ class DiskBlockStore:
                 eval_targets.append(c.lengths)
             return c
 
+        if kind == "compressed_kv":
+            try:
+                fmt = tuple(json.loads(metadata[f"{prefix}_format"]))
+            except (KeyError, TypeError, ValueError):
+                return None
+            if metadata.get(f"{prefix}_empty", "0") == "1":
+                return _make_single_row_kv_cache(fmt, None, None, 0)
+            slabs = []
+            for name in ("k", "v"):
+                try:
+                    structure = json.loads(metadata[f"{prefix}_{name}_structure"])
+                except (KeyError, TypeError, ValueError):
+                    return None
+                leaves = []
+                while f"{prefix}_{name}{len(leaves)}" in tensor_entries:
+                    leaf = _read_safetensors_tensor(
+                        path,
+                        data_start,
+                        tensor_entries[f"{prefix}_{name}{len(leaves)}"],
+                    )
+                    if leaf is None:
+                        return None
+                    leaves.append(leaf)
+                try:
+                    slabs.append(_kv_rebuild(structure, leaves))
+                except (StopIteration, ValueError):
+                    return None
+                eval_targets.extend(leaves)
+            keys, values = slabs
+            return _make_single_row_kv_cache(fmt, keys, values, _kv_length(keys))
+
         if kind in ("cache_list", "tuple"):
             try:
                 size = int(metadata.get(f"{prefix}_size", "0"))
@@ -2455,6 +2705,22 @@ class DiskBlockStore:
                 for j, sub_c in enumerate(c)
             )
 
+        fmt = kv_cache_format(c)
+        if fmt is not None and not hasattr(c, "left_padding"):
+            # Compressed K/V is written as-is: packed indices, norms and
+            # scales, never dequantized.
+            metadata[f"{prefix}_kind"] = "compressed_kv"
+            metadata[f"{prefix}_format"] = json.dumps(list(fmt))
+            if c.empty():
+                metadata[f"{prefix}_empty"] = "1"
+                return True
+            keys, values = c.state
+            for name, slab in (("k", keys), ("v", values)):
+                metadata[f"{prefix}_{name}_structure"] = json.dumps(_kv_structure(slab))
+                for j, leaf in enumerate(_kv_leaves(slab)):
+                    arrays[f"{prefix}_{name}{j}"] = leaf
+            return True
+
         return False
 
     def _write_exact_cache_snapshot(
@@ -2790,7 +3056,7 @@ class APCManager:
     def lookup_exact_cache(
         self,
         token_ids: Sequence[int],
-        extra_hash: int = 0,
+        extra_hash: ExtraHash = 0,
         max_prefix_tokens: Optional[int] = None,
         min_prefix_tokens: int = 0,
     ) -> Tuple[Optional[List[Any]], int]:
@@ -2819,7 +3085,8 @@ class APCManager:
                 for key, entry in self._exact_cache.items():
                     candidate_len = len(entry.token_ids)
                     if (
-                        entry.extra_hash != extra_hash
+                        entry.extra_hash
+                        != _prefix_extra(extra_hash, candidate_len, self.block_size)
                         or candidate_len <= min_prefix_tokens
                         or candidate_len > max_len
                     ):
@@ -2853,6 +3120,7 @@ class APCManager:
                 extra_hash=extra_hash,
                 max_prefix_tokens=max_prefix_tokens,
                 min_prefix_tokens=max(min_prefix_tokens, prefix_len),
+                block_size=self.block_size,
             )
             if disk_match is not None:
                 cache_hash, disk_prefix_len = disk_match
@@ -2863,7 +3131,8 @@ class APCManager:
                 if loaded is not None:
                     stored_tokens, stored_extra_hash, prompt_cache = loaded
                     if (
-                        stored_extra_hash == extra_hash
+                        stored_extra_hash
+                        == _prefix_extra(extra_hash, disk_prefix_len, self.block_size)
                         and len(stored_tokens) == disk_prefix_len
                         and token_tuple[:disk_prefix_len] == stored_tokens
                     ):
@@ -2897,12 +3166,13 @@ class APCManager:
         token_ids: Sequence[int],
         prompt_cache: Sequence[Any],
         *,
-        extra_hash: int = 0,
+        extra_hash: ExtraHash = 0,
     ) -> bool:
         """Store a full prompt-cache snapshot for exact-prefix reuse."""
         if (self._exact_cache_max <= 0 and self.disk is None) or not token_ids:
             return False
         token_tuple = tuple(int(t) for t in token_ids)
+        extra_hash = _prefix_extra(extra_hash, len(token_tuple), self.block_size)
         copied = _clone_prompt_cache_for_apc(prompt_cache)
         if copied is None:
             return False
@@ -2937,7 +3207,7 @@ class APCManager:
     def lookup_prefix_disk_cache(
         self,
         token_ids: Sequence[int],
-        extra_hash: int = 0,
+        extra_hash: ExtraHash = 0,
         max_prefix_tokens: Optional[int] = None,
         min_prefix_tokens: int = 0,
         allow_memory_overlap: bool = False,
@@ -2974,7 +3244,7 @@ class APCManager:
                     int(t)
                     for t in token_ids[i * self.block_size : (i + 1) * self.block_size]
                 )
-                h = _hash_tokens(parent, chunk, extra_hash)
+                h = _hash_tokens(parent, chunk, _block_extra(extra_hash, i))
                 # If the prefix is already in memory, the normal memory path is
                 # better and preserves the expected ref-count lifecycle.
                 b_mem = self.hash_table.get(h)
@@ -3002,7 +3272,7 @@ class APCManager:
         keys, values, metadatas = loaded
         if len(metadatas) != len(chunks):
             return None, 0
-        for chunk, metadata in zip(chunks, metadatas):
+        for i, (chunk, metadata) in enumerate(zip(chunks, metadatas)):
             try:
                 stored_tokens = tuple(
                     int(x) for x in metadata.get("token_ids", "").split(",") if x
@@ -3010,7 +3280,7 @@ class APCManager:
                 stored_extra = int(metadata.get("extra_hash", "0"))
             except (TypeError, ValueError):
                 return None, 0
-            if stored_tokens != chunk or stored_extra != extra_hash:
+            if stored_tokens != chunk or stored_extra != _block_extra(extra_hash, i):
                 return None, 0
 
         warm_cache = make_warm_kv_cache_from_layers(keys, values, matched_tokens)
@@ -3025,7 +3295,7 @@ class APCManager:
         return warm_cache, matched_tokens
 
     def lookup_prefix(
-        self, token_ids: Sequence[int], extra_hash: int = 0
+        self, token_ids: Sequence[int], extra_hash: ExtraHash = 0
     ) -> Tuple[List[APCBlock], int]:
         """Walk the hash chain over ``token_ids``; return acquired matched
         blocks and matched_token_count. Caller must release the blocks.
@@ -3042,7 +3312,7 @@ class APCManager:
                     int(t)
                     for t in token_ids[i * self.block_size : (i + 1) * self.block_size]
                 )
-                h = _hash_tokens(parent, chunk, extra_hash)
+                h = _hash_tokens(parent, chunk, _block_extra(extra_hash, i))
                 b_mem = self.hash_table.get(h)
                 if b_mem is None or b_mem.token_ids != chunk:
                     break
@@ -3060,15 +3330,21 @@ class APCManager:
     def store_kv_blocks(
         self,
         token_ids: Sequence[int],
-        layer_keys: List[mx.array],
-        layer_values: List[mx.array],
+        layer_keys: List[Any],
+        layer_values: List[Any],
         *,
-        extra_hash: int = 0,
+        extra_hash: ExtraHash = 0,
         skip_first_n_tokens: int = 0,
+        kv_formats: Optional[Sequence[Optional[Tuple[Any, ...]]]] = None,
     ) -> List[APCBlock]:
         """Slice ``layer_keys`` / ``layer_values`` into block_size chunks and
         store any new full blocks beyond ``skip_first_n_tokens``.
 
+        Layers may hold quantized K/V (``mx.quantize`` tuples or TurboQuant
+        states); blocks then keep that compressed form. The disk tier stores
+        compressed prefixes as one exact snapshot, which needs ``kv_formats``
+        (see ``kv_cache_format``) to rebuild the per-layer caches.
+
         Returns newly acquired blocks (caller must release).
         """
         with self.lock:
@@ -3084,11 +3360,15 @@ class APCManager:
             )
             new_blocks: List[APCBlock] = []
             disk_blocks: List[_DiskLayerMajorBlock] = []
-            per_block_tensors = len(layer_keys) + len(layer_values)
+            compressed = any(_kv_is_compressed(k) for k in layer_keys)
+            per_block_tensors = len(_kv_leaves(layer_keys)) + len(
+                _kv_leaves(layer_values)
+            )
             token_tuple = tuple(int(t) for t in token_ids[:layer_major_prefix_tokens])
             layer_major_stored = False
             if (
-                self._layer_major_memory_min_tokens > 0
+                not compressed
+                and self._layer_major_memory_min_tokens > 0
                 and self._exact_cache_max > 0
                 and layer_major_prefix_tokens >= self._layer_major_memory_min_tokens
             ):
@@ -3098,10 +3378,13 @@ class APCManager:
                     layer_major_prefix_tokens,
                 )
                 if copied is not None:
-                    key = _sequence_hash(token_tuple, extra_hash, self.block_size)
+                    prefix_extra = _prefix_extra(
+                        extra_hash, layer_major_prefix_tokens, self.block_size
+                    )
+                    key = _sequence_hash(token_tuple, prefix_extra, self.block_size)
                     self._exact_cache[key] = APCExactCacheEntry(
                         token_ids=token_tuple,
-                        extra_hash=int(extra_hash),
+                        extra_hash=prefix_extra,
                         prompt_cache=copied,
                         last_used=time.time(),
                     )
@@ -3117,20 +3400,21 @@ class APCManager:
                     int(t)
                     for t in token_ids[i * self.block_size : (i + 1) * self.block_size]
                 )
-                parent = _hash_tokens(parent, chunk, extra_hash)
+                parent = _hash_tokens(parent, chunk, _block_extra(extra_hash, i))
 
             for i in range(skip_full, n_full):
                 chunk = tuple(
                     int(t)
                     for t in token_ids[i * self.block_size : (i + 1) * self.block_size]
                 )
-                h = _hash_tokens(parent, chunk, extra_hash)
-                if self.disk is not None and not self.disk.has(h):
+                block_extra = _block_extra(extra_hash, i)
+                h = _hash_tokens(parent, chunk, block_extra)
+                if self.disk is not None and not compressed and not self.disk.has(h):
                     disk_blocks.append(
                         _DiskLayerMajorBlock(
                             block_hash=int(h),
                             parent_hash=int(parent),
-                            extra_hash=int(extra_hash),
+                            extra_hash=block_extra,
                             token_ids=chunk,
                             source_block_idx=i,
                         )
@@ -3177,13 +3461,19 @@ class APCManager:
                 # is decoupled from the caller's cache, which mlx.clear_cache
                 # may release after generation. mx.contiguous alone can return
                 # a view when the source is already row-contiguous.
-                k_slabs = [_copy_mlx_array(k[..., start:end, :]) for k in layer_keys]
-                v_slabs = [_copy_mlx_array(v[..., start:end, :]) for v in layer_values]
-                mx.eval(k_slabs + v_slabs)
+                k_slabs = [
+                    _kv_map(_kv_tokens(k, start, end), _copy_mlx_array)
+                    for k in layer_keys
+                ]
+                v_slabs = [
+                    _kv_map(_kv_tokens(v, start, end), _copy_mlx_array)
+                    for v in layer_values
+                ]
+                mx.eval(_kv_leaves(k_slabs) + _kv_leaves(v_slabs))
                 b.block_hash = h
                 b.parent_hash = parent
                 b.token_ids = chunk
-                b.extra_hash = extra_hash
+                b.extra_hash = block_extra
                 b.keys = k_slabs
                 b.values = v_slabs
                 b.ref_cnt = 1
@@ -3200,9 +3490,56 @@ class APCManager:
                     self.stats.disk_writes += len(disk_blocks)
                 except Exception as e:
                     logger.warning("APC disk save scheduling failed: %s", e)
+            if (
+                self.disk is not None
+                and compressed
+                and kv_formats is not None
+                and layer_major_prefix_tokens > skip_full * self.block_size
+            ):
+                self._save_compressed_prefix_to_disk(
+                    token_tuple,
+                    layer_keys,
+                    layer_values,
+                    kv_formats,
+                    _prefix_extra(
+                        extra_hash, layer_major_prefix_tokens, self.block_size
+                    ),
+                )
             self.stats.pool_used = sum(1 for x in self.pool if x.block_hash is not None)
             return new_blocks
 
+    def _save_compressed_prefix_to_disk(
+        self,
+        token_tuple: Tuple[int, ...],
+        layer_keys: List[Any],
+        layer_values: List[Any],
+        kv_formats: Sequence[Optional[Tuple[Any, ...]]],
+        prefix_extra: int,
+    ) -> None:
+        """Write a compressed K/V prefix as an exact disk snapshot.
+
+        Layer-major shards hold float K/V only, so quantized prefixes are
+        persisted as ``compressed_kv`` exact entries and come back through
+        ``lookup_exact_cache`` without re-quantizing.
+        """
+        key = _sequence_hash(token_tuple, prefix_extra, self.block_size)
+        if self.disk.has_exact(key):
+            return
+        n = len(token_tuple)
+        caches = []
+        eval_targets: List[mx.array] = []
+        for fmt, k, v in zip(kv_formats, layer_keys, layer_values):
+            k = _kv_map(_kv_tokens(k, 0, n), _copy_mlx_array)
+            v = _kv_map(_kv_tokens(v, 0, n), _copy_mlx_array)
+            eval_targets.extend(_kv_leaves(k) + _kv_leaves(v))
+            caches.append(_make_single_row_kv_cache(fmt, k, v, n))
+        mx.eval(eval_targets)
+        try:
+            self.disk.save_exact_cache(key, token_tuple, prefix_extra, caches)
+            self.stats.disk_writes += 1
+        except Exception as e:
+            logger.warning("APC compressed disk save scheduling failed: %s", e)
+
     def stats_snapshot(self) -> dict:
         with self.lock:
             self.stats.pool_used = sum(1 for x in self.pool if x.block_hash is not None)
@@ -3351,12 +3688,18 @@ def make_warm_batch_kv_cache(
 def make_warm_batch_kv_cache_multi(
     picks: List[Optional[dict]],
     num_layers: int,
+    caches: Optional[List[Any]] = None,
 ) -> Tuple[List[Any], int]:
     """Build a multi-row ``BatchKVCache`` list for mixed warm / cold prefill.
 
     ``picks`` is per-row, with each entry being ``None`` (cold) or a dict
     with key ``matched_blocks`` (list of APCBlock) and ``prefix_len``.
 
+    ``caches`` optionally supplies one empty batch cache per layer to fill
+    instead of ``BatchKVCache`` (e.g. ``BatchQuantizedKVCache`` or
+    ``BatchTurboQuantKVCache``); the picked K/V must already be in that
+    cache's storage format, and is spliced in without re-quantizing.
+
     Returns ``(cache_list, max_prefix)`` where ``max_prefix`` is the cache's
     ``_idx`` after warm-init (= max prefix_len across rows).
 
@@ -3373,55 +3716,51 @@ def make_warm_batch_kv_cache_multi(
     if max_prefix == 0:
         return [], 0
 
-    def layer_tensors(pick: dict, layer_idx: int) -> Tuple[mx.array, mx.array]:
+    def layer_tensors(pick: dict, layer_idx: int) -> Tuple[Any, Any]:
         warm_cache = pick.get("warm_cache")
         if warm_cache is not None:
             c = warm_cache[layer_idx]
             prefix_len = pick["prefix_len"]
-            return c.keys[..., :prefix_len, :], c.values[..., :prefix_len, :]
+            return _kv_tokens(c.keys, 0, prefix_len), _kv_tokens(
+                c.values, 0, prefix_len
+            )
         blocks = pick["matched_blocks"]
         ks = [b.keys[layer_idx] for b in blocks]
         vs = [b.values[layer_idx] for b in blocks]
-        return mx.concatenate(ks, axis=2), mx.concatenate(vs, axis=2)
+        return _kv_concat(ks, axis=2), _kv_concat(vs, axis=2)
 
-    # Discover dtype / head dims from the first non-empty pick.
     sample = next(p for p in picks if p)
-    sample_k, _ = layer_tensors(sample, 0)  # [1, H, prefix_len, D]
-    n_kv_heads = sample_k.shape[1]
-    head_dim = sample_k.shape[-1]
-    dtype = sample_k.dtype
 
     out: List[Any] = []
     for layer_idx in range(num_layers):
         # Build per-row warm K/V tensors of shape [1, H, max_prefix, D]; rows
         # without a hit get zeros, rows with a shorter prefix get zero left-pad.
-        row_keys: List[mx.array] = []
-        row_values: List[mx.array] = []
+        sample_k, sample_v = layer_tensors(sample, layer_idx)
+        row_keys: List[Any] = []
+        row_values: List[Any] = []
         for pick in picks:
             if pick is None:
                 # Cold row: full pre-warm zone is left padding (zeros).
-                row_keys.append(
-                    mx.zeros((1, n_kv_heads, max_prefix, head_dim), dtype=dtype)
-                )
-                row_values.append(
-                    mx.zeros((1, n_kv_heads, max_prefix, head_dim), dtype=dtype)
-                )
+                row_keys.append(_kv_zeros(sample_k, max_prefix))
+                row_values.append(_kv_zeros(sample_v, max_prefix))
                 continue
             warm_k, warm_v = layer_tensors(pick, layer_idx)
             lp = max_prefix - pick["prefix_len"]
             if lp > 0:
-                pad_k = mx.zeros((1, n_kv_heads, lp, head_dim), dtype=dtype)
-                pad_v = mx.zeros((1, n_kv_heads, lp, head_dim), dtype=dtype)
-                warm_k = mx.concatenate([pad_k, warm_k], axis=2)
-                warm_v = mx.concatenate([pad_v, warm_v], axis=2)
+                warm_k = _kv_concat([_kv_zeros(warm_k, lp), warm_k], axis=2)
+                warm_v = _kv_concat([_kv_zeros(warm_v, lp), warm_v], axis=2)
             row_keys.append(warm_k)
             row_values.append(warm_v)
-        merged_k = mx.concatenate(row_keys, axis=0)  # [B, H, max_prefix, D]
-        merged_v = mx.concatenate(row_values, axis=0)
+        merged_k = _kv_concat(row_keys, axis=0)  # [B, H, max_prefix, D]
+        merged_v = _kv_concat(row_values, axis=0)
 
         left_padding = [max_prefix - pl for pl in prefix_lens]
         offset = [pl for pl in prefix_lens]
-        c = BatchKVCache(left_padding=[0] * B)  # placeholder; state setter overrides
+        if caches is not None:
+            c = caches[layer_idx]
+        else:
+            # placeholder; state setter overrides
+            c = BatchKVCache(left_padding=[0] * B)
         c.state = (
             merged_k,
             merged_v,
@@ -3566,7 +3905,7 @@ def harvest_blocks_from_batch_cache(
     batch_idx: int,
     full_token_ids: Sequence[int],
     *,
-    extra_hash: int = 0,
+    extra_hash: ExtraHash = 0,
     skip_first_n_tokens: int = 0,
 ) -> List[APCBlock]:
     """Slice one row out of a batched KV cache and store its full blocks.
@@ -3574,8 +3913,8 @@ def harvest_blocks_from_batch_cache(
     Used at the end of prompt prefill in continuous-batching mode to add
     the new prefix to APC.
     """
-    layer_keys: List[mx.array] = []
-    layer_values: List[mx.array] = []
+    layer_keys: List[Any] = []
+    layer_values: List[Any] = []
     for c in batch_caches:
         keys = getattr(c, "keys", None)
         values = getattr(c, "values", None)
@@ -3591,15 +3930,17 @@ def harvest_blocks_from_batch_cache(
                 lp = 0
         else:
             lp = 0
-        # shape after slicing: [1, H, idx-lp, D]
-        layer_keys.append(keys[batch_idx : batch_idx + 1, :, lp:idx, :])
-        layer_values.append(values[batch_idx : batch_idx + 1, :, lp:idx, :])
+        # shape after slicing: [1, H, idx-lp, D] (per leaf when quantized)
+        row = lambda a: a[batch_idx : batch_idx + 1, :, lp:idx]
+        layer_keys.append(_kv_map(keys, row))
+        layer_values.append(_kv_map(values, row))
     return apc_manager.store_kv_blocks(
         full_token_ids,
         layer_keys,
         layer_values,
         extra_hash=extra_hash,
         skip_first_n_tokens=skip_first_n_tokens,
+        kv_formats=[kv_cache_format(c) for c in batch_caches],
     )
 
 
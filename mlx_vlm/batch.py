@@ -0,0 +1,637 @@
+"""Offline batch inference over JSONL files and Hugging Face datasets.
+
+Records are streamed through a single :class:`BatchGenerator` with
+continuous batching: a finished row is replaced by the next preprocessed
+record on the following step, so the decode batch stays full for the whole
+run. Chat templating, image loading and processor calls run on a thread
+pool ahead of the decode loop, and results are appended to the output JSONL
+as each record finishes. Rerunning the same command resumes from the
+records already written.
+
+Example::
+
+    python -m mlx_vlm.batch --model mlx-community/Qwen2.5-VL-3B-Instruct-4bit \\
+        --input captions.jsonl --output captions.out.jsonl \\
+        --prompt "Describe this image." --batch-size 32
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Union
+
+import mlx.core as mx
+
+from . import apc as _apc
+from .generate import (
+    DEFAULT_COMPLETION_BATCH_SIZE,
+    DEFAULT_MODEL_PATH,
+    DEFAULT_PREFILL_BATCH_SIZE,
+    DEFAULT_TEMPERATURE,
+    DEFAULT_TOP_P,
+    BatchGenerator,
+    normalize_resize_shape,
+)
+from .prompt_utils import apply_chat_template
+from .sample_utils import SamplingParams
+from .utils import load, prepare_inputs
+
+DEFAULT_MAX_TOKENS = 256
+DEFAULT_NUM_WORKERS = 4
+
+
+@dataclass
+class BatchRequest:
+    """One record to generate for.
+
+    Args:
+        id: Identifier written back with the result and used for resuming.
+        prompt: User prompt, or a list of chat messages.
+        images: Image paths, URLs or PIL images, or a callable returning them.
+            A callable is invoked on a preprocessing thread, so image decoding
+            overlaps with generation.
+        max_tokens: Per-record generation limit; the runner default if ``None``.
+    """
+
+    id: Any
+    prompt: Union[str, List[dict]]
+    images: Optional[Union[List[Any], Callable[[], List[Any]]]] = None
+    max_tokens: Optional[int] = None
+
+
+@dataclass
+class BatchResult:
+    """Generated output for one :class:`BatchRequest`."""
+
+    id: Any
+    text: str = ""
+    prompt_tokens: int = 0
+    generation_tokens: int = 0
+    finish_reason: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        if self.error is not None:
+            return {"id": self.id, "error": self.error}
+        return {
+            "id": self.id,
+            "output": self.text,
+            "prompt_tokens": self.prompt_tokens,
+            "generation_tokens": self.generation_tokens,
+            "finish_reason": self.finish_reason,
+        }
+
+
+class BatchRunner:
+    """Stream requests through one continuously batched :class:`BatchGenerator`.
+
+    Up to ``batch_size`` rows decode together. Requests are preprocessed on
+    ``num_workers`` threads with at most ``prefetch`` of them held in memory,
+    and a new request is only admitted once its preprocessing has finished,
+    so the decode loop never waits on image loading while it has rows to
+    step. Results are yielded in completion order, not request order.
+
+    Args:
+        model (nn.Module): The vision-language model.
+        processor: The matching processor.
+        max_tokens (int): Default generation limit per request.
+        batch_size (int): Maximum number of rows decoding at once.
+        prefill_batch_size (int): Maximum number of prompts prefilled together.
+        num_workers (int): Preprocessing threads; ``0`` preprocesses inline.
+        prefetch (int): Preprocessed requests held ahead of admission.
+            Defaults to ``batch_size``.
+        sampling_params (SamplingParams): Sampling settings for every row.
+        resize_shape: Optional image resize shape passed to the processor.
+        kwargs: The remaining options get passed to :obj:`BatchGenerator`.
+            With an ``apc_manager``, rows carry per-image APC identities so
+            prompt text ahead of the first image is shared between requests.
+    """
+
+    def __init__(
+        self,
+        model,
+        processor,
+        *,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        batch_size: int = DEFAULT_COMPLETION_BATCH_SIZE,
+        prefill_batch_size: int = DEFAULT_PREFILL_BATCH_SIZE,
+        num_workers: int = DEFAULT_NUM_WORKERS,
+        prefetch: Optional[int] = None,
+        sampling_params: Optional[SamplingParams] = None,
+        resize_shape=None,
+        **kwargs,
+    ):
+        self.model = model
+        self.processor = processor
+        self.max_tokens = max_tokens
+        self.batch_size = max(1, int(batch_size))
+        self.prefill_batch_size = min(prefill_batch_size, self.batch_size)
+        self.num_workers = max(0, int(num_workers))
+        self.prefetch = max(1, int(prefetch or self.batch_size))
+        self.sampling_params = sampling_params or SamplingParams()
+        self.resize_shape = normalize_resize_shape(resize_shape)
+        self.generator_kwargs = kwargs
+        if getattr(model, "no_chunked_prefill", False):
+            self.generator_kwargs["prefill_step_size"] = None
+
+        self.completed = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.generation_tokens = 0
+        self.elapsed = 0.0
+        self.peak_memory = 0.0
+
+    def _preprocess(self, request: BatchRequest) -> dict:
+        """CPU-only: template, tokenize and load images. Thread-safe."""
+        if callable(request.images):
+            request.images = request.images()
+        images = request.images or None
+        config = self.model.config
+        prompt = apply_chat_template(
+            self.processor,
+            config,
+            request.prompt,
+            num_images=len(images) if images else 0,
+        )
+        add_special_tokens = (
+            getattr(self.processor, "chat_template", None) is None
+            if config.model_type in ["gemma3", "gemma3n", "gemma4"]
+            else True
+        )
+        return prepare_inputs(
+            self.processor,
+            images=images,
+            audio=None,
+            prompts=prompt,
+            image_token_index=getattr(config, "image_token_index", None),
+            resize_shape=self.resize_shape,
+            add_special_tokens=add_special_tokens,
+        )
+
+    def _embed(self, request: BatchRequest, raw_inputs: dict) -> dict:
+        """GPU-only: run the vision tower and build the row's prompt kwargs."""
+        data_kwargs = {
+            k: v
+            for k, v in raw_inputs.items()
+            if k not in ["input_ids", "pixel_values", "attention_mask"]
+        }
+        embed = self.model.get_input_embeddings(
+            raw_inputs["input_ids"],
+            raw_inputs.get("pixel_values"),
+            mask=raw_inputs.get("attention_mask"),
+            **data_kwargs,
+        )
+        kwargs = {**data_kwargs, **embed.to_dict()}
+        if self.generator_kwargs.get("apc_manager") is not None:
+            kwargs.update(
+                _apc.image_prompt_kwargs(
+                    request.images or None, raw_inputs.get("pixel_values")
+                )
+            )
+        return kwargs
+
+    def run(self, requests: Iterable[BatchRequest]) -> Iterator[BatchResult]:
+        """Generate for every request, yielding each result as it finishes."""
+        requests = iter(requests)
+        pending = deque()
+        active = {}
+        executor = (
+            ThreadPoolExecutor(
+                max_workers=self.num_workers, thread_name_prefix="mlx-vlm-batch"
+            )
+            if self.num_workers > 0
+            else None
+        )
+
+        def schedule():
+            while len(pending) < self.prefetch:
+                request = next(requests, None)
+                if request is None:
+                    return
+                if executor is None:
+                    pending.append((request, None))
+                else:
+                    pending.append(
+                        (request, executor.submit(self._preprocess, request))
+                    )
+
+        gen = BatchGenerator(
+            self.model.language_model,
+            self.processor,
+            max_tokens=self.max_tokens,
+            completion_batch_size=self.batch_size,
+            prefill_batch_size=self.prefill_batch_size,
+            compute_logprobs=False,
+            **self.generator_kwargs,
+        )
+        detokenizer = self.processor.detokenizer
+        tic = time.perf_counter()
+        try:
+            schedule()
+            while pending or active:
+                # Admit preprocessed requests into free rows. Only block on a
+                # worker when there is nothing to decode in the meantime.
+                while pending and len(active) < self.batch_size:
+                    request, future = pending[0]
+                    if active and future is not None and not future.done():
+                        break
+                    pending.popleft()
+                    try:
+                        raw_inputs = (
+                            self._preprocess(request)
+                            if future is None
+                            else future.result()
+                        )
+                        prompt_kwargs = self._embed(request, raw_inputs)
+                        input_ids = raw_inputs["input_ids"].squeeze(0).tolist()
+                        (uid,) = gen.insert(
+                            [input_ids],
+                            max_tokens=request.max_tokens or self.max_tokens,
+                            prompt_kwargs=[prompt_kwargs],
+                            sampling_params=[self.sampling_params],
+                        )
+                    except Exception as e:
+                        self.failed += 1
+                        error = f"{type(e).__name__}: {e}"
+                        yield BatchResult(id=request.id, error=error)
+                        continue
+                    finally:
+                        schedule()
+                    active[uid] = (request, len(input_ids), [])
+
+                if not active:
+                    continue
+
+                _, responses = gen.next()
+                for r in responses:
+                    request, prompt_tokens, tokens = active[r.uid]
+                    if r.finish_reason != "stop":
+                        tokens.append(r.token)
+                    if r.finish_reason is None:
+                        continue
+                    del active[r.uid]
+                    detokenizer.reset()
+                    for t in tokens:
+                        detokenizer.add_token(t)
+                    detokenizer.finalize()
+                    self.completed += 1
+                    self.prompt_tokens += prompt_tokens
+                    self.generation_tokens += len(tokens)
+                    yield BatchResult(
+                        id=request.id,
+                        text=detokenizer.text,
+                        prompt_tokens=prompt_tokens,
+                        generation_tokens=len(tokens),
+                        finish_reason=r.finish_reason,
+                    )
+        finally:
+            self.elapsed += time.perf_counter() - tic
+            self.peak_memory = max(self.peak_memory, mx.get_peak_memory() / 1e9)
+            gen.close()
+            if executor is not None:
+                for _, future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False, cancel_futures=True)
+            mx.clear_cache()
+
+    def summary(self) -> str:
+        """Aggregate throughput over every :meth:`run` so far."""
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"{self.completed} completed, {self.failed} failed in {self.elapsed:.1f}s\n"
+            f"Prompt: {self.prompt_tokens} tokens, "
+            f"{self.prompt_tokens / elapsed:.1f} tokens-per-sec\n"
+            f"Generation: {self.generation_tokens} tokens, "
+            f"{self.generation_tokens / elapsed:.1f} tokens-per-sec\n"
+            f"Throughput: {self.completed / elapsed:.2f} samples-per-sec\n"
+            f"Peak memory: {self.peak_memory:.3f} GB"
+        )
+
+
+def _as_image_list(value, image_root=None) -> Optional[List[Any]]:
+    """Normalise a record's image field to a list of loadable images."""
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    images = []
+    for image in value:
+        if image is None:
+            continue
+        if isinstance(image, dict):
+            # Undecoded datasets ``Image`` feature.
+            if image.get("bytes") is not None:
+                from io import BytesIO
+
+                from PIL import Image
+
+                image = Image.open(BytesIO(image["bytes"]))
+            else:
+                image = image.get("path")
+        if (
+            isinstance(image, str)
+            and image_root is not None
+            and not image.startswith(("http://", "https://", "data:"))
+            and not os.path.isabs(image)
+        ):
+            image = os.path.join(image_root, image)
+        images.append(image)
+    return images or None
+
+
+def iter_records(
+    source: str,
+    split: str = "train",
+    subset: Optional[str] = None,
+    streaming: bool = False,
+) -> Iterator[dict]:
+    """Yield records from a JSONL file, or from a Hugging Face dataset id."""
+    if os.path.isfile(source):
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    from datasets import load_dataset
+
+    yield from load_dataset(source, subset, split=split, streaming=streaming)
+
+
+def completed_ids(output_path: str) -> set:
+    """Ids already written to ``output_path``, skipping failed records.
+
+    A partially written last line (from an interrupted run) is ignored, so
+    that record is generated again.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and "error" not in record:
+                done.add(record.get("id"))
+    return done
+
+
+def build_requests(
+    records: Iterable[dict],
+    prompt_field: str = "prompt",
+    image_field: str = "image",
+    id_field: str = "id",
+    default_prompt: Optional[str] = None,
+    system: Optional[str] = None,
+    image_root: Optional[str] = None,
+    skip_ids: Optional[set] = None,
+    max_samples: Optional[int] = None,
+) -> Iterator[BatchRequest]:
+    """Turn raw records into :class:`BatchRequest` objects.
+
+    Records without ``id_field`` are numbered by their position in the
+    input, which stays stable across resumed runs over the same input.
+    """
+    skip_ids = skip_ids or set()
+    emitted = 0
+    for index, record in enumerate(records):
+        if max_samples is not None and emitted >= max_samples:
+            return
+        rid = record.get(id_field, index)
+        if rid in skip_ids:
+            continue
+        prompt = record.get(prompt_field) or default_prompt
+        if prompt is None:
+            raise ValueError(
+                f"Record {rid!r} has no {prompt_field!r} field; pass --prompt "
+                "to use the same prompt for every record."
+            )
+        if system and isinstance(prompt, str):
+            prompt = [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ]
+        emitted += 1
+        yield BatchRequest(
+            id=rid,
+            prompt=prompt,
+            images=_as_image_list(record.get(image_field), image_root),
+            max_tokens=record.get("max_tokens"),
+        )
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Run a VLM over a JSONL file or Hugging Face dataset with "
+        "continuous batching."
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=DEFAULT_MODEL_PATH,
+        help="The path to the local model directory or Hugging Face repo.",
+    )
+    parser.add_argument(
+        "--adapter-path",
+        type=str,
+        default=None,
+        help="The path to the adapter weights.",
+    )
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=True,
+        help="JSONL file with one record per line, or a Hugging Face dataset id.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="JSONL file results are appended to. Records already in it are "
+        "skipped, so rerunning an interrupted job resumes it.",
+    )
+    parser.add_argument(
+        "--split", type=str, default="train", help="Dataset split to read."
+    )
+    parser.add_argument(
+        "--subset", type=str, default=None, help="Dataset configuration name."
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Stream the dataset instead of downloading it first.",
+    )
+    parser.add_argument(
+        "--prompt-field",
+        type=str,
+        default="prompt",
+        help="Record field holding the prompt or chat messages.",
+    )
+    parser.add_argument(
+        "--image-field",
+        type=str,
+        default="image",
+        help="Record field holding an image or a list of images.",
+    )
+    parser.add_argument(
+        "--id-field",
+        type=str,
+        default="id",
+        help="Record field identifying it; defaults to the record index.",
+    )
+    parser.add_argument(
+        "--image-root",
+        type=str,
+        default=None,
+        help="Directory relative image paths are resolved against. Defaults "
+        "to the directory of the --input file.",
+    )
+    parser.add_argument(
+        "--prompt",
+        type=str,
+        default=None,
+        help="Prompt for records without a prompt field (e.g. captioning).",
+    )
+    parser.add_argument(
+        "--system", type=str, default=None, help="Optional system message."
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=DEFAULT_MAX_TOKENS,
+        help="Maximum number of tokens to generate per record.",
+    )
+    parser.add_argument(
+        "--temperature",
+        type=float,
+        default=DEFAULT_TEMPERATURE,
+        help="Temperature for sampling.",
+    )
+    parser.add_argument(
+        "--top-p", type=float, default=DEFAULT_TOP_P, help="Top-p sampling."
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed for sampling.")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_COMPLETION_BATCH_SIZE,
+        help="Maximum number of sequences decoding at once.",
+    )
+    parser.add_argument(
+        "--prefill-batch-size",
+        type=int,
+        default=DEFAULT_PREFILL_BATCH_SIZE,
+        help="Maximum number of prompts prefilled together.",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=DEFAULT_NUM_WORKERS,
+        help="Threads preprocessing records (templating, image loading).",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=None,
+        help="Preprocessed records held ahead of the decode loop. Defaults to "
+        "--batch-size.",
+    )
+    parser.add_argument(
+        "--resize-shape",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Resize shape for the images.",
+    )
+    parser.add_argument(
+        "--max-samples",
+        type=int,
+        default=None,
+        help="Process at most this many new records.",
+    )
+    parser.add_argument(
+        "--report-every",
+        type=int,
+        default=100,
+        help="Print progress every N completed records (0 disables).",
+    )
+    parser.add_argument(
+        "--trust-remote-code",
+        action="store_true",
+        help="Trust remote code when loading models from Hugging Face Hub.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    image_root = args.image_root
+    if image_root is None and os.path.isfile(args.input):
+        image_root = os.path.dirname(os.path.abspath(args.input))
+
+    done = completed_ids(args.output)
+    if done:
+        print(f"Resuming: {len(done)} records already in {args.output}")
+
+    model, processor = load(
+        args.model, args.adapter_path, trust_remote_code=args.trust_remote_code
+    )
+    runner = BatchRunner(
+        model,
+        processor,
+        max_tokens=args.max_tokens,
+        batch_size=args.batch_size,
+        prefill_batch_size=args.prefill_batch_size,
+        num_workers=args.num_workers,
+        prefetch=args.prefetch,
+        sampling_params=SamplingParams(
+            temperature=args.temperature, top_p=args.top_p, seed=args.seed
+        ),
+        resize_shape=args.resize_shape,
+    )
+    requests = build_requests(
+        iter_records(args.input, args.split, args.subset, args.streaming),
+        prompt_field=args.prompt_field,
+        image_field=args.image_field,
+        id_field=args.id_field,
+        default_prompt=args.prompt,
+        system=args.system,
+        image_root=image_root,
+        skip_ids=done,
+        max_samples=args.max_samples,
+    )
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    tic = time.perf_counter()
+    with open(args.output, "a+", encoding="utf-8") as out:
+        # Terminate a line cut short by an interrupted run.
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        for result in runner.run(requests):
+            out.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+            out.flush()
+            if result.error is not None:
+                print(f"Record {result.id!r} failed: {result.error}")
+            finished = runner.completed + runner.failed
+            if args.report_every and finished % args.report_every == 0:
+                elapsed = time.perf_counter() - tic
+                print(
+                    f"[batch] {finished} records, "
+                    f"{runner.generation_tokens / elapsed:.1f} tokens-per-sec"
+                )
+
+    print(runner.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,10 @@ from typing import Optional
 
 from datasets import load_dataset
 from PIL import Image
-from tqdm import tqdm
 
 from mlx_vlm import load
-from mlx_vlm.evals.utils import inference
+from mlx_vlm.batch import BatchRequest
+from mlx_vlm.evals.utils import add_batch_arguments, batch_inference, batch_options
 
 
 def process_question(sample: dict) -> str:
@@ -355,6 +355,7 @@ def parse_args():
         help="Print detailed output for debugging",
     )
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    add_batch_arguments(parser)
     return parser.parse_args()
 
 
@@ -385,99 +386,102 @@ def main():
     output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    def load_image(sample):
+        """The sample's image as a loader callable, or ``None`` if it has none."""
+        pid = sample["pid"]
+        image = sample.get("decoded_image")
+        if not image:
+            logging.warning(f"No image for sample {pid}, skipping")
+            return None
+        if isinstance(image, str):
+            if not os.path.exists(image):
+                logging.warning(f"Image not found: {image}, skipping sample {pid}")
+                return None
+            return lambda: [Image.open(image).convert("RGB")]
+        # Image is already loaded
+        return lambda: [image.convert("RGB")]
+
+    samples = {}
+
+    def requests():
+        for sample in dataset:
+            images = load_image(sample)
+            if images is None:
+                continue
+            samples[sample["pid"]] = {
+                k: v for k, v in sample.items() if k not in ("image", "decoded_image")
+            }
+            yield BatchRequest(
+                id=sample["pid"], prompt=process_question(sample), images=images
+            )
+
+    predictions = batch_inference(
+        model,
+        processor,
+        requests(),
+        model_id=args.model,
+        benchmark=f"{args.dataset.split('/')[-1]}_{args.split}",
+        max_tokens=args.max_tokens,
+        temperature=args.temperature,
+        total=None if args.streaming else len(dataset),
+        **batch_options(args),
+    )
+
     results = {}
     category_scores = {}
     correct = 0
     total = 0
 
     # Evaluate each sample
-    for idx, sample in enumerate(tqdm(dataset, desc="Evaluating")):
-        pid = sample["pid"]
-
-        try:
-            # Load and process image
-            if "decoded_image" in sample and sample["decoded_image"]:
-                if isinstance(sample["decoded_image"], str):
-                    image_path = sample["decoded_image"]
-                    if os.path.exists(image_path):
-                        image = Image.open(image_path).convert("RGB")
-                    else:
-                        logging.warning(
-                            f"Image not found: {image_path}, skipping sample {pid}"
-                        )
-                        continue
-                else:
-                    # Image is already loaded
-                    image = sample["decoded_image"].convert("RGB")
-            else:
-                logging.warning(f"No image for sample {pid}, skipping")
-                continue
+    for pid, sample in samples.items():
+        response = predictions[str(pid)].strip()
 
-            # Create prompt
-            prompt = process_question(sample)
-
-            # Generate response
-            output = inference(
-                model,
-                processor,
-                prompt,
-                image=image,
-                max_tokens=args.max_tokens,
-                temperature=args.temperature,
-            )
+        # Normalize answer
+        prediction = normalize_answer(response, sample)
 
-            response = output.strip()
-
-            # Normalize answer
-            prediction = normalize_answer(response, sample)
-
-            # Evaluate
-            ground_truth = sample.get("answer", "")
-            if args.split == "testmini" and ground_truth:
-                is_correct = evaluate_answer(prediction, ground_truth)
-                if is_correct:
-                    correct += 1
-            else:
-                is_correct = None
-
-            total += 1
-
-            # Store results
-            results[pid] = {
-                "pid": pid,
-                "question": sample["question"],
-                "query": sample["query"],
-                "question_type": sample["question_type"],
-                "answer_type": sample["answer_type"],
-                "choices": sample.get("choices", []),
-                "unit": sample.get("unit", ""),
-                "precision": sample.get("precision", 0),
-                "ground_truth": ground_truth,
-                "response": response,
-                "prediction": prediction,
-                "correct": is_correct,
-                "metadata": sample.get("metadata", {}),
-            }
-            # Track category-wise performance
-            category = sample.get("metadata", {}).get("category", "unknown")
-            if category not in category_scores:
-                category_scores[category] = {"correct": 0, "total": 0}
-
-            category_scores[category]["total"] += 1
+        # Evaluate
+        ground_truth = sample.get("answer", "")
+        if args.split == "testmini" and ground_truth:
+            is_correct = evaluate_answer(prediction, ground_truth)
             if is_correct:
-                category_scores[category]["correct"] += 1
-
-            if args.verbose:
-                logging.info(f"\nSample {pid}:")
-                logging.info(f"Question: {sample['question']}")
-                logging.info(f"Response: {response}")
-                logging.info(f"Prediction: {prediction}")
-                logging.info(f"Ground Truth: {ground_truth}")
-                logging.info(f"Correct: {is_correct}")
-
-        except Exception as e:
-            logging.error(f"Error processing sample {pid}: {e}")
-            continue
+                correct += 1
+        else:
+            is_correct = None
+
+        total += 1
+
+        # Store results
+        results[pid] = {
+            "pid": pid,
+            "question": sample["question"],
+            "query": sample["query"],
+            "question_type": sample["question_type"],
+            "answer_type": sample["answer_type"],
+            "choices": sample.get("choices", []),
+            "unit": sample.get("unit", ""),
+            "precision": sample.get("precision", 0),
+            "ground_truth": ground_truth,
+            "response": response,
+            "prediction": prediction,
+            "correct": is_correct,
+            "metadata": sample.get("metadata", {}),
+        }
+        # Track category-wise performance
+        category = sample.get("metadata", {}).get("category", "unknown")
+        if category not in category_scores:
+            category_scores[category] = {"correct": 0, "total": 0}
+
+        category_scores[category]["total"] += 1
+        if is_correct:
+            category_scores[category]["correct"] += 1
+
+        if args.verbose:
+            logging.info(f"\nSample {pid}:")
+            logging.info(f"Question: {sample['question']}")
+            logging.info(f"Response: {response}")
+            logging.info(f"Prediction: {prediction}")
+            logging.info(f"Ground Truth: {ground_truth}")
+            logging.info(f"Correct: {is_correct}")
 
     # Calculate accuracy if applicable
     if args.split == "testmini":
@@ -7,10 +7,10 @@ import re
 from json import dump
 
 from datasets import load_dataset
-from tqdm import tqdm
 
 from mlx_vlm import load
-from mlx_vlm.evals.utils import inference
+from mlx_vlm.batch import BatchRequest
+from mlx_vlm.evals.utils import add_batch_arguments, batch_inference, batch_options
 
 # All 30 MMMU subjects (confirmed from dataset)
 MMMU_SUBJECTS = [
@@ -360,6 +360,7 @@ def parse_arguments():
         help="Directory to save evaluation results",
     )
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    add_batch_arguments(parser)
     return parser.parse_args()
 
 
@@ -462,46 +463,50 @@ def main():
     os.makedirs(args.output_dir, exist_ok=True)
 
     results = []
-    for subject, dataset in tqdm(datasets.items(), desc="Processing subjects"):
-        for idx, example in enumerate(tqdm(dataset, desc=f"Processing {subject}")):
-            question = process_question(example)
 
-            images = get_images(example)
-            try:
-                # Get prediction
-                prediction = inference(
-                    model,
-                    processor,
-                    question,
-                    images,
-                    args.max_tokens,
-                    args.temperature,
-                    args.resize_shape,
-                    args.verbose,
-                )
-            except Exception as e:
-                print(f"Error during inference:", question, images, "error message:", e)
-                prediction = ""
-
-            # Store result
-            result = {
-                "id": example.get("id", idx),
-                "question": question,
-                "answer": example.get("answer", ""),
-                "subfield": example.get("subfield", "Unknown"),
-                "topic_difficulty": example.get("topic_difficulty", "Unknown"),
-                "question_type": example.get("question_type", "Unknown"),
-                "prediction": prediction,
-                "subject": example.get("subject", None) or subject,
-            }
-            results.append(result)
-
-            # Show progress
-            if (idx + 1) % 10 == 0 or idx < 5:
-                logging.info(
-                    f"Sample {idx + 1}: Answer={result['answer']}, Prediction={prediction[:50]}..."
+    def requests():
+        # Every subject streams through the same batch, so the decode rows
+        # stay full across subject boundaries.
+        for subject, dataset in datasets.items():
+            for idx, example in enumerate(dataset):
+                question = process_question(example)
+                result = {
+                    "id": example.get("id", f"{subject}_{idx}"),
+                    "question": question,
+                    "answer": example.get("answer", ""),
+                    "subfield": example.get("subfield", "Unknown"),
+                    "topic_difficulty": example.get("topic_difficulty", "Unknown"),
+                    "question_type": example.get("question_type", "Unknown"),
+                    "prediction": "",
+                    "subject": example.get("subject", None) or subject,
+                }
+                results.append(result)
+                yield BatchRequest(
+                    id=result["id"],
+                    prompt=question,
+                    images=lambda example=example: get_images(example),
                 )
 
+    predictions = batch_inference(
+        model,
+        processor,
+        requests(),
+        model_id=args.model,
+        benchmark=f"{args.dataset.split('/')[-1]}_{args.split}",
+        max_tokens=args.max_tokens,
+        temperature=args.temperature,
+        top_p=args.top_p,
+        resize_shape=args.resize_shape,
+        total=(
+            sum(len(dataset) for dataset in datasets.values())
+            if not args.streaming
+            else None
+        ),
+        **batch_options(args),
+    )
+    for result in results:
+        result["prediction"] = predictions[str(result["id"])]
+
     # Print first few results
     print("\nFirst 5 results:")
     for i, result in enumerate(results[:5]):
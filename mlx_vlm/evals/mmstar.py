@@ -11,7 +11,8 @@ from datasets import load_dataset
 from tqdm import tqdm
 
 from mlx_vlm import load
-from mlx_vlm.evals.utils import inference
+from mlx_vlm.batch import BatchRequest
+from mlx_vlm.evals.utils import add_batch_arguments, batch_inference, batch_options
 
 
 def extract_answer(predict, answer):
@@ -253,6 +254,7 @@ def parse_arguments():
         help="Directory to save evaluation results",
     )
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    add_batch_arguments(parser)
 
     return parser.parse_args()
 
@@ -295,31 +297,45 @@ def main():
     result_file = f'{args.output_dir}/{args.model.split("/")[-1]}_{args.dataset.split("/")[-1]}_{args.split}_predictions.csv'
     os.makedirs(args.output_dir, exist_ok=True)
 
-    results = []
-    for example in tqdm(dataset, desc="Running inference"):
-        question = example["question"]
-        image = example["image"].convert("RGB")
-        prediction = inference(
-            model,
-            processor,
-            question,
-            image,
-            args.max_tokens,
-            args.temperature,
-            args.resize_shape,
-            args.verbose,
-        )
+    samples = []
+
+    def requests():
+        for idx, example in enumerate(dataset):
+            sample_id = example.get("index", idx)
+            samples.append(
+                {
+                    "id": sample_id,
+                    "question": example["question"],
+                    "answer": example["answer"],
+                    "category": example["category"],
+                    "l2_category": example["l2_category"],
+                    "meta_info": example["meta_info"],
+                }
+            )
+            # Decode on a preprocessing thread, overlapped with generation.
+            yield BatchRequest(
+                id=sample_id,
+                prompt=example["question"],
+                images=lambda image=example["image"]: [image.convert("RGB")],
+            )
 
-        results.append(
-            {
-                "question": question,
-                "answer": example["answer"],
-                "category": example["category"],
-                "l2_category": example["l2_category"],
-                "meta_info": example["meta_info"],
-                "prediction": prediction,
-            }
-        )
+    predictions = batch_inference(
+        model,
+        processor,
+        requests(),
+        model_id=args.model,
+        benchmark=f"{args.dataset.split('/')[-1]}_{args.split}",
+        max_tokens=args.max_tokens,
+        temperature=args.temperature,
+        resize_shape=args.resize_shape,
+        total=len(dataset) if hasattr(dataset, "__len__") else args.max_samples,
+        **batch_options(args),
+    )
+
+    results = []
+    for sample in samples:
+        sample_id = sample.pop("id")
+        results.append({**sample, "prediction": predictions[str(sample_id)]})
 
     print("\nFirst 5 results:")
     for i, result in enumerate(results[:5]):
@@ -1,5 +1,20 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, Optional
+
+from tqdm import tqdm
+
 from mlx_vlm import generate
+from mlx_vlm.apc import APCManager
+from mlx_vlm.batch import BatchRequest, BatchRunner
 from mlx_vlm.prompt_utils import apply_chat_template
+from mlx_vlm.sample_utils import SamplingParams
+
+DEFAULT_EVAL_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "mlx_vlm", "evals"
+)
 
 
 def inference(
@@ -35,3 +50,176 @@ def inference(
         verbose=verbose,
     )
     return response.text
+
+
+def add_batch_arguments(parser):
+    """Options shared by the benchmarks for :func:`batch_inference`."""
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=16,
+        help="Maximum number of samples decoding at once",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=4,
+        help="Threads loading images and preprocessing samples",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=DEFAULT_EVAL_CACHE_DIR,
+        help="Directory of cached predictions; reruns with the same model and "
+        "generation settings only evaluate new samples",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write cached predictions",
+    )
+    parser.add_argument(
+        "--no-apc",
+        action="store_true",
+        help="Disable prefix caching of the prompt text shared by all samples",
+    )
+    return parser
+
+
+def batch_options(args) -> dict:
+    """:func:`batch_inference` keyword arguments from parsed CLI ``args``."""
+    return {
+        "adapter_path": args.adapter_path,
+        "batch_size": args.batch_size,
+        "num_workers": args.num_workers,
+        "cache_dir": None if args.no_cache else args.cache_dir,
+        "use_apc": not args.no_apc,
+    }
+
+
+class PredictionCache:
+    """Predictions of one model under one generation config, on disk.
+
+    Entries are appended to a JSONL file named after a hash of ``model``,
+    ``benchmark`` and ``config``, one line per sample id, so a rerun with
+    the same settings only has to evaluate samples it has not seen.
+    """
+
+    def __init__(self, cache_dir: str, model: str, benchmark: str, config: dict):
+        key = json.dumps(
+            {"model": model, "benchmark": benchmark, "config": config},
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"{benchmark}-{digest}.jsonl")
+        self.predictions: Dict[str, str] = {}
+        if os.path.exists(self.path):
+            line = ""
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # line cut short by an interrupted run
+                    self.predictions[entry["id"]] = entry["prediction"]
+            if line and not line.endswith("\n"):
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n")
+
+    def __contains__(self, sample_id) -> bool:
+        return str(sample_id) in self.predictions
+
+    def __len__(self) -> int:
+        return len(self.predictions)
+
+    def get(self, sample_id) -> Optional[str]:
+        return self.predictions.get(str(sample_id))
+
+    def put(self, sample_id, prediction: str):
+        self.predictions[str(sample_id)] = prediction
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"id": str(sample_id), "prediction": prediction}))
+            f.write("\n")
+
+
+def batch_inference(
+    model,
+    processor,
+    requests: Iterable[BatchRequest],
+    *,
+    model_id: str,
+    benchmark: str,
+    adapter_path: Optional[str] = None,
+    max_tokens: int = 3000,
+    temperature: float = 0.0,
+    top_p: float = 1.0,
+    resize_shape=None,
+    batch_size: int = 16,
+    num_workers: int = 4,
+    cache_dir: Optional[str] = DEFAULT_EVAL_CACHE_DIR,
+    use_apc: bool = True,
+    total: Optional[int] = None,
+) -> Dict[str, str]:
+    """Run a benchmark's questions through one continuously batched generator.
+
+    Requests already answered in the prediction cache for ``model_id`` and
+    this generation config are not generated again. Image loading overlaps
+    with decoding when a request's ``images`` is a callable (see
+    :class:`mlx_vlm.batch.BatchRequest`), and with ``use_apc`` the templated
+    prompt text shared by every sample is prefilled once.
+
+    Returns:
+        Predictions keyed by ``str(request.id)``. Samples that failed to
+        generate map to an empty string and are not cached.
+    """
+    config = {
+        "adapter_path": adapter_path,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "resize_shape": resize_shape,
+    }
+    cache = (
+        PredictionCache(cache_dir, model_id, benchmark, config)
+        if cache_dir is not None
+        else None
+    )
+    predictions: Dict[str, str] = {}
+
+    def uncached():
+        for request in requests:
+            if cache is not None and request.id in cache:
+                predictions[str(request.id)] = cache.get(request.id)
+                progress.update(1)
+                continue
+            yield request
+
+    runner = BatchRunner(
+        model,
+        processor,
+        max_tokens=max_tokens,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        sampling_params=SamplingParams(temperature=temperature, top_p=top_p),
+        resize_shape=resize_shape,
+        apc_manager=APCManager() if use_apc else None,
+    )
+    with tqdm(total=total, desc=f"Running {benchmark} inference") as progress:
+        for result in runner.run(uncached()):
+            progress.update(1)
+            if result.error is not None:
+                logging.error(f"Error during inference for {result.id}: {result.error}")
+                predictions[str(result.id)] = ""
+                continue
+            predictions[str(result.id)] = result.text
+            if cache is not None:
+                cache.put(result.id, result.text)
+
+    reused = len(predictions) - runner.completed - runner.failed
+    if reused:
+        logging.info(f"Reused {reused} cached predictions from {cache.path}")
+    if runner.completed:
+        print(runner.summary())
+    return predictions
@@ -9,7 +9,17 @@ import time
 import warnings
 from collections.abc import Sequence
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import mlx.core as mx
 import mlx.nn as nn
@@ -22,7 +32,13 @@ from transformers import PreTrainedTokenizer
 from . import apc as _apc
 from .models import cache
 from .prompt_utils import apply_chat_template
+from .sample_utils import BatchSamplingState, SamplingParams
 from .speculative.utils import format_speculative_stats, run_speculative_rounds
+from .structured import (
+    LLGuidanceLogitsProcessor,
+    apply_token_bitmask,
+    fill_grammar_bitmask,
+)
 from .tokenizer_utils import make_streaming_detokenizer
 from .turboquant import BatchTurboQuantKVCache, TurboQuantKVCache, turboquant_enabled
 from .utils import (
@@ -55,6 +71,7 @@ DEFAULT_THINKING_START_TOKEN = "<think>"
 DEFAULT_THINKING_END_TOKEN = "</think>"
 DEFAULT_QUANTIZED_KV_START = 5000
 DEFAULT_PREFILL_STEP_SIZE = 2048
+DEFAULT_VISION_BATCH_SIZE = 32
 
 
 def parse_arguments():
@@ -226,10 +243,11 @@ def parse_arguments():
         "--draft-kind",
         type=str,
         default=None,
-        choices=["dflash", "eagle3", "mtp"],
+        choices=["dflash", "eagle3", "mtp", "ngram"],
         help="Drafter family. Supported: 'dflash' (Qwen3.5 DFlash), "
         "'eagle3' (Speculators/SGLang EAGLE-3), "
-        "'mtp' (Gemma 4 Multi-Token Prediction / Assistant model). "
+        "'mtp' (Gemma 4 Multi-Token Prediction / Assistant model), "
+        "'ngram' (prompt lookup on any model; needs no --draft-model). "
         "Default: auto-detected from the drafter's HF model_type.",
     )
     parser.add_argument(
@@ -238,6 +256,13 @@ def parse_arguments():
         default=None,
         help="Override the drafter's configured block size.",
     )
+    parser.add_argument(
+        "--draft-tree-budget",
+        type=int,
+        default=None,
+        help="Verify DFlash drafts as a tree of this many nodes instead of a "
+        "single block (targets with tree attention, e.g. Gemma 4).",
+    )
     parser.add_argument(
         "--enable-thinking",
         action="store_true",
@@ -521,7 +546,8 @@ def generate_step(
           memory usage.
         draft_model (nn.Module, optional): A drafter for speculative decoding.
           When set, the decode loop is replaced by the drafter's speculative
-          loop (e.g. DFlash block-diffusion). VLM prefill with image/audio
+          loop (e.g. DFlash block-diffusion, or ``NGramDrafter`` prompt
+          lookup with ``draft_kind="ngram"``). VLM prefill with image/audio
           is supported via the same ``get_input_embeddings`` path the normal
           decoder uses; decode itself is text-only. ``temperature`` and
           ``sampler`` are respected; ``logprobs`` is always ``None`` on the
@@ -585,9 +611,12 @@ def generate_step(
                     draft_model.config.target_layer_ids,
                 )
             )
-        else:
+        elif draft_kind != "ngram":
             kwargs["capture_layer_ids"] = list(draft_model.config.target_layer_ids)
-        prefill_step_size = None
+        if draft_kind != "ngram":
+            # Drafters read hidden states of the whole prompt; the n-gram
+            # lookup only needs token ids, so its prefill can stay chunked.
+            prefill_step_size = None
         # Reset stale mRoPE state from any previous generation.
         lm = model.language_model if hasattr(model, "language_model") else model
         if hasattr(lm, "_position_ids"):
@@ -635,6 +664,7 @@ def generate_step(
 
             return y, logprobs.squeeze(0) if logprobs.shape[0] == 1 else logprobs
 
+    prompt_ids = input_ids
     with mx.stream(generation_stream):
         # Get input embeddings (handles both multimodal and text-only)
         embedding_output = model.get_input_embeddings(
@@ -721,6 +751,7 @@ def generate_step(
             sampler=sampler,
             draft_block_size=draft_block_size,
             sampler_is_greedy=sampler_is_greedy,
+            prompt_tokens=prompt_ids,
         )
         return
 
@@ -831,13 +862,14 @@ def stream_generate(
 
     # Vision feature caching: reuse cached image features across turns
     if vision_cache is not None and image is not None and pixel_values is not None:
-        cached = vision_cache.get(image)
+        cache_params = {"resize_shape": resize_shape} if resize_shape else None
+        cached = vision_cache.get(image, params=cache_params)
         if cached is not None:
             kwargs["cached_image_features"] = cached
         elif hasattr(model, "encode_image"):
             features = model.encode_image(pixel_values)
             mx.eval(features)
-            vision_cache.put(image, features)
+            vision_cache.put(image, features, params=cache_params)
             kwargs["cached_image_features"] = features
 
     # Prompt cache reuse: skip common prefix from previous turn
@@ -1319,7 +1351,17 @@ _SEQUENCE_ALIGNED_PROMPT_KWARGS = {
     "pos_hw",
 }
 
-APC_PRIVATE_PROMPT_KEYS = ("_apc_tenant", "_apc_image_hash")
+APC_PRIVATE_PROMPT_KEYS = (
+    "_apc_tenant",
+    "_apc_image_hash",
+    "_apc_image_hashes",
+    "_apc_adapter",
+)
+
+
+def _sequence_sampling_params(sequence: tuple) -> Optional[SamplingParams]:
+    # Pending sequences are (uid, ids, max_tokens, kwargs, processors[, params]).
+    return sequence[5] if len(sequence) > 5 else None
 
 
 def _prompt_kwarg_row(v: mx.array, row_idx: int, batch_size: int) -> mx.array:
@@ -1563,6 +1605,61 @@ class PromptProgress:
     prompt_time: float = 0.0
 
 
+def _split_grammar_processors(row_processors):
+    """Pull one LLGuidance processor per row out for batched masking.
+
+    Returns ``(grammar, rest)``: ``grammar`` is a per-row list of
+    processors (``None`` when no row is constrained) and ``rest`` the
+    remaining per-row processors.
+    """
+    grammar = []
+    rest = []
+    for processors in row_processors:
+        row_grammar = None
+        others = []
+        for processor in processors or []:
+            if row_grammar is None and isinstance(processor, LLGuidanceLogitsProcessor):
+                row_grammar = processor
+            else:
+                others.append(processor)
+        grammar.append(row_grammar)
+        rest.append(others)
+    if all(g is None for g in grammar):
+        grammar = None
+    return grammar, rest
+
+
+def _apply_row_logits_processors(
+    logits, grammar, rest, contexts, last_tokens=None
+) -> mx.array:
+    """Apply per-row logits processors to ``logits`` (B, vocab).
+
+    Grammar rows are advanced together and masked with a single
+    vectorized fill after the other processors ran. When ``last_tokens``
+    is given, processors with ``process_last_token`` receive it.
+    """
+    bitmask = None
+    if grammar is not None:
+        grammar_tokens = last_tokens or [ctx[-1] if ctx else 0 for ctx in contexts]
+        bitmask = fill_grammar_bitmask(grammar, grammar_tokens)
+    if any(rest):
+        processed_logits = []
+        for i in range(logits.shape[0]):
+            sample_logits = logits[i : i + 1]
+            for processor in rest[i]:
+                if last_tokens is not None and hasattr(processor, "process_last_token"):
+                    sample_logits = processor.process_last_token(
+                        last_tokens[i], sample_logits
+                    )
+                else:
+                    sample_logits = processor(mx.array(contexts[i]), sample_logits)
+            processed_logits.append(sample_logits)
+        logits = mx.concatenate(processed_logits, axis=0)
+    if bitmask is not None:
+        logits = apply_token_bitmask(logits, bitmask, [g is not None for g in grammar])
+    return logits
+
+
 class GenerationBatch:
     """
     Batched token generator with double-buffered pipelining.
@@ -1594,12 +1691,15 @@ class GenerationBatch:
         logits_processors: Optional[
             List[Optional[List[Callable[[mx.array, mx.array], mx.array]]]]
         ] = None,
+        sampling_state: Optional[BatchSamplingState] = None,
     ):
         self.model = model
         self._language_model = getattr(model, "language_model", model)
         self.uids = uids
         self.prompt_cache = prompt_cache
         self.sampler = sampler
+        # Per-row sampling parameters; rows without them use ``sampler``.
+        self.sampling_state = sampling_state or BatchSamplingState([None] * len(uids))
         self.stop_criteria = stop_criteria
         self.max_tokens = max_tokens
         self._num_tokens = [0] * len(uids)
@@ -1638,30 +1738,23 @@ class GenerationBatch:
         logits = logits[:, -1, :]
 
         if self.logits_processors and any(self.logits_processors):
+            grammar, rest = _split_grammar_processors(self.logits_processors)
+            if grammar is not None:
+                # Dispatch this step's forward first so grammar masks are
+                # computed on the CPU while it runs.
+                mx.async_eval(logits)
             last_tokens = inputs.tolist()
             if not self.token_context:
                 self.token_context = [[] for _ in self.uids]
             for i, token in enumerate(last_tokens):
                 self.token_context[i].append(token)
 
-            processed_logits = []
-            for i in range(logits.shape[0]):
-                sample_logits = logits[i : i + 1]
-                processors = self.logits_processors[i] or []
-                for processor in processors:
-                    if hasattr(processor, "process_last_token"):
-                        sample_logits = processor.process_last_token(
-                            last_tokens[i], sample_logits
-                        )
-                    else:
-                        sample_logits = processor(
-                            mx.array(self.token_context[i]), sample_logits
-                        )
-                processed_logits.append(sample_logits)
-            logits = mx.concatenate(processed_logits, axis=0)
+            logits = _apply_row_logits_processors(
+                logits, grammar, rest, self.token_context, last_tokens
+            )
 
         logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
-        sampled = self.sampler(logprobs)
+        sampled = self.sampling_state.sample(logprobs, self.sampler)
 
         self._next_tokens = sampled
         prev_top_idx = self._next_top_idx
@@ -1715,6 +1808,7 @@ class GenerationBatch:
         self._num_tokens.extend(other._num_tokens)
         self.token_context.extend(other.token_context)
         self.logits_processors.extend(other.logits_processors)
+        self.sampling_state.extend(other.sampling_state)
 
         if self._current_tokens is None:
             self._current_tokens = other._current_tokens
@@ -1772,6 +1866,8 @@ class GenerationBatch:
             self.token_context = [self.token_context[idx] for idx in keep]
         if self.logits_processors:
             self.logits_processors = [self.logits_processors[idx] for idx in keep]
+        if len(self.sampling_state):
+            self.sampling_state.filter(keep)
 
         if not keep:
             self.prompt_cache.clear()
@@ -1857,6 +1953,7 @@ class GenerationBatch:
         batch.top_logprobs_k = top_logprobs_k
         batch.token_context = []
         batch.logits_processors = []
+        batch.sampling_state = BatchSamplingState()
         batch._current_tokens = None
         batch._current_lps = None
         batch._next_tokens = None
@@ -1897,10 +1994,15 @@ class PromptProcessingBatch:
         right_pad_per_row: Optional[List[int]] = None,
         suffix_lens: Optional[List[int]] = None,
         apc_mode: Optional[str] = None,
+        sampling_params: Optional[List[Optional[SamplingParams]]] = None,
+        rope_deltas: Optional[mx.array] = None,
     ):
         self.model = model
         self.uids = uids
         self._prompt_uids = list(uids)
+        # Per-row mRoPE deltas when the prompt kwargs carry explicit
+        # ``position_ids``; otherwise read back from the language model.
+        self._rope_deltas = rope_deltas
         self.max_tokens = max_tokens
         self.prefill_step_size = prefill_step_size
 
@@ -1928,6 +2030,7 @@ class PromptProcessingBatch:
         self._processed_prompt_columns = 0
 
         self.logits_processors = logits_processors or []
+        self.sampling_state = BatchSamplingState(sampling_params or [None] * len(uids))
         self._token_context = (
             [list(ids) for ids in input_ids]
             if self.logits_processors and any(self.logits_processors)
@@ -1936,6 +2039,7 @@ class PromptProcessingBatch:
         self._inputs_embeds = inputs_embeds
         self._prompt_kwargs = prompt_kwargs or {}
         self._prompt_length_aware_keys: List[str] = []
+        self._prompt_position_aware = False
         if self._prompt_kwargs and self._inputs_embeds is not None:
             prompt_batch = self._inputs_embeds.shape[0]
             prompt_len = self._inputs_embeds.shape[1]
@@ -1947,6 +2051,14 @@ class PromptProcessingBatch:
                     and v.shape[1] == prompt_len
                 ):
                     self._prompt_length_aware_keys.append(k)
+            # mRoPE positions are laid out (3, B, L).
+            position_ids = self._prompt_kwargs.get("position_ids")
+            if (
+                isinstance(position_ids, mx.array)
+                and position_ids.ndim == 3
+                and position_ids.shape[1:] == (prompt_batch, prompt_len)
+            ):
+                self._prompt_position_aware = True
 
         # APC metadata used for post-prefill block harvest (per-row).
         self._apc_meta = apc_meta or []
@@ -2085,11 +2197,15 @@ class PromptProcessingBatch:
             meta["checkpoint_done"] = True
 
     def _prompt_kwargs_for_step(self, n: Optional[int] = None) -> dict:
-        if n is None or not self._prompt_length_aware_keys:
+        if n is None or not (
+            self._prompt_length_aware_keys or self._prompt_position_aware
+        ):
             return self._prompt_kwargs
         out = dict(self._prompt_kwargs)
         for k in self._prompt_length_aware_keys:
             out[k] = out[k][:, :n, ...]
+        if self._prompt_position_aware:
+            out["position_ids"] = out["position_ids"][..., :n]
         return out
 
     def prompt_step(self) -> int:
@@ -2119,6 +2235,10 @@ class PromptProcessingBatch:
         self._input_ids = self._input_ids[:, n:]
         for k in self._prompt_length_aware_keys:
             self._prompt_kwargs[k] = self._prompt_kwargs[k][:, n:, ...]
+        if self._prompt_position_aware:
+            self._prompt_kwargs["position_ids"] = self._prompt_kwargs["position_ids"][
+                ..., n:
+            ]
         mx.clear_cache()
         return n
 
@@ -2162,19 +2282,15 @@ class PromptProcessingBatch:
         else:
             logits = logits[:, -1, :]
         if self.logits_processors and any(self.logits_processors):
-            processed_logits = []
-            for i in range(logits.shape[0]):
-                sample_logits = logits[i : i + 1]
-                processors = self.logits_processors[i] or []
-                for processor in processors:
-                    sample_logits = processor(
-                        mx.array(self._token_context[i]), sample_logits
-                    )
-                processed_logits.append(sample_logits)
-            logits = mx.concatenate(processed_logits, axis=0)
+            grammar, rest = _split_grammar_processors(self.logits_processors)
+            if grammar is not None:
+                mx.async_eval(logits)
+            logits = _apply_row_logits_processors(
+                logits, grammar, rest, self._token_context
+            )
 
         logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
-        first_tokens = sampler(logprobs)
+        first_tokens = self.sampling_state.sample(logprobs, sampler)
 
         mx.async_eval(first_tokens)
 
@@ -2215,6 +2331,7 @@ class PromptProcessingBatch:
             top_logprobs_k=top_logprobs_k,
             token_context=[list(ctx) for ctx in self._token_context],
             logits_processors=list(self.logits_processors),
+            sampling_state=self.sampling_state,
         )
         gen_batch.compute_logprobs = compute_logprobs
 
@@ -2233,7 +2350,9 @@ class PromptProcessingBatch:
             gen_batch._next_top_lp = top_lp
 
         language_model = getattr(self.model, "language_model", self.model)
-        rope_deltas = self._capture_rope_deltas(language_model, len(gen_batch.uids))
+        rope_deltas = self._rope_deltas
+        if rope_deltas is None:
+            rope_deltas = self._capture_rope_deltas(language_model, len(gen_batch.uids))
         if rope_deltas is not None:
             # Normalize to shape (B, 1) so extend/filter stay consistent.
             if rope_deltas.ndim == 0:
@@ -2314,6 +2433,7 @@ class PromptProcessingBatch:
         self.prompt_cache = []
         self._token_context = []
         self.logits_processors = []
+        self.sampling_state = BatchSamplingState()
         self._apc_meta = []
         return gen_batch
 
@@ -2351,6 +2471,8 @@ class BatchGenerator:
     - generation_responses is a list of GenerationBatch.Response objects
     """
 
+    adapter_set = None
+
     def __init__(
         self,
         model,
@@ -2374,9 +2496,13 @@ class BatchGenerator:
         ] = None,
         stream=None,
         apc_manager: Optional["_apc.APCManager"] = None,
+        adapter_set=None,
     ):
         self.model = model
         self.max_tokens = max_tokens
+        # Optional trainer.lora.LoRaAdapterSet; rows pick an adapter by name.
+        self.adapter_set = adapter_set
+        self._row_adapters: dict = {}
         self.processor = processor
         self.kv_bits = kv_bits
         self.kv_group_size = kv_group_size
@@ -2385,14 +2511,16 @@ class BatchGenerator:
         self.compute_logprobs = compute_logprobs
         self.top_logprobs_k = top_logprobs_k
         self.logits_processors = logits_processors or []
-        # APC: opt-out for KV-quantized caches. Plain KV models use block APC;
-        # mixed/custom cache models use exact prompt-cache snapshots.
+        # APC: plain KV models use block APC; mixed/custom cache models use
+        # exact prompt-cache snapshots. Quantized KV (uniform or TurboQuant)
+        # is reused in its compressed form, on the block path only.
         self.apc_mode = None
-        if apc_manager is not None and kv_bits is not None:
-            apc_manager = None
         if apc_manager is not None:
             self.apc_mode = _apc.model_apc_mode(model)
-            if self.apc_mode is None:
+            if self.apc_mode is None or (
+                kv_bits is not None and self.apc_mode != "block"
+            ):
+                self.apc_mode = None
                 apc_manager = None
         self.apc_manager = apc_manager
         self.tokenizer = (
@@ -2431,8 +2559,29 @@ class BatchGenerator:
     # the merged kwargs are passed to the language model forward.
     _APC_PRIVATE_KEYS = APC_PRIVATE_PROMPT_KEYS
 
-    def _apc_extra_hash(self, prompt_kwargs: dict) -> int:
-        """Salt for the APC hash chain."""
+    def _apc_image_token_ids(self) -> Tuple[int, ...]:
+        config = getattr(self.model, "config", None)
+        ids = []
+        for name in (
+            "image_token_id",
+            "image_token_index",
+            "video_token_id",
+            "video_token_index",
+        ):
+            value = getattr(config, name, None)
+            if isinstance(value, int) and value not in ids:
+                ids.append(value)
+        return tuple(ids)
+
+    def _apc_extra_hash(
+        self, prompt_kwargs: dict, token_ids: Optional[Sequence[int]] = None
+    ) -> "_apc.ExtraHash":
+        """Salt for the APC hash chain.
+
+        With per-image hashes (``_apc_image_hashes``) and ``token_ids`` the
+        salt is per block, so text ahead of the first image is shared across
+        requests with different images.
+        """
         if self.apc_manager is None:
             return 0
         if prompt_kwargs is None:
@@ -2442,23 +2591,94 @@ class BatchGenerator:
             pixel_values = prompt_kwargs.get("pixel_values")
             img = _apc.hash_image_payload(pixel_values=pixel_values, image_ref=None)
         tenant = prompt_kwargs.get("_apc_tenant")
+        adapter = prompt_kwargs.get("_apc_adapter")
+        if adapter is not None:
+            # KV blocks computed under one LoRA adapter differ from the base's.
+            tenant = f"{tenant or ''}\0lora:{adapter}"
+        kv_bits = getattr(self, "kv_bits", None)
+        if kv_bits is not None:
+            # Compressed blocks are only spliced into caches of the same format.
+            tenant = (
+                f"{tenant or ''}\0kv:{self.kv_quant_scheme}:{kv_bits}"
+                f":{self.kv_group_size}"
+            )
+        image_hashes = prompt_kwargs.get("_apc_image_hashes")
+        if token_ids is not None and image_hashes:
+            salts = _apc.image_block_salts(
+                token_ids,
+                self.apc_manager.block_size,
+                self._apc_image_token_ids(),
+                image_hashes,
+                salt=_apc.tenant_scoped_hash(tenant, 0),
+            )
+            if salts is not None:
+                return salts
         return _apc.tenant_scoped_hash(tenant, img)
 
+    def _apc_rope_index(
+        self, ids_list: Sequence[int], prompt_kwargs: dict
+    ) -> Optional[Tuple[mx.array, mx.array]]:
+        """Full-prompt mRoPE ``(position_ids, rope_deltas)`` for one row.
+
+        Returns ``None`` for models without positional state on the language
+        model (plain RoPE resumes from the cache offset) and raises if the
+        model's ``get_rope_index`` cannot handle the row.
+        """
+        lm = self.model
+        get_rope_index = getattr(lm, "get_rope_index", None)
+        if not callable(get_rope_index):
+            return None
+        if not (hasattr(lm, "_rope_deltas") or hasattr(lm, "_position_ids")):
+            return None
+        prompt_kwargs = prompt_kwargs or {}
+        position_ids, rope_deltas = get_rope_index(
+            mx.array([list(ids_list)]),
+            prompt_kwargs.get("image_grid_thw", None),
+            prompt_kwargs.get("video_grid_thw", None),
+            None,
+        )
+        return position_ids, mx.array(rope_deltas).reshape(1, 1)
+
+    def _apc_prefix_reusable(
+        self, ids_list: Sequence[int], prefix_len: int, prompt_kwargs: dict
+    ) -> bool:
+        """Whether a cached ``prefix_len``-token prefix may be reused.
+
+        Image-bearing prefixes are reused only when the request carries an
+        image identity (so the salt pins the blocks to those pixels) and, on
+        mRoPE models, when the full-prompt positions can be recomputed for
+        the suffix.
+        """
+        image_ids = set(self._apc_image_token_ids())
+        if not any(t in image_ids for t in ids_list[:prefix_len]):
+            return True
+        prompt_kwargs = prompt_kwargs or {}
+        if not any(
+            prompt_kwargs.get(k) is not None
+            for k in ("_apc_image_hash", "_apc_image_hashes", "pixel_values")
+        ):
+            return False
+        try:
+            self._apc_rope_index(ids_list, prompt_kwargs)
+        except Exception as e:
+            logger.warning(
+                "Could not restore mRoPE state for an image prefix; "
+                "falling back to cold prefill: %s",
+                e,
+            )
+            return False
+        return True
+
     def _apc_pick_for(self, sequence) -> Optional[dict]:
         """Look up an APC prefix for ``sequence``. Returns dict with matched
         blocks + suffix metadata when there is a usable hit, else None.
         """
         if self.apc_manager is None:
             return None
-        uid, ids_list, max_toks, prompt_kwargs, lps = sequence
+        uid, ids_list, max_toks, prompt_kwargs = sequence[:4]
         if not ids_list or len(ids_list) < 2:
             return None
-        # v1/v2: don't trim a prefix that contains image tokens — re-running
-        # vision merging on the suffix is the cheap path here.
-        image_token_id = getattr(self.model.config, "image_token_id", None) or getattr(
-            self.model.config, "image_token_index", None
-        )
-        extra_hash = self._apc_extra_hash(prompt_kwargs or {})
+        extra_hash = self._apc_extra_hash(prompt_kwargs or {}, ids_list)
         apc_mode = getattr(self, "apc_mode", "block")
         if apc_mode == "exact":
             exact_cache, exact_prefix_len = self.apc_manager.lookup_exact_cache(
@@ -2470,9 +2690,8 @@ class BatchGenerator:
                 and exact_prefix_len > 0
                 and exact_prefix_len < len(ids_list)
             ):
-                if (
-                    image_token_id is not None
-                    and image_token_id in ids_list[:exact_prefix_len]
+                if not self._apc_prefix_reusable(
+                    ids_list, exact_prefix_len, prompt_kwargs
                 ):
                     return None
                 return {
@@ -2508,10 +2727,7 @@ class BatchGenerator:
         ) and disk_prefix_len < len(ids_list):
             if matched:
                 self.apc_manager.release(matched)
-            if (
-                image_token_id is not None
-                and image_token_id in ids_list[:disk_prefix_len]
-            ):
+            if not self._apc_prefix_reusable(ids_list, disk_prefix_len, prompt_kwargs):
                 return None
             return {
                 "matched_blocks": [],
@@ -2523,10 +2739,7 @@ class BatchGenerator:
         if exact_prefix_len > prefix_len and exact_prefix_len < len(ids_list):
             if matched:
                 self.apc_manager.release(matched)
-            if (
-                image_token_id is not None
-                and image_token_id in ids_list[:exact_prefix_len]
-            ):
+            if not self._apc_prefix_reusable(ids_list, exact_prefix_len, prompt_kwargs):
                 return None
             return {
                 "matched_blocks": [],
@@ -2536,7 +2749,7 @@ class BatchGenerator:
                 "full_input_ids": list(ids_list),
             }
         if prefix_len > 0 and prefix_len < len(ids_list):
-            if image_token_id is not None and image_token_id in ids_list[:prefix_len]:
+            if not self._apc_prefix_reusable(ids_list, prefix_len, prompt_kwargs):
                 self.apc_manager.release(matched)
                 return None
             return {
@@ -2575,6 +2788,7 @@ class BatchGenerator:
         max_tokens_list = [s[2] for s in sequences]
         prompt_kwargs_list = [s[3] for s in sequences]
         logits_processors = [s[4] for s in sequences]
+        sampling_params = [_sequence_sampling_params(s) for s in sequences]
 
         # Per-row prefix length and suffix tokens
         prefix_lens = [p["prefix_len"] if p else 0 for p in picks]
@@ -2633,6 +2847,63 @@ class BatchGenerator:
         for k, vs in per_row_keys.items():
             merged_kwargs[k] = mx.concatenate(vs, axis=0)
 
+        image_ids = set(self._apc_image_token_ids())
+        deepstack = [
+            (kw or {}).get("deepstack_visual_embeds") for kw in prompt_kwargs_list
+        ]
+        if any(d is not None for d in deepstack):
+            # Deepstack features are consumed in row order, one per visual
+            # token; drop those that belong to a row's cached prefix.
+            layers: List[List[mx.array]] = []
+            for i, rows in enumerate(deepstack):
+                if rows is None:
+                    continue
+                skip = sum(1 for t in full_ids[i][: prefix_lens[i]] if t in image_ids)
+                for layer_idx, feats in enumerate(rows):
+                    if layer_idx == len(layers):
+                        layers.append([])
+                    layers[layer_idx].append(feats[skip:])
+            merged_kwargs["deepstack_visual_embeds"] = [
+                mx.concatenate(feats, axis=0) for feats in layers
+            ]
+
+        # mRoPE models resume from the full prompt's positions: rebuild them
+        # per row instead of trusting whatever request last set the language
+        # model's ``_position_ids`` / ``_rope_deltas``.
+        rope_deltas = None
+        try:
+            rope_rows = [
+                self._apc_rope_index(full_ids[i], prompt_kwargs_list[i])
+                for i in range(len(sequences))
+            ]
+        except Exception as e:
+            rope_rows = None
+            if any(
+                any(t in image_ids for t in full_ids[i][: prefix_lens[i]])
+                for i in range(len(sequences))
+            ):
+                logger.warning(
+                    "Could not restore mRoPE state for a mixed APC batch; "
+                    "falling back to cold prefill: %s",
+                    e,
+                )
+                for p in picks:
+                    if p is not None:
+                        self.apc_manager.release(p.get("matched_blocks", []))
+                return None
+        if rope_rows is not None and all(r is not None for r in rope_rows):
+            positions = []
+            for i, (position_ids, _) in enumerate(rope_rows):
+                suffix = position_ids[:, :, prefix_lens[i] :]
+                pad = right_pad_per_row[i]
+                if pad > 0:
+                    suffix = mx.concatenate(
+                        [suffix, mx.zeros((3, 1, pad), dtype=suffix.dtype)], axis=2
+                    )
+                positions.append(suffix)
+            merged_kwargs["position_ids"] = mx.concatenate(positions, axis=1)
+            rope_deltas = mx.concatenate([d for _, d in rope_rows], axis=0)
+
         apc_mode = getattr(self, "apc_mode", "block")
         if apc_mode == "exact":
             row_caches = [
@@ -2652,8 +2923,17 @@ class BatchGenerator:
                 if hasattr(self.model, "make_cache")
                 else len(self.model.layers)
             )
+            template = None
+            if self.kv_bits is not None:
+                template = _make_cache(
+                    self.model,
+                    [0] * len(picks),
+                    kv_bits=self.kv_bits,
+                    kv_group_size=self.kv_group_size,
+                    kv_quant_scheme=self.kv_quant_scheme,
+                )
             warm_cache, _ = _apc.make_warm_batch_kv_cache_multi(
-                picks, num_layers=num_layers
+                picks, num_layers=num_layers, caches=template
             )
 
         apc_meta = [
@@ -2663,7 +2943,7 @@ class BatchGenerator:
                 "extra_hash": (
                     picks[i]["extra_hash"]
                     if picks[i]
-                    else self._apc_extra_hash(prompt_kwargs_list[i] or {})
+                    else self._apc_extra_hash(prompt_kwargs_list[i] or {}, full_ids[i])
                 ),
                 "apc_blocks": picks[i].get("matched_blocks", []) if picks[i] else [],
                 "checkpoint_len": (
@@ -2696,6 +2976,8 @@ class BatchGenerator:
             right_pad_per_row=right_pad_per_row,
             suffix_lens=suffix_lens,
             apc_mode=apc_mode,
+            sampling_params=sampling_params,
+            rope_deltas=rope_deltas,
         )
 
     def _build_apc_meta_for_cold(
@@ -2710,7 +2992,7 @@ class BatchGenerator:
             return None
         meta: List[Optional[dict]] = []
         for ids_list, kw in zip(input_ids_list, prompt_kwargs_list):
-            extra_hash = self._apc_extra_hash(kw or {})
+            extra_hash = self._apc_extra_hash(kw or {}, ids_list)
             meta.append(
                 {
                     "full_input_ids": list(ids_list),
@@ -2749,7 +3031,17 @@ class BatchGenerator:
         logits_processors: Optional[
             List[Optional[List[Callable[[mx.array, mx.array], mx.array]]]]
         ] = None,
+        sampling_params: Optional[List[Optional[SamplingParams]]] = None,
+        adapters: Optional[List[Optional[str]]] = None,
     ):
+        """Queue ``prompts`` for prefill and return their uids.
+
+        ``sampling_params`` optionally gives each prompt its own
+        :class:`SamplingParams`; prompts without one use the generator's
+        ``sampler``. Rows with different settings still share decode steps.
+        ``adapters`` names a LoRA adapter from ``adapter_set`` per prompt
+        (``None`` decodes with the base weights).
+        """
         uids = []
 
         if max_tokens is None or isinstance(max_tokens, int):
@@ -2761,9 +3053,32 @@ class BatchGenerator:
             logits_processors = [self.logits_processors] * len(prompts)
         elif len(logits_processors) != len(prompts):
             raise ValueError("Insufficient number of logits_processors provided")
-
-        for p, m, kw, lp in zip(prompts, max_tokens, prompt_kwargs, logits_processors):
-            self._unprocessed_sequences.append((self.uid_count, p, m, kw, lp))
+        if sampling_params is None:
+            sampling_params = [None] * len(prompts)
+        elif len(sampling_params) != len(prompts):
+            raise ValueError("Insufficient number of sampling_params provided")
+        if adapters is None:
+            adapters = [None] * len(prompts)
+        elif len(adapters) != len(prompts):
+            raise ValueError("Insufficient number of adapters provided")
+        for adapter in adapters:
+            if adapter is not None and (
+                self.adapter_set is None or adapter not in self.adapter_set
+            ):
+                raise ValueError(f"LoRA adapter {adapter!r} is not loaded")
+
+        for p, m, kw, lp, sp, adapter in zip(
+            prompts,
+            max_tokens,
+            prompt_kwargs,
+            logits_processors,
+            sampling_params,
+            adapters,
+        ):
+            if adapter is not None:
+                kw = {**(kw or {}), "_apc_adapter": adapter}
+                self._row_adapters[self.uid_count] = adapter
+            self._unprocessed_sequences.append((self.uid_count, p, m, kw, lp, sp))
             uids.append(self.uid_count)
             self.uid_count += 1
         # Sort in ascending order of length
@@ -2772,12 +3087,25 @@ class BatchGenerator:
         )
         return uids
 
+    def _route_adapters(self, batch):
+        """Point the LoRA layers at the adapters of ``batch``'s rows."""
+        if self.adapter_set is not None:
+            self.adapter_set.select([self._row_adapters.get(uid) for uid in batch.uids])
+
+    def active_adapters(self) -> set:
+        """Adapters referenced by queued, prefilling or decoding rows."""
+        if self.adapter_set is None:
+            return set()
+        return set(self._row_adapters.values())
+
     def remove(self, uid) -> bool:
         """Remove a sequence from the batch by uid."""
+        if self.adapter_set is not None:
+            self._row_adapters.pop(uid, None)
         with mx.stream(self._stream):
             # Waiting in the queue.
-            for i, (seq_uid, _, _, _, _) in enumerate(self._unprocessed_sequences):
-                if seq_uid == uid:
+            for i, sequence in enumerate(self._unprocessed_sequences):
+                if sequence[0] == uid:
                     self._unprocessed_sequences.pop(i)
                     return True
 
@@ -2851,7 +3179,12 @@ class BatchGenerator:
 
         # Decode-first: always emit a generation step before touching prefill.
         if len(self._generation_batch) > 0:
+            self._route_adapters(self._generation_batch)
             generation_responses = self._generation_batch.next()
+            if self.adapter_set is not None:
+                for r in generation_responses:
+                    if r.finish_reason is not None:
+                        self._row_adapters.pop(r.uid, None)
             self._gen_tokens_counter += len(generation_responses)
             self._steps_counter += 1
             if self._steps_counter % 512 == 0:
@@ -2863,6 +3196,7 @@ class BatchGenerator:
         if self._prompt_batch is not None:
             if self._prompt_batch.needs_processing():
                 tic = time.perf_counter()
+                self._route_adapters(self._prompt_batch)
                 n = self._prompt_batch.prompt_step()
                 elapsed = time.perf_counter() - tic
                 self._prompt_time_counter += elapsed
@@ -2871,6 +3205,8 @@ class BatchGenerator:
                 return prompt_responses, generation_responses
 
             tic = time.perf_counter()
+
+            self._route_adapters(self._prompt_batch)
             gen_batch = self._prompt_batch.generate(
                 self.sampler,
                 self.tokenizer.stopping_criteria,
@@ -2908,12 +3244,14 @@ class BatchGenerator:
                 self._prompt_tokens_counter += self._prompt_batch.total_prompt_tokens
                 if self._prompt_batch.needs_processing():
                     tic = time.perf_counter()
+                    self._route_adapters(self._prompt_batch)
                     nstep = self._prompt_batch.prompt_step()
                     elapsed = time.perf_counter() - tic
                     self._prompt_time_counter += elapsed
                     self._record_prompt_batch_time(self._prompt_batch, elapsed)
                 else:
                     tic = time.perf_counter()
+                    self._route_adapters(self._prompt_batch)
                     gen_batch = self._prompt_batch.generate(
                         self.sampler,
                         self.tokenizer.stopping_criteria,
@@ -2936,6 +3274,7 @@ class BatchGenerator:
             max_tokens_list = [s[2] for s in sequences]
             prompt_kwargs_list = [s[3] for s in sequences]
             logits_processors = [s[4] for s in sequences]
+            sampling_params = [_sequence_sampling_params(s) for s in sequences]
 
             inputs_embeds, merged_kwargs = _merge_prefill_prompt_kwargs(
                 prompt_kwargs_list, input_ids
@@ -2959,17 +3298,20 @@ class BatchGenerator:
                 apc_meta=apc_meta,
                 apc_manager=self.apc_manager,
                 apc_mode=self.apc_mode,
+                sampling_params=sampling_params,
             )
             self._prompt_tokens_counter += self._prompt_batch.total_prompt_tokens
 
             if self._prompt_batch.needs_processing():
                 tic = time.perf_counter()
+                self._route_adapters(self._prompt_batch)
                 n = self._prompt_batch.prompt_step()
                 elapsed = time.perf_counter() - tic
                 self._prompt_time_counter += elapsed
                 self._record_prompt_batch_time(self._prompt_batch, elapsed)
             else:
                 tic = time.perf_counter()
+                self._route_adapters(self._prompt_batch)
                 gen_batch = self._prompt_batch.generate(
                     self.sampler,
                     self.tokenizer.stopping_criteria,
@@ -3003,6 +3345,7 @@ def batch_generate(
     verbose: bool = False,
     group_by_shape: bool = True,
     track_image_sizes: bool = True,
+    vision_batch_size: int = DEFAULT_VISION_BATCH_SIZE,
     **kwargs,
 ):
     """
@@ -3018,6 +3361,12 @@ def batch_generate(
     (which wastes computation and may hurt accuracy), we group same-sized
     images together so there's zero padding within each group.
 
+    For models that implement ``encode_packed_images`` (Qwen2.5-VL, Qwen3-VL,
+    Gemma 3, Idefics3), the vision tower is not run per group: the images of
+    consecutive groups are packed into one vision forward of up to
+    ``vision_batch_size`` images, and each group reuses its slice of the
+    features.
+
     Args:
        model (nn.Module): The language model.
        processor (PreTrainedTokenizer): The tokenizer/processor.
@@ -3030,6 +3379,8 @@ def batch_generate(
        group_by_shape (bool): If ``True``, group same-shaped images for efficient
           batch processing.
        track_image_sizes (bool): If ``True``, track and return original image sizes.
+       vision_batch_size (int): Maximum number of images per packed vision
+          forward across shape groups. ``0`` encodes each group separately.
        kwargs: The remaining options get passed to :obj:`BatchGenerator`.
           See :obj:`BatchGenerator` for more details.
 
@@ -3096,48 +3447,78 @@ def batch_generate(
     all_image_sizes = [None] * len(prompts)
     total_stats = BatchStats()
 
-    for shape, indices in grouped_indices.items():
-        # Get images and prompts for this shape group
-        group_images = [processed_images[i] for i in indices]
-        group_prompts = [prompts[i] for i in indices]
-        group_sizes = [image_sizes_original[i] for i in indices]
-
-        # Handle per-sample max_tokens
-        if isinstance(max_tokens, list):
-            group_max_tokens = [max_tokens[i] for i in indices]
+    pack_vision = (
+        vision_batch_size > 0
+        and len(grouped_indices) > 1
+        and hasattr(model, "encode_packed_images")
+    )
+    resize_shape = normalize_resize_shape(kwargs.get("resize_shape"))
+    for window in _vision_pack_windows(
+        list(grouped_indices.values()), vision_batch_size if pack_vision else 0
+    ):
+        if pack_vision:
+            window_inputs = [
+                _prepare_batch_inputs(
+                    model,
+                    processor,
+                    [prompts[i] for i in indices],
+                    [processed_images[i] for i in indices],
+                    resize_shape,
+                )
+                for indices in window
+            ]
+            window_features = model.encode_packed_images(window_inputs)
+            mx.eval(window_features)
         else:
-            group_max_tokens = max_tokens
+            window_inputs = window_features = [None] * len(window)
 
-        group_kwargs = dict(kwargs)
-        logits_processors = group_kwargs.get("logits_processors")
-        if logits_processors is not None and isinstance(logits_processors, list):
-            if not logits_processors or all(callable(p) for p in logits_processors):
-                group_kwargs["logits_processors"] = logits_processors
+        for indices, group_inputs, group_features in zip(
+            window, window_inputs, window_features
+        ):
+            # Get images and prompts for this shape group
+            group_images = [processed_images[i] for i in indices]
+            group_prompts = [prompts[i] for i in indices]
+            group_sizes = [image_sizes_original[i] for i in indices]
+
+            # Handle per-sample max_tokens
+            if isinstance(max_tokens, list):
+                group_max_tokens = [max_tokens[i] for i in indices]
             else:
-                group_kwargs["logits_processors"] = [
-                    logits_processors[i] for i in indices
-                ]
+                group_max_tokens = max_tokens
 
-        # Process the entire group at once (same shape = no padding needed)
-        chunk_texts, chunk_stats = _generate_batch(
-            model,
-            processor,
-            group_prompts,
-            group_images,
-            group_max_tokens,
-            **group_kwargs,
-        )
+            group_kwargs = dict(kwargs)
+            logits_processors = group_kwargs.get("logits_processors")
+            if logits_processors is not None and isinstance(logits_processors, list):
+                if not logits_processors or all(callable(p) for p in logits_processors):
+                    group_kwargs["logits_processors"] = logits_processors
+                else:
+                    group_kwargs["logits_processors"] = [
+                        logits_processors[i] for i in indices
+                    ]
+
+            # Process the entire group at once (same shape = no padding needed)
+            chunk_texts, chunk_stats = _generate_batch(
+                model,
+                processor,
+                group_prompts,
+                group_images,
+                group_max_tokens,
+                inputs=group_inputs,
+                cached_image_features=group_features,
+                **group_kwargs,
+            )
 
-        # Store results in original order
-        for j, orig_idx in enumerate(indices):
-            all_texts[orig_idx] = chunk_texts[j]
-            all_image_sizes[orig_idx] = group_sizes[j]
+            # Store results in original order
+            for j, orig_idx in enumerate(indices):
+                all_texts[orig_idx] = chunk_texts[j]
+                all_image_sizes[orig_idx] = group_sizes[j]
 
-        # Accumulate stats
-        total_stats.prompt_tokens += chunk_stats.prompt_tokens
-        total_stats.prompt_time += chunk_stats.prompt_time
-        total_stats.generation_tokens += chunk_stats.generation_tokens
-        total_stats.generation_time += chunk_stats.generation_time
+            # Accumulate stats
+            total_stats.prompt_tokens += chunk_stats.prompt_tokens
+            total_stats.prompt_time += chunk_stats.prompt_time
+            total_stats.generation_tokens += chunk_stats.generation_tokens
+            total_stats.generation_time += chunk_stats.generation_time
+        del window_inputs, window_features
 
     mx.clear_cache()
 
@@ -3180,20 +3561,31 @@ def _clone_or_share_logits_processor(processor):
     return processor
 
 
-def _generate_batch(
+def _vision_pack_windows(groups: List[List[int]], max_images: int):
+    """Yield runs of shape groups holding at most ``max_images`` images.
+
+    A group larger than ``max_images`` forms its own window; ``max_images``
+    of ``0`` yields every group on its own.
+    """
+    window, count = [], 0
+    for indices in groups:
+        if window and count + len(indices) > max_images:
+            yield window
+            window, count = [], 0
+        window.append(indices)
+        count += len(indices)
+    if window:
+        yield window
+
+
+def _prepare_batch_inputs(
     model,
     processor,
     prompts: List[str],
     images: List = None,
-    max_tokens: Union[int, List[int]] = 100,
-    verbose: bool = False,
-    **kwargs,
-) -> Tuple[List[str], BatchStats]:
-
-    tokenizer = processor.tokenizer if hasattr(processor, "tokenizer") else processor
-    batch_size = len(prompts)
-    logits_processors = kwargs.pop("logits_processors", None)
-
+    resize_shape=None,
+) -> dict:
+    """Template and preprocess one shape group for ``_generate_batch``."""
     num_images_list = [
         1 if i < (len(images) if images is not None else 0) else 0
         for i in range(len(prompts))
@@ -3214,10 +3606,9 @@ def _generate_batch(
         else True
     )
 
-    resize_shape = normalize_resize_shape(kwargs.pop("resize_shape", None))
     image_token_index = getattr(model.config, "image_token_index", None)
 
-    inputs = prepare_inputs(
+    return prepare_inputs(
         processor,
         images=images,
         audio=None,
@@ -3227,6 +3618,27 @@ def _generate_batch(
         add_special_tokens=add_special_tokens,
         pad_to_uniform_size=False,  # Since images are pre-grouped by shape, they're already uniform size
     )
+
+
+def _generate_batch(
+    model,
+    processor,
+    prompts: List[str],
+    images: List = None,
+    max_tokens: Union[int, List[int]] = 100,
+    verbose: bool = False,
+    inputs: Optional[dict] = None,
+    cached_image_features=None,
+    **kwargs,
+) -> Tuple[List[str], BatchStats]:
+
+    tokenizer = processor.tokenizer if hasattr(processor, "tokenizer") else processor
+    batch_size = len(prompts)
+    logits_processors = kwargs.pop("logits_processors", None)
+
+    resize_shape = normalize_resize_shape(kwargs.pop("resize_shape", None))
+    if inputs is None:
+        inputs = _prepare_batch_inputs(model, processor, prompts, images, resize_shape)
     input_ids = inputs.get("input_ids", None)
     pixel_values = inputs.get("pixel_values", None)
     mask = inputs.get("attention_mask", None)
@@ -3251,8 +3663,12 @@ def _generate_batch(
         **kwargs,
     )
 
+    embed_kwargs = dict(data_kwargs)
+    if cached_image_features is not None:
+        # Features from a packed vision forward over several shape groups.
+        embed_kwargs["cached_image_features"] = cached_image_features
     embedding_output = model.get_input_embeddings(
-        input_ids, pixel_values, mask=mask, **data_kwargs
+        input_ids, pixel_values, mask=mask, **embed_kwargs
     )
 
     gen_kwargs = {**data_kwargs, **embedding_output.to_dict()}
@@ -3318,7 +3734,16 @@ def main():
     config = model.config
 
     draft_model = None
-    if args.draft_model is not None:
+    if args.draft_kind == "ngram":
+        from .speculative.ngram import NGramDrafter
+
+        if args.draft_model is not None:
+            raise ValueError(
+                "--draft-kind ngram drafts from the prompt; drop --draft-model."
+            )
+        print("Using prompt-lookup (n-gram) speculative decoding.")
+        draft_model = NGramDrafter()
+    elif args.draft_model is not None:
         from .speculative.drafters import load_drafter
 
         print(f"Loading drafter ({args.draft_kind or 'auto'}): {args.draft_model}")
@@ -3333,6 +3758,10 @@ def main():
                 f"using {resolved_kind!r} instead of {args.draft_kind!r}."
             )
         args.draft_kind = resolved_kind
+    if args.draft_tree_budget is not None:
+        if draft_model is None or args.draft_kind != "dflash":
+            raise ValueError("--draft-tree-budget requires a DFlash drafter.")
+        draft_model.config.tree_budget = args.draft_tree_budget
 
     prompt = args.prompt
 
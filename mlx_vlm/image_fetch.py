@@ -0,0 +1,510 @@
+"""Pooled, cached image downloads for URL image inputs.
+
+Remote images are fetched through one shared ``requests.Session`` so
+connections to the same host are reused. Several images from one request
+download concurrently, and ``fetch_many_async`` lets asyncio callers (the
+server endpoints) wait for them without blocking the event loop.
+
+Downloads are cached at two levels:
+
+- **Memory**: decoded RGB images keyed by the SHA-256 of the response body,
+  bounded by ``max_memory_bytes`` of pixel data with LRU eviction.
+- **Disk** (optional): raw response bodies stored as ``<sha256>.img`` under
+  ``cache_dir``. A small per-URL ``<sha256>.url`` index file records the
+  content hash and ETag so a restarted process still skips the network for
+  URLs it has seen. Bodies and index files share the ``max_disk_bytes``
+  budget and are evicted together, least recently used first.
+
+A URL seen before is served from the cache without a request until it is
+stale: past the response's ``Cache-Control: max-age`` (or ``Expires``) when
+the server sent one, otherwise past ``max_age`` seconds. Stale entries are
+revalidated with ``If-None-Match``, and a ``304`` response reuses the cached
+body. Different URLs serving identical bytes share one decoded image. At most
+``max_urls`` URL entries are kept in memory.
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import requests
+from PIL import Image, ImageOps
+
+DEFAULT_IMAGE_FETCH_WORKERS = 8
+DEFAULT_IMAGE_CACHE_MEMORY_BYTES = 512 * 1024 * 1024
+DEFAULT_IMAGE_CACHE_DISK_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_IMAGE_CACHE_MAX_AGE = 24 * 60 * 60
+DEFAULT_IMAGE_CACHE_URLS = 4096
+
+
+def is_remote_image(source) -> bool:
+    return isinstance(source, str) and source.startswith(("http://", "https://"))
+
+
+def decode_image(data: bytes) -> Image.Image:
+    image = Image.open(BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    return image.convert("RGB")
+
+
+def response_max_age(headers) -> Optional[float]:
+    """Freshness lifetime in seconds from ``Cache-Control`` or ``Expires``.
+
+    ``no-cache``/``no-store`` give ``0``; ``None`` means the response did not
+    say and the fetcher's own ``max_age`` applies.
+    """
+    cache_control = headers.get("Cache-Control") or ""
+    for directive in cache_control.lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        if name in ("no-cache", "no-store"):
+            return 0.0
+        if name == "max-age":
+            try:
+                return max(0.0, float(value.strip('"')))
+            except ValueError:
+                return 0.0
+    expires = headers.get("Expires")
+    if expires is None:
+        return None
+    try:
+        expires_at = email.utils.parsedate_to_datetime(expires).timestamp()
+    except (TypeError, ValueError):
+        # An invalid Expires means already expired (RFC 9111, 5.3).
+        return 0.0
+    date = headers.get("Date")
+    try:
+        now = email.utils.parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        now = time.time()
+    return max(0.0, expires_at - now)
+
+
+@dataclass
+class _UrlEntry:
+    digest: str
+    etag: Optional[str]
+    fetched_at: float
+    max_age: Optional[float] = None
+
+
+class ImageFetcher:
+    """Fetch and cache remote images over a pooled HTTP session.
+
+    Args:
+        cache_dir: Directory for the on-disk tier. ``None`` keeps the cache in
+            memory only.
+        max_memory_bytes: Budget for decoded images held in memory.
+        max_disk_bytes: Budget for raw bodies and URL index files stored
+            under ``cache_dir``.
+        max_workers: Concurrent downloads, also the connection pool size.
+        max_age: Seconds before a cached URL is revalidated with its ETag when
+            the response carried no ``Cache-Control``/``Expires``. ``None``
+            never revalidates such URLs.
+        max_urls: URL entries kept in memory, least recently used evicted.
+        session: Optional pre-configured ``requests.Session``.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_memory_bytes: int = DEFAULT_IMAGE_CACHE_MEMORY_BYTES,
+        max_disk_bytes: int = DEFAULT_IMAGE_CACHE_DISK_BYTES,
+        max_workers: int = DEFAULT_IMAGE_FETCH_WORKERS,
+        max_age: Optional[float] = DEFAULT_IMAGE_CACHE_MAX_AGE,
+        max_urls: int = DEFAULT_IMAGE_CACHE_URLS,
+        session: Optional[requests.Session] = None,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        self.max_urls = max(1, max_urls)
+        self.max_workers = max(1, max_workers)
+
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.max_workers, pool_maxsize=self.max_workers
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self._lock = threading.Lock()
+        self._urls: "OrderedDict[str, _UrlEntry]" = OrderedDict()
+        self._images: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._memory_bytes = 0
+        self._inflight: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # file name -> size for bodies and URL indexes, least recently used
+        # first; scanned once here.
+        self._disk_files: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._scan_disk()
+
+    # -- public API --
+
+    def fetch(self, url: str, timeout: float = 10) -> Image.Image:
+        """Return the decoded RGB image at ``url``.
+
+        Concurrent calls for the same URL share one download.
+        """
+        with self._lock:
+            future = self._inflight.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[url] = future
+        if not owner:
+            return future.result().copy()
+
+        try:
+            image = self._fetch_uncached(url, timeout)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(image)
+            return image.copy()
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def known_digest(self, url: str) -> Optional[str]:
+        """SHA-256 of the last body fetched from ``url``, without a request."""
+        entry = self._lookup_url(url)
+        return entry.digest if entry is not None else None
+
+    def fetch_many(self, urls: List[str], timeout: float = 10) -> List[Image.Image]:
+        """Fetch ``urls`` concurrently, preserving order."""
+        if len(urls) <= 1:
+            return [self.fetch(url, timeout) for url in urls]
+        executor = self._get_executor()
+        futures = [executor.submit(self.fetch, url, timeout) for url in urls]
+        return [future.result() for future in futures]
+
+    async def fetch_many_async(
+        self, urls: List[str], timeout: float = 10
+    ) -> List[Image.Image]:
+        """Asyncio variant of ``fetch_many`` for use on an event loop."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        return await asyncio.gather(
+            *(loop.run_in_executor(executor, self.fetch, url, timeout) for url in urls)
+        )
+
+    def clear(self) -> None:
+        """Drop the in-memory tier. Disk entries are kept."""
+        with self._lock:
+            self._urls.clear()
+            self._images.clear()
+            self._memory_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "images": len(self._images),
+                "urls": len(self._urls),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.session.close()
+
+    # -- internals --
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="mlx-vlm-fetch"
+                )
+            return self._executor
+
+    def _fetch_uncached(self, url: str, timeout: float) -> Image.Image:
+        entry = self._lookup_url(url)
+        if entry is not None and not self._is_stale(entry):
+            image = self._load_digest(entry.digest)
+            if image is not None:
+                with self._lock:
+                    self.hits += 1
+                return image
+
+        headers = {}
+        if entry is not None and entry.etag and self._has_digest(entry.digest):
+            headers["If-None-Match"] = entry.etag
+
+        with self.session.get(url, timeout=timeout, headers=headers) as response:
+            max_age = response_max_age(response.headers)
+            if response.status_code == 304 and headers:
+                with self._lock:
+                    self.revalidations += 1
+                self._record_url(url, entry.digest, entry.etag, max_age)
+                image = self._load_digest(entry.digest)
+                if image is not None:
+                    return image
+                return self._fetch_uncached(url, timeout)
+            response.raise_for_status()
+            data = response.content
+            etag = response.headers.get("ETag")
+
+        with self._lock:
+            self.misses += 1
+        digest = hashlib.sha256(data).hexdigest()
+        image = self._load_digest(digest)
+        if image is None:
+            image = decode_image(data)
+            self._store_image(digest, image)
+        self._store_bytes(digest, data)
+        self._record_url(url, digest, etag, max_age)
+        return image
+
+    def _is_stale(self, entry: _UrlEntry) -> bool:
+        max_age = entry.max_age if entry.max_age is not None else self.max_age
+        return max_age is not None and time.time() - entry.fetched_at > max_age
+
+    def _lookup_url(self, url: str) -> Optional[_UrlEntry]:
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is not None:
+                self._urls.move_to_end(url)
+        if entry is not None or self.cache_dir is None:
+            return entry
+        index_path = self._index_path(url)
+        try:
+            record = json.loads(index_path.read_text())
+            entry = _UrlEntry(
+                record["digest"],
+                record.get("etag"),
+                record["fetched_at"],
+                record.get("max_age"),
+            )
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember_url(url, entry)
+        with self._lock:
+            if index_path.name in self._disk_files:
+                self._disk_files.move_to_end(index_path.name)
+        return entry
+
+    def _remember_url(self, url: str, entry: _UrlEntry) -> None:
+        with self._lock:
+            self._urls[url] = entry
+            self._urls.move_to_end(url)
+            while len(self._urls) > self.max_urls:
+                self._urls.popitem(last=False)
+
+    def _record_url(
+        self, url: str, digest: str, etag: Optional[str], max_age: Optional[float]
+    ) -> None:
+        entry = _UrlEntry(digest, etag, time.time(), max_age)
+        self._remember_url(url, entry)
+        if self.cache_dir is None:
+            return
+        index_path = self._index_path(url)
+        payload = json.dumps(
+            {
+                "digest": digest,
+                "etag": etag,
+                "fetched_at": entry.fetched_at,
+                "max_age": max_age,
+            }
+        )
+        try:
+            index_path.write_text(payload)
+        except OSError:
+            return
+        self._track_disk_file(index_path.name, len(payload.encode()))
+
+    def _load_digest(self, digest: str) -> Optional[Image.Image]:
+        with self._lock:
+            image = self._images.get(digest)
+            if image is not None:
+                self._images.move_to_end(digest)
+                return image
+        if self.cache_dir is None:
+            return None
+        blob = self._blob_path(digest)
+        try:
+            data = blob.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(blob)
+        except OSError:
+            pass
+        with self._lock:
+            if blob.name in self._disk_files:
+                self._disk_files.move_to_end(blob.name)
+        image = decode_image(data)
+        self._store_image(digest, image)
+        return image
+
+    def _has_digest(self, digest: str) -> bool:
+        with self._lock:
+            if digest in self._images:
+                return True
+        return self.cache_dir is not None and self._blob_path(digest).exists()
+
+    def _store_image(self, digest: str, image: Image.Image) -> None:
+        nbytes = image.width * image.height * len(image.getbands())
+        if nbytes > self.max_memory_bytes:
+            return
+        with self._lock:
+            if digest in self._images:
+                self._images.move_to_end(digest)
+                return
+            self._images[digest] = image
+            self._memory_bytes += nbytes
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._memory_bytes -= (
+                    evicted.width * evicted.height * len(evicted.getbands())
+                )
+
+    def _store_bytes(self, digest: str, data: bytes) -> None:
+        if self.cache_dir is None or len(data) > self.max_disk_bytes:
+            return
+        blob = self._blob_path(digest)
+        if blob.exists():
+            with self._lock:
+                if blob.name in self._disk_files:
+                    self._disk_files.move_to_end(blob.name)
+            return
+        tmp = blob.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, blob)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        self._track_disk_file(blob.name, len(data))
+
+    def _track_disk_file(self, name: str, size: int) -> None:
+        with self._lock:
+            self._disk_bytes += size - self._disk_files.get(name, 0)
+            self._disk_files[name] = size
+            self._disk_files.move_to_end(name)
+            evicted = self._evict_disk_locked()
+        for path in evicted:
+            path.unlink(missing_ok=True)
+
+    def _scan_disk(self) -> None:
+        files = []
+        for pattern in ("*.img", "*.url"):
+            for path in self.cache_dir.glob(pattern):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path.name))
+        with self._lock:
+            for _, size, name in sorted(files):
+                self._disk_files[name] = size
+                self._disk_bytes += size
+            evicted = self._evict_disk_locked()
+        for path in evicted:
+            path.unlink(missing_ok=True)
+
+    def _evict_disk_locked(self) -> List[Path]:
+        """Drop LRU files from the index until under budget; return their paths."""
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes and self._disk_files:
+            name, size = self._disk_files.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(self.cache_dir / name)
+        return evicted
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.cache_dir / f"{digest}.img"
+
+    def _index_path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.url"
+
+
+_default_fetcher: Optional[ImageFetcher] = None
+_default_fetcher_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_image_fetcher() -> ImageFetcher:
+    """Process-wide fetcher used by ``load_image`` and the server.
+
+    Configured from ``MLX_VLM_IMAGE_CACHE_DIR``, ``MLX_VLM_IMAGE_CACHE_BYTES``,
+    ``MLX_VLM_IMAGE_CACHE_DISK_BYTES``, ``MLX_VLM_IMAGE_CACHE_MAX_AGE`` and
+    ``MLX_VLM_IMAGE_FETCH_WORKERS``.
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = ImageFetcher(
+                cache_dir=os.environ.get("MLX_VLM_IMAGE_CACHE_DIR") or None,
+                max_memory_bytes=_env_int(
+                    "MLX_VLM_IMAGE_CACHE_BYTES", DEFAULT_IMAGE_CACHE_MEMORY_BYTES
+                ),
+                max_disk_bytes=_env_int(
+                    "MLX_VLM_IMAGE_CACHE_DISK_BYTES", DEFAULT_IMAGE_CACHE_DISK_BYTES
+                ),
+                max_workers=_env_int(
+                    "MLX_VLM_IMAGE_FETCH_WORKERS", DEFAULT_IMAGE_FETCH_WORKERS
+                ),
+                max_age=_env_int(
+                    "MLX_VLM_IMAGE_CACHE_MAX_AGE", DEFAULT_IMAGE_CACHE_MAX_AGE
+                ),
+            )
+        return _default_fetcher
+
+
+def set_image_fetcher(fetcher: Optional[ImageFetcher]) -> None:
+    """Replace the process-wide fetcher (``None`` resets to the env default)."""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        _default_fetcher = fetcher
+
+
+async def prefetch_images(images, timeout: float = 10) -> None:
+    """Warm the fetch cache for the remote entries of ``images``.
+
+    Errors are ignored here; the synchronous load that follows reports them
+    with the usual message.
+    """
+    if not images:
+        return
+    urls = list(dict.fromkeys(img for img in images if is_remote_image(img)))
+    if not urls:
+        return
+    fetcher = get_image_fetcher()
+    try:
+        await fetcher.fetch_many_async(urls, timeout=timeout)
+    except Exception:
+        pass
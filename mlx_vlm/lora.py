@@ -1,11 +1,17 @@
 import argparse
 import json
 import logging
+import os
 
 import mlx.optimizers as optim
 from datasets import load_dataset
 
-from .trainer.datasets import PreferenceVisionDataset, VisionDataset
+from .trainer.datasets import (
+    PreferenceVisionDataset,
+    PreprocessedDataset,
+    VisionDataset,
+    VisionFeatureDataset,
+)
 from .trainer.orpo_trainer import ORPOTrainingArgs, train_orpo
 from .trainer.sft_trainer import TrainingArgs, train
 from .trainer.utils import (
@@ -18,6 +24,7 @@ from .trainer.utils import (
     unfreeze_modules,
 )
 from .utils import load
+from .vision_cache import VisionFeatureCache, processor_fingerprint
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -135,6 +142,9 @@ def setup_model_for_training(model, args, adapter_path=None):
 
 
 def main(args):
+    if args.batching == "bucket" and not args.preprocessed_cache_dir:
+        raise ValueError("--batching bucket requires --preprocessed-cache-dir")
+
     args.output_path = (
         args.output_path
         if args.output_path.endswith(".safetensors")
@@ -189,10 +199,34 @@ def main(args):
             image_resize_shape=args.image_resize_shape,
         )
 
+    if args.preprocessed_cache_dir:
+        logger.info(
+            f"{Colors.HEADER}Using preprocessed dataset cache in "
+            f"{args.preprocessed_cache_dir}{Colors.ENDC}"
+        )
+        train_dataset = PreprocessedDataset(
+            train_dataset,
+            args.preprocessed_cache_dir,
+            num_workers=args.num_workers,
+        )
+
     # Setup model for training
     model = setup_model_for_training(model, args, args.adapter_path)
     print_trainable_parameters(model)
 
+    if args.cache_vision_features:
+        if args.train_mode == "orpo":
+            raise ValueError("--cache-vision-features is only supported for SFT")
+        logger.info(f"{Colors.HEADER}Precomputing vision features{Colors.ENDC}")
+        vision_cache = VisionFeatureCache(
+            namespace=f"{args.model_path}|{processor_fingerprint(processor)}",
+            disk_dir=args.vision_feature_cache_dir
+            or os.path.join(os.path.dirname(args.output_path), "vision_features"),
+        )
+        train_dataset = VisionFeatureDataset(
+            train_dataset, model, vision_cache, batch_size=args.batch_size
+        )
+
     # Setup optimizer
     logger.info(f"{Colors.HEADER}Setting up optimizer{Colors.ENDC}")
     optimizer = optim.Adam(learning_rate=args.learning_rate)
@@ -214,6 +248,10 @@ def main(args):
             grad_clip=args.grad_clip,
             gradient_accumulation_steps=args.gradient_accumulation_steps,
             full_finetune=args.full_finetune,
+            num_workers=args.num_workers,
+            prefetch_batches=args.prefetch_batches,
+            seed=args.seed,
+            batching=args.batching,
             beta=args.beta,
             eps=args.eps,
         )
@@ -241,6 +279,10 @@ def main(args):
             grad_clip=args.grad_clip,
             gradient_accumulation_steps=args.gradient_accumulation_steps,
             full_finetune=args.full_finetune,
+            num_workers=args.num_workers,
+            prefetch_batches=args.prefetch_batches,
+            seed=args.seed,
+            batching=args.batching,
         )
         train(
             model=model,
@@ -266,12 +308,29 @@ if __name__ == "__main__":
     )
     parser.add_argument("--full-finetune", action="store_true")
     parser.add_argument("--train-vision", action="store_true")
+    parser.add_argument(
+        "--cache-vision-features",
+        action="store_true",
+        help="Encode each image once and skip the frozen vision tower in training",
+    )
+    parser.add_argument(
+        "--vision-feature-cache-dir",
+        type=str,
+        default=None,
+        help="Persist cached vision features here (default: next to the adapter)",
+    )
 
     # Dataset arguments
     parser.add_argument("--dataset", type=str, required=True)
     parser.add_argument("--split", type=str, default="train")
     parser.add_argument("--dataset-config", type=str, default=None)
     parser.add_argument("--image-resize-shape", type=int, nargs=2, default=None)
+    parser.add_argument(
+        "--preprocessed-cache-dir",
+        type=str,
+        default=None,
+        help="Process the dataset once into safetensors shards here and reuse them",
+    )
     parser.add_argument(
         "--custom-prompt-format",
         type=str,
@@ -293,6 +352,23 @@ if __name__ == "__main__":
     parser.add_argument("--grad-clip", type=float, default=None)
     parser.add_argument("--train-on-completions", action="store_true")
     parser.add_argument("--gradient-accumulation-steps", type=int, default=1)
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=2,
+        help="Threads preprocessing batches ahead of training (0 = inline)",
+    )
+    parser.add_argument("--prefetch-batches", type=int, default=4)
+    parser.add_argument(
+        "--batching",
+        type=str,
+        default="shuffle",
+        choices=["shuffle", "bucket"],
+        help="Group samples randomly or by length (needs --preprocessed-cache-dir)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Seed for the batch order"
+    )
     parser.add_argument("--assistant-id", type=int, default=77091)
 
     # LoRA arguments
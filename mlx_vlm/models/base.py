@@ -2,7 +2,8 @@ import inspect
 import math
 from abc import abstractmethod
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 import mlx.core as mx
 import mlx.nn as nn
@@ -96,6 +97,44 @@ class InputEmbeddingsFeatures:
         }
 
 
+@dataclass
+class TreeAttention:
+    """A flattened speculative draft tree fed to one target forward.
+
+    Slot 0 is the root (the last committed token) and slots are grouped by
+    depth, so each entry of ``spans`` is a contiguous ``(start, end, depth)``
+    run. A slot at depth ``d`` sits at position ``offset + d``.
+    ``ancestors[i, j]`` is True when slot ``j`` is slot ``i`` or one of its
+    ancestors.
+    """
+
+    depths: mx.array
+    ancestors: mx.array
+    spans: List[Tuple[int, int, int]]
+
+
+def create_tree_attention_mask(mask: mx.array, tree: TreeAttention) -> mx.array:
+    """Restrict a causal mask over the tree slots to each slot's ancestors.
+
+    ``mask`` is the boolean mask the cache built for ``N`` new tokens
+    (``[..., N, K]``). Its row ``d`` describes a query at ``offset + d``,
+    so the prefix columns for a slot come from the row of its depth; that
+    keeps sliding windows exact.
+    """
+    n = tree.ancestors.shape[-1]
+    prefix = mx.take(mask, tree.depths, axis=-2)[..., :-n]
+    ancestors = mx.broadcast_to(tree.ancestors, (*prefix.shape[:-1], n))
+    return mx.concatenate([prefix, ancestors], axis=-1)
+
+
+def apply_tree_rope(rope, x: mx.array, offset, tree: TreeAttention) -> mx.array:
+    """Apply ``rope`` to ``[B, H, N, D]`` tree slots at their depth positions."""
+    return mx.concatenate(
+        [rope(x[:, :, s:e, :], offset=offset + d) for s, e, d in tree.spans],
+        axis=2,
+    )
+
+
 @dataclass
 class BaseModelConfig:
     @classmethod
@@ -376,6 +415,42 @@ def interpolate(pos_embed, size, mode="cubic", align_corners=False):
     return result
 
 
+@lru_cache(maxsize=128)
+def grid_position_ids(t: int, h: int, w: int, merge_size: int) -> mx.array:
+    """``(row, col)`` positions of a ``t x h x w`` patch grid in merge order.
+
+    Patches are ordered ``merge_size x merge_size`` block by block, as the
+    Qwen-style vision towers embed them. Cached per grid since traffic
+    repeats a handful of resolutions.
+    """
+    rows, cols = np.meshgrid(np.arange(h), np.arange(w), indexing="ij")
+    coords = (
+        np.stack([rows, cols], axis=-1)
+        .reshape(h // merge_size, merge_size, w // merge_size, merge_size, 2)
+        .transpose(0, 2, 1, 3, 4)
+        .reshape(-1, 2)
+    )
+    return mx.array(np.tile(coords, (t, 1)), dtype=mx.int32)
+
+
+def vision_position_ids(grid_thw: List[List[int]], merge_size: int) -> mx.array:
+    """Concatenated :func:`grid_position_ids` for every grid in a batch."""
+    pos_ids = [
+        grid_position_ids(int(t), int(h), int(w), merge_size) for t, h, w in grid_thw
+    ]
+    return pos_ids[0] if len(pos_ids) == 1 else mx.concatenate(pos_ids, axis=0)
+
+
+def split_packed_features(features: mx.array, counts: List[int]) -> List[mx.array]:
+    """Split features encoded for several batches back along axis 0.
+
+    ``counts[i]`` is the number of leading-axis rows that belong to batch
+    ``i`` in the packed vision forward.
+    """
+    offsets = np.cumsum(counts)[:-1].tolist()
+    return mx.split(features, offsets, axis=0) if offsets else [features]
+
+
 @mx.compile
 def chunked_attention(
     queries: mx.array,
@@ -414,6 +489,107 @@ def ensure_fused_sdpa(q, k, v, scale, mask=None):
     ]
 
 
+# Segments sharing one padded ``varlen_attention`` call waste at most this
+# many attended slots per real token.
+VARLEN_MAX_PADDING_RATIO = 2.0
+
+
+@dataclass
+class VarlenSegments:
+    """Host-side layout of the segments of a packed vision sequence.
+
+    Built once per vision forward by ``varlen_segments`` and shared by every
+    layer attending over the same boundaries. Each bucket holds segments of
+    similar length as a ``[S, L]`` gather index (``None`` when the bucket is
+    the whole sequence cut into equal consecutive segments) and a key-padding
+    mask (``None`` when no segment is padded). ``scatter`` maps the
+    concatenated bucket outputs back to packed order, or is ``None`` when
+    they are already in it.
+    """
+
+    buckets: List[Tuple[Optional[mx.array], Optional[mx.array], int]]
+    scatter: Optional[mx.array]
+
+
+def frame_cu_seqlens(grid_thw: List[List[int]]) -> np.ndarray:
+    """Cumulative patch counts with one segment per frame of every grid."""
+    lengths = [int(h * w) for t, h, w in grid_thw for _ in range(int(t))]
+    return np.cumsum([0] + lengths)
+
+
+def varlen_segments(cu_seqlens) -> VarlenSegments:
+    """Plan ``varlen_attention`` over the boundaries in ``cu_seqlens``.
+
+    ``cu_seqlens`` (``[0, ..., N]``) may be a list, numpy array or
+    ``mx.array``; the latter costs one host sync, so call this once per
+    forward rather than per layer. Segments are sorted by length and cut
+    into buckets whose padding stays within ``VARLEN_MAX_PADDING_RATIO``, so
+    mixed resolutions and ragged windows attend in a few fused calls instead
+    of one call per segment.
+    """
+    if isinstance(cu_seqlens, mx.array):
+        cu_seqlens = cu_seqlens.tolist()
+    bounds = np.asarray(cu_seqlens, dtype=np.int64)
+    starts, lengths = bounds[:-1], np.diff(bounds)
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    n = int(bounds[-1])
+
+    if (lengths == lengths[0]).all() and (
+        starts == np.arange(len(starts)) * lengths[0]
+    ).all():
+        return VarlenSegments([(None, None, int(lengths[0]))], None)
+
+    order = np.argsort(-lengths, kind="stable")
+    buckets, scatter, base, i = [], np.empty(n, dtype=np.int64), 0, 0
+    while i < len(order):
+        width = int(lengths[order[i]])
+        j = i + 1
+        while j < len(order) and lengths[order[j]] * VARLEN_MAX_PADDING_RATIO > width:
+            j += 1
+        seg_starts, seg_lengths = starts[order[i:j]], lengths[order[i:j]]
+        offsets = np.arange(width)
+        valid = offsets[None, :] < seg_lengths[:, None]
+        gather = np.where(valid, seg_starts[:, None] + offsets[None, :], 0)
+        rows, cols = np.nonzero(valid)
+        scatter[gather[rows, cols]] = base + rows * width + cols
+        mask = None if valid.all() else mx.array(valid[:, None, None, :])
+        buckets.append((mx.array(gather, dtype=mx.int32), mask, width))
+        base += gather.size
+        i = j
+    return VarlenSegments(buckets, mx.array(scatter, dtype=mx.int32))
+
+
+def varlen_attention(
+    q: mx.array,
+    k: mx.array,
+    v: mx.array,
+    segments: VarlenSegments,
+    scale: float,
+) -> mx.array:
+    """Attend within each segment of a packed ``[1, H, N, D]`` sequence.
+
+    Each bucket of ``segments`` is gathered into a zero-padded
+    ``[S, H, L, D]`` batch and attended in one fused call with its
+    key-padding mask, and the results are gathered back into packed order.
+    """
+    heads, dim = q.shape[1], q.shape[-1]
+    outputs = []
+    for gather, mask, width in segments.buckets:
+
+        def pack(x):
+            if gather is None:
+                return x[0].reshape(heads, -1, width, dim).transpose(1, 0, 2, 3)
+            return x[0][:, gather].transpose(1, 0, 2, 3)
+
+        out = ensure_fused_sdpa(pack(q), pack(k), pack(v), scale, mask=mask)
+        outputs.append(out.transpose(1, 0, 2, 3).reshape(heads, -1, dim))
+    out = outputs[0] if len(outputs) == 1 else mx.concatenate(outputs, axis=1)
+    if segments.scatter is not None:
+        out = out[:, segments.scatter]
+    return out[None]
+
+
 def install_auto_processor_patch(target_model_types, processor_cls):
     """
     Install a composable patch on transformers.AutoProcessor.from_pretrained
@@ -12,6 +12,7 @@ from mlx_lm.models.cache import (
     QuantizedKVCache,
     RotatingKVCache,
     _BaseCache,
+    dynamic_roll,
 )
 
 
@@ -204,9 +205,34 @@ class BatchQuantizedKVCache(_BaseCache):
         self.left_padding = mx.array(left_padding)
         self.offset = mx.array([-lp for lp in left_padding])
         self._idx = 0
+        self._right_padding = None
         self.group_size = group_size
         self.bits = bits
 
+    def prepare(self, *, left_padding=None, lengths=None, right_padding=None):
+        """Same contract as ``BatchKVCache.prepare``."""
+        if left_padding is not None:
+            if self.keys is not None:
+                raise ValueError(
+                    "Left padding can only be added to an empty BatchQuantizedKVCache"
+                )
+            left_padding = mx.array(left_padding)
+            self.left_padding += left_padding
+            self.offset -= left_padding
+
+        if right_padding is not None and max(right_padding) > 0:
+            self._right_padding = mx.array(right_padding)
+
+    def finalize(self):
+        """Roll right padding into left padding, leaf by leaf."""
+        if self._right_padding is not None:
+            padding = self._right_padding[:, None]
+            self.keys = tuple(dynamic_roll(k, padding, axis=2) for k in self.keys)
+            self.values = tuple(dynamic_roll(v, padding, axis=2) for v in self.values)
+            self.offset -= self._right_padding
+            self.left_padding += self._right_padding
+            self._right_padding = None
+
     def update_and_fetch(self, keys: mx.array, values: mx.array):
         """Quantize incoming keys/values and append to the cache.
 
@@ -419,6 +445,30 @@ def make_prompt_cache(
         return [KVCache() for _ in range(num_layers)]
 
 
+def compact_speculative_cache(
+    caches: List[Any], keep: List[int], block_size: int
+) -> None:
+    """Keep only the ``keep`` slots of the last ``block_size`` cached tokens.
+
+    After a tree-verify forward the newest ``block_size`` entries of every
+    KV cache hold the whole draft tree. ``keep`` lists the slots on the
+    accepted path in order; they are moved to the front of that block and
+    the rest is trimmed away.
+    """
+    keep_idx = mx.array(keep)
+    moved = keep != list(range(len(keep)))
+    for c in caches:
+        if c is None or c.keys is None:
+            continue
+        if moved:
+            end = c._idx if hasattr(c, "_idx") else c.offset
+            start = end - block_size
+            stop = start + len(keep)
+            c.keys[:, :, start:stop, :] = c.keys[:, :, start + keep_idx, :]
+            c.values[:, :, start:stop, :] = c.values[:, :, start + keep_idx, :]
+        c.trim(block_size - len(keep))
+
+
 class SimpleKVCache:
     """A simple key-value cache for transformer attention layers.
 
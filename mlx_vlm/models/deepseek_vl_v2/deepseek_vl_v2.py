@@ -393,10 +393,8 @@ class Model(nn.Module):
         **kwargs,
     ):
 
-        images_spatial_crop = kwargs.get("images_spatial_crop", None)
-        images_seq_mask = kwargs.get("images_seq_mask", None)
         input_embeddings_features = self.get_input_embeddings(
-            input_ids, pixel_values, images_spatial_crop, images_seq_mask
+            input_ids, pixel_values, **kwargs
         )
         logits = self.language_model(
             input_ids,
@@ -192,7 +192,7 @@ class Model(nn.Module):
         **kwargs,
     ):
         input_embeddings_features = self.get_input_embeddings(
-            input_ids, pixel_values, mask
+            input_ids, pixel_values, mask, **kwargs
         )
         logits = self.language_model(
             input_ids,
@@ -1,10 +1,10 @@
-from typing import Optional
+from typing import List, Optional
 
 import mlx.core as mx
 import mlx.nn as nn
 import numpy as np
 
-from ..base import InputEmbeddingsFeatures
+from ..base import InputEmbeddingsFeatures, split_packed_features
 from . import processing_gemma3  # noqa: F401
 from .config import ModelConfig
 from .language import LanguageModel, RMSNorm
@@ -123,6 +123,24 @@ class Model(nn.Module):
             inputs_embeds=final_inputs_embeds, attention_mask_4d=final_attention_mask_4d
         )
 
+    def encode_packed_images(self, batches: List[dict]) -> List[mx.array]:
+        """Encode the images of several prepared batches in one vision forward.
+
+        The processor resizes every image to the same resolution, so batches
+        stack along the image axis. Returns one ``cached_image_features`` per
+        batch.
+        """
+        # Match the text embedding dtype (the weight may be quantized).
+        dtype = self.language_model.model.embed_tokens(mx.array([0])).dtype
+        pixel_values = mx.concatenate([batch["pixel_values"] for batch in batches])
+        hidden_state, _, _ = self.vision_tower(
+            pixel_values.transpose(0, 2, 3, 1).astype(dtype),
+            output_hidden_states=True,
+        )
+        image_features = self.multi_modal_projector(hidden_state)
+        counts = [batch["pixel_values"].shape[0] for batch in batches]
+        return split_packed_features(image_features, counts)
+
     @staticmethod
     def prepare_inputs_for_multimodal(
         hidden_size,
@@ -185,7 +203,7 @@ class Model(nn.Module):
         **kwargs,
     ):
         input_embeddings_features = self.get_input_embeddings(
-            input_ids, pixel_values, mask
+            input_ids, pixel_values, mask, **kwargs
         )
         inputs_embeds = input_embeddings_features.inputs_embeds
         attention_mask = input_embeddings_features.attention_mask_4d
@@ -7,10 +7,13 @@ from mlx.nn import RMSNorm
 
 from ..base import (
     LanguageModelOutput,
+    TreeAttention,
+    apply_tree_rope,
     create_attention_mask,
+    create_tree_attention_mask,
     scaled_dot_product_attention,
 )
-from ..cache import KVCache, RotatingKVCache
+from ..cache import KVCache, RotatingKVCache, compact_speculative_cache
 from .config import TextConfig
 from .rope_utils import initialize_rope
 
@@ -196,6 +199,11 @@ class Attention(nn.Module):
         )
         self.is_kv_shared_layer = layer_idx >= first_kv_shared_layer_idx > 0
 
+    def _rope(self, x, offset, tree):
+        if tree is None:
+            return self.rope(x, offset=offset)
+        return apply_tree_rope(self.rope, x, offset, tree)
+
     def __call__(
         self,
         x: mx.array,
@@ -203,6 +211,7 @@ class Attention(nn.Module):
         cache: Optional[Any] = None,
         shared_kv: Optional[tuple] = None,
         offset: Optional[Any] = None,
+        tree: Optional[TreeAttention] = None,
     ) -> mx.array:
         B, L, _ = x.shape
 
@@ -224,7 +233,7 @@ class Attention(nn.Module):
 
             keys = self.k_norm(keys)
             keys = keys.transpose(0, 2, 1, 3)
-            keys = self.rope(keys, offset=offset)
+            keys = self._rope(keys, offset, tree)
 
             values = self.v_norm(values)
             values = values.transpose(0, 2, 1, 3)
@@ -233,7 +242,7 @@ class Attention(nn.Module):
                 keys, values = cache.update_and_fetch(keys, values)
 
         queries = queries.transpose(0, 2, 1, 3)
-        queries = self.rope(queries, offset=offset)
+        queries = self._rope(queries, offset, tree)
 
         output = scaled_dot_product_attention(
             queries, keys, values, cache=cache, scale=self.scale, mask=mask
@@ -312,12 +321,13 @@ class DecoderLayer(nn.Module):
         per_layer_input: Optional[mx.array] = None,
         shared_kv: Optional[tuple] = None,
         offset: Optional[Any] = None,
+        tree: Optional[TreeAttention] = None,
     ) -> mx.array:
         residual = x
 
         h = self.input_layernorm(x)
         h, shared_kv, offset = self.self_attn(
-            h, mask, cache, shared_kv=shared_kv, offset=offset
+            h, mask, cache, shared_kv=shared_kv, offset=offset, tree=tree
         )
         h = self.post_attention_layernorm(h)
         h = residual + h
@@ -445,13 +455,13 @@ class Gemma4TextModel(nn.Module):
 
         return (per_layer_projection + per_layer_inputs) * self.per_layer_input_scale
 
-    def _make_masks(self, h, cache):
+    def _make_masks(self, h, cache, tree=None):
         """Create attention masks, deduplicated by layer type."""
         mask = {}
         masks = []
         for l, c in zip(self.layers, cache):
             if l.layer_type not in mask:
-                return_array = (
+                return_array = tree is not None or (
                     h.shape[1] > 1
                     and c is not None
                     and int(mx.max(mx.array(c.offset)).item()) > 0
@@ -464,6 +474,10 @@ class Gemma4TextModel(nn.Module):
                     mask["sliding_attention"] = create_attention_mask(
                         h, c, window_size=self.window_size, return_array=return_array
                     )
+                if tree is not None:
+                    mask[l.layer_type] = create_tree_attention_mask(
+                        mask[l.layer_type], tree
+                    )
             masks.append(mask[l.layer_type])
         return masks
 
@@ -477,6 +491,7 @@ class Gemma4TextModel(nn.Module):
         capture_layer_ids: Optional[List[int]] = None,
         hidden_sink: Optional[list] = None,
         shared_kv_sink: Optional[dict] = None,
+        speculative_tree: Optional[TreeAttention] = None,
         **kwargs,
     ):
         if inputs_embeds is None:
@@ -513,7 +528,7 @@ class Gemma4TextModel(nn.Module):
             cache = cache + [None] * (len(self.layers) - len(cache))
 
         if mask is None:
-            masks = self._make_masks(h, cache)
+            masks = self._make_masks(h, cache, speculative_tree)
         else:
             masks = [mask] * len(self.layers)
 
@@ -538,7 +553,13 @@ class Gemma4TextModel(nn.Module):
         ):
             kvs, offset = intermediates[prev_idx]
             h, kvs, offset = layer(
-                h, m, c, per_layer_input=pli, shared_kv=kvs, offset=offset
+                h,
+                m,
+                c,
+                per_layer_input=pli,
+                shared_kv=kvs,
+                offset=offset,
+                tree=speculative_tree,
             )
             intermediates[idx] = (kvs, offset)
             if hidden_sink is not None and idx in capture_set:
@@ -666,6 +687,17 @@ class LanguageModel(nn.Module):
                         c.values[bi, :, start:kv_len, :] = 0
         return max_a
 
+    def commit_speculative_tree(
+        self, caches: List[Any], keep: List[int], tree_size: int
+    ) -> None:
+        """Keep the accepted path of a tree-verify forward in the KV caches.
+
+        Called after ``__call__(..., speculative_tree=...)`` verified
+        ``tree_size`` flattened draft slots; ``keep`` is the accepted path
+        from the root slot.
+        """
+        compact_speculative_cache(caches, keep, tree_size)
+
     def sanitize(self, weights):
         sanitized = {}
         for k, v in weights.items():
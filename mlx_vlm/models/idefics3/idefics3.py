@@ -1,11 +1,11 @@
 import re
-from typing import Optional
+from typing import List, Optional
 
 import mlx.core as mx
 import mlx.nn as nn
 import numpy as np
 
-from ..base import InputEmbeddingsFeatures
+from ..base import InputEmbeddingsFeatures, split_packed_features
 from . import processing_idefics3  # noqa: F401
 from .config import ModelConfig
 from .language import LanguageModel
@@ -97,6 +97,21 @@ class Model(nn.Module):
 
         inputs_embeds = self.language_model.embed_tokens(input_ids)
 
+        cached = kwargs.get("cached_image_features", None)
+        if cached is not None:
+            image_features = cached
+        else:
+            pixel_values, patch_attention_mask = self._real_images_and_patch_mask(
+                pixel_values, pixel_attention_mask
+            )
+            image_features = self._encode_images(pixel_values, patch_attention_mask)
+
+        final_inputs_embeds = self._prepare_inputs_for_multimodal(
+            image_features, inputs_embeds, input_ids
+        )
+        return InputEmbeddingsFeatures(inputs_embeds=final_inputs_embeds)
+
+    def _real_images_and_patch_mask(self, pixel_values, pixel_attention_mask=None):
         batch_size, num_images, num_channels, height, width = pixel_values.shape
         pixel_values = pixel_values.reshape(
             batch_size * num_images, num_channels, height, width
@@ -142,24 +157,37 @@ class Model(nn.Module):
 
         # Sum over patch dimensions and check if any pixels are active
         patch_attention_mask = reshaped.sum(axis=(-1, -2)) > 0
+        return pixel_values, patch_attention_mask
 
-        cached = kwargs.get("cached_image_features", None)
-        if cached is not None:
-            image_features = cached
-        else:
-            pooler_output, *_ = self.vision_model(
-                pixel_values.transpose(0, 2, 3, 1),
-                patch_attention_mask=patch_attention_mask,
-                output_hidden_states=True,
-            )
+    def _encode_images(self, pixel_values, patch_attention_mask):
+        pooler_output, *_ = self.vision_model(
+            pixel_values.transpose(0, 2, 3, 1),
+            patch_attention_mask=patch_attention_mask,
+            output_hidden_states=True,
+        )
 
-            image_features = pooler_output.astype(pixel_values.dtype)
-            image_features = self.connector(image_features)
+        image_features = pooler_output.astype(pixel_values.dtype)
+        return self.connector(image_features)
 
-        final_inputs_embeds = self._prepare_inputs_for_multimodal(
-            image_features, inputs_embeds, input_ids
+    def encode_packed_images(self, batches: List[dict]) -> List[mx.array]:
+        """Encode the images of several prepared batches in one vision forward.
+
+        Images are split into fixed-size tiles by the processor, so the real
+        (non-padding) tiles of every batch stack along the tile axis. Returns
+        one ``cached_image_features`` per batch.
+        """
+        tiles, masks = zip(
+            *(
+                self._real_images_and_patch_mask(
+                    batch["pixel_values"], batch.get("pixel_attention_mask")
+                )
+                for batch in batches
+            )
         )
-        return InputEmbeddingsFeatures(inputs_embeds=final_inputs_embeds)
+        image_features = self._encode_images(
+            mx.concatenate(tiles), mx.concatenate(masks)
+        )
+        return split_packed_features(image_features, [t.shape[0] for t in tiles])
 
     def _prepare_inputs_for_multimodal(self, image_features, inputs_embeds, input_ids):
         special_image_mask = input_ids == self.config.image_token_index
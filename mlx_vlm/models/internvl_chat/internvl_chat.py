@@ -118,7 +118,9 @@ class Model(nn.Module):
         cache=None,
         **kwargs,
     ):
-        input_embeddings_features = self.get_input_embeddings(input_ids, pixel_values)
+        input_embeddings_features = self.get_input_embeddings(
+            input_ids, pixel_values, **kwargs
+        )
         logits = self.language_model(
             None, cache=cache, inputs_embeds=input_embeddings_features.inputs_embeds
         )
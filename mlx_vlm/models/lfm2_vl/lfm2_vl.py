@@ -193,10 +193,8 @@ class Model(nn.Module):
         cache=None,
         **kwargs,
     ):
-        spatial_shapes = kwargs.get("spatial_shapes", None)
-        pixel_attention_mask = kwargs.get("pixel_attention_mask", None)
         input_embeddings_features = self.get_input_embeddings(
-            input_ids, pixel_values, spatial_shapes, pixel_attention_mask
+            input_ids, pixel_values, **kwargs
         )
 
         logits = self.language_model(
@@ -127,7 +127,9 @@ class Model(nn.Module):
         cache=None,
         **kwargs,
     ):
-        input_embeddings_features = self.get_input_embeddings(input_ids, pixel_values)
+        input_embeddings_features = self.get_input_embeddings(
+            input_ids, pixel_values, **kwargs
+        )
         logits = self.language_model(
             input_ids,
             mask=mask,
@@ -165,7 +165,9 @@ class Model(nn.Module):
         cache: Optional[Tuple[mx.array, mx.array]] = None,
         **kwargs,
     ):
-        input_embeddings_features = self.get_input_embeddings(input_ids, pixel_values)
+        input_embeddings_features = self.get_input_embeddings(
+            input_ids, pixel_values, **kwargs
+        )
         logits = self.language_model(
             inputs=input_ids,
             cache=cache,
@@ -135,7 +135,9 @@ class Model(nn.Module):
         **kwargs,
     ):
 
-        input_embeddings_features = self.get_input_embeddings(input_ids, pixel_values)
+        input_embeddings_features = self.get_input_embeddings(
+            input_ids, pixel_values, **kwargs
+        )
         logits = self.language_model(
             input_ids,
             cache=cache,
@@ -131,7 +131,7 @@ class Model(nn.Module):
         **kwargs,
     ):
         input_embeddings_features = self.get_input_embeddings(
-            input_ids, pixel_values, mask
+            input_ids, pixel_values, mask, **kwargs
         )
         input_embeddings = input_embeddings_features.inputs_embeds
         final_attention_mask_4d = input_embeddings_features.attention_mask_4d
@@ -1,9 +1,9 @@
-from typing import Optional
+from typing import List, Optional
 
 import mlx.core as mx
 import mlx.nn as nn
 
-from ..base import InputEmbeddingsFeatures
+from ..base import InputEmbeddingsFeatures, split_packed_features
 from . import processing_qwen2_5_vl  # noqa: F401
 from .config import ModelConfig
 from .language import LanguageModel
@@ -71,6 +71,28 @@ class Model(nn.Module):
 
         return InputEmbeddingsFeatures(inputs_embeds=final_inputs_embeds)
 
+    def encode_packed_images(self, batches: List[dict]) -> List[mx.array]:
+        """Encode the images of several prepared batches in one vision forward.
+
+        Attention inside the vision tower is restricted to each image through
+        ``cu_seqlens``, so packing patches across batches leaves every image's
+        features unchanged. Returns one ``cached_image_features`` per batch.
+        """
+        dtype = self.vision_tower.patch_embed.proj.weight.dtype
+        pixel_values = mx.concatenate(
+            [batch["pixel_values"].astype(dtype) for batch in batches]
+        )
+        grid_thw = mx.concatenate([batch["image_grid_thw"] for batch in batches])
+        hidden_states = self.vision_tower(
+            pixel_values, grid_thw, output_hidden_states=False
+        )
+        merge_area = self.config.vision_config.spatial_merge_size**2
+        counts = [
+            int(batch["image_grid_thw"].prod(axis=-1).sum().item()) // merge_area
+            for batch in batches
+        ]
+        return split_packed_features(hidden_states, counts)
+
     @staticmethod
     def merge_input_ids_with_image_features(
         image_token_id,
@@ -1,9 +1,17 @@
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Tuple
 
 import mlx.core as mx
 import mlx.nn as nn
 import numpy as np
 
+from ..base import (
+    VarlenSegments,
+    frame_cu_seqlens,
+    varlen_attention,
+    varlen_segments,
+    vision_position_ids,
+)
 from .config import VisionConfig
 
 
@@ -51,6 +59,40 @@ def apply_rotary_pos_emb_vision(tensor, freqs) -> mx.array:
     return output.astype(orig_dtype)
 
 
+@lru_cache(maxsize=128)
+def grid_window_index(
+    t: int, h: int, w: int, merge_size: int, window_size: int
+) -> Tuple[mx.array, Tuple[int, ...]]:
+    """Window permutation of one ``t x h x w`` grid, cached per grid.
+
+    Returns the merged-patch order that groups each ``window_size`` window
+    contiguously and the cumulative patch counts of the non-empty windows
+    (without the leading 0).
+    """
+    llm_grid_h, llm_grid_w = h // merge_size, w // merge_size
+    index = np.arange(t * llm_grid_h * llm_grid_w).reshape(t, llm_grid_h, llm_grid_w)
+
+    pad_h = window_size - llm_grid_h % window_size
+    pad_w = window_size - llm_grid_w % window_size
+    num_windows_h = (llm_grid_h + pad_h) // window_size
+    num_windows_w = (llm_grid_w + pad_w) // window_size
+
+    index_padded = np.pad(index, ((0, 0), (0, pad_h), (0, pad_w)), constant_values=-100)
+    index_padded = (
+        index_padded.reshape(t, num_windows_h, window_size, num_windows_w, window_size)
+        .transpose(0, 1, 3, 2, 4)
+        .reshape(t * num_windows_h * num_windows_w, window_size * window_size)
+    )
+
+    valid = index_padded != -100
+    seqlens = valid.sum(axis=-1)
+    cu_seqlens = np.cumsum(seqlens[seqlens > 0]) * merge_size * merge_size
+    return (
+        mx.array(index_padded[valid], dtype=mx.int32),
+        tuple(cu_seqlens.tolist()),
+    )
+
+
 class VisionRotaryEmbedding(nn.Module):
     def __init__(self, dim: int, theta: float = 10000.0) -> None:
         super().__init__()
@@ -131,7 +173,11 @@ class Attention(nn.Module):
         self.proj = nn.Linear(dim, dim)
 
     def __call__(
-        self, x: mx.array, cu_seqlens: mx.array, rotary_pos_emb: mx.array = None
+        self,
+        x: mx.array,
+        cu_seqlens: mx.array,
+        rotary_pos_emb: mx.array = None,
+        segments: Optional[VarlenSegments] = None,
     ) -> mx.array:
         seq_length = x.shape[0]
         qkv = (
@@ -146,20 +192,10 @@ class Attention(nn.Module):
         k = k.transpose(0, 2, 1, 3)
         v = v.transpose(0, 2, 1, 3)
 
-        splits = [
-            mx.split(tensor, cu_seqlens[1:-1].tolist(), axis=2) for tensor in (q, k, v)
-        ]
-
-        attn_outputs = []
-        for q, k, v in zip(*splits):
-            output = mx.fast.scaled_dot_product_attention(
-                q, k, v, scale=self.scale, mask=None
-            )
-            attn_outputs.append(output)
-
-        output = mx.concatenate(attn_outputs, axis=2)
-        output = output.transpose(0, 2, 1, 3)
-        output = output.reshape(seq_length, -1)
+        if segments is None:
+            segments = varlen_segments(cu_seqlens)
+        output = varlen_attention(q, k, v, segments, self.scale)
+        output = output.transpose(0, 2, 1, 3).reshape(seq_length, -1)
         return self.proj(output)
 
 
@@ -183,11 +219,14 @@ class Qwen2VLVisionBlock(nn.Module):
         self.attn = Attention(dim=config.hidden_size, num_heads=config.num_heads)
         self.mlp = MLP(dim=config.hidden_size, hidden_dim=config.intermediate_size)
 
-    def __call__(self, hidden_states, cu_seqlens, rotary_pos_emb) -> mx.array:
+    def __call__(
+        self, hidden_states, cu_seqlens, rotary_pos_emb, segments=None
+    ) -> mx.array:
         hidden_states = hidden_states + self.attn(
             self.norm1(hidden_states),
             cu_seqlens=cu_seqlens,
             rotary_pos_emb=rotary_pos_emb,
+            segments=segments,
         )
         hidden_states = hidden_states + self.mlp(self.norm2(hidden_states))
         return hidden_states
@@ -223,35 +262,7 @@ class VisionModel(nn.Module):
         )
 
     def rot_pos_emb(self, grid_thw):
-        pos_ids = []
-
-        for t, h, w in grid_thw.tolist():
-            hpos_ids = mx.expand_dims(mx.arange(h), 1)
-            hpos_ids = mx.repeat(hpos_ids, w, axis=1)
-            hpos_ids = hpos_ids.reshape(
-                h // self.spatial_merge_size,
-                self.spatial_merge_size,
-                w // self.spatial_merge_size,
-                self.spatial_merge_size,
-            )
-            hpos_ids = mx.transpose(hpos_ids, (0, 2, 1, 3))
-            hpos_ids = hpos_ids.flatten()
-
-            wpos_ids = mx.expand_dims(mx.arange(w), 0)
-            wpos_ids = mx.repeat(wpos_ids, h, axis=0)
-            wpos_ids = wpos_ids.reshape(
-                h // self.spatial_merge_size,
-                self.spatial_merge_size,
-                w // self.spatial_merge_size,
-                self.spatial_merge_size,
-            )
-            wpos_ids = mx.transpose(wpos_ids, (0, 2, 1, 3))
-            wpos_ids = wpos_ids.flatten()
-
-            stacked_pos_ids = mx.stack([hpos_ids, wpos_ids], axis=-1)
-            pos_ids.append(mx.tile(stacked_pos_ids, (t, 1)))
-
-        pos_ids = mx.concatenate(pos_ids, axis=0)
+        pos_ids = vision_position_ids(grid_thw.tolist(), self.spatial_merge_size)
         max_grid_size = mx.max(grid_thw[:, 1:])
         rotary_pos_emb_full = self.rotary_pos_emb(max_grid_size)
         rotary_pos_emb = rotary_pos_emb_full[pos_ids]
@@ -267,59 +278,20 @@ class VisionModel(nn.Module):
         )
 
         for grid_t, grid_h, grid_w in grid_thw.tolist():
-            llm_grid_h = grid_h // self.spatial_merge_size
-            llm_grid_w = grid_w // self.spatial_merge_size
-
-            index = mx.arange(grid_t * llm_grid_h * llm_grid_w).reshape(
-                grid_t, llm_grid_h, llm_grid_w
-            )
-
-            pad_h = vit_merger_window_size - llm_grid_h % vit_merger_window_size
-            pad_w = vit_merger_window_size - llm_grid_w % vit_merger_window_size
-            num_windows_h = (llm_grid_h + pad_h) // vit_merger_window_size
-            num_windows_w = (llm_grid_w + pad_w) // vit_merger_window_size
-
-            # Replace F.pad with np.pad
-            index_padded = mx.pad(
-                index,
-                ((0, 0), (0, pad_h), (0, pad_w)),
-                mode="constant",
-                constant_values=-100,
-            )
-
-            index_padded = index_padded.reshape(
-                grid_t,
-                num_windows_h,
-                vit_merger_window_size,
-                num_windows_w,
-                vit_merger_window_size,
-            )
-
-            # Replace permute with np.transpose
-            index_padded = mx.transpose(index_padded, (0, 1, 3, 2, 4)).reshape(
-                grid_t,
-                num_windows_h * num_windows_w,
-                vit_merger_window_size,
+            index, cu_seqlens = grid_window_index(
+                int(grid_t),
+                int(grid_h),
+                int(grid_w),
+                self.spatial_merge_size,
                 vit_merger_window_size,
             )
-
-            seqlens = mx.sum(index_padded != -100, axis=(2, 3)).reshape(-1)
-            index_padded = index_padded.reshape(-1)
-            index = np.where(index_padded != -100)[
-                0
-            ].tolist()  # [i for i, x in enumerate(index_padded) if x != -100]
-            index_new = index_padded[index]
-
-            window_index.append(index_new + window_index_id)
-            cu_seqlens_tmp = (
-                mx.cumsum(seqlens, axis=0) * self.spatial_merge_unit
-                + cu_window_seqlens[-1]
-            )
-            cu_window_seqlens.extend(cu_seqlens_tmp.tolist())
-            window_index_id += int(grid_t * llm_grid_h * llm_grid_w)
+            window_index.append(index + window_index_id)
+            last = cu_window_seqlens[-1]
+            cu_window_seqlens.extend(last + c for c in cu_seqlens)
+            window_index_id += index.shape[0]
 
         window_index = mx.concatenate(window_index, axis=0)
-        cu_window_seqlens = mx.array(cu_window_seqlens)
+        cu_window_seqlens = mx.array(cu_window_seqlens, dtype=mx.int32)
 
         return window_index, cu_window_seqlens
 
@@ -334,17 +306,6 @@ class VisionModel(nn.Module):
         rotary_pos_emb = self.rot_pos_emb(grid_thw)
         window_index, cu_window_seqlens = self.get_window_index(grid_thw)
 
-        # Get indices of first occurrence of each unique value
-        seen = set()
-        idx = []
-        for i, x in enumerate(cu_window_seqlens):
-            if x not in seen:
-                seen.add(x)
-                idx.append(i)
-
-        idx = mx.array(idx, dtype=mx.int32)
-        cu_window_seqlens = cu_window_seqlens[idx]
-
         seq_len, _ = hidden_states.shape
         hidden_states = hidden_states.reshape(
             seq_len // self.spatial_merge_unit, self.spatial_merge_unit, -1
@@ -357,31 +318,24 @@ class VisionModel(nn.Module):
         rotary_pos_emb = rotary_pos_emb[window_index, :, :]
         rotary_pos_emb = rotary_pos_emb.reshape(seq_len, -1)
 
-        # Assuming grid_thw has shape (batch_size, 3)
-        batch_size = grid_thw.shape[0]
-
-        # Calculate cu_seqlens for each item in the batch
-        cu_seqlens = []
-        for i in range(batch_size):
-            seq_len = grid_thw[i, 1] * grid_thw[i, 2]
-            cu_seqlens.append(mx.repeat(seq_len, grid_thw[i, 0]))
-
-        # Concatenate the cu_seqlens for all items in the batch
-        cu_seqlens = mx.concatenate(cu_seqlens)
-
-        cu_seqlens = mx.cumsum(cu_seqlens.astype(mx.int32), axis=0)
-        cu_seqlens = mx.pad(cu_seqlens, (1, 0), mode="constant", constant_values=0)
+        # One attention segment per frame of each grid
+        cu_seqlens = frame_cu_seqlens(grid_thw.tolist())
 
         encoder_states = (hidden_states,) if output_hidden_states else None
 
+        segments = varlen_segments(cu_seqlens)
+        window_segments = varlen_segments(cu_window_seqlens)
         for layer_num, blk in enumerate(self.blocks):
             if layer_num in self.fullatt_block_indexes:
-                cu_seqlens_now = cu_seqlens
+                cu_seqlens_now, segments_now = cu_seqlens, segments
             else:
-                cu_seqlens_now = cu_window_seqlens
+                cu_seqlens_now, segments_now = cu_window_seqlens, window_segments
 
             hidden_states = blk(
-                hidden_states, cu_seqlens=cu_seqlens_now, rotary_pos_emb=rotary_pos_emb
+                hidden_states,
+                cu_seqlens=cu_seqlens_now,
+                rotary_pos_emb=rotary_pos_emb,
+                segments=segments_now,
             )
 
             if output_hidden_states:
@@ -3,6 +3,13 @@ from typing import Optional
 import mlx.core as mx
 import mlx.nn as nn
 
+from ..base import (
+    VarlenSegments,
+    frame_cu_seqlens,
+    varlen_attention,
+    varlen_segments,
+    vision_position_ids,
+)
 from .config import VisionConfig
 
 
@@ -130,7 +137,11 @@ class Attention(nn.Module):
         self.proj = nn.Linear(dim, dim)
 
     def __call__(
-        self, x: mx.array, cu_seqlens: mx.array, rotary_pos_emb: mx.array = None
+        self,
+        x: mx.array,
+        cu_seqlens: mx.array,
+        rotary_pos_emb: mx.array = None,
+        segments: Optional[VarlenSegments] = None,
     ) -> mx.array:
         seq_length = x.shape[0]
         qkv = (
@@ -145,19 +156,10 @@ class Attention(nn.Module):
         k = k.transpose(0, 2, 1, 3)
         v = v.transpose(0, 2, 1, 3)
 
-        splits = [
-            mx.split(tensor, cu_seqlens[1:-1].tolist(), axis=2) for tensor in (q, k, v)
-        ]
-
-        attn_outputs = []
-        for q, k, v in zip(*splits):
-            output = mx.fast.scaled_dot_product_attention(
-                q, k, v, scale=self.scale, mask=None
-            )
-            attn_outputs.append(output)
-        output = mx.concatenate(attn_outputs, axis=2)
-        output = output.transpose(0, 2, 1, 3)
-        output = output.reshape(seq_length, -1)
+        if segments is None:
+            segments = varlen_segments(cu_seqlens)
+        output = varlen_attention(q, k, v, segments, self.scale)
+        output = output.transpose(0, 2, 1, 3).reshape(seq_length, -1)
         return self.proj(output)
 
 
@@ -184,11 +186,14 @@ class Qwen2VLVisionBlock(nn.Module):
         self.attn = Attention(dim=config.embed_dim, num_heads=config.num_heads)
         self.mlp = MLP(dim=config.embed_dim, hidden_dim=mlp_hidden_dim)
 
-    def __call__(self, hidden_states, cu_seqlens, rotary_pos_emb) -> mx.array:
+    def __call__(
+        self, hidden_states, cu_seqlens, rotary_pos_emb, segments=None
+    ) -> mx.array:
         hidden_states = hidden_states + self.attn(
             self.norm1(hidden_states),
             cu_seqlens=cu_seqlens,
             rotary_pos_emb=rotary_pos_emb,
+            segments=segments,
         )
         hidden_states = hidden_states + self.mlp(self.norm2(hidden_states))
         return hidden_states
@@ -217,42 +222,12 @@ class VisionModel(nn.Module):
         self.merger = PatchMerger(dim=config.hidden_size, context_dim=config.embed_dim)
 
     def rot_pos_emb(self, grid_thw):
-        pos_ids = []
-
-        for t, h, w in grid_thw:
-            h, w = int(h), int(w)  # Ensure h and w are integers
-            hpos_ids = mx.expand_dims(mx.arange(h), 1)
-            hpos_ids = mx.repeat(hpos_ids, w, axis=1)
-            hpos_ids = hpos_ids.reshape(
-                h // self.spatial_merge_size,
-                self.spatial_merge_size,
-                w // self.spatial_merge_size,
-                self.spatial_merge_size,
-            )
-            hpos_ids = mx.transpose(hpos_ids, (0, 2, 1, 3))
-            hpos_ids = hpos_ids.flatten()
-
-            wpos_ids = mx.expand_dims(mx.arange(w), 0)
-            wpos_ids = mx.repeat(wpos_ids, h, axis=0)
-            wpos_ids = wpos_ids.reshape(
-                h // self.spatial_merge_size,
-                self.spatial_merge_size,
-                w // self.spatial_merge_size,
-                self.spatial_merge_size,
-            )
-            wpos_ids = mx.transpose(wpos_ids, (0, 2, 1, 3))
-            wpos_ids = wpos_ids.flatten()
-
-            stacked_pos_ids = mx.stack([hpos_ids, wpos_ids], axis=-1)
-            pos_ids.append(mx.tile(stacked_pos_ids, (t, 1)))
-
-        pos_ids = mx.concatenate(pos_ids, axis=0)
+        pos_ids = vision_position_ids(grid_thw.tolist(), self.spatial_merge_size)
         max_grid_size = mx.max(grid_thw[:, 1:])
         rotary_pos_emb_full = self.rotary_pos_emb(max_grid_size)
+        rotary_pos_emb = rotary_pos_emb_full[pos_ids]
 
-        rotary_pos_emb_full = rotary_pos_emb_full[pos_ids]
-
-        return rotary_pos_emb_full.reshape(pos_ids.shape[0], -1)
+        return rotary_pos_emb.reshape(pos_ids.shape[0], -1)
 
     def __call__(
         self,
@@ -263,26 +238,18 @@ class VisionModel(nn.Module):
         hidden_states = self.patch_embed(hidden_states)
         rotary_pos_emb = self.rot_pos_emb(grid_thw)
 
-        # Assuming grid_thw has shape (batch_size, 3)
-        batch_size = grid_thw.shape[0]
-
-        # Calculate cu_seqlens for each item in the batch
-        cu_seqlens = []
-        for i in range(batch_size):
-            seq_len = grid_thw[i, 1] * grid_thw[i, 2]
-            cu_seqlens.append(mx.repeat(seq_len, grid_thw[i, 0]))
-
-        # Concatenate the cu_seqlens for all items in the batch
-        cu_seqlens = mx.concatenate(cu_seqlens)
-
-        cu_seqlens = mx.cumsum(cu_seqlens.astype(mx.int32), axis=0)
-        cu_seqlens = mx.pad(cu_seqlens, (1, 0), mode="constant", constant_values=0)
+        # One attention segment per frame of each grid
+        cu_seqlens = frame_cu_seqlens(grid_thw.tolist())
 
         encoder_states = (hidden_states,) if output_hidden_states else None
 
+        segments = varlen_segments(cu_seqlens)
         for blk in self.blocks:
             hidden_states = blk(
-                hidden_states, cu_seqlens=cu_seqlens, rotary_pos_emb=rotary_pos_emb
+                hidden_states,
+                cu_seqlens=cu_seqlens,
+                rotary_pos_emb=rotary_pos_emb,
+                segments=segments,
             )
             if output_hidden_states:
                 encoder_states = encoder_states + (hidden_states,)
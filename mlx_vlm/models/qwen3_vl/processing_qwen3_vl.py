@@ -7,6 +7,7 @@ Adapted from HuggingFace Transformers:
 """
 
 import math
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Tuple, Union
 
 import numpy as np
@@ -148,6 +149,7 @@ class Qwen3VLImageProcessor(ImageProcessingMixin):
         image_mean: Optional[List[float]] = None,
         image_std: Optional[List[float]] = None,
         do_convert_rgb: bool = True,
+        num_workers: int = 8,
         **kwargs,
     ):
         self.patch_size = patch_size
@@ -161,13 +163,28 @@ class Qwen3VLImageProcessor(ImageProcessingMixin):
         self.image_mean = image_mean or [0.5, 0.5, 0.5]
         self.image_std = image_std or [0.5, 0.5, 0.5]
         self.do_convert_rgb = do_convert_rgb
+        self.num_workers = num_workers
 
     def fetch_images(self, images):
         if not isinstance(images, list):
             images = [images]
         return [_to_numpy_image(img) for img in images]
 
-    def _process_one(self, image: np.ndarray) -> Tuple[np.ndarray, List[int]]:
+    def _affine(self, channels: int, dtype) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-channel ``scale, offset`` folding rescale and normalize."""
+        scale = np.ones(channels, dtype=np.float32)
+        offset = np.zeros(channels, dtype=np.float32)
+        if self.do_rescale and dtype == np.uint8:
+            scale *= self.rescale_factor
+        if self.do_normalize:
+            std = np.array(self.image_std, dtype=np.float32)
+            scale /= std
+            offset -= np.array(self.image_mean, dtype=np.float32) / std
+        return scale[:, None, None, None], offset[:, None, None, None]
+
+    def _process_one(self, image) -> Tuple[np.ndarray, List[int]]:
+        if not (isinstance(image, np.ndarray) and image.ndim == 3):
+            image = _to_numpy_image(image)
         C, H, W = image.shape
         resized_h, resized_w = _smart_resize_image(
             H,
@@ -179,17 +196,6 @@ class Qwen3VLImageProcessor(ImageProcessingMixin):
         # Bicubic resize via PIL (same pattern as the video path).
         frame = _resize_video_frames(image[None, ...], resized_h, resized_w)[0]
 
-        img = frame.astype(np.float32)
-        if self.do_rescale and image.dtype == np.uint8:
-            img = img * self.rescale_factor
-        if self.do_normalize:
-            mean = np.array(self.image_mean, dtype=np.float32)[:, None, None]
-            std = np.array(self.image_std, dtype=np.float32)[:, None, None]
-            img = (img - mean) / std
-
-        # Duplicate along T so grid_t * tps frames match the model's expectation.
-        patches = np.repeat(img[None, None, ...], self.temporal_patch_size, axis=1)
-
         ps = self.patch_size
         tps = self.temporal_patch_size
         ms = self.merge_size
@@ -197,39 +203,34 @@ class Qwen3VLImageProcessor(ImageProcessingMixin):
         grid_h = resized_h // ps
         grid_w = resized_w // ps
 
-        patches = patches.reshape(
-            1,
-            grid_t,
-            tps,
-            C,
-            grid_h // ms,
-            ms,
-            ps,
-            grid_w // ms,
-            ms,
-            ps,
+        # Patch order of the vision tower, still in the source dtype:
+        # (C, H, W) -> (gh/ms, gw/ms, ms, ms, C, 1, ps, ps).
+        patches = frame.reshape(C, grid_h // ms, ms, ps, grid_w // ms, ms, ps)
+        patches = patches.transpose(1, 4, 2, 5, 0, 3, 6)[:, :, :, :, :, None]
+
+        # One pass casts, rescales + normalizes and duplicates the frame
+        # along T so grid_t * tps frames match the model's expectation.
+        scale, offset = self._affine(C, image.dtype)
+        out = np.empty(
+            (grid_h // ms, grid_w // ms, ms, ms, C, tps, ps, ps), dtype=np.float32
         )
-        patches = patches.transpose(0, 1, 4, 7, 5, 8, 3, 2, 6, 9)
-        flatten = patches.reshape(1, grid_t * grid_h * grid_w, C * tps * ps * ps)
-        return flatten[0], [grid_t, grid_h, grid_w]
+        np.multiply(patches, scale, out=out)
+        out += offset
+        return out.reshape(grid_t * grid_h * grid_w, -1), [grid_t, grid_h, grid_w]
 
     def __call__(self, images, **kwargs):
         if not isinstance(images, list):
             images = [images]
-        imgs = [
-            (
-                img
-                if (isinstance(img, np.ndarray) and img.ndim == 3)
-                else _to_numpy_image(img)
-            )
-            for img in images
-        ]
-        all_patches = []
-        all_thw = []
-        for v in imgs:
-            patches, thw = self._process_one(v)
-            all_patches.append(patches)
-            all_thw.append(thw)
+        # PIL decode/resize and numpy release the GIL, so several images
+        # preprocess in parallel.
+        workers = min(len(images), self.num_workers)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._process_one, images))
+        else:
+            results = [self._process_one(img) for img in images]
+        all_patches = [patches for patches, _ in results]
+        all_thw = [thw for _, thw in results]
         return {
             "pixel_values": np.concatenate(all_patches, axis=0),
             "image_grid_thw": np.array(all_thw, dtype=np.int64),
@@ -1,10 +1,10 @@
-from typing import Optional
+from typing import List, Optional
 
 import mlx.core as mx
 import mlx.nn as nn
 import numpy as np
 
-from ..base import InputEmbeddingsFeatures
+from ..base import InputEmbeddingsFeatures, split_packed_features
 from . import processing_qwen3_vl  # noqa: F401
 from .config import ModelConfig
 from .language import LanguageModel
@@ -68,7 +68,10 @@ class Model(nn.Module):
         inputs_embeds = self.language_model.model.embed_tokens(input_ids)
 
         cached = kwargs.get("cached_image_features", None)
-        if cached is not None:
+        if isinstance(cached, tuple):
+            # Packed encodes carry the deepstack features alongside.
+            hidden_states, deepstack_visual_embeds = cached
+        elif cached is not None:
             hidden_states = cached
             deepstack_visual_embeds = None
         else:
@@ -106,6 +109,31 @@ class Model(nn.Module):
             deepstack_visual_embeds=deepstack_visual_embeds,
         )
 
+    def encode_packed_images(self, batches: List[dict]) -> List[tuple]:
+        """Encode the images of several prepared batches in one vision forward.
+
+        Attention inside the vision tower is restricted to each image through
+        ``cu_seqlens``, so packing patches across batches leaves every image's
+        features unchanged. Returns one ``(hidden_states, deepstack_embeds)``
+        ``cached_image_features`` per batch.
+        """
+        dtype = self.vision_tower.patch_embed.proj.weight.dtype
+        pixel_values = mx.concatenate(
+            [batch["pixel_values"].astype(dtype) for batch in batches]
+        )
+        grid_thw = mx.concatenate([batch["image_grid_thw"] for batch in batches])
+        hidden_states, deepstack = self.vision_tower(pixel_values, grid_thw)
+        merge_area = self.config.vision_config.spatial_merge_size**2
+        counts = [
+            int(batch["image_grid_thw"].prod(axis=-1).sum().item()) // merge_area
+            for batch in batches
+        ]
+        split_deepstack = [split_packed_features(d, counts) for d in deepstack]
+        return [
+            (features, [layer[i] for layer in split_deepstack])
+            for i, features in enumerate(split_packed_features(hidden_states, counts))
+        ]
+
     @staticmethod
     def merge_input_ids_with_image_features(
         image_features, inputs_embeds, input_ids, image_token_index, video_token_index
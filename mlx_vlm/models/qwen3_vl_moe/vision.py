@@ -1,9 +1,16 @@
 from itertools import accumulate
+from typing import Optional
 
 import mlx.core as mx
 import mlx.nn as nn
 
-from ..base import ensure_fused_sdpa
+from ..base import (
+    VarlenSegments,
+    frame_cu_seqlens,
+    varlen_attention,
+    varlen_segments,
+    vision_position_ids,
+)
 from .config import VisionConfig
 
 
@@ -133,7 +140,11 @@ class Attention(nn.Module):
         self.proj = nn.Linear(dim, dim)
 
     def __call__(
-        self, x: mx.array, cu_seqlens: mx.array, rotary_pos_emb: mx.array = None
+        self,
+        x: mx.array,
+        cu_seqlens: mx.array,
+        rotary_pos_emb: mx.array = None,
+        segments: Optional[VarlenSegments] = None,
     ) -> mx.array:
         seq_length = x.shape[0]
         qkv = (
@@ -148,17 +159,10 @@ class Attention(nn.Module):
         k = k.transpose(0, 2, 1, 3)
         v = v.transpose(0, 2, 1, 3)
 
-        splits = [
-            mx.split(tensor, cu_seqlens[1:-1].tolist(), axis=2) for tensor in (q, k, v)
-        ]
-
-        attn_outputs = []
-        for q, k, v in zip(*splits):
-            attn_outputs.append(ensure_fused_sdpa(q, k, v, self.scale))
-
-        output = mx.concat(attn_outputs, axis=2)
-        output = output.transpose(0, 2, 1, 3)
-        output = output.reshape(seq_length, -1)
+        if segments is None:
+            segments = varlen_segments(cu_seqlens)
+        output = varlen_attention(q, k, v, segments, self.scale)
+        output = output.transpose(0, 2, 1, 3).reshape(seq_length, -1)
         return self.proj(output)
 
 
@@ -182,11 +186,14 @@ class Qwen3VLMoEVisionBlock(nn.Module):
         self.attn = Attention(dim=config.hidden_size, num_heads=config.num_heads)
         self.mlp = MLP(dim=config.hidden_size, hidden_dim=config.intermediate_size)
 
-    def __call__(self, hidden_states, cu_seqlens, rotary_pos_emb) -> mx.array:
+    def __call__(
+        self, hidden_states, cu_seqlens, rotary_pos_emb, segments=None
+    ) -> mx.array:
         hidden_states = hidden_states + self.attn(
             self.norm1(hidden_states),
             cu_seqlens=cu_seqlens,
             rotary_pos_emb=rotary_pos_emb,
+            segments=segments,
         )
         hidden_states = hidden_states + self.mlp(self.norm2(hidden_states))
         return hidden_states
@@ -231,65 +238,19 @@ class VisionModel(nn.Module):
         ]
 
     def rot_pos_emb(self, grid_thw: mx.array) -> mx.array:
-        merge_size = self.spatial_merge_size
+        grids = grid_thw.tolist()
 
         # Get max grid size for frequency table
-        max_hw = int(mx.max(grid_thw[:, 1:]).item())
+        max_hw = max(max(h, w) for _, h, w in grids)
         freq_table = self.rotary_pos_emb(max_hw)  # Shape: (max_hw, dim // 2)
 
-        pos_ids = []
+        # (total_tokens, 2) height/width positions, cached per grid
+        pos_ids = vision_position_ids(grids, self.spatial_merge_size)
 
-        for num_frames, height, width in grid_thw.tolist():
-            num_frames, height, width = int(num_frames), int(height), int(width)
-            merged_h, merged_w = height // merge_size, width // merge_size
-
-            # Create block indices
-            block_rows = mx.arange(merged_h)
-            block_cols = mx.arange(merged_w)
-
-            # Create intra-block indices
-            intra_row = mx.arange(merge_size)
-            intra_col = mx.arange(merge_size)
-
-            # Compute full-resolution positions
-            row_idx = (
-                block_rows[:, None, None, None] * merge_size
-                + intra_row[None, None, :, None]
-            )
-            col_idx = (
-                block_cols[None, :, None, None] * merge_size
-                + intra_col[None, None, None, :]
-            )
-
-            # Broadcast and flatten
-            row_idx = mx.broadcast_to(
-                row_idx, (merged_h, merged_w, merge_size, merge_size)
-            ).reshape(-1)
-            col_idx = mx.broadcast_to(
-                col_idx, (merged_h, merged_w, merge_size, merge_size)
-            ).reshape(-1)
-
-            # Stack into coordinate pairs
-            coords = mx.stack([row_idx, col_idx], axis=-1)
-
-            # Repeat for temporal dimension
-            if num_frames > 1:
-                coords = mx.tile(coords, (num_frames, 1))
-
-            pos_ids.append(coords)
-
-        # Concatenate all position IDs - shape: (total_tokens, 2)
-        pos_ids = mx.concatenate(pos_ids, axis=0)
-
-        # Lookup embeddings: freq_table[h_pos] and freq_table[w_pos]
-        # pos_ids[:, 0] = height positions, pos_ids[:, 1] = width positions
         h_embeddings = freq_table[pos_ids[:, 0]]  # (total_tokens, dim // 2)
         w_embeddings = freq_table[pos_ids[:, 1]]  # (total_tokens, dim // 2)
 
-        # Concatenate height and width embeddings
-        embeddings = mx.concatenate([h_embeddings, w_embeddings], axis=-1)
-
-        return embeddings
+        return mx.concatenate([h_embeddings, w_embeddings], axis=-1)
 
     def fast_pos_embed_interpolate(self, grid_thw):
         grid_thw_list = grid_thw.tolist()
@@ -387,27 +348,17 @@ class VisionModel(nn.Module):
         hidden_states = hidden_states.reshape(seq_len, -1)
         rotary_pos_emb = rotary_pos_emb.reshape(seq_len, -1)
 
-        # Assuming grid_thw has shape (batch_size, 3)
-        batch_size = grid_thw.shape[0]
-
-        # Calculate cu_seqlens for each item in the batch
-        cu_seqlens = []
-        for i in range(batch_size):
-            seq_len = grid_thw[i, 1] * grid_thw[i, 2]
-            cu_seqlens.append(mx.repeat(seq_len, grid_thw[i, 0]))
-
-        # Concatenate the cu_seqlens for all items in the batch
-        cu_seqlens = mx.concatenate(cu_seqlens)
-
-        cu_seqlens = mx.cumsum(cu_seqlens.astype(mx.int32), axis=0)
-        cu_seqlens = mx.pad(cu_seqlens, (1, 0), mode="constant", constant_values=0)
+        # One attention segment per frame of each grid
+        cu_seqlens = frame_cu_seqlens(grid_thw.tolist())
 
         deepstack_feature_lists = []
+        segments = varlen_segments(cu_seqlens)
         for layer_num, blk in enumerate(self.blocks):
             hidden_states = blk(
                 hidden_states,
                 cu_seqlens=cu_seqlens,
                 rotary_pos_emb=rotary_pos_emb,
+                segments=segments,
             )
             if layer_num in self.deepstack_visual_indexes:
                 deepstack_feature = self.deepstack_merger_list[
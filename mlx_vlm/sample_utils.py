@@ -1,3 +1,6 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
 import mlx.core as mx
 
 
@@ -45,3 +48,196 @@ def top_p_sampling(logits: mx.array, top_p: float, temperature: float) -> mx.arr
         -1
     )
     return token.squeeze(0) if unbatched else token
+
+
+def greedy_sample(logprobs: mx.array) -> mx.array:
+    return mx.argmax(logprobs, axis=-1)
+
+
+@dataclass
+class SamplingParams:
+    """Sampling settings for a single row of a continuous batch.
+
+    ``temperature == 0`` selects greedy decoding. ``top_p`` outside ``(0, 1)``
+    and ``top_k <= 0`` disable the respective filters. ``seed`` makes the row's
+    random stream reproducible independently of the other rows in the batch.
+    """
+
+    temperature: float = 0.0
+    top_p: float = 1.0
+    top_k: int = 0
+    min_p: float = 0.0
+    seed: Optional[int] = None
+
+    @property
+    def is_greedy(self) -> bool:
+        return self.temperature <= 0
+
+    @property
+    def needs_filtering(self) -> bool:
+        return 0 < self.top_p < 1.0 or self.top_k > 0 or self.min_p > 0
+
+
+def batched_sample(
+    logprobs: mx.array,
+    temperature: mx.array,
+    top_p: mx.array,
+    top_k: mx.array,
+    min_p: mx.array,
+    noise: Optional[mx.array] = None,
+    apply_filters: bool = True,
+) -> mx.array:
+    """
+    Sample one token per row with per-row sampling parameters.
+
+    All rows are sampled in a single vectorized pass with the Gumbel-max
+    trick, so rows with different settings can share one decode step.
+
+    Args:
+        logprobs: Log probabilities of shape [B, vocab].
+        temperature: Per-row temperature of shape [B]; rows ``<= 0`` are greedy.
+        top_p: Per-row nucleus threshold of shape [B]; values ``>= 1`` or
+            ``<= 0`` keep the full distribution.
+        top_k: Per-row top-k of shape [B]; values ``<= 0`` keep every token.
+        min_p: Per-row min-p of shape [B]; ``0`` keeps every token.
+        noise: Optional Gumbel noise of shape [B, vocab]. Drawn from the
+            global generator when omitted.
+        apply_filters: When False the top-p/top-k/min-p filters are skipped,
+            which avoids the vocab sort when no row uses them.
+    Returns:
+        Sampled token ids of shape [B].
+    """
+    if logprobs.dtype == mx.bfloat16:
+        logprobs = logprobs.astype(mx.float32)
+
+    greedy = temperature <= 0
+    temp = mx.where(greedy, 1.0, temperature).astype(logprobs.dtype)[:, None]
+    logits = logprobs / temp
+    if noise is None:
+        noise = mx.random.gumbel(shape=logits.shape)
+
+    if apply_filters:
+        vocab = logits.shape[-1]
+        # Filter in descending-probability order, then map back to vocab ids.
+        order = mx.argsort(-logits, axis=-1)
+        sorted_logits = mx.take_along_axis(logits, order, axis=-1)
+        probs = mx.softmax(sorted_logits, axis=-1)
+        rank = mx.arange(vocab)[None]
+
+        k = top_k[:, None]
+        keep = (k <= 0) | (rank < k)
+
+        p = top_p[:, None]
+        exclusive_cumsum = mx.cumsum(probs, axis=-1) - probs
+        keep = keep & ((p <= 0) | (p >= 1.0) | (exclusive_cumsum < p))
+
+        keep = keep & (probs >= min_p[:, None] * probs[:, :1])
+        # Always keep the most likely token so no row is left empty.
+        keep = keep | (rank == 0)
+
+        sorted_logits = mx.where(keep, sorted_logits, -mx.inf)
+        sampled_pos = mx.argmax(sorted_logits + noise, axis=-1)
+        sampled = mx.take_along_axis(order, sampled_pos[:, None], axis=-1).squeeze(-1)
+    else:
+        sampled = mx.argmax(logits + noise, axis=-1)
+
+    return mx.where(greedy, mx.argmax(logprobs, axis=-1), sampled)
+
+
+class BatchSamplingState:
+    """
+    Per-row sampling parameters for a continuous batch.
+
+    Rows are kept in batch order and follow the batch through ``extend`` and
+    ``filter``. Rows without parameters (``None``) are sampled with the
+    fallback sampler passed to :meth:`sample`. Seeded rows own a PRNG key that
+    advances once per step, so their output does not depend on which other
+    requests share the batch.
+    """
+
+    def __init__(self, params: Optional[List[Optional[SamplingParams]]] = None):
+        self.params: List[Optional[SamplingParams]] = list(params or [])
+        self._keys: List[Optional[mx.array]] = [
+            mx.random.key(p.seed) if p is not None and p.seed is not None else None
+            for p in self.params
+        ]
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.params)
+
+    @property
+    def has_params(self) -> bool:
+        return any(p is not None for p in self.params)
+
+    def extend(self, other: "BatchSamplingState"):
+        self.params.extend(other.params)
+        self._keys.extend(other._keys)
+        self._arrays = None
+
+    def filter(self, keep: List[int]):
+        self.params = [self.params[idx] for idx in keep]
+        self._keys = [self._keys[idx] for idx in keep]
+        self._arrays = None
+
+    def _param_arrays(self):
+        if self._arrays is None:
+            rows = [p or SamplingParams() for p in self.params]
+            self._arrays = (
+                mx.array([p.temperature for p in rows], dtype=mx.float32),
+                mx.array([p.top_p for p in rows], dtype=mx.float32),
+                mx.array([p.top_k for p in rows], dtype=mx.int32),
+                mx.array([p.min_p for p in rows], dtype=mx.float32),
+                mx.array([p is None for p in self.params]),
+                any(p is not None and p.needs_filtering for p in self.params),
+            )
+        return self._arrays
+
+    def _noise(self, shape) -> mx.array:
+        if all(key is None for key in self._keys):
+            return mx.random.gumbel(shape=shape)
+        unseeded = mx.random.gumbel(shape=shape)
+        rows = []
+        for i, key in enumerate(self._keys):
+            if key is None:
+                rows.append(unseeded[i])
+                continue
+            key, subkey = mx.random.split(key)
+            self._keys[i] = key
+            rows.append(mx.random.gumbel(shape=shape[1:], key=subkey))
+        return mx.stack(rows)
+
+    def sample(
+        self,
+        logprobs: mx.array,
+        fallback: Optional[Callable[[mx.array], mx.array]] = None,
+    ) -> mx.array:
+        """Sample a [B] token array from [B, vocab] ``logprobs``."""
+        if len(self.params) != logprobs.shape[0]:
+            raise ValueError(
+                f"Sampling state has {len(self.params)} rows but logprobs has "
+                f"{logprobs.shape[0]}; extend/filter must follow the batch."
+            )
+        if fallback is None:
+            fallback = greedy_sample
+        if not self.has_params:
+            return fallback(logprobs)
+
+        temperature, top_p, top_k, min_p, use_fallback, apply_filters = (
+            self._param_arrays()
+        )
+        if all(p is not None and p.is_greedy for p in self.params):
+            return mx.argmax(logprobs, axis=-1)
+
+        tokens = batched_sample(
+            logprobs,
+            temperature,
+            top_p,
+            top_k,
+            min_p,
+            noise=self._noise(logprobs.shape),
+            apply_filters=apply_filters,
+        )
+        if any(p is None for p in self.params):
+            tokens = mx.where(use_fallback, fallback(logprobs), tokens)
+        return tokens
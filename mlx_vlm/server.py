@@ -8,13 +8,13 @@ import re
 import time
 import traceback
 import uuid
-from collections import deque
+from collections import OrderedDict, deque
 from contextlib import asynccontextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from queue import Empty as QueueEmpty
 from queue import Queue
-from threading import Event, Lock, Thread
+from threading import Condition, Event, Lock, Thread
 from typing import Any, Callable, Iterator, List, Literal, Optional, Tuple, Union
 
 logger = logging.getLogger("mlx_vlm.server")
@@ -23,8 +23,9 @@ import mlx.core as mx
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from huggingface_hub import scan_cache_dir
+from mlx.utils import tree_flatten
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing_extensions import Required, TypeAlias, TypedDict
 
@@ -46,34 +47,80 @@ from .generate import (
     normalize_resize_shape,
     stream_generate,
 )
+from .image_fetch import prefetch_images
 from .prompt_utils import apply_chat_template, extract_text_from_content
-from .sample_utils import top_p_sampling
+from .sample_utils import SamplingParams, top_p_sampling
 from .speculative.utils import (
     make_speculative_prompt_cache,
+    restore_speculative_session,
     run_speculative_server_rounds,
+    snapshot_speculative_session,
     speculative_hidden_state,
     speculative_prefill_kwargs,
 )
-from .structured import build_json_schema_logits_processor
+from .structured import build_json_schema_logits_processor, grammar_cache
 from .tokenizer_utils import _ServerTokenStreamer, make_streaming_detokenizer
 from .tool_parsers import _infer_tool_parser_from_processor, load_tool_module
-from .utils import load, prepare_inputs
+from .trainer.lora import LoRaAdapterSet
+from .trainer.utils import load_lora_adapter
+from .utils import get_model_path, group_inputs_by_shape, load, prepare_inputs
 from .version import __version__
-from .vision_cache import VisionFeatureCache
+from .vision_cache import (
+    DEFAULT_VISION_CACHE_BYTES,
+    VisionFeatureCache,
+    processor_fingerprint,
+)
 
 DEFAULT_SERVER_HOST = "0.0.0.0"
 DEFAULT_SERVER_PORT = 8080
 DEFAULT_TOKEN_QUEUE_TIMEOUT = 600.0
 DEFAULT_SPECULATIVE_BATCH_COALESCE_MS = 5.0
+DEFAULT_SPECULATIVE_MAX_COHORTS = 2
+DEFAULT_VISION_ENCODE_BATCH_SIZE = 8
+DEFAULT_MAX_RESIDENT_MODELS = 4
+DEFAULT_MAX_LORA_ADAPTERS = 8
 DEFAULT_ENABLE_THINKING = False
 METRICS_HISTORY_LIMIT = 100
 METRICS_RECENT_LIMIT = 32
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit.
+LATENCY_BUCKETS_S = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+# Envelope field -> histogram name. Inter-token latency comes from token times.
+LATENCY_HISTOGRAMS = {
+    "ttft_s": "ttft_seconds",
+    "queue_wait_s": "queue_wait_seconds",
+    "vision_encode_s": "vision_encode_seconds",
+    "prompt_eval_time_s": "prefill_seconds",
+    "request_elapsed_s": "request_duration_seconds",
+}
 
 
 class PromptTooLongError(ValueError):
     """Raised when a request exceeds the configured server context budget."""
 
 
+class QueueFullError(RuntimeError):
+    """Raised when admission control rejects a request (HTTP 429)."""
+
+
+# Admission priority classes, served strictly in this order.
+PRIORITY_CLASSES = ("interactive", "default", "batch")
+DEFAULT_PRIORITY = "default"
+
+
 def _get_draft_block_size_from_env():
     draft_block_size_str = os.environ.get("MLX_VLM_DRAFT_BLOCK_SIZE")
     return int(draft_block_size_str) if draft_block_size_str else None
@@ -115,6 +162,131 @@ def get_speculative_batch_coalesce_s():
         return DEFAULT_SPECULATIVE_BATCH_COALESCE_MS / 1000.0
 
 
+def get_speculative_max_cohorts():
+    raw = os.environ.get(
+        "MLX_VLM_SPEC_MAX_COHORTS", str(DEFAULT_SPECULATIVE_MAX_COHORTS)
+    )
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return DEFAULT_SPECULATIVE_MAX_COHORTS
+
+
+def get_vision_encode_batch_size():
+    raw = os.environ.get(
+        "MLX_VLM_VISION_ENCODE_BATCH_SIZE", str(DEFAULT_VISION_ENCODE_BATCH_SIZE)
+    )
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return DEFAULT_VISION_ENCODE_BATCH_SIZE
+
+
+def get_vision_cache_size():
+    raw = os.environ.get("MLX_VLM_VISION_CACHE_SIZE")
+    try:
+        return max(1, int(raw)) if raw else None
+    except ValueError:
+        return None
+
+
+def get_vision_cache_bytes():
+    raw = os.environ.get("MLX_VLM_VISION_CACHE_BYTES")
+    try:
+        return max(0, int(raw)) if raw else DEFAULT_VISION_CACHE_BYTES
+    except ValueError:
+        return DEFAULT_VISION_CACHE_BYTES
+
+
+def get_vision_cache_disk_bytes():
+    raw = os.environ.get("MLX_VLM_VISION_CACHE_DISK_BYTES")
+    try:
+        return max(0, int(raw)) if raw else None
+    except ValueError:
+        return None
+
+
+def get_max_resident_models():
+    raw = os.environ.get(
+        "MLX_VLM_MAX_RESIDENT_MODELS", str(DEFAULT_MAX_RESIDENT_MODELS)
+    )
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return DEFAULT_MAX_RESIDENT_MODELS
+
+
+def get_model_pool_bytes():
+    """Byte budget for resident model weights.
+
+    Defaults to Metal's recommended working set so swapping kicks in before
+    unified memory starts paging; ``None`` means only the count cap applies.
+    """
+    raw = os.environ.get("MLX_VLM_MODEL_POOL_BYTES")
+    if raw:
+        try:
+            return max(0, int(raw))
+        except ValueError:
+            pass
+    try:
+        return mx.device_info().get("max_recommended_working_set_size")
+    except Exception:
+        return None
+
+
+def get_lora_hot_swap():
+    raw = os.environ.get("MLX_VLM_LORA_HOT_SWAP", "")
+    return raw.lower() in ("1", "true", "yes", "on")
+
+
+def get_max_lora_adapters():
+    raw = os.environ.get("MLX_VLM_MAX_LORA_ADAPTERS", str(DEFAULT_MAX_LORA_ADAPTERS))
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return DEFAULT_MAX_LORA_ADAPTERS
+
+
+def get_max_queued_requests():
+    """Queued-request bound past which new requests get a 429 (0 = unbounded)."""
+    raw = os.environ.get("MLX_VLM_MAX_QUEUED_REQUESTS", "0")
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return 0
+
+
+def get_max_queued_per_tenant():
+    raw = os.environ.get("MLX_VLM_MAX_QUEUED_PER_TENANT", "0")
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return 0
+
+
+def get_max_tenant_rows():
+    """Concurrent generation rows allowed per tenant (0 = unlimited)."""
+    raw = os.environ.get("MLX_VLM_MAX_TENANT_ROWS", "0")
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return 0
+
+
+def get_tenant_weights() -> dict:
+    """Fair-share weights from ``MLX_VLM_TENANT_WEIGHTS="a=3,b=1"``."""
+    weights = {}
+    for part in os.environ.get("MLX_VLM_TENANT_WEIGHTS", "").split(","):
+        name, sep, value = part.partition("=")
+        if not sep:
+            continue
+        try:
+            weights[name.strip()] = max(1e-6, float(value))
+        except ValueError:
+            continue
+    return weights
+
+
 def get_server_enable_thinking():
     raw = os.environ.get("MLX_VLM_ENABLE_THINKING")
     if raw is None:
@@ -210,6 +382,107 @@ def _token_window_rate_first(token_times: List[float], window: int) -> Optional[
     return (len(subset) - 1) / elapsed
 
 
+class LatencyHistogram:
+    """Fixed-bucket histogram with Prometheus-style cumulative buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_S):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        value = max(0.0, float(value))
+        index = next(
+            (i for i, bound in enumerate(self.buckets) if value <= bound),
+            len(self.buckets),
+        )
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the ``q`` quantile by interpolating within its bucket."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        out, total = [], 0
+        for bound, n in zip([*map(repr, self.buckets), "+Inf"], self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+@dataclass
+class RequestTrace:
+    """Phase boundaries of one request, filled in by the generation thread.
+
+    ``cancelled`` is set by the request handler when its client goes away.
+    """
+
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    admitted_at: Optional[float] = None
+    vision_encode_s: Optional[float] = None
+    prefill_s: Optional[float] = None
+    cancelled: bool = False
+
+    @property
+    def queue_wait_s(self) -> Optional[float]:
+        if self.admitted_at is None:
+            return None
+        waited = self.admitted_at - self.enqueued_at - (self.vision_encode_s or 0.0)
+        return max(0.0, waited)
+
+
+def _prometheus_label(value) -> str:
+    text = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"')
+
+
+def get_trace_file():
+    return os.environ.get("MLX_VLM_TRACE_FILE") or None
+
+
+def _trace_spans(envelope: dict) -> List[dict]:
+    """Sequential phase spans (offsets from request start) for one envelope."""
+    spans = []
+    offset = 0.0
+    for name, key in (
+        ("queue", "queue_wait_s"),
+        ("vision_encode", "vision_encode_s"),
+        ("prefill", "prompt_eval_time_s"),
+    ):
+        duration = envelope.get(key)
+        if duration is not None:
+            spans.append({"name": name, "start_s": offset, "duration_s": duration})
+            offset += duration
+    ttft = envelope.get("ttft_s")
+    decode = envelope.get("decode_elapsed_s")
+    if ttft is not None and decode is not None:
+        spans.append({"name": "decode", "start_s": ttft, "duration_s": decode})
+    return spans
+
+
 class ServerMetricsStore:
     """Rolling request metrics and lifetime counters for the server."""
 
@@ -234,6 +507,17 @@ class ServerMetricsStore:
         self._decode_time_total_s = 0.0
         self._last_request_at: Optional[float] = None
         self._last_error: Optional[dict] = None
+        # (histogram name, endpoint, model) -> LatencyHistogram
+        self._histograms: dict = {}
+        # Trace lines are appended by a background thread, off the event loop.
+        self._trace_queue: Optional[Queue] = None
+
+    def _observe(self, name: str, endpoint: str, model: str, value: float):
+        key = (name, endpoint, model)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram()
+        histogram.observe(value)
 
     def begin_request(self, *, endpoint: str, model: str, stream: bool):
         del endpoint, model
@@ -243,9 +527,19 @@ class ServerMetricsStore:
             if stream:
                 self._streaming_requests += 1
 
-    def record_success(self, envelope: dict):
+    def record_success(self, envelope: dict, token_times: Optional[List[float]] = None):
         payload = dict(envelope)
+        endpoint = payload.get("endpoint", "")
+        model = payload.get("model", "")
         with self._lock:
+            for field_name, histogram in LATENCY_HISTOGRAMS.items():
+                value = payload.get(field_name)
+                if value is not None:
+                    self._observe(histogram, endpoint, model, value)
+            for prev, curr in zip(token_times or [], (token_times or [])[1:]):
+                self._observe(
+                    "inter_token_latency_seconds", endpoint, model, curr - prev
+                )
             self._requests_completed += 1
             self._in_flight = max(0, self._in_flight - 1)
             self._latest = payload
@@ -256,6 +550,51 @@ class ServerMetricsStore:
             self._generated_tokens_total += int(payload.get("generated_tokens") or 0)
             self._request_time_total_s += float(payload.get("request_elapsed_s") or 0.0)
             self._decode_time_total_s += float(payload.get("decode_elapsed_s") or 0.0)
+        trace_file = get_trace_file()
+        if trace_file:
+            self._export_trace(trace_file, payload)
+
+    def _export_trace(self, path: str, envelope: dict):
+        """Queue one request span (with phase children) for the trace writer."""
+        span = {
+            "trace_id": uuid.uuid4().hex,
+            "name": envelope.get("endpoint"),
+            "model": envelope.get("model"),
+            "start_unix": envelope.get("timestamp_unix", time.time())
+            - (envelope.get("request_elapsed_s") or 0.0),
+            "duration_s": envelope.get("request_elapsed_s"),
+            "attributes": {
+                k: envelope.get(k)
+                for k in ("prompt_tokens", "completion_tokens", "finish_reason")
+            },
+            "spans": _trace_spans(envelope),
+        }
+        with self._lock:
+            if self._trace_queue is None:
+                self._trace_queue = Queue()
+                Thread(
+                    target=self._write_traces, args=(self._trace_queue,), daemon=True
+                ).start()
+            self._trace_queue.put((path, json.dumps(span) + "\n"))
+
+    @staticmethod
+    def _write_traces(traces: Queue):
+        while True:
+            path, line = traces.get()
+            try:
+                with open(path, "a") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning("Could not write request trace to %s: %s", path, e)
+            finally:
+                traces.task_done()
+
+    def flush_traces(self):
+        """Block until every queued trace line has been written."""
+        with self._lock:
+            traces = self._trace_queue
+        if traces is not None:
+            traces.join()
 
     def record_failure(self, *, endpoint: str, model: str, stream: bool, error: str):
         with self._lock:
@@ -294,9 +633,15 @@ class ServerMetricsStore:
                 dict(self._last_error) if self._last_error is not None else None
             )
             last_request_at = self._last_request_at
+            histograms = {}
+            for (name, endpoint, model), histogram in sorted(self._histograms.items()):
+                histograms.setdefault(name, []).append(
+                    {"endpoint": endpoint, "model": model, **histogram.summary()}
+                )
             return {
                 "latest": latest,
                 "recent": recent,
+                "histograms": histograms,
                 "summary": {
                     "uptime_s": max(0.0, time.time() - self.started_at),
                     "requests_started": self._requests_started,
@@ -315,6 +660,47 @@ class ServerMetricsStore:
                 },
             }
 
+    def prometheus(self) -> str:
+        """Render counters and latency histograms in Prometheus text format."""
+        lines = []
+        with self._lock:
+            counters = (
+                ("requests_started_total", "counter", self._requests_started),
+                ("requests_completed_total", "counter", self._requests_completed),
+                ("requests_failed_total", "counter", self._requests_failed),
+                ("requests_in_flight", "gauge", self._in_flight),
+                ("prompt_tokens_total", "counter", self._prompt_tokens_total),
+                ("generated_tokens_total", "counter", self._generated_tokens_total),
+            )
+            grammar = grammar_cache.stats()
+            counters += (
+                ("grammar_cache_hits_total", "counter", grammar["hits"]),
+                ("grammar_cache_misses_total", "counter", grammar["misses"]),
+                ("grammar_cache_evictions_total", "counter", grammar["evictions"]),
+                ("grammar_cache_entries", "gauge", grammar["entries"]),
+            )
+            for name, kind, value in counters:
+                lines.append(f"# TYPE mlx_vlm_{name} {kind}")
+                lines.append(f"mlx_vlm_{name} {value}")
+            by_name: dict = {}
+            for (name, endpoint, model), histogram in sorted(self._histograms.items()):
+                by_name.setdefault(name, []).append((endpoint, model, histogram))
+            for name, series in by_name.items():
+                metric = f"mlx_vlm_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for endpoint, model, histogram in series:
+                    labels = (
+                        f'endpoint="{_prometheus_label(endpoint)}",'
+                        f'model="{_prometheus_label(model)}"'
+                    )
+                    for bound, total in histogram.cumulative():
+                        lines.append(
+                            f'{metric}_bucket{{{labels},le="{bound}"}} {total}'
+                        )
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
 
 def _prompt_eval_time_from_tps(
     prompt_tokens: int, prompt_tps: Optional[float]
@@ -360,6 +746,7 @@ def _build_metrics_envelope(
     thinking_enabled: bool = False,
     tool_parser: Optional[str] = None,
     tool_calls: bool = False,
+    trace: Optional[RequestTrace] = None,
 ) -> dict:
     token_times = token_times or []
     ttft_s = max(0.0, token_times[0] - request_started_s) if token_times else None
@@ -372,6 +759,8 @@ def _build_metrics_envelope(
     elif decode_elapsed_s is not None and decode_elapsed_s > 0 and generated_tokens > 0:
         decode_tok_s = generated_tokens / decode_elapsed_s
     prompt_eval_time_s = _prompt_eval_time_from_tps(prompt_tokens, prompt_tps)
+    if trace is not None and trace.prefill_s is not None:
+        prompt_eval_time_s = trace.prefill_s
     request_tok_s = (
         completion_tokens / request_elapsed_s if request_elapsed_s > 0 else 0.0
     )
@@ -387,6 +776,8 @@ def _build_metrics_envelope(
         "reasoning_tokens": max(0, int(generated_tokens) - int(completion_tokens)),
         "total_tokens": int(prompt_tokens) + int(completion_tokens),
         "prompt_eval_time_s": prompt_eval_time_s,
+        "queue_wait_s": trace.queue_wait_s if trace is not None else None,
+        "vision_encode_s": trace.vision_encode_s if trace is not None else None,
         "prefill_tok_s": prompt_tps,
         "ttft_s": ttft_s,
         "decode_elapsed_s": decode_elapsed_s,
@@ -438,11 +829,31 @@ def _server_runtime_snapshot() -> dict:
         ),
         "continuous_batching_enabled": response_generator is not None,
         "request_queue_depth": queue_depth,
+        "admission": (
+            response_generator.requests.stats()
+            if response_generator is not None
+            and hasattr(getattr(response_generator, "requests", None), "stats")
+            else None
+        ),
+        "resident_models": [
+            {
+                "model": entry.cache.get("model_path"),
+                "adapter": entry.cache.get("adapter_path"),
+                "weight_bytes": entry.nbytes,
+                "request_queue_depth": (
+                    entry.generator.requests.qsize()
+                    if entry.generator is not None
+                    else 0
+                ),
+            }
+            for entry in reversed(model_pool.values())
+        ],
         "apc": (
             {"enabled": False}
             if apc_manager is None
             else {"enabled": True, **apc_manager.stats_snapshot()}
         ),
+        "grammar_cache": grammar_cache.stats(),
     }
 
 
@@ -471,6 +882,13 @@ class GenerationArguments:
     # cached blocks from one tenant can't be reused (or detected via timing)
     # by another. None = no salt = single-tenant behaviour.
     tenant_id: Optional[str] = None
+    # LoRA adapter applied to this request's rows over the shared base model
+    # (hot-swap mode). None = base weights.
+    lora_adapter: Optional[str] = None
+    # Phase timings recorded by the generation thread for /metrics.
+    trace: Optional[RequestTrace] = None
+    # Admission class, one of PRIORITY_CLASSES.
+    priority: str = DEFAULT_PRIORITY
 
     def to_generate_kwargs(self) -> dict:
         """Convert to kwargs dict for generate()/stream_generate()."""
@@ -527,13 +945,485 @@ class StreamingToken:
     top_logprobs: Optional[List[Tuple[int, float]]] = None
 
 
+@dataclass
+class _SpeculativeCohort:
+    """Requests prefilled together and decoded by one speculative round loop."""
+
+    uids: List[int] = field(default_factory=list)
+    rqueues: dict = field(default_factory=dict)
+    token_lists: dict = field(default_factory=dict)
+    stream_infos: dict = field(default_factory=dict)
+    max_tokens_map: dict = field(default_factory=dict)
+    prompt_tps_map: dict = field(default_factory=dict)
+    finished_uids: set = field(default_factory=set)
+    rounds_iter: Optional[Iterator] = None
+    # Target/drafter state swapped in before each step of ``rounds_iter``.
+    session: Optional[dict] = None
+
+    @property
+    def done(self) -> bool:
+        return len(self.finished_uids) >= len(self.uids)
+
+    def cancel(self, uids: set):
+        """Mark abandoned requests finished so the round loop evicts them."""
+        for uid in uids:
+            if uid in self.rqueues and uid not in self.finished_uids:
+                self.finished_uids.add(uid)
+                self.rqueues[uid].put(None)
+
+    def unfinished_queues(self) -> list:
+        return [
+            rqueue
+            for uid, rqueue in self.rqueues.items()
+            if uid not in self.finished_uids
+        ]
+
+
+def _fail_speculative_requests(rqueues: list, error: Exception):
+    """Report ``error`` to each response queue and end its stream."""
+    print(f"Error in speculative generation thread: {error}")
+    traceback.print_exc()
+    for rqueue in {id(q): q for q in rqueues}.values():
+        rqueue.put(error)
+        rqueue.put(None)
+
+
+def _speculative_sampling_key(args: "GenerationArguments") -> tuple:
+    if args.temperature == 0:
+        return (0.0,)
+    return (args.temperature, args.top_p)
+
+
+def _take_speculative_group(waiting: deque) -> list:
+    """Pop the oldest waiting request plus every peer with the same sampler."""
+    first = waiting.popleft()
+    key = _speculative_sampling_key(first[3])
+    group = [first]
+    rest = []
+    while waiting:
+        item = waiting.popleft()
+        if _speculative_sampling_key(item[3]) == key:
+            group.append(item)
+        else:
+            rest.append(item)
+    waiting.extend(rest)
+    return group
+
+
+def _request_cancelled(args) -> bool:
+    return bool(getattr(getattr(args, "trace", None), "cancelled", False))
+
+
+def _fail_cancelled_requests(items: list):
+    """Answer requests dropped before admission so ``generate`` returns."""
+    for item in items:
+        item[0].put(RuntimeError("Request was cancelled before it was admitted."))
+
+
+class VisionEncodeStage:
+    """
+    Requests waiting for ``get_input_embeddings`` on the generation thread.
+
+    Encoding a new image request inline stalls every in-flight decode stream
+    for the whole vision-tower forward. The stage instead releases at most one
+    encode group per decode step while streams are active, and everything at
+    once when the generator is idle. Text-only requests only need an
+    embedding lookup and are always released immediately. Requests whose
+    vision inputs share shapes (see ``group_inputs_by_shape``) are encoded
+    together through ``encode_batch`` when the model supports it; prompt
+    lengths do not split a group. Requests cancelled while they wait are
+    removed by ``drain_cancelled``.
+
+    Args:
+        encode: ``(raw_inputs, images) -> (input_ids, gen_kwargs)``
+        encode_batch: ``(raw_inputs_list, images_list) -> list | None``; a
+            ``None`` result falls back to per-request ``encode``.
+        max_batch_size: Maximum number of requests per vision forward.
+    """
+
+    def __init__(
+        self,
+        encode: Callable,
+        encode_batch: Optional[Callable] = None,
+        max_batch_size: int = DEFAULT_VISION_ENCODE_BATCH_SIZE,
+    ):
+        self.encode = encode
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: deque = deque()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, items: list):
+        self._pending.extend(items)
+
+    @staticmethod
+    def _vision_inputs(item) -> dict:
+        return {
+            k: v for k, v in item[1].items() if k not in ("input_ids", "attention_mask")
+        }
+
+    @classmethod
+    def _needs_vision(cls, item) -> bool:
+        return any(isinstance(v, mx.array) for v in cls._vision_inputs(item).values())
+
+    def drain_cancelled(self) -> list:
+        """Remove and return the pending requests whose client went away."""
+        cancelled = [item for item in self._pending if _request_cancelled(item[3])]
+        for item in cancelled:
+            self._pending.remove(item)
+        return cancelled
+
+    def _next_group(self) -> list:
+        """Pop the oldest vision request and its peers with same-shape images."""
+        vision_items = [item for item in self._pending if self._needs_vision(item)]
+        if not vision_items:
+            return []
+        _, grouped_indices = group_inputs_by_shape(
+            [self._vision_inputs(item) for item in vision_items]
+        )
+        first_group = next(
+            indices for indices in grouped_indices.values() if indices[0] == 0
+        )
+        group = [vision_items[i] for i in first_group[: self.max_batch_size]]
+        for item in group:
+            self._pending.remove(item)
+        return group
+
+    def _encode_group(self, group: list) -> list:
+        tic = time.perf_counter()
+        results = self._encode_group_inputs(group)
+        if self._needs_vision(group[0]):
+            # Materialize the embeddings here so the vision forward is timed
+            # (and run) between decode steps rather than inside prefill.
+            embeds = [
+                encoded[1].get("inputs_embeds")
+                for _, encoded in results
+                if not isinstance(encoded, Exception)
+            ]
+            mx.eval([e for e in embeds if isinstance(e, mx.array)])
+            elapsed = time.perf_counter() - tic
+            for item, _ in results:
+                trace = getattr(item[3], "trace", None)
+                if trace is not None:
+                    trace.vision_encode_s = elapsed
+        return results
+
+    def _encode_group_inputs(self, group: list) -> list:
+        if len(group) > 1 and self.encode_batch is not None:
+            try:
+                encoded = self.encode_batch(
+                    [item[1] for item in group], [item[4] for item in group]
+                )
+            except Exception as e:
+                logger.warning(
+                    "Batched vision encode failed, retrying per request: %s", e
+                )
+                encoded = None
+            if encoded is not None:
+                return list(zip(group, encoded))
+        results = []
+        for item in group:
+            try:
+                results.append((item, self.encode(item[1], item[4])))
+            except Exception as e:
+                results.append((item, e))
+        return results
+
+    def step(self, decoding: bool) -> list:
+        """Encode the next share of pending requests.
+
+        Returns ``(item, encoded)`` pairs in arrival order, where ``encoded``
+        is ``(input_ids, gen_kwargs)`` or the exception raised for that item.
+        """
+        released = []
+        text_items = [item for item in self._pending if not self._needs_vision(item)]
+        for item in text_items:
+            self._pending.remove(item)
+        released.extend(self._encode_group([item]) for item in text_items)
+
+        while True:
+            group = self._next_group()
+            if not group:
+                break
+            released.append(self._encode_group(group))
+            if decoding:
+                break
+        return [pair for pairs in released for pair in pairs]
+
+
+class AdmissionQueue:
+    """
+    Request queue for the generation thread with priorities and fair sharing.
+
+    Drop-in for the ``Queue`` previously used by ``ResponseGenerator``:
+    ``put``/``get``/``get_nowait``/``qsize`` keep their meaning, and ``None``
+    is still the stop sentinel. Items are ``(rqueue, raw_inputs,
+    prompt_tokens, args, images)`` and are keyed on ``args.tenant_id`` and
+    ``args.priority``.
+
+    - Priority classes (``PRIORITY_CLASSES``) are served strictly in order.
+    - Within a class, tenants share admission by start-time fair queuing: a
+      request's tag is its tenant's previous tag (or the current virtual time)
+      plus ``(prompt_tokens + max_tokens) / weight``, and the smallest tag at
+      the head of a tenant queue goes next. A tenant flooding long prompts
+      therefore cannot push other tenants' requests back.
+    - A tenant already holding ``max_tenant_rows`` admitted requests is
+      skipped until ``release`` is called for one of them.
+    - ``put`` raises :class:`QueueFullError` past ``max_queued`` requests in
+      total or ``max_queued_per_tenant`` for one tenant, and once the queue
+      has been closed by ``close_if_idle``.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_queued: Optional[int] = None,
+        max_queued_per_tenant: Optional[int] = None,
+        max_tenant_rows: Optional[int] = None,
+        weights: Optional[dict] = None,
+    ):
+        self.max_queued = (
+            get_max_queued_requests() if max_queued is None else max_queued
+        )
+        self.max_queued_per_tenant = (
+            get_max_queued_per_tenant()
+            if max_queued_per_tenant is None
+            else max_queued_per_tenant
+        )
+        self.max_tenant_rows = (
+            get_max_tenant_rows() if max_tenant_rows is None else max_tenant_rows
+        )
+        self.weights = get_tenant_weights() if weights is None else weights
+        self._cond = Condition()
+        self._control = 0
+        # priority -> tenant -> deque[(tag, item)]
+        self._queues = {p: {} for p in PRIORITY_CLASSES}
+        self._finish_tags: dict = {}
+        self._virtual_time = 0.0
+        self._size = 0
+        self._queued_by_tenant: dict = {}
+        self._admitted: dict = {}
+        self._rows_by_tenant: dict = {}
+        self._closed = False
+        self.rejected = 0
+
+    @staticmethod
+    def _tenant(item) -> str:
+        return getattr(item[3], "tenant_id", None) or ""
+
+    @staticmethod
+    def _priority(item) -> str:
+        priority = getattr(item[3], "priority", None) or DEFAULT_PRIORITY
+        return priority if priority in PRIORITY_CLASSES else DEFAULT_PRIORITY
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._size
+
+    def check_admission(self, tenant_id: Optional[str] = None):
+        """Raise :class:`QueueFullError` if a request would be rejected now."""
+        with self._cond:
+            reason = self._full_reason_locked(tenant_id or "")
+            if reason is not None:
+                self._reject_locked(reason)
+
+    def in_use(self) -> bool:
+        """Whether any request is queued or still holds an admitted row."""
+        with self._cond:
+            return bool(self._size or self._admitted)
+
+    def close_if_idle(self) -> bool:
+        """Turn away new requests unless some are queued or admitted.
+
+        Returns ``True`` when the queue was closed.
+        """
+        with self._cond:
+            if self._size or self._admitted:
+                return False
+            self._closed = True
+            return True
+
+    def _full_reason_locked(self, tenant: str) -> Optional[str]:
+        if self._closed:
+            return "Model is being unloaded; retry the request."
+        if self.max_queued and self._size >= self.max_queued:
+            return f"Server queue is full ({self._size} requests waiting)."
+        queued = self._queued_by_tenant.get(tenant, 0)
+        if self.max_queued_per_tenant and queued >= self.max_queued_per_tenant:
+            return (
+                f"Too many queued requests for tenant {tenant or 'default'!r} "
+                f"({queued} waiting)."
+            )
+        return None
+
+    def _reject_locked(self, reason: str):
+        # The one place a request is turned away, so each counts once.
+        self.rejected += 1
+        raise QueueFullError(reason)
+
+    def put(self, item):
+        with self._cond:
+            if item is None:
+                self._control += 1
+                self._cond.notify()
+                return
+            tenant = self._tenant(item)
+            reason = self._full_reason_locked(tenant)
+            if reason is not None:
+                self._reject_locked(reason)
+            args = item[3]
+            cost = max(1, int(item[2] or 0) + int(getattr(args, "max_tokens", 0) or 0))
+            start = max(self._virtual_time, self._finish_tags.get(tenant, 0.0))
+            tag = start + cost / self.weights.get(tenant, 1.0)
+            self._finish_tags[tenant] = tag
+            self._queues[self._priority(item)].setdefault(tenant, deque()).append(
+                (tag, item)
+            )
+            self._queued_by_tenant[tenant] = self._queued_by_tenant.get(tenant, 0) + 1
+            self._size += 1
+            self._cond.notify()
+
+    def _pop_locked(self):
+        if self._control:
+            self._control -= 1
+            return None, True
+        for priority in PRIORITY_CLASSES:
+            candidates = [
+                (pending[0][0], tenant)
+                for tenant, pending in self._queues[priority].items()
+                if pending
+                and not (
+                    self.max_tenant_rows
+                    and self._rows_by_tenant.get(tenant, 0) >= self.max_tenant_rows
+                )
+            ]
+            if not candidates:
+                continue
+            tag, tenant = min(candidates)
+            _, item = self._queues[priority][tenant].popleft()
+            self._virtual_time = max(self._virtual_time, tag)
+            self._size -= 1
+            self._queued_by_tenant[tenant] -= 1
+            self._rows_by_tenant[tenant] = self._rows_by_tenant.get(tenant, 0) + 1
+            self._admitted[id(item[0])] = tenant
+            return item, True
+        return None, False
+
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                item, found = self._pop_locked()
+                if found:
+                    return item
+                if not block:
+                    raise QueueEmpty
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise QueueEmpty
+                self._cond.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def release(self, rqueue):
+        """Free the tenant row held by the request answering on ``rqueue``."""
+        with self._cond:
+            tenant = self._admitted.pop(id(rqueue), None)
+            if tenant is None:
+                return
+            self._rows_by_tenant[tenant] = max(
+                0, self._rows_by_tenant.get(tenant, 0) - 1
+            )
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": self._size,
+                "queued_by_priority": {
+                    p: sum(len(q) for q in tenants.values())
+                    for p, tenants in self._queues.items()
+                },
+                "queued_by_tenant": {
+                    t or "default": n for t, n in self._queued_by_tenant.items() if n
+                },
+                "active_rows_by_tenant": {
+                    t or "default": n for t, n in self._rows_by_tenant.items() if n
+                },
+                "rejected": self.rejected,
+            }
+
+
+class _GPUWorker:
+    """
+    The one thread that issues GPU work for every resident model.
+
+    Each ``ResponseGenerator`` registers its loop as an iterator of steps and
+    the worker advances every loop by one step in turn, so resident models
+    share the device without racing each other's MLX streams. A step yields
+    ``True`` while its loop has work in flight; when none does, the worker
+    sleeps until :meth:`wake` is called or ``idle_timeout`` passes. The thread
+    exits once no loops are registered and restarts on the next ``add``.
+    """
+
+    def __init__(self, idle_timeout: float = 0.1):
+        self.idle_timeout = idle_timeout
+        self._lock = Lock()
+        self._runners: list = []
+        self._wakeup = Event()
+        self._thread: Optional[Thread] = None
+
+    def add(self, steps: Iterator[bool], on_exit=None):
+        with self._lock:
+            self._runners.append((steps, on_exit))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self.wake()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                runners = list(self._runners)
+                if not runners:
+                    self._thread = None
+                    return
+            self._wakeup.clear()
+            busy = False
+            for runner in runners:
+                steps, on_exit = runner
+                try:
+                    busy = bool(next(steps)) or busy
+                    continue
+                except StopIteration:
+                    pass
+                except Exception:
+                    logger.exception("Error in GPU worker loop")
+                with self._lock:
+                    self._runners.remove(runner)
+                if on_exit is not None:
+                    on_exit()
+            if not busy:
+                self._wakeup.wait(self.idle_timeout)
+
+
+_gpu_worker = _GPUWorker()
+
+
 class ResponseGenerator:
     """
-    Continuous batching for concurrent requests via a single GPU thread.
+    Continuous batching for concurrent requests on the shared GPU worker.
 
-    A dedicated thread owns all GPU work (BatchGenerator). FastAPI async
-    handlers submit requests to a queue and read tokens back from
-    per-request queues. Multiple requests are batched together for
+    The generation loop owns all GPU work (BatchGenerator) and runs as steps
+    on ``_gpu_worker``, interleaved with the loops of other resident models.
+    FastAPI async handlers submit requests to a queue and read tokens back
+    from per-request queues. Multiple requests are batched together for
     higher throughput — same pattern as mlx-lm's server.
     """
 
@@ -564,19 +1454,42 @@ class ResponseGenerator:
         self.top_logprobs_k = top_logprobs_k
         self.apc_manager = apc_manager
         self.tokenizer = None
-        self.requests: Queue = Queue()
+        self.requests = AdmissionQueue()
         self._stop = False
         self._ready = Event()
         self._load_error: Optional[Exception] = None
         self._cancelled: set = set()
         self._cancel_lock = Lock()
-        self._thread = Thread(target=self._run, daemon=True)
-        self._thread.start()
+        self._retiring = False
+        self._finished = Event()
+        Thread(target=self._load_and_register, daemon=True).start()
 
     def stop_and_join(self):
         self._stop = True
         self.requests.put(None)
-        self._thread.join(timeout=5.0)
+        _gpu_worker.wake()
+        self._finished.wait(timeout=5.0)
+
+    @property
+    def in_use(self) -> bool:
+        """Whether requests are queued on or streaming from this generator."""
+        in_use = getattr(self.requests, "in_use", None)
+        return bool(in_use is not None and in_use())
+
+    def retire(self):
+        """Stop taking requests and shut down once the bound ones finish.
+
+        The loop then drops the APC pool and vision cache itself.
+        """
+        self._retiring = True
+        _gpu_worker.wake()
+
+    def _drained(self) -> bool:
+        """Whether a retiring generator has closed with nothing left to serve."""
+        if not getattr(self, "_retiring", False):
+            return False
+        close = getattr(self.requests, "close_if_idle", None)
+        return close is None or close()
 
     def wait_until_ready(self, timeout: Optional[float] = None):
         if not self._ready.wait(timeout):
@@ -588,6 +1501,19 @@ class ResponseGenerator:
     def _cancel(self, uid):
         with self._cancel_lock:
             self._cancelled.add(uid)
+        _gpu_worker.wake()
+
+    def abandon(self, args: GenerationArguments):
+        """Give up on the request submitted with ``args``.
+
+        For handlers whose client went away: the request is dropped wherever
+        it is — still queued, waiting for the vision encoder, or decoding
+        with nobody reading its stream.
+        """
+        if args.trace is None:
+            args.trace = RequestTrace()
+        args.trace.cancelled = True
+        _gpu_worker.wake()
 
     def _drain_cancellations(self) -> set:
         with self._cancel_lock:
@@ -609,7 +1535,16 @@ class ResponseGenerator:
         draft_model = None
         draft_kind = os.environ.get("MLX_VLM_DRAFT_KIND")
         draft_model_path = os.environ.get("MLX_VLM_DRAFT_MODEL")
-        if draft_model_path:
+        if draft_kind == "ngram":
+            from .speculative.ngram import NGramDrafter
+
+            if draft_model_path:
+                raise ValueError(
+                    "--draft-kind ngram drafts from the prompt; drop --draft-model."
+                )
+            draft_model = NGramDrafter()
+            print("Prompt-lookup (n-gram) speculative decoding enabled.")
+        elif draft_model_path:
             from .speculative.drafters import load_drafter
 
             print(
@@ -633,6 +1568,7 @@ class ResponseGenerator:
         self.stop_tokens = stop_tokens
         self.draft_model = draft_model
         self.draft_kind = draft_kind
+        self.lora_adapters = LoRaAdapterSet(model.language_model)
         self.tokenizer = (
             processor.tokenizer if hasattr(processor, "tokenizer") else processor
         )
@@ -650,6 +1586,10 @@ class ResponseGenerator:
             raise ValueError(
                 "Structured response_format is not supported with speculative decoding."
             )
+        if self.draft_model is not None and args.lora_adapter is not None:
+            raise ValueError(
+                "LoRA adapter hot-swap is not supported with speculative decoding."
+            )
         rqueue: Queue = Queue()
 
         # CPU preprocessing (tokenize, load images) on caller thread.
@@ -658,11 +1598,15 @@ class ResponseGenerator:
         prompt_tokens = _count_prompt_tokens(raw_inputs)
         _check_configured_context_budget(prompt_tokens, args.max_tokens)
 
+        if args.trace is None:
+            args.trace = RequestTrace()
         self.requests.put((rqueue, raw_inputs, prompt_tokens, args, images))
+        _gpu_worker.wake()
 
         # Block until the GPU thread sends back the context
         ctx = rqueue.get()
         if isinstance(ctx, Exception):
+            self._release_row(rqueue)
             raise ctx
 
         uid = ctx.uid
@@ -703,9 +1647,24 @@ class ResponseGenerator:
             finally:
                 if not ended:
                     self._cancel(uid)
+                self._release_row(rqueue)
 
         return ctx, token_iterator()
 
+    def _release_row(self, rqueue):
+        """Return the tenant's admission slot held by this request."""
+        release = getattr(getattr(self, "requests", None), "release", None)
+        if release is not None:
+            release(rqueue)
+            # A freed tenant row can unblock a queued request.
+            _gpu_worker.wake()
+
+    def check_admission(self, args: Optional[GenerationArguments] = None):
+        """Raise :class:`QueueFullError` when a new request would be rejected."""
+        check = getattr(getattr(self, "requests", None), "check_admission", None)
+        if check is not None:
+            check(getattr(args, "tenant_id", None))
+
     def _cpu_preprocess(self, prompt, images=None, audio=None) -> dict:
         """CPU-only: tokenize text, load/resize images. Thread-safe."""
         add_special_tokens = (
@@ -737,8 +1696,44 @@ class ResponseGenerator:
 
         return sampler
 
-    def _gpu_embed(self, raw_inputs: dict, images=None) -> Tuple[mx.array, dict]:
-        """GPU-only: run vision encoder if needed. Must run on GPU thread."""
+    def _sampling_params(self, args: GenerationArguments) -> SamplingParams:
+        """Per-request sampling settings for the continuous-batching loop."""
+        return SamplingParams(
+            temperature=args.temperature,
+            top_p=args.top_p,
+            top_k=args.top_k,
+            min_p=args.min_p,
+            seed=args.seed,
+        )
+
+    def _ensure_lora_adapter(self, name: str, batch_gen: BatchGenerator):
+        """Make adapter ``name`` resident, evicting idle ones past the cap."""
+        adapters = self.lora_adapters
+        if name in adapters:
+            adapters.touch(name)
+            return
+        in_use = batch_gen.active_adapters()
+        while len(adapters) >= get_max_lora_adapters():
+            victim = adapters.least_recent(exclude=in_use)
+            if victim is None:
+                raise RuntimeError(
+                    "Every resident LoRA adapter is in use; raise "
+                    "MLX_VLM_MAX_LORA_ADAPTERS or retry later."
+                )
+            print(f"Evicting LoRA adapter: {victim}")
+            adapters.remove(victim)
+        print(f"Loading LoRA adapter: {name}")
+        layers, scale = load_lora_adapter(name)
+        adapters.add(name, layers, scale)
+
+    def _gpu_embed(
+        self, raw_inputs: dict, images=None, cached_image_features=None
+    ) -> Tuple[mx.array, dict]:
+        """GPU-only: run vision encoder if needed. Must run on GPU thread.
+
+        ``cached_image_features`` skips the vision tower with features that
+        were already computed for this request.
+        """
         input_ids = raw_inputs.get("input_ids")
         pixel_values = raw_inputs.get("pixel_values")
         mask = raw_inputs.get("attention_mask")
@@ -755,6 +1750,8 @@ class ResponseGenerator:
         ):
             data_kwargs["vision_cache"] = self.vision_cache
             data_kwargs["_image_key"] = images
+        if cached_image_features is not None:
+            data_kwargs["cached_image_features"] = cached_image_features
 
         # Always call get_input_embeddings — BatchGenerator requires inputs_embeds
         embed = self.model.get_input_embeddings(
@@ -763,15 +1760,54 @@ class ResponseGenerator:
         # Remove cache kwargs before passing to BatchGenerator
         data_kwargs.pop("vision_cache", None)
         data_kwargs.pop("_image_key", None)
+        data_kwargs.pop("cached_image_features", None)
         gen_kwargs = {**data_kwargs, **embed.to_dict()}
-        if images is not None:
-            gen_kwargs["_apc_image_hash"] = _apc.hash_image_payload(image_ref=images)
-        elif pixel_values is not None:
-            gen_kwargs["_apc_image_hash"] = _apc.hash_image_payload(
-                pixel_values=pixel_values
-            )
+        gen_kwargs.update(_apc.image_prompt_kwargs(images, pixel_values))
         return input_ids, gen_kwargs
 
+    def _gpu_embed_batch(
+        self, raw_inputs_list: List[dict], images_list: List
+    ) -> Optional[List[Union[Tuple[mx.array, dict], Exception]]]:
+        """GPU-only: run the vision tower once for a group of requests.
+
+        Images missing from the vision cache are encoded together through the
+        model's ``encode_packed_images`` and stored in it; each request's
+        embeddings are then built from its slice of the features by
+        ``_gpu_embed``. Prompts may
+        differ in length, and models that keep positional state on the
+        language model (Qwen mRoPE) set it per request exactly as the
+        single-request path does. A request that fails to embed gets its
+        exception in place of the result. Returns ``None`` when the model
+        cannot encode images on their own.
+        """
+        encode_packed_images = getattr(self.model, "encode_packed_images", None)
+        if encode_packed_images is None or len(raw_inputs_list) < 2:
+            return None
+
+        cache = self.vision_cache
+        features = [
+            cache.get(images) if cache is not None and images is not None else None
+            for images in images_list
+        ]
+        missing = [i for i, cached in enumerate(features) if cached is None]
+        if missing:
+            packed = encode_packed_images([raw_inputs_list[i] for i in missing])
+            mx.eval(packed)
+            for i, encoded in zip(missing, packed):
+                features[i] = encoded
+                if cache is not None and images_list[i] is not None:
+                    cache.put(images_list[i], encoded)
+
+        results = []
+        for raw_inputs, images, cached in zip(raw_inputs_list, images_list, features):
+            try:
+                results.append(
+                    self._gpu_embed(raw_inputs, images, cached_image_features=cached)
+                )
+            except Exception as e:
+                results.append(e)
+        return results
+
     def _collect_pending_requests(
         self,
         *,
@@ -811,7 +1847,23 @@ class ResponseGenerator:
         return pending, should_stop
 
     def _run(self):
-        """Single GPU thread: owns BatchGenerator, runs tight next() loop."""
+        """Load the model and run the whole loop on the calling thread."""
+        if self._load():
+            for _ in self._steps():
+                pass
+
+    def _load_and_register(self):
+        """Load the model on this thread, then hand its loop to the GPU worker.
+
+        Loading weights can take minutes; the other resident models keep
+        decoding on the worker meanwhile.
+        """
+        if self._load():
+            _gpu_worker.add(self._steps(idle_timeout=0.0), self._finished.set)
+        else:
+            self._finished.set()
+
+    def _load(self) -> bool:
         try:
             self._initialize_model()
         except Exception as e:
@@ -819,49 +1871,88 @@ class ResponseGenerator:
             self._ready.set()
             print(f"Error loading model in generation thread: {e}")
             traceback.print_exc()
-            return
-
+            return False
         self._ready.set()
+        return True
+
+    def _steps(self, idle_timeout: float = 0.1) -> Iterator[bool]:
+        """Advance the generation loop one step per yield.
 
+        Each yield reports whether requests are in flight. ``idle_timeout`` is
+        how long a step may block waiting for a request while idle; the GPU
+        worker passes 0 and sleeps on its own wakeup instead.
+        """
         if self.draft_model is not None:
-            self._run_speculative()
-            return
+            yield from self._speculative_steps(idle_timeout)
+        else:
+            yield from self._generation_steps(idle_timeout)
 
+        if self._drained():
+            if self.apc_manager is not None:
+                self.apc_manager.clear()
+            if self.vision_cache is not None:
+                self.vision_cache.clear()
+
+    def _generation_steps(self, idle_timeout: float) -> Iterator[bool]:
+        """Continuous-batching loop: owns BatchGenerator, one next() per step."""
         generation_stream = mx.default_stream(mx.default_device())
 
         batch_gen = None
         # uid -> {rqueue, tokens, gen_kwargs}
         active: dict = {}
+        encode_stage = VisionEncodeStage(
+            self._gpu_embed,
+            self._gpu_embed_batch,
+            max_batch_size=get_vision_encode_batch_size(),
+        )
 
         while not self._stop:
             try:
-                # Poll the request queue — non-blocking when generating, short
-                # blocking wait when idle so we don't spin.
+                if self._drained():
+                    break
+                # Poll the request queue — non-blocking when generating or
+                # encoding, short blocking wait when idle so we don't spin.
                 new_items, should_stop = self._collect_pending_requests(
-                    active=bool(active)
+                    active=bool(active) or bool(encode_stage),
+                    idle_timeout=idle_timeout,
                 )
                 if should_stop:
                     break
+                encode_stage.submit(new_items)
 
                 # Drop abandoned requests before doing more work.
+                _fail_cancelled_requests(encode_stage.drain_cancelled())
                 cancelled = self._drain_cancellations()
+                cancelled.update(
+                    uid
+                    for uid, info in active.items()
+                    if getattr(info["trace"], "cancelled", False)
+                )
                 if cancelled and batch_gen is not None:
                     for uid in cancelled:
                         if uid in active:
                             batch_gen.remove(uid)
                             info = active.pop(uid)
+                            self._release_row(info["rqueue"])
                             try:
                                 info["rqueue"].put(None)
                             except Exception:
                                 pass
 
-                for rqueue, raw_inputs, prompt_tokens, args, images in new_items:
+                # Vision encoder runs on the GPU thread; text tokenization
+                # already happened on the caller thread. While other streams
+                # decode, the stage releases one encode group per step so a
+                # new image request does not stall them for a whole batch.
+                for item, encoded in encode_stage.step(decoding=bool(active)):
+                    rqueue, raw_inputs, prompt_tokens, args, images = item
+                    if isinstance(encoded, Exception):
+                        rqueue.put(encoded)
+                        continue
                     if batch_gen is None:
                         batch_gen = BatchGenerator(
                             self.model.language_model,
                             self.processor,
                             stop_tokens=self.stop_tokens,
-                            sampler=self._make_sampler(args),
                             kv_bits=self.kv_bits,
                             kv_group_size=self.kv_group_size,
                             kv_quant_scheme=self.kv_quant_scheme,
@@ -869,11 +1960,10 @@ class ResponseGenerator:
                             top_logprobs_k=self.top_logprobs_k,
                             stream=generation_stream,
                             apc_manager=self.apc_manager,
+                            adapter_set=getattr(self, "lora_adapters", None),
                         )
 
-                    # Vision encoder runs on the GPU thread; text tokenization
-                    # already happened on the caller thread.
-                    input_ids, gen_kwargs = self._gpu_embed(raw_inputs, images)
+                    input_ids, gen_kwargs = encoded
                     has_embeds = bool(gen_kwargs.get("inputs_embeds") is not None)
                     # Per-tenant APC salt: keep this out of the model forward
                     # by namespacing under "_apc_tenant"; BatchGenerator strips
@@ -892,16 +1982,22 @@ class ResponseGenerator:
                         self._flush(batch_gen, active)
 
                     try:
+                        if args.lora_adapter is not None:
+                            self._ensure_lora_adapter(args.lora_adapter, batch_gen)
                         (uid,) = batch_gen.insert(
                             [input_ids.squeeze(0).tolist()],
                             max_tokens=args.max_tokens,
                             prompt_kwargs=[gen_kwargs],
                             logits_processors=[args.logits_processors],
+                            sampling_params=[self._sampling_params(args)],
+                            adapters=[args.lora_adapter],
                         )
                     except Exception as e:
                         rqueue.put(e)
                         continue
 
+                    if args.trace is not None:
+                        args.trace.admitted_at = time.perf_counter()
                     rqueue.put(GenerationContext(uid=uid, prompt_tokens=prompt_tokens))
                     active[uid] = {
                         "rqueue": rqueue,
@@ -911,12 +2007,11 @@ class ResponseGenerator:
                         ),
                         "gen_kwargs": gen_kwargs if has_embeds else None,
                         "prompt_tps": None,
+                        "trace": args.trace,
                     }
 
-                if not active or batch_gen is None:
-                    continue
-
-                self._step(batch_gen, active)
+                if active and batch_gen is not None:
+                    self._step(batch_gen, active)
 
             except Exception as e:
                 logger.exception("Error in generation thread")
@@ -930,244 +2025,312 @@ class ResponseGenerator:
                 batch_gen = None
                 mx.clear_cache()
                 gc.collect()
+            yield bool(active) or bool(encode_stage)
 
     def _run_speculative(self):
-        """GPU thread loop with DFlash, EAGLE-3, or MTP speculative decoding.
+        """Run the speculative loop on the calling thread until it stops."""
+        for _ in self._speculative_steps(idle_timeout=0.1):
+            pass
 
-        Collects incoming requests, prefills them as a batch with the
-        per-family hooks, then runs the matching round-loop for decode.
-        Finished sequences are filtered out automatically by the round-loop's
-        ``stop_check`` callback.
+    def _speculative_steps(self, idle_timeout: float) -> Iterator[bool]:
+        """Generation loop with DFlash, EAGLE-3, or MTP speculative decoding.
+
+        Requests are prefilled in cohorts with the per-family hooks, and each
+        cohort decodes through the matching round-loop. Finished sequences are
+        filtered out by the round-loop's ``stop_check`` callback.
+
+        Batching is continuous across cohorts: requests that arrive while
+        others decode are prefilled as a new cohort between round-loop steps,
+        and the active cohorts take turns advancing. A new request therefore
+        waits for at most one round of each running cohort instead of for the
+        slowest member of an earlier batch. Requests are grouped into cohorts
+        by sampling settings because a round loop shares one sampler.
+
+        Taking turns costs decode latency: between two rounds of a cohort,
+        every other cohort runs one round and at most one new cohort is
+        prefilled. Time between tokens is therefore bounded by
+        ``MLX_VLM_SPEC_MAX_COHORTS`` rounds plus one prefill; requests beyond
+        that many cohorts wait for a slot.
         """
-        from mlx_lm.sample_utils import make_sampler as _make_sampler
-
         generation_stream = mx.default_stream(mx.default_device())
 
         lm = self.model.language_model
         drafter = self.draft_model
-        draft_kind = self.draft_kind
-        is_mtp = draft_kind == "mtp"
-        prefill_kwargs = speculative_prefill_kwargs(draft_kind, drafter)
-        eos_set = set(self.stop_tokens) if is_mtp else None
-        sampler = _make_sampler(temp=0)
-        draft_block_size = _get_draft_block_size_from_env()
+        max_cohorts = get_speculative_max_cohorts()
+        cohorts: List[_SpeculativeCohort] = []
+        waiting: deque = deque()
+        # Requests arriving at an idle loop wait this long for peers to share
+        # their cohort. Kept as a deadline rather than a sleep so the shared
+        # GPU worker keeps stepping other models meanwhile.
+        admit_at: Optional[float] = None
 
         while not self._stop:
             pending = []
-            rqueues = {}
             try:
+                if self._drained():
+                    break
                 # --- Phase 1: collect pending requests ---
-                pending, should_stop = self._collect_pending_requests(
-                    active=False,
-                    coalesce_s=get_speculative_batch_coalesce_s(),
+                new_items, should_stop = self._collect_pending_requests(
+                    active=bool(cohorts) or bool(waiting),
+                    idle_timeout=idle_timeout,
                 )
                 if should_stop:
                     break
+                waiting.extend(new_items)
+                dropped = [item for item in waiting if _request_cancelled(item[3])]
+                for item in dropped:
+                    waiting.remove(item)
+                _fail_cancelled_requests(dropped)
 
-                if not pending:
-                    continue
-                # --- Phase 2: prefill new batch ---
-                uids = []
-                rqueues = {}
-                token_lists = {}
-                stream_infos = {}
-                max_tokens_map = {}
-                prompt_tokens_map = {}
-                prompt_tps_map = {}
-                all_input_ids = []
-                prompt_kwargs_list = []
-
-                if hasattr(lm, "_position_ids"):
-                    lm._position_ids = None
-                if hasattr(lm, "_rope_deltas"):
-                    lm._rope_deltas = None
-
-                for rqueue, raw_inputs, prompt_tokens, args, images in pending:
-                    input_ids, gen_kwargs = self._gpu_embed(raw_inputs, images)
-                    uid = id(rqueue)
-                    uids.append(uid)
-                    rqueues[uid] = rqueue
-                    token_lists[uid] = []
-                    stream_infos[uid] = {
-                        "streamer": _ServerTokenStreamer(
-                            self.tokenizer,
-                            make_streaming_detokenizer(self.processor),
+                cancelled = self._drain_cancellations()
+                if cancelled:
+                    for cohort in cohorts:
+                        cohort.cancel(cancelled)
+
+                # --- Phase 2: admit one waiting group as a new cohort ---
+                # One prefill per step keeps it from stalling running cohorts
+                # for several prefills in a row. A failure only fails the
+                # cohort it happened in; the others keep decoding.
+                if cohorts or not waiting:
+                    admit_at = None
+                elif admit_at is None:
+                    admit_at = time.monotonic() + get_speculative_batch_coalesce_s()
+                coalescing = admit_at is not None and time.monotonic() < admit_at
+                if waiting and len(cohorts) < max_cohorts and not coalescing:
+                    pending = _take_speculative_group(waiting)
+                    try:
+                        cohort = self._prefill_speculative_cohort(
+                            pending, generation_stream
                         )
-                    }
-                    max_tokens_map[uid] = args.max_tokens
-                    prompt_tokens_map[uid] = prompt_tokens
-                    all_input_ids.append(input_ids.squeeze(0).tolist())
-                    prompt_kwargs_list.append(gen_kwargs)
-                    rqueue.put(GenerationContext(uid=uid, prompt_tokens=prompt_tokens))
-                    sampler = self._make_sampler(args) or _make_sampler(temp=0)
+                    except Exception as e:
+                        _fail_speculative_requests(
+                            [rqueue for rqueue, *_ in pending], e
+                        )
+                        cohort = None
+                    pending = []
+                    if cohort is not None:
+                        cohorts.append(cohort)
 
-                B = len(uids)
-                max_len = max(len(ids) for ids in all_input_ids)
-                left_padding = [max_len - len(ids) for ids in all_input_ids]
-                padded = [
-                    [0] * left_padding[i] + ids for i, ids in enumerate(all_input_ids)
+                # --- Phase 3: advance every cohort by one round-loop step ---
+                for cohort in list(cohorts):
+                    try:
+                        if self._advance_speculative_cohort(cohort, lm, drafter):
+                            continue
+                        self._finish_speculative_cohort(cohort)
+                    except Exception as e:
+                        _fail_speculative_requests(cohort.unfinished_queues(), e)
+                    cohorts.remove(cohort)
+
+            except Exception as e:
+                error_queues = [
+                    rqueue
+                    for cohort in cohorts
+                    for rqueue in cohort.unfinished_queues()
                 ]
-                input_mx = mx.array(padded, dtype=mx.int32)
+                error_queues.extend(rqueue for rqueue, *_ in pending)
+                _fail_speculative_requests(error_queues, e)
+                cohorts.clear()
+            yield bool(cohorts) or bool(waiting)
 
-                inputs_embeds_mx, prompt_kwargs = _merge_prefill_prompt_kwargs(
-                    prompt_kwargs_list, all_input_ids
-                )
+    def _prefill_speculative_cohort(
+        self, pending: list, generation_stream
+    ) -> Optional["_SpeculativeCohort"]:
+        """Prefill ``pending`` as one batch and start its round loop.
+
+        Returns ``None`` when every request finished on its first token.
+        """
+        from mlx_lm.sample_utils import make_sampler as _make_sampler
+
+        lm = self.model.language_model
+        drafter = self.draft_model
+        draft_kind = self.draft_kind
+        is_mtp = draft_kind == "mtp"
+        prefill_kwargs = speculative_prefill_kwargs(draft_kind, drafter)
+        sampler = _make_sampler(temp=0)
 
-                prompt_cache = make_speculative_prompt_cache(
-                    lm,
-                    draft_kind=draft_kind,
-                    batch_size=B,
-                    left_padding=left_padding,
-                    make_cache=_make_cache,
+        cohort = _SpeculativeCohort()
+        all_input_ids = []
+        prompt_kwargs_list = []
+        prompt_tokens_map = {}
+
+        if hasattr(lm, "_position_ids"):
+            lm._position_ids = None
+        if hasattr(lm, "_rope_deltas"):
+            lm._rope_deltas = None
+
+        traces = []
+        for rqueue, raw_inputs, prompt_tokens, args, images in pending:
+            if args.trace is not None:
+                args.trace.admitted_at = time.perf_counter()
+                traces.append(args.trace)
+            input_ids, gen_kwargs = self._gpu_embed(raw_inputs, images)
+            uid = id(rqueue)
+            cohort.uids.append(uid)
+            cohort.rqueues[uid] = rqueue
+            cohort.token_lists[uid] = []
+            cohort.stream_infos[uid] = {
+                "streamer": _ServerTokenStreamer(
+                    self.tokenizer,
+                    make_streaming_detokenizer(self.processor),
                 )
+            }
+            cohort.max_tokens_map[uid] = args.max_tokens
+            prompt_tokens_map[uid] = prompt_tokens
+            all_input_ids.append(input_ids.squeeze(0).tolist())
+            prompt_kwargs_list.append(gen_kwargs)
+            rqueue.put(GenerationContext(uid=uid, prompt_tokens=prompt_tokens))
+            sampler = self._make_sampler(args) or _make_sampler(temp=0)
+
+        B = len(cohort.uids)
+        max_len = max(len(ids) for ids in all_input_ids)
+        left_padding = [max_len - len(ids) for ids in all_input_ids]
+        padded = [[0] * left_padding[i] + ids for i, ids in enumerate(all_input_ids)]
+        input_mx = mx.array(padded, dtype=mx.int32)
+
+        inputs_embeds_mx, prompt_kwargs = _merge_prefill_prompt_kwargs(
+            prompt_kwargs_list, all_input_ids
+        )
 
-                lm_call_kwargs = {**prefill_kwargs, **prompt_kwargs}
-                lm_call_kwargs["inputs_embeds"] = inputs_embeds_mx
-
-                prompt_started = time.perf_counter()
-                with mx.stream(generation_stream):
-                    out = lm(input_mx, cache=prompt_cache, **lm_call_kwargs)
-                hidden = speculative_hidden_state(draft_kind, out)
-                shared_kv_states = out.shared_kv_states if is_mtp else None
-                first_bonus = sampler(out.logits[:, -1:]).squeeze(-1)
-                mx.eval(first_bonus, hidden, out.logits)
-                prompt_elapsed = time.perf_counter() - prompt_started
-                for uid in uids:
-                    prompt_tokens = prompt_tokens_map[uid]
-                    prompt_tps_map[uid] = (
-                        prompt_tokens / prompt_elapsed
-                        if prompt_tokens > 0 and prompt_elapsed > 0
-                        else None
-                    )
+        prompt_cache = make_speculative_prompt_cache(
+            lm,
+            draft_kind=draft_kind,
+            batch_size=B,
+            left_padding=left_padding,
+            make_cache=_make_cache,
+        )
 
-                finished_uids = set()
-
-                # Send first bonus tokens to clients
-                fb_list = first_bonus.tolist()
-                for j, uid in enumerate(uids):
-                    tok = int(fb_list[j])
-                    token_lists[uid].append(tok)
-                    is_stop = tok in self.stop_tokens
-                    is_max = len(token_lists[uid]) >= max_tokens_map[uid]
-                    finish = "stop" if is_stop else "length" if is_max else None
-                    text = self._stream_text(stream_infos[uid], tok, finish)
-                    rqueues[uid].put(
-                        StreamingToken(
-                            text=text,
-                            token=tok,
-                            logprobs=0.0,
-                            finish_reason=finish,
-                            peak_memory=mx.get_peak_memory() / 1e9,
-                            prompt_tps=prompt_tps_map.get(uid),
-                        )
-                    )
-                    if finish is not None:
-                        rqueues[uid].put(None)
-                        finished_uids.add(uid)
+        lm_call_kwargs = {**prefill_kwargs, **prompt_kwargs}
+        lm_call_kwargs["inputs_embeds"] = inputs_embeds_mx
+
+        prompt_started = time.perf_counter()
+        with mx.stream(generation_stream):
+            out = lm(input_mx, cache=prompt_cache, **lm_call_kwargs)
+        hidden = speculative_hidden_state(draft_kind, out)
+        shared_kv_states = out.shared_kv_states if is_mtp else None
+        first_bonus = sampler(out.logits[:, -1:]).squeeze(-1)
+        mx.eval(first_bonus, hidden, out.logits)
+        prompt_elapsed = time.perf_counter() - prompt_started
+        for trace in traces:
+            trace.prefill_s = prompt_elapsed
+        for uid in cohort.uids:
+            prompt_tokens = prompt_tokens_map[uid]
+            cohort.prompt_tps_map[uid] = (
+                prompt_tokens / prompt_elapsed
+                if prompt_tokens > 0 and prompt_elapsed > 0
+                else None
+            )
 
-                if len(finished_uids) == len(uids):
-                    continue
+        # Send first bonus tokens to clients
+        fb_list = first_bonus.tolist()
+        for j, uid in enumerate(cohort.uids):
+            self._emit_speculative_token(cohort, uid, int(fb_list[j]))
 
-                # --- Phase 3: speculative decode rounds ---
-                max_tok = max(max_tokens_map[u] for u in uids)
-
-                def stop_check(seq_idx, token_id):
-                    uid = uids[seq_idx]
-                    if uid in finished_uids:
-                        return True
-                    if token_id in self.stop_tokens:
-                        return True
-                    if len(token_lists[uid]) >= max_tokens_map[uid]:
-                        return True
-                    return False
-
-                rounds_iter = run_speculative_server_rounds(
-                    self.model,
-                    drafter,
-                    prompt_cache,
-                    hidden,
-                    draft_kind=draft_kind,
-                    first_bonus=first_bonus,
-                    max_tokens=max_tok,
-                    sampler=sampler,
-                    draft_block_size=draft_block_size,
-                    token_dtype=mx.int32,
-                    stop_check=stop_check,
-                    greedy_sampling=all(
-                        pending_args.temperature == 0
-                        for _, _, _, pending_args, _ in pending
-                    ),
-                    shared_kv_states=shared_kv_states,
-                    eos_token_ids=eos_set,
-                    prompt_tokens=input_mx,
-                )
-                for tok_list, _ in rounds_iter:
-                    for j, tok in enumerate(tok_list):
-                        if tok is None:
-                            continue
-                        uid = uids[j]
-                        if uid in finished_uids:
-                            continue
+        if cohort.done:
+            return None
 
-                        token_lists[uid].append(tok)
-                        tokens = token_lists[uid]
-
-                        is_stop = tok in self.stop_tokens
-                        is_max = len(tokens) >= max_tokens_map[uid]
-                        finish = "stop" if is_stop else "length" if is_max else None
-                        text = self._stream_text(stream_infos[uid], tok, finish)
-
-                        rqueues[uid].put(
-                            StreamingToken(
-                                text=text,
-                                token=tok,
-                                logprobs=0.0,
-                                finish_reason=finish,
-                                peak_memory=mx.get_peak_memory() / 1e9,
-                                prompt_tps=prompt_tps_map.get(uid),
-                            )
-                        )
+        def stop_check(seq_idx, token_id):
+            uid = cohort.uids[seq_idx]
+            if uid in cohort.finished_uids:
+                return True
+            if token_id in self.stop_tokens:
+                return True
+            if len(cohort.token_lists[uid]) >= cohort.max_tokens_map[uid]:
+                return True
+            return False
 
-                        if finish is not None:
-                            rqueues[uid].put(None)
-                            finished_uids.add(uid)
-                    if len(finished_uids) == len(uids):
-                        break
+        cohort.rounds_iter = run_speculative_server_rounds(
+            self.model,
+            drafter,
+            prompt_cache,
+            hidden,
+            draft_kind=draft_kind,
+            first_bonus=first_bonus,
+            max_tokens=max(cohort.max_tokens_map.values()),
+            sampler=sampler,
+            draft_block_size=_get_draft_block_size_from_env(),
+            token_dtype=mx.int32,
+            stop_check=stop_check,
+            greedy_sampling=all(
+                pending_args.temperature == 0 for _, _, _, pending_args, _ in pending
+            ),
+            shared_kv_states=shared_kv_states,
+            eos_token_ids=set(self.stop_tokens) if is_mtp else None,
+            prompt_tokens=input_mx,
+        )
+        cohort.session = snapshot_speculative_session(lm, drafter)
+        return cohort
 
-                # Log acceptance stats
-                al = drafter.accept_lens
-                if al:
-                    mean_a = (sum(al) + len(al)) / len(al)
-                    print(
-                        f"[{draft_kind.upper()}] batch={B} "
-                        f"tokens={sum(len(token_lists[u]) for u in uids)} "
-                        f"accept={mean_a:.2f} rounds={len(al)}"
-                    )
+    def _advance_speculative_cohort(self, cohort, lm, drafter) -> bool:
+        """Run one step of ``cohort``'s round loop and stream its tokens.
 
-                # Finalize any remaining
-                for uid in uids:
-                    if uid not in finished_uids:
-                        text = stream_infos[uid]["streamer"].finalize()
-                        rqueues[uid].put(
-                            StreamingToken(
-                                text=text,
-                                token=0,
-                                logprobs=0.0,
-                                finish_reason="length",
-                                peak_memory=mx.get_peak_memory() / 1e9,
-                                prompt_tps=prompt_tps_map.get(uid),
-                            )
-                        )
-                        rqueues[uid].put(None)
+        Returns ``False`` once the cohort has nothing left to decode.
+        """
+        if cohort.done:
+            return False
+        restore_speculative_session(lm, drafter, cohort.session)
+        try:
+            tok_list, _ = next(cohort.rounds_iter)
+        except StopIteration:
+            return False
+        finally:
+            cohort.session = snapshot_speculative_session(lm, drafter)
 
-            except Exception as e:
-                print(f"Error in speculative generation thread: {e}")
-                traceback.print_exc()
-                error_queues = {id(rqueue): rqueue for rqueue in rqueues.values()}
-                error_queues.update({id(rqueue): rqueue for rqueue, *_ in pending})
-                for rqueue in error_queues.values():
-                    rqueue.put(e)
-                    rqueue.put(None)
+        for j, tok in enumerate(tok_list):
+            if tok is None:
+                continue
+            uid = cohort.uids[j]
+            if uid in cohort.finished_uids:
+                continue
+            self._emit_speculative_token(cohort, uid, tok)
+        return not cohort.done
+
+    def _emit_speculative_token(self, cohort, uid, tok: int):
+        cohort.token_lists[uid].append(tok)
+        is_stop = tok in self.stop_tokens
+        is_max = len(cohort.token_lists[uid]) >= cohort.max_tokens_map[uid]
+        finish = "stop" if is_stop else "length" if is_max else None
+        text = self._stream_text(cohort.stream_infos[uid], tok, finish)
+        rqueue = cohort.rqueues[uid]
+        rqueue.put(
+            StreamingToken(
+                text=text,
+                token=tok,
+                logprobs=0.0,
+                finish_reason=finish,
+                peak_memory=mx.get_peak_memory() / 1e9,
+                prompt_tps=cohort.prompt_tps_map.get(uid),
+            )
+        )
+        if finish is not None:
+            rqueue.put(None)
+            cohort.finished_uids.add(uid)
+
+    def _finish_speculative_cohort(self, cohort):
+        """Log acceptance stats and close any request the round loop left open."""
+        al = self.draft_model.accept_lens
+        if al:
+            mean_a = (sum(al) + len(al)) / len(al)
+            print(
+                f"[{self.draft_kind.upper()}] batch={len(cohort.uids)} "
+                f"tokens={sum(len(cohort.token_lists[u]) for u in cohort.uids)} "
+                f"accept={mean_a:.2f} rounds={len(al)}"
+            )
+
+        for uid in cohort.uids:
+            if uid not in cohort.finished_uids:
+                text = cohort.stream_infos[uid]["streamer"].finalize()
+                cohort.rqueues[uid].put(
+                    StreamingToken(
+                        text=text,
+                        token=0,
+                        logprobs=0.0,
+                        finish_reason="length",
+                        peak_memory=mx.get_peak_memory() / 1e9,
+                        prompt_tps=cohort.prompt_tps_map.get(uid),
+                    )
+                )
+                cohort.rqueues[uid].put(None)
+                cohort.finished_uids.add(uid)
 
     def _step(self, batch_gen, active, gen_kwargs=None):
         """One batch generation step: prefill + decode."""
@@ -1175,7 +2338,10 @@ class ResponseGenerator:
         prompt_responses, responses = batch_gen.next(**kwargs)
         for prompt_response in prompt_responses:
             if prompt_response.uid in active:
-                active[prompt_response.uid]["prompt_tps"] = prompt_response.prompt_tps
+                info = active[prompt_response.uid]
+                info["prompt_tps"] = prompt_response.prompt_tps
+                if info.get("trace") is not None:
+                    info["trace"].prefill_s = prompt_response.prompt_time
         if not responses:
             return
 
@@ -1209,6 +2375,7 @@ class ResponseGenerator:
             if r.finish_reason is not None:
                 rqueue.put(None)
                 del active[r.uid]
+                self._release_row(rqueue)
 
     def _stream_text(self, info: dict, token: int, finish_reason: Optional[str]) -> str:
         """Convert one generated token into a streaming text segment."""
@@ -1309,7 +2476,10 @@ def process_tool_calls(model_output: str, tool_module, tools):
 
 
 def _build_gen_args(
-    request, processor=None, tenant_id: Optional[str] = None
+    request,
+    processor=None,
+    tenant_id: Optional[str] = None,
+    priority: str = DEFAULT_PRIORITY,
 ) -> GenerationArguments:
     """Build GenerationArguments from an OpenAIRequest or ChatRequest."""
     max_tokens = getattr(request, "max_tokens", None)
@@ -1331,12 +2501,14 @@ def _build_gen_args(
         top_p=getattr(request, "top_p", DEFAULT_TOP_P),
         top_k=getattr(request, "top_k", 0),
         min_p=getattr(request, "min_p", 0.0),
+        seed=_request_field_or_default(request, "seed", None),
         repetition_penalty=getattr(request, "repetition_penalty", None),
         logit_bias=logit_bias,
         enable_thinking=enable_thinking,
         thinking_budget=getattr(request, "thinking_budget", None),
         thinking_start_token=getattr(request, "thinking_start_token", None),
         tenant_id=tenant_id,
+        priority=priority,
     )
     if processor is not None:
         args.logits_processors = _build_structured_logits_processors(request, processor)
@@ -1362,6 +2534,14 @@ def _read_tenant_id(http_request) -> Optional[str]:
     return h.get("x-apc-tenant") or h.get("x-tenant-id") or None
 
 
+def _read_priority(http_request) -> str:
+    """Admission class from the ``X-Priority`` header (see PRIORITY_CLASSES)."""
+    if http_request is None or not hasattr(http_request, "headers"):
+        return DEFAULT_PRIORITY
+    priority = (http_request.headers.get("x-priority") or "").strip().lower()
+    return priority if priority in PRIORITY_CLASSES else DEFAULT_PRIORITY
+
+
 async def _preflight_stream_context_budget(
     *,
     endpoint: str,
@@ -1370,13 +2550,27 @@ async def _preflight_stream_context_budget(
     images: Optional[List] = None,
     audio: Optional[List] = None,
     args: GenerationArguments,
+    generator: Optional[ResponseGenerator] = None,
 ):
     """Reject over-budget streaming requests before the HTTP stream starts."""
-    if response_generator is None:
+    generator = generator or response_generator
+    if generator is None:
         return
+    try:
+        check_admission = getattr(generator, "check_admission", None)
+        if check_admission is not None:
+            check_admission(args)
+    except QueueFullError as e:
+        server_metrics.record_failure(
+            endpoint=endpoint,
+            model=model,
+            stream=True,
+            error=str(e),
+        )
+        raise HTTPException(status_code=429, detail=str(e))
     try:
         await asyncio.to_thread(
-            response_generator.validate_context_budget,
+            generator.validate_context_budget,
             prompt,
             images,
             audio,
@@ -1524,6 +2718,23 @@ apc_manager: Optional[_apc.APCManager] = None
 
 # Loading/unloading utilities
 model_cache = {}
+
+
+@dataclass
+class _ResidentModel:
+    """One loaded model with its generator and caches."""
+
+    cache: dict
+    generator: Optional[ResponseGenerator]
+    apc_manager: Optional[_apc.APCManager]
+    nbytes: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+# Resident models keyed by (model_path, adapter_path), least recently used first.
+# The module-level model_cache/response_generator/apc_manager mirror the most
+# recently requested entry.
+model_pool: "OrderedDict[tuple, _ResidentModel]" = OrderedDict()
 server_metrics = ServerMetricsStore()
 
 
@@ -1540,6 +2751,7 @@ async def lifespan(app):
             logger.info("KV cache quantization: bits=%s scheme=%s", kv_bits, kv_scheme)
         logger.info("Model ready, continuous batching enabled.")
     yield
+    server_metrics.flush_traces()
 
 
 app = FastAPI(
@@ -1566,6 +2778,33 @@ class FlexibleBaseModel(BaseModel):
     model_config = ConfigDict(extra="allow")
 
 
+async def _generate_in_thread(generator, args: GenerationArguments, func, *func_args):
+    """Run ``func`` off the event loop, abandoning its request on disconnect.
+
+    The worker thread cannot be interrupted, so when the handler is cancelled
+    the request is marked for the generation loop to drop instead.
+    """
+    try:
+        return await asyncio.to_thread(func, *func_args)
+    except asyncio.CancelledError:
+        generator.abandon(args)
+        raise
+
+
+def _resolve_request_adapter(request: BaseModel):
+    """Return ``(adapter_path, lora_adapter)`` for ``get_cached_model``.
+
+    Hot-swap mode serves adapters over one resident base model instead of
+    loading a merged copy per adapter, so a named adapter becomes the LoRA
+    adapter and the base model is requested.
+    """
+    if "adapter_path" not in request.model_fields_set:
+        return _INHERIT_ADAPTER, None
+    if get_lora_hot_swap():
+        return None, request.adapter_path
+    return request.adapter_path, None
+
+
 def load_model_resources(model_path: str, adapter_path: Optional[str]):
     """
     Loads model, processor, and config based on paths.
@@ -1594,34 +2833,145 @@ def load_model_resources(model_path: str, adapter_path: Optional[str]):
 _INHERIT_ADAPTER = object()
 
 
+def _model_nbytes(model) -> int:
+    try:
+        return sum(v.nbytes for _, v in tree_flatten(model.parameters()))
+    except Exception:
+        return 0
+
+
+def _estimate_model_nbytes(model_path: str) -> int:
+    """Weight bytes of ``model_path`` from its safetensors files, before loading.
+
+    Fetches the checkpoint first when it is not local, as loading would.
+    Returns 0 when the size cannot be determined.
+    """
+    try:
+        path = get_model_path(model_path)
+        return sum(f.stat().st_size for f in path.glob("*.safetensors"))
+    except Exception:
+        return 0
+
+
+def _activate_resident(entry: _ResidentModel):
+    global model_cache, response_generator, apc_manager
+    entry.last_used = time.monotonic()
+    model_cache = entry.cache
+    response_generator = entry.generator
+    apc_manager = entry.apc_manager
+
+
+def _resident_in_use(entry: _ResidentModel) -> bool:
+    return bool(getattr(entry.generator, "in_use", False))
+
+
+def _release_resident(entry: _ResidentModel):
+    """Stop a resident model's generator and drop its caches.
+
+    A generator that still has queued requests or open streams is retired
+    instead: it refuses new requests, finishes the ones it holds and then
+    drops its caches itself.
+    """
+    global model_cache, response_generator, apc_manager
+    print(
+        f"Unloading model: {entry.cache.get('model_path')}, Adapter: {entry.cache.get('adapter_path')}"
+    )
+    if _resident_in_use(entry):
+        print("Draining ResponseGenerator...")
+        entry.generator.retire()
+    else:
+        if entry.generator is not None:
+            print("Stopping ResponseGenerator...")
+            entry.generator.stop_and_join()
+        if entry.apc_manager is not None:
+            entry.apc_manager.clear()
+        if "vision_cache" in entry.cache:
+            entry.cache["vision_cache"].clear()
+    if model_cache is entry.cache:
+        model_cache = {}
+        response_generator = None
+        apc_manager = None
+
+
+def _evict_resident_models(keep=None, reserve: int = 0, incoming_bytes: int = 0) -> int:
+    """Evict least recently used models until the pool fits its budget.
+
+    Idle models go first; one still serving requests is only drained when
+    evicting every idle model is not enough. ``reserve`` and
+    ``incoming_bytes`` leave room for models about to be loaded. The entry
+    keyed ``keep`` is never evicted. Returns the number evicted.
+    """
+    max_models = get_max_resident_models()
+    max_bytes = get_model_pool_bytes()
+    evicted = 0
+    # sorted() is stable, so each group keeps its least-recently-used order.
+    candidates = sorted(
+        (key for key in model_pool if key != keep),
+        key=lambda key: _resident_in_use(model_pool[key]),
+    )
+    for key in candidates:
+        total = sum(e.nbytes for e in model_pool.values()) + incoming_bytes
+        over_count = len(model_pool) + reserve > max_models
+        over_bytes = max_bytes is not None and total > max_bytes
+        if not (over_count or over_bytes):
+            break
+        _release_resident(model_pool.pop(key))
+        evicted += 1
+    if evicted:
+        gc.collect()
+        mx.clear_cache()
+    return evicted
+
+
 def get_cached_model(model_path: str, adapter_path=_INHERIT_ADAPTER):
     """
     Factory function to get or load the appropriate model resources from cache or by loading.
     Also creates/updates the ResponseGenerator for continuous batching.
+
+    Several models stay resident at once, each with its own generator,
+    request queue, APC pool and vision cache; their generation loops share
+    one GPU worker thread. Loading past the model-count or byte budget evicts
+    the least recently used idle model.
     """
     global model_cache, response_generator, apc_manager
 
     if adapter_path is _INHERIT_ADAPTER:
         cached = model_cache.get("cache_key")
-        adapter_path = cached[1] if cached and cached[0] == model_path else None
+        if cached and cached[0] == model_path:
+            adapter_path = cached[1]
+        else:
+            adapter_path = next(
+                (key[1] for key in reversed(model_pool) if key[0] == model_path),
+                None,
+            )
 
     cache_key = (model_path, adapter_path)
 
-    # Return from cache if already loaded and matches the requested paths
-    if model_cache.get("cache_key") == cache_key:
+    # Return from the pool if already resident
+    entry = model_pool.get(cache_key)
+    if entry is not None:
         print(f"Using cached model: {model_path}, Adapter: {adapter_path}")
+        model_pool.move_to_end(cache_key)
+        _activate_resident(entry)
         return model_cache["model"], model_cache["processor"], model_cache["config"]
 
-    # If cache exists but doesn't match, clear it
-    if model_cache:
-        print("New model request, clearing existing cache...")
-        unload_model_sync()  # Use a synchronous version for internal call
-
-    vision_cache_size = int(os.environ.get("MLX_VLM_VISION_CACHE_SIZE", "20"))
-    vision_cache = VisionFeatureCache(max_size=vision_cache_size)
+    # Make room for the incoming model before loading its weights, so peak
+    # memory stays within the byte budget.
+    if _evict_resident_models(
+        reserve=1, incoming_bytes=_estimate_model_nbytes(model_path)
+    ):
+        print("New model request, evicted least recently used model.")
+
+    vision_cache = VisionFeatureCache(
+        max_size=get_vision_cache_size(),
+        max_bytes=get_vision_cache_bytes(),
+        namespace=f"{model_path}|{adapter_path}",
+        disk_dir=os.environ.get("MLX_VLM_VISION_CACHE_DIR") or None,
+        max_disk_bytes=get_vision_cache_disk_bytes(),
+    )
 
     # APC: build a shared block pool if opted in via env var.
-    apc_manager = _apc.from_env(model_namespace=model_path)
+    model_apc = _apc.from_env(model_namespace=model_path)
 
     # KV cache quantization (uniform or TurboQuant)
     kv_bits = get_quantized_kv_bits(model_path)
@@ -1629,7 +2979,7 @@ def get_cached_model(model_path: str, adapter_path=_INHERIT_ADAPTER):
     quantized_kv_start = get_quantized_kv_start()
     kv_quant_scheme = get_kv_quant_scheme()
 
-    response_generator = ResponseGenerator(
+    generator = ResponseGenerator(
         model_path=model_path,
         adapter_path=adapter_path,
         vision_cache=vision_cache,
@@ -1638,54 +2988,55 @@ def get_cached_model(model_path: str, adapter_path=_INHERIT_ADAPTER):
         kv_quant_scheme=kv_quant_scheme,
         quantized_kv_start=quantized_kv_start,
         top_logprobs_k=get_top_logprobs_k(),
-        apc_manager=apc_manager,
+        apc_manager=model_apc,
     )
     try:
-        model, processor, config = response_generator.wait_until_ready()
+        model, processor, config = generator.wait_until_ready()
     except Exception:
-        response_generator.stop_and_join()
-        response_generator = None
+        generator.stop_and_join()
         vision_cache.clear()
         raise
+    vision_cache.set_namespace(
+        f"{model_path}|{adapter_path}|{processor_fingerprint(processor)}"
+    )
 
-    model_cache = {
-        "cache_key": cache_key,
-        "model_path": model_path,
-        "adapter_path": adapter_path,
-        "model": model,
-        "processor": processor,
-        "config": config,
-        "vision_cache": vision_cache,
-    }
+    entry = _ResidentModel(
+        cache={
+            "cache_key": cache_key,
+            "model_path": model_path,
+            "adapter_path": adapter_path,
+            "model": model,
+            "processor": processor,
+            "config": config,
+            "vision_cache": vision_cache,
+        },
+        generator=generator,
+        apc_manager=model_apc,
+        nbytes=_model_nbytes(model),
+    )
+    model_pool[cache_key] = entry
+    _activate_resident(entry)
+    _evict_resident_models(keep=cache_key)
 
     return model, processor, config
 
 
 # Synchronous unload function for internal use
-def unload_model_sync():
+def unload_model_sync(cache_key=None):
+    """Unload ``cache_key`` from the pool, or every resident model if omitted."""
     global model_cache, response_generator, apc_manager
-    if not model_cache:
-        return False
-
-    print(
-        f"Unloading model: {model_cache.get('model_path')}, Adapter: {model_cache.get('adapter_path')}"
-    )
-
-    # Stop the ResponseGenerator if running
-    if response_generator is not None:
-        print("Stopping ResponseGenerator...")
-        response_generator.stop_and_join()
-        response_generator = None
-
-    # Drop APC blocks for the previous model
-    if apc_manager is not None:
-        apc_manager.clear()
-        apc_manager = None
-
-    # Clear vision cache before dropping references
-    if "vision_cache" in model_cache:
-        model_cache["vision_cache"].clear()
-    model_cache = {}
+    if cache_key is not None:
+        entry = model_pool.pop(cache_key, None)
+        if entry is None:
+            return False
+        _release_resident(entry)
+    else:
+        if not model_pool:
+            return False
+        while model_pool:
+            _release_resident(model_pool.popitem(last=False)[1])
+    if model_pool and not model_cache:
+        _activate_resident(next(reversed(model_pool.values())))
     # Force garbage collection
     gc.collect()
     mx.clear_cache()
@@ -1801,6 +3152,9 @@ class OpenAIRequest(FlexibleBaseModel):
         ..., description="Input text or list of chat messages."
     )
     model: str = Field(..., description="The model to use for generation.")
+    adapter_path: Optional[str] = Field(
+        None, description="The path to the adapter weights."
+    )
     max_output_tokens: int = Field(
         default_factory=get_server_max_tokens,
         description="Maximum number of tokens to generate.",
@@ -2209,7 +3563,14 @@ async def responses_endpoint(request: Request):
 
     try:
         # Get model, processor, config - loading if necessary
-        model, processor, config = get_cached_model(openai_request.model)
+        adapter_path, lora_adapter = _resolve_request_adapter(openai_request)
+        model, processor, config = get_cached_model(openai_request.model, adapter_path)
+
+        # Bind this model's generator and caches; another request may make a
+        # different pooled model active while this one is still streaming.
+        generator = response_generator
+        vision_cache = model_cache.get("vision_cache")
+        model_apc = apc_manager
 
         kwargs = {}
 
@@ -2280,10 +3641,18 @@ async def responses_endpoint(request: Request):
             print("no input")
             raise HTTPException(status_code=400, detail="Missing input.")
 
+        # Download remote images concurrently without blocking the event loop;
+        # preprocessing on the worker thread then reads them from the cache.
+        await prefetch_images(images)
+
         try:
             gen_args = _build_gen_args(
-                openai_request, processor, tenant_id=_read_tenant_id(request)
+                openai_request,
+                processor,
+                tenant_id=_read_tenant_id(request),
+                priority=_read_priority(request),
             )
+            gen_args.lora_adapter = lora_adapter
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
@@ -2322,6 +3691,7 @@ async def responses_endpoint(request: Request):
                 images=images if images else None,
                 audio=None,
                 args=gen_args,
+                generator=generator,
             )
 
             async def stream_generator():
@@ -2380,11 +3750,13 @@ async def responses_endpoint(request: Request):
                     full_text = ""
                     usage_stats = {"input_tokens": 0, "output_tokens": 0}
 
-                    if response_generator is not None:
+                    if generator is not None:
                         # generate() blocks on _cpu_preprocess + queue.get;
                         # offload so concurrent handlers preprocess in parallel.
-                        ctx, token_iter = await asyncio.to_thread(
-                            response_generator.generate,
+                        ctx, token_iter = await _generate_in_thread(
+                            generator,
+                            gen_args,
+                            generator.generate,
                             formatted_prompt,
                             images if images else None,
                             None,  # audio
@@ -2433,9 +3805,9 @@ async def responses_endpoint(request: Request):
                             temperature=openai_request.temperature,
                             max_tokens=gen_args.max_tokens,
                             top_p=openai_request.top_p,
-                            vision_cache=model_cache.get("vision_cache"),
+                            vision_cache=vision_cache,
                             logits_processors=gen_args.logits_processors,
-                            apc_manager=apc_manager,
+                            apc_manager=model_apc,
                             apc_tenant=gen_args.tenant_id,
                             **kwargs,
                         )
@@ -2495,7 +3867,7 @@ async def responses_endpoint(request: Request):
                         stream=True,
                         backend=(
                             "continuous_batching"
-                            if response_generator is not None
+                            if generator is not None
                             else "generate"
                         ),
                         prompt_tokens=usage_stats["input_tokens"],
@@ -2504,6 +3876,7 @@ async def responses_endpoint(request: Request):
                         request_elapsed_s=time.perf_counter() - request_start,
                         request_started_s=request_start,
                         token_times=token_times,
+                        trace=gen_args.trace,
                         prompt_tps=prompt_tps,
                         generation_tps=generation_tps,
                         peak_memory_gb=peak_memory or None,
@@ -2512,7 +3885,7 @@ async def responses_endpoint(request: Request):
                         structured_output=bool(gen_args.logits_processors),
                         thinking_enabled=bool(gen_args.enable_thinking),
                     )
-                    server_metrics.record_success(envelope)
+                    server_metrics.record_success(envelope, token_times=token_times)
                     metrics_finalized = True
                     completed_response = base_response.model_copy(
                         update={
@@ -2586,10 +3959,10 @@ async def responses_endpoint(request: Request):
                 peak_memory = 0.0
                 finish_reason = None
 
-                if response_generator is not None:
+                if generator is not None:
 
                     def _blocking_resp():
-                        ctx_, ti = response_generator.generate(
+                        ctx_, ti = generator.generate(
                             prompt=formatted_prompt,
                             images=images if images else None,
                             args=gen_args,
@@ -2623,7 +3996,7 @@ async def responses_endpoint(request: Request):
                         prompt_tps,
                         peak_memory,
                         finish_reason,
-                    ) = await asyncio.to_thread(_blocking_resp)
+                    ) = await _generate_in_thread(generator, gen_args, _blocking_resp)
                 else:
                     result = generate(
                         model=model,
@@ -2631,8 +4004,8 @@ async def responses_endpoint(request: Request):
                         prompt=formatted_prompt,
                         image=images,
                         verbose=logger.isEnabledFor(logging.DEBUG),
-                        vision_cache=model_cache.get("vision_cache"),
-                        apc_manager=apc_manager,
+                        vision_cache=vision_cache,
+                        apc_manager=model_apc,
                         **gen_args.to_generate_kwargs(),
                         **kwargs,
                     )
@@ -2699,9 +4072,7 @@ async def responses_endpoint(request: Request):
                     model=openai_request.model,
                     stream=False,
                     backend=(
-                        "continuous_batching"
-                        if response_generator is not None
-                        else "generate"
+                        "continuous_batching" if generator is not None else "generate"
                     ),
                     prompt_tokens=prompt_tokens,
                     completion_tokens=output_tokens,
@@ -2709,6 +4080,7 @@ async def responses_endpoint(request: Request):
                     request_elapsed_s=elapsed,
                     request_started_s=request_start,
                     token_times=token_times,
+                    trace=gen_args.trace,
                     prompt_tps=prompt_tps,
                     generation_tps=generation_tps,
                     peak_memory_gb=peak_memory or None,
@@ -2717,10 +4089,18 @@ async def responses_endpoint(request: Request):
                     structured_output=bool(gen_args.logits_processors),
                     thinking_enabled=bool(gen_args.enable_thinking),
                 )
-                server_metrics.record_success(envelope)
+                server_metrics.record_success(envelope, token_times=token_times)
 
                 return response
 
+            except QueueFullError as e:
+                server_metrics.record_failure(
+                    endpoint="/responses",
+                    model=openai_request.model,
+                    stream=False,
+                    error=str(e),
+                )
+                raise HTTPException(status_code=429, detail=str(e))
             except PromptTooLongError as e:
                 server_metrics.record_failure(
                     endpoint="/responses",
@@ -2768,13 +4148,15 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
 
     request_start = time.perf_counter()
     try:
-        adapter_path = (
-            request.adapter_path
-            if "adapter_path" in request.model_fields_set
-            else _INHERIT_ADAPTER
-        )
+        adapter_path, lora_adapter = _resolve_request_adapter(request)
         model, processor, config = get_cached_model(request.model, adapter_path)
 
+        # Bind this model's generator and caches; another request may make a
+        # different pooled model active while this one is still streaming.
+        generator = response_generator
+        vision_cache = model_cache.get("vision_cache")
+        model_apc = apc_manager
+
         kwargs = {}
 
         if request.resize_shape is not None:
@@ -2838,6 +4220,8 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
 
             processed_messages.append(msg)
 
+        await prefetch_images(images)
+
         # Detect tool parser from chat template
         tools = getattr(request, "tools", None)
         tool_parser_type = _infer_tool_parser_from_processor(processor)
@@ -2845,8 +4229,12 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
 
         try:
             gen_args = _build_gen_args(
-                request, processor, tenant_id=_read_tenant_id(http_request)
+                request,
+                processor,
+                tenant_id=_read_tenant_id(http_request),
+                priority=_read_priority(http_request),
             )
+            gen_args.lora_adapter = lora_adapter
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
@@ -2885,10 +4273,10 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                 images=images if images else None,
                 audio=audio if audio else None,
                 args=gen_args,
+                generator=generator,
             )
 
             async def stream_generator():
-                global response_generator
                 token_iterator = None
                 token_iter = None  # For ResponseGenerator cleanup
                 metrics_finalized = False
@@ -2905,10 +4293,12 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                     tool_calls_made = False
 
                     # Use ResponseGenerator if available, otherwise fall back to stream_generate
-                    if response_generator is not None:
+                    if generator is not None:
                         # generate() does blocking Queue.get — run off event loop
-                        ctx, token_iter = await asyncio.to_thread(
-                            response_generator.generate,
+                        ctx, token_iter = await _generate_in_thread(
+                            generator,
+                            gen_args,
+                            generator.generate,
                             formatted_prompt,
                             images if images else None,
                             audio if audio else None,
@@ -2983,7 +4373,7 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                                 chunk_logprobs = ChatLogprobs(
                                     content=[
                                         _make_logprob_content(
-                                            response_generator.tokenizer,
+                                            generator.tokenizer,
                                             token.token,
                                             token.logprobs,
                                             top_logprobs=token.top_logprobs,
@@ -3063,9 +4453,9 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                             temperature=request.temperature,
                             max_tokens=gen_args.max_tokens,
                             top_p=request.top_p,
-                            vision_cache=model_cache.get("vision_cache"),
+                            vision_cache=vision_cache,
                             logits_processors=gen_args.logits_processors,
-                            apc_manager=apc_manager,
+                            apc_manager=model_apc,
                             apc_tenant=gen_args.tenant_id,
                             **kwargs,
                         )
@@ -3122,12 +4512,12 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                         stream=True,
                         backend=(
                             "continuous_batching"
-                            if response_generator is not None
+                            if generator is not None
                             else "generate"
                         ),
                         prompt_tokens=(
                             ctx.prompt_tokens
-                            if response_generator is not None
+                            if generator is not None
                             else stream_prompt_tokens
                         ),
                         completion_tokens=completion_tokens,
@@ -3135,6 +4525,7 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                         request_elapsed_s=time.perf_counter() - request_start,
                         request_started_s=request_start,
                         token_times=token_times,
+                        trace=gen_args.trace,
                         prompt_tps=prompt_tps,
                         generation_tps=generation_tps,
                         peak_memory_gb=peak_memory or None,
@@ -3147,7 +4538,7 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                         tool_parser=tool_parser_type,
                         tool_calls=tool_calls_made,
                     )
-                    server_metrics.record_success(envelope)
+                    server_metrics.record_success(envelope, token_times=token_times)
                     metrics_finalized = True
 
                     # Signal stream end
@@ -3223,7 +4614,7 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                     Tuple[int, float, Optional[List[Tuple[int, float]]]]
                 ] = []
 
-                if response_generator is not None:
+                if generator is not None:
 
                     def _blocking_generate():
                         text = ""
@@ -3232,7 +4623,7 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                         tt: List[float] = []
                         ptps = None
                         fr = None
-                        ctx, token_iter = response_generator.generate(
+                        ctx, token_iter = generator.generate(
                             prompt=formatted_prompt,
                             images=images if images else None,
                             audio=audio if audio else None,
@@ -3266,7 +4657,9 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                         peak_memory,
                         token_times,
                         finish_reason,
-                    ) = await asyncio.to_thread(_blocking_generate)
+                    ) = await _generate_in_thread(
+                        generator, gen_args, _blocking_generate
+                    )
                 else:
                     gen_result = generate(
                         model=model,
@@ -3275,8 +4668,8 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                         image=images,
                         audio=audio,
                         verbose=logger.isEnabledFor(logging.DEBUG),
-                        vision_cache=model_cache.get("vision_cache"),
-                        apc_manager=apc_manager,
+                        vision_cache=vision_cache,
+                        apc_manager=model_apc,
                         **gen_args.to_generate_kwargs(),
                         **kwargs,
                     )
@@ -3388,9 +4781,7 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                     model=request.model,
                     stream=False,
                     backend=(
-                        "continuous_batching"
-                        if response_generator is not None
-                        else "generate"
+                        "continuous_batching" if generator is not None else "generate"
                     ),
                     prompt_tokens=prompt_tokens,
                     completion_tokens=completion_tokens,
@@ -3398,6 +4789,7 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                     request_elapsed_s=elapsed,
                     request_started_s=request_start,
                     token_times=token_times,
+                    trace=gen_args.trace,
                     prompt_tps=prompt_tps,
                     generation_tps=generation_tps,
                     peak_memory_gb=peak_memory or None,
@@ -3411,10 +4803,18 @@ async def chat_completions_endpoint(request: ChatRequest, http_request: Request)
                     tool_parser=tool_parser_type,
                     tool_calls=bool(parsed_tool_calls),
                 )
-                server_metrics.record_success(envelope)
+                server_metrics.record_success(envelope, token_times=token_times)
 
                 return result
 
+            except QueueFullError as e:
+                server_metrics.record_failure(
+                    endpoint="/chat/completions",
+                    model=request.model,
+                    stream=False,
+                    error=str(e),
+                )
+                raise HTTPException(status_code=429, detail=str(e))
             except PromptTooLongError as e:
                 server_metrics.record_failure(
                     endpoint="/chat/completions",
@@ -3518,7 +4918,20 @@ async def health_check():
 
 @app.get("/metrics")
 @app.get("/v1/metrics", include_in_schema=False)
-async def metrics_endpoint():
+async def metrics_endpoint(request: Request):
+    """Server metrics as JSON, or Prometheus text for scrapers.
+
+    Prometheus output is returned for ``?format=prometheus`` or when the
+    ``Accept`` header asks for ``text/plain``/OpenMetrics.
+    """
+    accept = request.headers.get("accept", "")
+    if request.query_params.get("format") == "prometheus" or (
+        "text/plain" in accept or "openmetrics" in accept
+    ):
+        return PlainTextResponse(
+            server_metrics.prometheus(),
+            media_type="text/plain; version=0.0.4",
+        )
     payload = server_metrics.snapshot()
     payload["server"] = _server_runtime_snapshot()
     return payload
@@ -3598,8 +5011,31 @@ def main():
     parser.add_argument(
         "--vision-cache-size",
         type=int,
-        default=20,
-        help="Max number of cached vision features (default: 20).",
+        default=None,
+        help="Optional cap on the number of cached vision features.",
+    )
+    parser.add_argument(
+        "--vision-cache-bytes",
+        type=int,
+        default=None,
+        help=(
+            "Memory budget in bytes for cached vision features "
+            f"(default: {DEFAULT_VISION_CACHE_BYTES})."
+        ),
+    )
+    parser.add_argument(
+        "--vision-cache-dir",
+        type=str,
+        default=None,
+        help="Directory that persists vision features across restarts.",
+    )
+    parser.add_argument(
+        "--lora-hot-swap",
+        action="store_true",
+        help=(
+            "Serve a request's adapter_path as a LoRA adapter over the resident "
+            "base model, batching rows with different adapters together."
+        ),
     )
     parser.add_argument(
         "--prefill-step-size",
@@ -3666,8 +5102,9 @@ def main():
         "--draft-kind",
         type=str,
         default=None,
-        choices=["dflash", "eagle3", "mtp"],
-        help="Drafter family — 'dflash', 'eagle3', or 'mtp' (Gemma 4). "
+        choices=["dflash", "eagle3", "mtp", "ngram"],
+        help="Drafter family — 'dflash', 'eagle3', 'mtp' (Gemma 4), or "
+        "'ngram' (prompt lookup, no --draft-model needed). "
         "Default: auto-detected from the drafter's HF model_type.",
     )
     parser.add_argument(
@@ -3705,9 +5142,17 @@ def main():
         os.environ["MLX_VLM_PRELOAD_MODEL"] = args.model
         if args.adapter_path:
             os.environ["MLX_VLM_PRELOAD_ADAPTER"] = args.adapter_path
-    os.environ["MLX_VLM_VISION_CACHE_SIZE"] = str(args.vision_cache_size)
-    if args.draft_model:
-        os.environ["MLX_VLM_DRAFT_MODEL"] = args.draft_model
+    if args.vision_cache_size is not None:
+        os.environ["MLX_VLM_VISION_CACHE_SIZE"] = str(args.vision_cache_size)
+    if args.vision_cache_bytes is not None:
+        os.environ["MLX_VLM_VISION_CACHE_BYTES"] = str(args.vision_cache_bytes)
+    if args.vision_cache_dir:
+        os.environ["MLX_VLM_VISION_CACHE_DIR"] = args.vision_cache_dir
+    if args.lora_hot_swap:
+        os.environ["MLX_VLM_LORA_HOT_SWAP"] = "1"
+    if args.draft_model or args.draft_kind == "ngram":
+        if args.draft_model:
+            os.environ["MLX_VLM_DRAFT_MODEL"] = args.draft_model
         if args.draft_kind is not None:
             os.environ["MLX_VLM_DRAFT_KIND"] = args.draft_kind
         if args.draft_block_size is not None:
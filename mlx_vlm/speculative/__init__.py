@@ -1,8 +1,11 @@
-from .ddtree import DDTreeNode, build_ddtree
+from .ddtree import DDTreeLayout, DDTreeNode, build_ddtree
 from .drafters import load_drafter
+from .ngram import NGramDrafter
 
 __all__ = [
+    "DDTreeLayout",
     "DDTreeNode",
+    "NGramDrafter",
     "build_ddtree",
     "load_drafter",
 ]
@@ -14,14 +14,19 @@ Lemma 1 reduces the search space to the top-``K = min(B, |V|)`` tokens at
 each depth. Algorithm 1 enumerates those prefixes in descending
 log-probability order with a max-heap, popping one prefix per iteration and
 pushing its first child and next sibling.
+
+:class:`DDTreeLayout` flattens the tree for a single tree-attention target
+forward and walks the verified tokens back down the accepted path.
 """
 
 from dataclasses import dataclass
 from heapq import heappop, heappush
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 import mlx.core as mx
 
+from ..models.base import TreeAttention
+
 
 @dataclass
 class DDTreeNode:
@@ -47,10 +52,12 @@ def _top_k_tokens_per_depth(log_probs: mx.array, K: int) -> Tuple[mx.array, mx.a
     """
     L, V = log_probs.shape
     K = min(K, V)
-    # Fall back to argpartition for stability with large V.
-    top_ids = mx.argsort(-log_probs, axis=-1)[:, :K]
-    gather_idx = top_ids[None, :, :]  # [1, L, K] for take_along_axis
+    # Partial selection of the K best, then order only those K.
+    top_ids = mx.argpartition(-log_probs, kth=K - 1, axis=-1)[:, :K]
     top_lp = mx.take_along_axis(log_probs, top_ids, axis=-1)
+    order = mx.argsort(-top_lp, axis=-1)
+    top_ids = mx.take_along_axis(top_ids, order, axis=-1)
+    top_lp = mx.take_along_axis(top_lp, order, axis=-1)
     return top_lp, top_ids
 
 
@@ -162,3 +169,80 @@ def build_ddtree(
             counter += 1
 
     return tree
+
+
+@dataclass
+class DDTreeLayout:
+    """A draft tree flattened into target verify slots.
+
+    Slot 0 holds the root bonus token; the tree nodes follow grouped by
+    depth, so every parent precedes its children. ``parents[0]`` is -1.
+    """
+
+    tokens: List[int]
+    parents: List[int]
+    depths: List[int]
+
+    @classmethod
+    def from_tree(cls, tree: List[DDTreeNode], root_token: int) -> "DDTreeLayout":
+        order = sorted(range(len(tree)), key=lambda i: tree[i].depth)
+        slot_of = {node_idx: slot for slot, node_idx in enumerate(order, start=1)}
+        tokens = [int(root_token)]
+        parents = [-1]
+        depths = [0]
+        for node_idx in order:
+            node = tree[node_idx]
+            tokens.append(node.token_ids[-1])
+            parents.append(0 if node.parent < 0 else slot_of[node.parent])
+            depths.append(node.depth)
+        return cls(tokens=tokens, parents=parents, depths=depths)
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def attention(self) -> TreeAttention:
+        n = len(self.tokens)
+        ancestors = [[False] * n for _ in range(n)]
+        for slot in range(n):
+            node = slot
+            while node >= 0:
+                ancestors[slot][node] = True
+                node = self.parents[node]
+
+        spans = []
+        start = 0
+        for slot in range(1, n + 1):
+            if slot == n or self.depths[slot] != self.depths[start]:
+                spans.append((start, slot, self.depths[start]))
+                start = slot
+        return TreeAttention(
+            depths=mx.array(self.depths),
+            ancestors=mx.array(ancestors),
+            spans=spans,
+        )
+
+    def walk(
+        self, target_tokens: List[int], budget: int
+    ) -> Tuple[List[int], List[int]]:
+        """Follow the target's choices down the tree.
+
+        ``target_tokens[s]`` is the target's token after slot ``s``. From the
+        root, step to the child holding that token until none does; that
+        token is the bonus. Returns ``(path, new_tokens)`` where ``path``
+        lists the accepted slots starting with 0 and ``new_tokens`` (the
+        accepted drafts plus the bonus) is truncated to ``budget``.
+        """
+        children: Dict[Tuple[int, int], int] = {}
+        for slot in range(1, len(self.tokens)):
+            children[(self.parents[slot], self.tokens[slot])] = slot
+
+        path = [0]
+        new_tokens = []
+        while True:
+            tok = target_tokens[path[-1]]
+            new_tokens.append(tok)
+            child = children.get((path[-1], tok))
+            if child is None:
+                break
+            path.append(child)
+        return path, new_tokens[:budget]
@@ -10,6 +10,7 @@ from .common import (
     _speculative_walk_batch,
     generation_stream,
 )
+from .ddtree import DDTreeLayout, build_ddtree
 
 
 def _dflash_next_block_size(
@@ -98,6 +99,22 @@ def _dflash_rounds(
             "supports mlx_vlm.models.qwen3_5."
         )
 
+    tree_budget = getattr(draft_model.config, "tree_budget", None)
+    if tree_budget and hasattr(lm, "commit_speculative_tree"):
+        yield from _dflash_tree_rounds(
+            model,
+            draft_model,
+            prompt_cache,
+            hidden,
+            first_bonus=first_bonus,
+            max_tokens=max_tokens,
+            sampler=sampler,
+            tree_budget=int(tree_budget),
+            draft_block_size=draft_block_size,
+            token_dtype=token_dtype,
+        )
+        return
+
     target_layer_ids = list(draft_model.config.target_layer_ids)
     block_total = _dflash_block_total(draft_model, draft_block_size)
     draft_cache = draft_model.reset(model)
@@ -160,6 +177,79 @@ def _dflash_rounds(
             mx.clear_cache()
 
 
+def _dflash_tree_rounds(
+    model: nn.Module,
+    draft_model: nn.Module,
+    prompt_cache: List[Any],
+    hidden: mx.array,
+    *,
+    first_bonus: int,
+    max_tokens: int,
+    sampler: Callable[[mx.array], mx.array],
+    tree_budget: int,
+    draft_block_size: Optional[int] = None,
+    token_dtype: mx.Dtype = mx.int32,
+) -> Generator[Tuple[int, None], None, None]:
+    """DFlash round loop that verifies a draft tree instead of one block.
+
+    draft logits → best-first tree of ``tree_budget`` nodes → one target
+    forward over the flattened tree with tree attention → walk the accepted
+    path → compact the caches to that path. Several candidates per depth
+    raise the accepted length per target forward. Needs a target that
+    implements ``commit_speculative_tree``.
+    """
+    lm = model.language_model if hasattr(model, "language_model") else model
+    target_layer_ids = list(draft_model.config.target_layer_ids)
+    block_total = _dflash_block_total(draft_model, draft_block_size)
+    draft_cache = draft_model.reset(model)
+
+    b = first_bonus
+    emitted = 1  # the first bonus has already been yielded by the caller
+
+    while emitted < max_tokens:
+        bs = _dflash_next_block_size(
+            draft_model,
+            block_total,
+            max_tokens - emitted + 1,
+        )
+        if bs <= 1:
+            break
+
+        draft_logits = draft_model.draft_logits(b, hidden, draft_cache, bs, token_dtype)
+        layout = DDTreeLayout.from_tree(
+            build_ddtree(draft_logits, tree_budget, slot_offset=0), b
+        )
+
+        with mx.stream(generation_stream):
+            verify_out = lm(
+                mx.array([layout.tokens], dtype=token_dtype),
+                cache=prompt_cache,
+                capture_layer_ids=target_layer_ids,
+                speculative_tree=layout.attention(),
+            )
+            hidden = mx.concatenate(verify_out.hidden_states, axis=-1)
+            target_tokens = sampler(verify_out.logits)
+
+        path, new_tokens = layout.walk(
+            target_tokens.reshape(-1).tolist(), max_tokens - emitted
+        )
+        _record_speculative_round(draft_model, len(path) - 1, bs - 1)
+
+        for tok in new_tokens:
+            yield tok, None
+            emitted += 1
+            if emitted >= max_tokens:
+                return
+
+        hidden = hidden[:, mx.array(path), :]
+        b = new_tokens[-1]
+        with mx.stream(generation_stream):
+            lm.commit_speculative_tree(prompt_cache, path, len(layout))
+
+        if emitted % 256 == 0:
+            mx.clear_cache()
+
+
 def _dflash_rounds_batch(
     model: nn.Module,
     draft_model: nn.Module,
@@ -29,6 +29,7 @@ class DFlashConfig(BaseModelConfig):
     final_logit_softcapping: Optional[float] = None
     runtime_block_size: int | None = None
     draft_window_size: int | None = None
+    tree_budget: int | None = None
 
     @classmethod
     def from_dict(cls, params: dict) -> "DFlashConfig":
@@ -42,6 +43,8 @@ class DFlashConfig(BaseModelConfig):
             flat["runtime_block_size"] = dflash_cfg["runtime_block_size"]
         if "draft_window_size" in dflash_cfg:
             flat["draft_window_size"] = dflash_cfg["draft_window_size"]
+        if "tree_budget" in dflash_cfg:
+            flat["tree_budget"] = dflash_cfg["tree_budget"]
         sig = inspect.signature(cls).parameters
         return cls(**{k: v for k, v in flat.items() if k in sig})
 
@@ -190,6 +190,19 @@ class DFlashDraftModel(nn.Module):
         sampler,
         token_dtype: mx.Dtype = mx.int32,
     ) -> mx.array:
+        return sampler(
+            self.draft_logits(last_bonus, hidden, cache, block_size, token_dtype)
+        )
+
+    def draft_logits(
+        self,
+        last_bonus,
+        hidden: mx.array,
+        cache: List[KVCache],
+        block_size: int,
+        token_dtype: mx.Dtype = mx.int32,
+    ) -> mx.array:
+        """Logits for the ``block_size - 1`` masked slots after ``last_bonus``."""
         mask_id = int(self.config.mask_token_id)
         if isinstance(last_bonus, int):
             block = mx.array(
@@ -203,8 +216,7 @@ class DFlashDraftModel(nn.Module):
                 [last_bonus[:, None].astype(token_dtype), masks], axis=1
             )
         draft_hidden = self._hidden(block, hidden, cache)
-        draft_logits = self._logits(draft_hidden[:, 1:])
-        return sampler(draft_logits)
+        return self._logits(draft_hidden[:, 1:])
 
     def _hidden(
         self,
@@ -0,0 +1,259 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+import mlx.core as mx
+import mlx.nn as nn
+
+from .common import (
+    _batch_cache_left_padding,
+    _dflash_block_total,
+    _record_speculative_round,
+    _speculative_walk_batch,
+    _speculative_walk_batch_uniform_acceptance,
+    generation_stream,
+)
+from .dflash import _dflash_next_block_size
+
+# Pads rows whose lookup found fewer drafts than the longest one. Sampled
+# tokens are never negative, so the walk always rejects it; the verify pass
+# sees token 0 in its place.
+_DRAFT_FILLER = -1
+
+
+@dataclass
+class NGramConfig:
+    block_size: int = 8
+    max_ngram: int = 3
+    min_ngram: int = 2
+
+
+class NGramIndex:
+    """Suffix lookup table over one sequence's token ids.
+
+    Every n-gram (``min_ngram <= n <= max_ngram``) maps to the position
+    right after its most recent occurrence. An n-gram is only registered
+    once the token following it is known, so a lookup of the current
+    suffix never points at the suffix itself.
+    """
+
+    def __init__(self, tokens: List[int], max_ngram: int = 3, min_ngram: int = 2):
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+        self.tokens: List[int] = []
+        self.table: Dict[Tuple[int, ...], int] = {}
+        self.extend(tokens)
+
+    def extend(self, tokens: List[int]) -> None:
+        for tok in tokens:
+            pos = len(self.tokens)
+            for n in range(self.min_ngram, min(self.max_ngram, pos) + 1):
+                self.table[tuple(self.tokens[pos - n : pos])] = pos
+            self.tokens.append(int(tok))
+
+    def draft(self, k: int) -> List[int]:
+        """Continuation of the longest suffix n-gram seen before, up to ``k``."""
+        if k <= 0:
+            return []
+        for n in range(min(self.max_ngram, len(self.tokens)), self.min_ngram - 1, -1):
+            pos = self.table.get(tuple(self.tokens[-n:]))
+            if pos is not None:
+                return self.tokens[pos : pos + k]
+        return []
+
+
+class NGramDrafter:
+    """Drafter-free speculative decoding by prompt lookup.
+
+    Drafts are copied from earlier occurrences of the current suffix in the
+    prompt and generated text, so no drafter weights are loaded. This pays
+    off when outputs quote their input (OCR, transcription, document QA,
+    code edits). The lookup is deterministic, so accepting a draft token
+    only when it equals the target's sampled token keeps the output
+    distribution exact at any temperature.
+    """
+
+    def __init__(self, config: Optional[NGramConfig] = None, **kwargs):
+        self.config = config or NGramConfig(**kwargs)
+        self.accept_lens: List[float] = []
+        self.draft_lens: List[int] = []
+
+    def make_index(self, tokens: List[int]) -> NGramIndex:
+        return NGramIndex(tokens, self.config.max_ngram, self.config.min_ngram)
+
+
+def _can_rewind(lm: nn.Module, prompt_cache: List[Any]) -> bool:
+    if callable(getattr(lm, "rollback_speculative_cache", None)):
+        return True
+    return all(c.is_trimmable() for c in prompt_cache if c is not None)
+
+
+def _ngram_rounds(
+    model: nn.Module,
+    draft_model: NGramDrafter,
+    prompt_cache: List[Any],
+    *,
+    prompt_tokens: Optional[mx.array],
+    first_bonus: int,
+    max_tokens: int,
+    sampler: Callable[[mx.array], mx.array],
+    draft_block_size: Optional[int] = None,
+    token_dtype: mx.Dtype = mx.int32,
+) -> Generator[Tuple[int, None], None, None]:
+    """Single-sequence n-gram round loop; see :func:`_ngram_rounds_batch`."""
+    for tokens, _ in _ngram_rounds_batch(
+        model,
+        draft_model,
+        prompt_cache,
+        prompt_tokens=prompt_tokens,
+        first_bonus=mx.array([first_bonus], dtype=token_dtype),
+        max_tokens=max_tokens,
+        sampler=sampler,
+        draft_block_size=draft_block_size,
+        token_dtype=token_dtype,
+    ):
+        if tokens[0] is not None:
+            yield tokens[0], None
+
+
+def _ngram_rounds_batch(
+    model: nn.Module,
+    draft_model: NGramDrafter,
+    prompt_cache: List[Any],
+    *,
+    prompt_tokens: Optional[mx.array],
+    first_bonus: mx.array,
+    max_tokens: int,
+    sampler: Callable[[mx.array], mx.array],
+    draft_block_size: Optional[int] = None,
+    token_dtype: mx.Dtype = mx.int32,
+    stop_check: Optional[Callable[[int, int], bool]] = None,
+) -> Generator[Tuple[List[Optional[int]], None], None, None]:
+    """Prompt-lookup speculative-decoding round loop.
+
+    lookup → verify → walk → rewind. Works with any target: models with a
+    ``rollback_speculative_cache`` hook rewind through it, everything else
+    trims its KV caches. Once a cache can no longer be trimmed (a rotating
+    cache that wrapped, an SSM state) rounds fall back to plain one-token
+    decode steps. Each row drafts as far as its own lookup reaches, padded
+    with an always-rejected filler. Rows accept independently through the
+    rollback hook; trimmed caches share the shortest acceptance so they stay
+    aligned.
+
+    Yields ``(tokens_list, None)`` like :func:`_dflash_rounds_batch`.
+    """
+    lm = model.language_model if hasattr(model, "language_model") else model
+    rollback = getattr(lm, "rollback_speculative_cache", None)
+    # qwen3_5 only returns the GDN states its rollback needs when asked for
+    # layer captures; an empty list requests them without extra hiddens.
+    verify_kwargs = {"capture_layer_ids": []} if callable(rollback) else {}
+
+    B = int(first_bonus.shape[0])
+    cache_left_padding = _batch_cache_left_padding(prompt_cache)
+    if cache_left_padding is None:
+        left_padding = [0] * B
+    else:
+        padding_values = (
+            cache_left_padding.tolist()
+            if hasattr(cache_left_padding, "tolist")
+            else cache_left_padding
+        )
+        left_padding = [int(pad) for pad in padding_values]
+    rows = prompt_tokens.tolist() if prompt_tokens is not None else [[]] * B
+
+    block_total = _dflash_block_total(draft_model, draft_block_size)
+    b = first_bonus.reshape(-1).tolist()
+    indices = [
+        draft_model.make_index(rows[i][left_padding[i] :] + [b[i]]) for i in range(B)
+    ]
+    emitted = [1] * B
+    finished = [False] * B
+    active_idx = list(range(B))
+    total_emitted = sum(emitted)
+
+    while len(active_idx) > 0:
+        n_active = len(active_idx)
+        remaining = [max(1, max_tokens - emitted[orig] + 1) for orig in active_idx]
+        bs = _dflash_next_block_size(draft_model, block_total, min(remaining))
+        if bs < 1:
+            break
+
+        k = bs - 1 if _can_rewind(lm, prompt_cache) else 0
+        drafts = [indices[orig].draft(k) for orig in active_idx]
+        k = max(len(d) for d in drafts)
+        draft_tokens = mx.array(
+            [d + [_DRAFT_FILLER] * (k - len(d)) for d in drafts], dtype=token_dtype
+        ).reshape(n_active, k)
+
+        with mx.stream(generation_stream):
+            b_arr = mx.array([b[orig] for orig in active_idx], dtype=token_dtype)
+            verify_input = mx.concatenate(
+                [b_arr[:, None], mx.maximum(draft_tokens, 0)], axis=1
+            )
+            verify_out = lm(verify_input, cache=prompt_cache, **verify_kwargs)
+            target_tokens = sampler(verify_out.logits)
+        mx.eval(target_tokens)
+
+        budgets = [max_tokens - emitted[orig] for orig in active_idx]
+        accepted_list, new_tokens_list = _speculative_walk_batch(
+            draft_tokens, target_tokens, budgets
+        )
+        if not callable(rollback) and len(set(accepted_list)) > 1:
+            accepted_list, new_tokens_list = _speculative_walk_batch_uniform_acceptance(
+                draft_tokens, target_tokens, accepted_list, budgets
+            )
+        accepted = min(accepted_list)
+        for a, d in zip(accepted_list, drafts):
+            _record_speculative_round(draft_model, a, len(d))
+
+        max_new = max(len(nt) for nt in new_tokens_list)
+        for pos in range(max_new):
+            tokens_out: List[Optional[int]] = [None] * B
+            for j, orig in enumerate(active_idx):
+                if pos < len(new_tokens_list[j]) and not finished[orig]:
+                    tok = new_tokens_list[j][pos]
+                    tokens_out[orig] = tok
+                    emitted[orig] += 1
+                    if emitted[orig] >= max_tokens:
+                        finished[orig] = True
+                    if stop_check is not None and stop_check(orig, tok):
+                        finished[orig] = True
+            yield tokens_out, None
+
+        for j, orig in enumerate(active_idx):
+            if new_tokens_list[j]:
+                b[orig] = new_tokens_list[j][-1]
+                indices[orig].extend(new_tokens_list[j])
+
+        # The verify pass cached the bonus plus ``k`` drafts; keep the bonus
+        # and the accepted drafts.
+        if accepted < k:
+            with mx.stream(generation_stream):
+                if callable(rollback):
+                    rollback(
+                        prompt_cache,
+                        getattr(verify_out, "gdn_states", None),
+                        mx.array(accepted_list) if n_active > 1 else accepted,
+                        k + 1,
+                    )
+                else:
+                    for c in prompt_cache:
+                        if c is not None:
+                            c.trim(k - accepted)
+
+        keep_slots = [j for j in range(n_active) if not finished[active_idx[j]]]
+        if len(keep_slots) == 0:
+            break
+        if len(keep_slots) < n_active:
+            keep_mx = mx.array(keep_slots, dtype=mx.int32)
+            for c in prompt_cache:
+                if hasattr(c, "filter"):
+                    c.filter(keep_mx)
+            rope_deltas = getattr(lm, "_rope_deltas", None)
+            if rope_deltas is not None and rope_deltas.shape[0] == n_active:
+                lm._rope_deltas = rope_deltas[keep_mx]
+            active_idx = [active_idx[j] for j in keep_slots]
+
+        new_total = sum(emitted)
+        if new_total // 256 > total_emitted // 256:
+            mx.clear_cache()
+        total_emitted = new_total
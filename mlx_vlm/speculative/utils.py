@@ -32,6 +32,7 @@ from .mtp import (
     _speculative_walk_batch_deferred_greedy,
     _speculative_walk_deferred_greedy,
 )
+from .ngram import _ngram_rounds, _ngram_rounds_batch
 
 __all__ = [
     "_MTPVerifyResult",
@@ -49,6 +50,8 @@ __all__ = [
     "_mtp_rounds_batch",
     "_mtp_shared_kv_from_prompt_cache",
     "_mtp_verify_target",
+    "_ngram_rounds",
+    "_ngram_rounds_batch",
     "_speculative_walk",
     "_speculative_walk_batch",
     "_speculative_walk_batch_deferred_greedy",
@@ -57,12 +60,20 @@ __all__ = [
     "format_speculative_stats",
     "get_speculative_rounds_batch",
     "make_speculative_prompt_cache",
+    "restore_speculative_session",
     "run_speculative_rounds",
     "run_speculative_server_rounds",
+    "snapshot_speculative_session",
     "speculative_hidden_state",
     "speculative_prefill_kwargs",
 ]
 
+# Per-sequence positional state the target language model keeps between
+# forward calls (mRoPE models cache these after prefill).
+_TARGET_SESSION_ATTRS = ("_position_ids", "_rope_deltas")
+_DRAFTER_SESSION_STATS = ("accept_lens", "draft_lens")
+_MODULE_INTERNAL_ATTRS = ("_no_grad", "_training")
+
 
 def format_speculative_stats(draft_model: nn.Module) -> Optional[str]:
     return _format_speculative_stats(draft_model)
@@ -75,8 +86,11 @@ def get_speculative_rounds_batch(draft_kind: str):
         return _mtp_rounds_batch
     if draft_kind == "dflash":
         return _dflash_rounds_batch
+    if draft_kind == "ngram":
+        return _ngram_rounds_batch
     raise ValueError(
-        f"Unknown draft_kind {draft_kind!r}. Supported: ['dflash', 'eagle3', 'mtp']"
+        f"Unknown draft_kind {draft_kind!r}. "
+        "Supported: ['dflash', 'eagle3', 'mtp', 'ngram']"
     )
 
 
@@ -87,8 +101,11 @@ def speculative_prefill_kwargs(draft_kind: str, drafter) -> dict:
         return {"capture_layer_ids": _eagle3_capture_layer_ids(drafter)}
     if draft_kind == "dflash":
         return {"capture_layer_ids": list(drafter.config.target_layer_ids)}
+    if draft_kind == "ngram":
+        return {}
     raise ValueError(
-        f"Unknown draft_kind {draft_kind!r}. Supported: ['dflash', 'eagle3', 'mtp']"
+        f"Unknown draft_kind {draft_kind!r}. "
+        "Supported: ['dflash', 'eagle3', 'mtp', 'ngram']"
     )
 
 
@@ -97,8 +114,11 @@ def speculative_hidden_state(draft_kind: str, outputs):
         return outputs.hidden_states[-1]
     if draft_kind in ("dflash", "eagle3"):
         return mx.concatenate(outputs.hidden_states, axis=-1)
+    if draft_kind == "ngram":
+        return None
     raise ValueError(
-        f"Unknown draft_kind {draft_kind!r}. Supported: ['dflash', 'eagle3', 'mtp']"
+        f"Unknown draft_kind {draft_kind!r}. "
+        "Supported: ['dflash', 'eagle3', 'mtp', 'ngram']"
     )
 
 
@@ -115,6 +135,43 @@ def make_speculative_prompt_cache(
     return make_cache(lm, left_padding)
 
 
+def snapshot_speculative_session(lm, draft_model) -> dict:
+    """Capture the decode state a round loop leaves on the target and drafter.
+
+    Round loops keep per-request state on the shared modules: positional
+    state on the target and private ``_``-prefixed attributes (draft cache,
+    seed token/hidden, shared KV) plus acceptance stats on the drafter. The
+    server interleaves several round loops over the same modules, so each
+    one's state is swapped in before it advances and captured afterwards.
+    """
+    target = {
+        name: getattr(lm, name) for name in _TARGET_SESSION_ATTRS if hasattr(lm, name)
+    }
+    names = set()
+    if isinstance(draft_model, dict):
+        names.update(k for k in draft_model.keys() if k.startswith("_"))
+    names.update(
+        k
+        for k in vars(draft_model)
+        if k.startswith("_")
+        and not k.startswith("__")
+        and k not in _MODULE_INTERNAL_ATTRS
+    )
+    names.update(k for k in _DRAFTER_SESSION_STATS if hasattr(draft_model, k))
+    drafter = {name: getattr(draft_model, name) for name in names}
+    return {"target": target, "drafter": drafter}
+
+
+def restore_speculative_session(lm, draft_model, session: Optional[dict]) -> None:
+    """Reinstate state captured by :func:`snapshot_speculative_session`."""
+    if session is None:
+        return
+    for name, value in session["target"].items():
+        setattr(lm, name, value)
+    for name, value in session["drafter"].items():
+        setattr(draft_model, name, value)
+
+
 def run_speculative_server_rounds(
     model: nn.Module,
     draft_model: nn.Module,
@@ -224,8 +281,24 @@ def run_speculative_server_rounds(
         )
         return
 
+    if draft_kind == "ngram":
+        yield from _ngram_rounds_batch(
+            model,
+            draft_model,
+            prompt_cache,
+            prompt_tokens=prompt_tokens,
+            first_bonus=first_bonus.reshape(-1),
+            max_tokens=max_tokens,
+            sampler=sampler,
+            draft_block_size=draft_block_size,
+            token_dtype=token_dtype,
+            stop_check=stop_check,
+        )
+        return
+
     raise ValueError(
-        f"Unknown draft_kind {draft_kind!r}. Supported: ['dflash', 'eagle3', 'mtp']"
+        f"Unknown draft_kind {draft_kind!r}. "
+        "Supported: ['dflash', 'eagle3', 'mtp', 'ngram']"
     )
 
 
@@ -243,9 +316,46 @@ def run_speculative_rounds(
     sampler: Callable[[mx.array], mx.array],
     draft_block_size: Optional[int] = None,
     sampler_is_greedy: bool = False,
+    prompt_tokens: Optional[mx.array] = None,
 ) -> Generator[Tuple[Any, mx.array], None, None]:
     B = input_ids.shape[0]
 
+    if draft_kind == "ngram":
+        # Prefill may have been chunked, leaving ``input_ids`` as just the
+        # last prompt token; the lookup wants the whole prompt.
+        if prompt_tokens is None:
+            prompt_tokens = input_ids
+        mx.eval(first_token)
+        if B == 1:
+            bonus = first_token.item()
+            yield bonus, logprobs
+            yield from _ngram_rounds(
+                model,
+                draft_model,
+                prompt_cache,
+                prompt_tokens=prompt_tokens,
+                first_bonus=bonus,
+                max_tokens=max_tokens,
+                sampler=sampler,
+                draft_block_size=draft_block_size,
+                token_dtype=input_ids.dtype,
+            )
+        else:
+            first_bonus = first_token.reshape(-1)
+            yield first_bonus.tolist(), logprobs
+            yield from _ngram_rounds_batch(
+                model,
+                draft_model,
+                prompt_cache,
+                prompt_tokens=prompt_tokens,
+                first_bonus=first_bonus,
+                max_tokens=max_tokens,
+                sampler=sampler,
+                draft_block_size=draft_block_size,
+                token_dtype=input_ids.dtype,
+            )
+        return
+
     if draft_kind == "mtp":
         shared_kv_states = last_outputs.shared_kv_states
         hidden = last_outputs.hidden_states[-1]
@@ -345,7 +455,8 @@ def run_speculative_rounds(
 
     if draft_kind != "dflash":
         raise ValueError(
-            f"Unknown draft_kind {draft_kind!r}. Supported: ['dflash', 'eagle3', 'mtp']"
+            f"Unknown draft_kind {draft_kind!r}. "
+            "Supported: ['dflash', 'eagle3', 'mtp', 'ngram']"
         )
 
     hidden = mx.concatenate(last_outputs.hidden_states, axis=-1)
@@ -1,7 +1,48 @@
+import hashlib
 import json
-from typing import Any
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
 
 import mlx.core as mx
+import numpy as np
+
+# llguidance's native thread pool, shared by every grammar-constrained row.
+_llg_executor = None
+
+
+def _get_llg_executor():
+    global _llg_executor
+    if _llg_executor is None:
+        from llguidance import LLExecutor
+
+        _llg_executor = LLExecutor()
+    return _llg_executor
+
+
+def apply_token_bitmask(
+    logits: mx.array,
+    bitmask: np.ndarray,
+    constrained: Optional[Sequence[bool]] = None,
+) -> mx.array:
+    """Mask disallowed tokens of ``logits`` (B, vocab) to ``-inf`` in one op.
+
+    ``bitmask`` is llguidance's packed (B, ceil(n_vocab / 32)) int32 layout.
+    Logit columns past the grammar vocab are disallowed for constrained rows
+    and left alone for the others (``constrained`` defaults to all rows).
+    """
+    batch, vocab = logits.shape
+    words = mx.array(bitmask)
+    bits = (words[:, :, None] >> mx.arange(32, dtype=mx.int32)) & 1
+    allowed = bits.reshape(batch, -1)[:, :vocab] != 0
+    if allowed.shape[1] < vocab:
+        if constrained is None:
+            constrained = [True] * batch
+        tail = mx.array([not c for c in constrained])[:, None]
+        tail = mx.broadcast_to(tail, (batch, vocab - allowed.shape[1]))
+        allowed = mx.concatenate([allowed, tail], axis=1)
+    return mx.where(allowed, logits, mx.array(-float("inf"), dtype=logits.dtype))
 
 
 class LLGuidanceLogitsProcessor:
@@ -12,13 +53,17 @@ class LLGuidanceLogitsProcessor:
     (batch, vocab).
     """
 
-    def __init__(self, grammar: str, llg_tokenizer) -> None:
+    def __init__(self, grammar: str, llg_tokenizer, matcher_template=None) -> None:
         self.grammar = grammar
         self.llg_tokenizer = llg_tokenizer
+        # A fresh, already-compiled LLMatcher; rows start from deep copies.
+        self.matcher_template = matcher_template
         self.is_first_token = True
 
     def clone(self) -> "LLGuidanceLogitsProcessor":
-        return LLGuidanceLogitsProcessor(self.grammar, self.llg_tokenizer)
+        return LLGuidanceLogitsProcessor(
+            self.grammar, self.llg_tokenizer, self.matcher_template
+        )
 
     def reset(self):
         self.is_first_token = True
@@ -30,38 +75,43 @@ class LLGuidanceLogitsProcessor:
         import llguidance.numpy
         from llguidance import LLMatcher
 
-        self.ll_matchers = [
-            LLMatcher(self.llg_tokenizer, self.grammar) for _ in range(batch_size)
-        ]
+        if self.matcher_template is not None:
+            self.ll_matchers = [
+                self.matcher_template.deep_copy() for _ in range(batch_size)
+            ]
+        else:
+            self.ll_matchers = [
+                LLMatcher(self.llg_tokenizer, self.grammar) for _ in range(batch_size)
+            ]
         self.bitmask = llguidance.numpy.allocate_token_bitmask(
             batch_size, self.llg_tokenizer.vocab_size
         )
 
     def _consume_tokens(self, last_tokens: list[int]) -> None:
-        for i, last_token in enumerate(last_tokens):
-            self.ll_matchers[i].consume_token(last_token)
-            error = self.ll_matchers[i].get_error()
-            if error:
-                raise ValueError(f"LLGuidance matcher error: {error}")
+        _consume_par(list(zip(self.ll_matchers, last_tokens)))
 
     def _apply_bitmask(self, logits: mx.array) -> mx.array:
-        import llguidance.mlx
         import llguidance.numpy
 
-        biased_logits = []
-        for i in range(logits.shape[0]):
-            llguidance.numpy.fill_next_token_bitmask(
-                self.ll_matchers[i], self.bitmask, i
-            )
-            row = mx.array(
-                llguidance.mlx.apply_token_bitmask(logits[i], self.bitmask[i])
-            )
-            if row.ndim == 2 and row.shape[0] == 1:
-                row = row[0]
-            biased_logits.append(row)
-        return mx.concatenate(
-            [mx.array(logit)[None, :] for logit in biased_logits], axis=0
+        llguidance.numpy.fill_next_token_bitmask_par(
+            _get_llg_executor(),
+            [(m, i) for i, m in enumerate(self.ll_matchers)],
+            self.bitmask,
         )
+        return apply_token_bitmask(logits, self.bitmask)
+
+    def advance(self, last_token: int):
+        """Step a single-row processor and return its matcher.
+
+        Mirrors ``process_last_token`` without touching logits: the first
+        call builds the matcher, later calls hand back ``last_token`` for
+        the caller to consume alongside other rows.
+        """
+        if self.is_first_token:
+            self._setup(1)
+            self.is_first_token = False
+            return self.ll_matchers[0], None
+        return self.ll_matchers[0], int(last_token)
 
     def process_last_token(self, last_token: int, logits: mx.array) -> mx.array:
         if logits.ndim == 1:
@@ -91,12 +141,117 @@ class LLGuidanceLogitsProcessor:
         return self._apply_bitmask(logits)
 
 
+def _consume_par(pairs: list) -> None:
+    import llguidance.numpy
+
+    if not pairs:
+        return
+    llguidance.numpy.consume_token_par(_get_llg_executor(), pairs)
+    for matcher, _ in pairs:
+        error = matcher.get_error()
+        if error:
+            raise ValueError(f"LLGuidance matcher error: {error}")
+
+
+def fill_grammar_bitmask(
+    processors: Sequence[Optional[LLGuidanceLogitsProcessor]],
+    last_tokens: Sequence[int],
+) -> np.ndarray:
+    """Advance every constrained row and compute all next-token bitmasks.
+
+    ``processors`` holds one single-row processor (or ``None``) per batch
+    row. Token consumption and mask computation each run as one call on
+    llguidance's thread pool; rows without a processor stay all-allowed.
+    """
+    import llguidance.numpy
+
+    active = [(i, p) for i, p in enumerate(processors) if p is not None]
+    vocab_size = active[0][1].llg_tokenizer.vocab_size
+    bitmask = llguidance.numpy.allocate_token_bitmask(len(processors), vocab_size)
+    matchers = []
+    to_consume = []
+    for i, processor in active:
+        matcher, token = processor.advance(last_tokens[i])
+        matchers.append((matcher, i))
+        if token is not None:
+            to_consume.append((matcher, token))
+    _consume_par(to_consume)
+    llguidance.numpy.fill_next_token_bitmask_par(_get_llg_executor(), matchers, bitmask)
+    return bitmask
+
+
 def _serialize_schema(schema: str | dict[str, Any]) -> str:
     if isinstance(schema, str):
         return schema
     return json.dumps(schema)
 
 
+def schema_hash(schema: str | dict[str, Any]) -> str:
+    """Canonical hash of a JSON schema: key order and whitespace don't count."""
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CompiledGrammarCache:
+    """LRU of compiled grammars and matcher templates.
+
+    Entries are keyed by ``(llguidance tokenizer, schema hash)``. A hit hands
+    out the cached grammar plus a compiled ``LLMatcher`` that requests
+    deep-copy, so repeated schemas skip grammar compilation entirely.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        if max_entries is None:
+            max_entries = int(os.environ.get("MLX_VLM_GRAMMAR_CACHE_SIZE", "64"))
+        self.max_entries = max(0, int(max_entries))
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = build()
+        if entry is None or self.max_entries == 0:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+grammar_cache = CompiledGrammarCache()
+
+
 # Building an llguidance tokenizer walks the entire vocab (~1.5s for a 150k
 # token model), so we keep the result around for the lifetime of the process.
 _llg_tokenizer_cache = {}
@@ -117,5 +272,15 @@ def build_json_schema_logits_processor(tokenizer, schema: str | dict[str, Any]):
         llg_tokenizer = llguidance.hf.from_tokenizer(tokenizer)
         _llg_tokenizer_cache[id(tokenizer)] = llg_tokenizer
 
-    grammar = llg.grammar_from("json_schema", _serialize_schema(schema))
-    return LLGuidanceLogitsProcessor(grammar, llg_tokenizer)
+    def build():
+        grammar = llg.grammar_from("json_schema", _serialize_schema(schema))
+        template = llg.LLMatcher(llg_tokenizer, grammar)
+        if template.is_error():
+            # No template for invalid grammars; each request's own matcher
+            # reports the error.
+            return grammar, None
+        return grammar, template
+
+    key = (id(llg_tokenizer), schema_hash(schema))
+    grammar, template = grammar_cache.get_or_build(key, build)
+    return LLGuidanceLogitsProcessor(grammar, llg_tokenizer, template)
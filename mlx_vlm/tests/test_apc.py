@@ -18,6 +18,7 @@ from mlx_vlm.apc import (
     from_env,
     harvest_blocks_from_batch_cache,
     hash_image_payload,
+    image_block_salts,
     make_warm_batch_exact_cache_multi,
     make_warm_batch_kv_cache,
     make_warm_batch_kv_cache_multi,
@@ -80,6 +81,18 @@ def test_hash_chain_and_image_hash_are_deterministic():
     )
 
 
+def test_hash_image_payload_hashes_pil_image_content():
+    from PIL import Image
+
+    red = Image.new("RGB", (4, 4), (255, 0, 0))
+    assert hash_image_payload(image_ref=red) == hash_image_payload(
+        image_ref=Image.new("RGB", (4, 4), (255, 0, 0))
+    )
+    assert hash_image_payload(image_ref=red) != hash_image_payload(
+        image_ref=Image.new("RGB", (4, 4), (0, 0, 255))
+    )
+
+
 def test_tenant_scoped_hash_is_stable_namespaced_and_process_stable():
     image_hash = hash_image_payload(image_ref="cat.jpg")
 
@@ -197,6 +210,37 @@ def test_extra_hash_isolates_image_and_tenant_prefixes():
     manager.release(matched)
 
 
+def test_image_block_salts_share_text_ahead_of_the_image():
+    block_size = 4
+    image = 99
+    # Two text blocks, then an image run starting in block 2.
+    token_ids = [1, 2, 3, 4, 5, 6, 7, 8, 9, image, image, 10, 11]
+    layer_keys, layer_values = _make_fake_kv(seq_len=len(token_ids))
+    cat = image_block_salts(
+        token_ids, block_size, [image], [hash_image_payload(image_ref="cat.jpg")]
+    )
+    dog = image_block_salts(
+        token_ids, block_size, [image], [hash_image_payload(image_ref="dog.jpg")]
+    )
+
+    assert cat[:2] == dog[:2] == [0, 0]
+    assert cat[2] != dog[2]
+    assert image_block_salts(token_ids, block_size, [image], []) is None
+
+    manager = APCManager(num_blocks=16, block_size=block_size)
+    manager.release(
+        manager.store_kv_blocks(token_ids, layer_keys, layer_values, extra_hash=cat)
+    )
+
+    matched, matched_tokens = manager.lookup_prefix(token_ids, extra_hash=dog)
+    assert matched_tokens == 2 * block_size
+    manager.release(matched)
+    matched, matched_tokens = manager.lookup_prefix(token_ids, extra_hash=cat)
+    assert matched_tokens == 3 * block_size
+    assert [b.extra_hash for b in matched] == cat[:3]
+    manager.release(matched)
+
+
 def test_stored_block_tensors_are_decoupled_from_source_cache():
     block_size = 16
     manager = APCManager(num_blocks=4, block_size=block_size)
@@ -768,6 +812,76 @@ def test_harvest_blocks_from_batch_cache_drops_left_padding():
     source_manager.release(full_blocks + short_blocks)
 
 
+def test_quantized_blocks_are_spliced_without_requantizing():
+    from mlx_vlm.models.cache import BatchQuantizedKVCache
+
+    block_size = 16
+    manager = APCManager(num_blocks=8, block_size=block_size)
+    token_ids = list(range(2 * block_size))
+    keys, values = _make_fake_kv(seq_len=len(token_ids), head_dim=64)
+    source = [BatchQuantizedKVCache([0], group_size=32, bits=4) for _ in keys]
+    for c, k, v in zip(source, keys, values):
+        c.update_and_fetch(k, v)
+
+    blocks = harvest_blocks_from_batch_cache(manager, source, 0, token_ids)
+    assert len(blocks) == 2
+    assert isinstance(blocks[0].keys[0], tuple)
+    matched, prefix_len = manager.lookup_prefix(token_ids + [999])
+    assert prefix_len == 2 * block_size
+
+    templates = [BatchQuantizedKVCache([0, 0], group_size=32, bits=4) for _ in keys]
+    caches, max_prefix = make_warm_batch_kv_cache_multi(
+        [{"matched_blocks": matched, "prefix_len": prefix_len}, None],
+        num_layers=2,
+        caches=templates,
+    )
+
+    assert max_prefix == prefix_len
+    assert caches[0] is templates[0]
+    assert caches[0]._idx == prefix_len
+    assert caches[0].left_padding.tolist() == [0, prefix_len]
+    for got, want in zip(caches[1].values, source[1].state[1]):
+        assert mx.array_equal(got[:1], want).item()
+    manager.release(matched + blocks)
+
+
+def test_turboquant_prefix_persists_to_disk_compressed(tmp_path, monkeypatch):
+    from mlx_vlm.turboquant import BatchTurboQuantKVCache, TurboQuantKVCache
+
+    monkeypatch.setenv("APC_EXACT_CACHE_ENTRIES", "0")
+    block_size = 16
+    token_ids = list(range(3 * block_size))
+    keys, values = _make_fake_kv(seq_len=len(token_ids), head_dim=64)
+    source = [BatchTurboQuantKVCache([0], bits=3) for _ in keys]
+    for c, k, v in zip(source, keys, values):
+        c.update_and_fetch(k, v)
+
+    disk = DiskBlockStore(tmp_path, namespace="turbo")
+    manager = APCManager(num_blocks=8, block_size=block_size, disk=disk)
+    blocks = harvest_blocks_from_batch_cache(manager, source, 0, token_ids)
+    disk._q.join()
+    assert disk.num_exact_indexed == 1
+    manager.release(blocks)
+    manager.close()
+
+    disk = DiskBlockStore(tmp_path, namespace="turbo")
+    manager = APCManager(num_blocks=8, block_size=block_size, disk=disk)
+    warm, prefix_len = manager.lookup_exact_cache(token_ids + [999])
+
+    # The guard tail keeps the last partial block out of the snapshot.
+    assert prefix_len == 2 * block_size
+    assert isinstance(warm[0], TurboQuantKVCache)
+    assert warm[0].offset == prefix_len
+    restored = apc_module._kv_leaves(warm[0].state[0])
+    expected = apc_module._kv_leaves(
+        apc_module._kv_tokens(source[0].state[0], 0, prefix_len)
+    )
+    assert len(restored) == len(expected)
+    for got, want in zip(restored, expected):
+        assert mx.array_equal(got, want).item()
+    manager.close()
+
+
 def test_disk_metadata_mismatch_is_a_miss(tmp_path):
     block_size = 16
     token_ids = list(range(block_size))
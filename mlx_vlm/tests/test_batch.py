@@ -0,0 +1,153 @@
+import json
+from types import SimpleNamespace
+
+import mlx.core as mx
+
+from mlx_vlm import batch
+from mlx_vlm.batch import BatchRequest, BatchRunner, build_requests, completed_ids
+
+
+class _FakeDetokenizer:
+    def reset(self):
+        self.tokens = []
+
+    def add_token(self, token):
+        self.tokens.append(token)
+
+    def finalize(self):
+        pass
+
+    @property
+    def text(self):
+        return " ".join(str(t) for t in self.tokens)
+
+
+class _FakeGenerator:
+    """Emits ``max_tokens`` tokens per row, then a ``length`` finish."""
+
+    instances = []
+
+    def __init__(self, model, processor, **kwargs):
+        self.kwargs = kwargs
+        self.rows = {}
+        self.uid_count = 0
+        self.max_active = 0
+        self.closed = False
+        _FakeGenerator.instances.append(self)
+
+    def insert(self, prompts, max_tokens, prompt_kwargs, sampling_params):
+        uid = self.uid_count
+        self.uid_count += 1
+        self.rows[uid] = [0, max_tokens]
+        self.max_active = max(self.max_active, len(self.rows))
+        return [uid]
+
+    def next(self):
+        responses = []
+        for uid, row in list(self.rows.items()):
+            row[0] += 1
+            finish = "length" if row[0] == row[1] else None
+            responses.append(
+                SimpleNamespace(uid=uid, token=uid * 10 + row[0], finish_reason=finish)
+            )
+            if finish:
+                del self.rows[uid]
+        return [], responses
+
+    def close(self):
+        self.closed = True
+
+
+def _runner(monkeypatch, **kwargs):
+    monkeypatch.setattr(batch, "BatchGenerator", _FakeGenerator)
+    model = SimpleNamespace(language_model=None, config=None)
+    processor = SimpleNamespace(detokenizer=_FakeDetokenizer())
+    runner = BatchRunner(model, processor, **kwargs)
+
+    def preprocess(request):
+        if request.prompt == "bad":
+            raise ValueError("unreadable image")
+        return {"input_ids": mx.array([[1, 2, 3]])}
+
+    monkeypatch.setattr(runner, "_preprocess", preprocess)
+    monkeypatch.setattr(runner, "_embed", lambda request, raw_inputs: {})
+    return runner
+
+
+class TestBatchRunner:
+    def test_runs_every_request(self, monkeypatch):
+        _FakeGenerator.instances.clear()
+        runner = _runner(monkeypatch, max_tokens=2, batch_size=2, num_workers=2)
+        requests = [BatchRequest(id=i, prompt="hi") for i in range(5)]
+
+        results = list(runner.run(requests))
+
+        assert sorted(r.id for r in results) == list(range(5))
+        assert all(r.generation_tokens == 2 for r in results)
+        assert all(r.prompt_tokens == 3 for r in results)
+        assert runner.completed == 5
+        assert runner.generation_tokens == 10
+        gen = _FakeGenerator.instances[-1]
+        assert gen.closed
+        assert gen.kwargs["completion_batch_size"] == 2
+
+    def test_failed_request_does_not_stop_run(self, monkeypatch):
+        _FakeGenerator.instances.clear()
+        runner = _runner(monkeypatch, max_tokens=1, batch_size=2, num_workers=0)
+        requests = [
+            BatchRequest(id="a", prompt="hi"),
+            BatchRequest(id="b", prompt="bad"),
+            BatchRequest(id="c", prompt="hi", max_tokens=3),
+        ]
+
+        results = {r.id: r for r in runner.run(requests)}
+
+        assert results["b"].error == "ValueError: unreadable image"
+        assert results["b"].to_dict() == {"id": "b", "error": results["b"].error}
+        assert results["c"].generation_tokens == 3
+        assert runner.failed == 1 and runner.completed == 2
+        assert _FakeGenerator.instances[-1].max_active == 2
+
+
+class TestRecords:
+    def test_completed_ids_skips_errors_and_partial_lines(self, tmp_path):
+        path = tmp_path / "out.jsonl"
+        path.write_text(
+            json.dumps({"id": 0, "output": "a cat"})
+            + "\n"
+            + json.dumps({"id": 1, "error": "boom"})
+            + "\n"
+            + '{"id": 2, "outp'
+        )
+        assert completed_ids(str(path)) == {0}
+        assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+    def test_build_requests(self, tmp_path):
+        records = [
+            {"image": "a.png"},
+            {"id": "x", "question": "What?", "image": ["b.png", "http://c/d.png"]},
+            {"image": "e.png"},
+        ]
+        requests = list(
+            build_requests(
+                records,
+                prompt_field="question",
+                default_prompt="Describe.",
+                image_root=str(tmp_path),
+                skip_ids={2},
+            )
+        )
+
+        assert [r.id for r in requests] == [0, "x"]
+        assert requests[0].prompt == "Describe."
+        assert requests[0].images == [str(tmp_path / "a.png")]
+        assert requests[1].prompt == "What?"
+        assert requests[1].images == [str(tmp_path / "b.png"), "http://c/d.png"]
+
+    def test_build_requests_system_and_limit(self):
+        records = [{"prompt": "hi"}] * 3
+        requests = list(build_requests(records, system="Be brief.", max_samples=2))
+
+        assert len(requests) == 2
+        assert requests[0].prompt[0] == {"role": "system", "content": "Be brief."}
+        assert requests[0].images is None
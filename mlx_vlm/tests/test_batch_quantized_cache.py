@@ -159,6 +159,21 @@ class TestState:
         assert state[1] is None
 
 
+class TestRightPadding:
+    def test_finalize_rolls_right_padding_into_left_padding(self):
+        cache = BatchQuantizedKVCache([0, 0], group_size=GROUP_SIZE, bits=BITS)
+        cache.prepare(right_padding=[0, 2], lengths=[4, 2])
+        k, v = _rand_kv(B, 4)
+        cache.update_and_fetch(k, v)
+        before = cache.keys[0][1, :, :2]
+        cache.finalize()
+
+        assert cache.offset.tolist() == [4, 2]
+        assert cache.left_padding.tolist() == [0, 2]
+        assert mx.array_equal(cache.keys[0][1, :, 2:4], before).item()
+        assert cache._right_padding is None
+
+
 class TestMakeCache:
     """Test that _make_cache creates BatchQuantizedKVCache when kv_bits is set."""
 
@@ -0,0 +1,38 @@
+from mlx_vlm.evals.utils import PredictionCache
+
+
+class TestPredictionCache:
+    def test_persists_predictions(self, tmp_path):
+        config = {"max_tokens": 16, "temperature": 0.0}
+        cache = PredictionCache(str(tmp_path), "model-a", "MMStar_val", config)
+        cache.put(1, "A")
+        cache.put("q-2", "B")
+
+        reloaded = PredictionCache(str(tmp_path), "model-a", "MMStar_val", config)
+        assert len(reloaded) == 2
+        assert 1 in reloaded and "1" in reloaded
+        assert reloaded.get("q-2") == "B"
+        assert reloaded.get(3) is None
+
+    def test_keyed_by_model_and_config(self, tmp_path):
+        base = PredictionCache(str(tmp_path), "model-a", "MMStar_val", {"t": 0.0})
+        base.put(1, "A")
+
+        assert 1 not in PredictionCache(
+            str(tmp_path), "model-b", "MMStar_val", {"t": 0.0}
+        )
+        assert 1 not in PredictionCache(
+            str(tmp_path), "model-a", "MMStar_val", {"t": 0.7}
+        )
+
+    def test_ignores_truncated_line(self, tmp_path):
+        cache = PredictionCache(str(tmp_path), "model-a", "OCRBench_test", {})
+        cache.put(1, "A")
+        with open(cache.path, "a", encoding="utf-8") as f:
+            f.write('{"id": "2", "predic')
+
+        reloaded = PredictionCache(str(tmp_path), "model-a", "OCRBench_test", {})
+        reloaded.put(3, "C")
+
+        reloaded = PredictionCache(str(tmp_path), "model-a", "OCRBench_test", {})
+        assert len(reloaded) == 2 and reloaded.get(3) == "C"
@@ -21,6 +21,7 @@ from mlx_vlm.generate import (
     _prime_cached_prefix_rope_state,
     normalize_resize_shape,
 )
+from mlx_vlm.sample_utils import BatchSamplingState, SamplingParams
 from mlx_vlm.utils import ThinkingBudgetCriteria
 
 generate_module = sys.modules["mlx_vlm.generate"]
@@ -460,6 +461,29 @@ class TestBatchGenerator:
         assert gen.uid_count == 3
         assert len(gen.unprocessed_prompts) == 3
 
+    def test_insert_routes_lora_adapters_per_row(self, mock_model, mock_processor):
+        adapter_set = MagicMock()
+        adapter_set.__contains__.side_effect = lambda name: name == "tenant-a"
+        gen = BatchGenerator(
+            model=mock_model.language_model,
+            processor=mock_processor,
+            adapter_set=adapter_set,
+        )
+
+        uids = gen.insert([[1, 2], [3, 4, 5]], adapters=["tenant-a", None])
+        kwargs = {s[0]: s[3] for s in gen.unprocessed_prompts}
+
+        assert kwargs[uids[0]]["_apc_adapter"] == "tenant-a"
+        assert "_apc_adapter" not in (kwargs[uids[1]] or {})
+        assert gen.active_adapters() == {"tenant-a"}
+        gen._route_adapters(SimpleNamespace(uids=[uids[1], uids[0]]))
+        adapter_set.select.assert_called_with([None, "tenant-a"])
+        with pytest.raises(ValueError, match="not loaded"):
+            gen.insert([[6]], adapters=["missing"])
+
+        gen.remove(uids[0])
+        assert gen.active_adapters() == set()
+
     def test_insert_with_max_tokens(self, mock_model, mock_processor):
         gen = BatchGenerator(
             model=mock_model.language_model,
@@ -575,6 +599,43 @@ class TestBatchGenerator:
         second = batch.next()
         assert [r.token for r in second] == [2, 2]
 
+    def test_generation_batch_samples_rows_with_their_own_params(self):
+        class FixedLogitModel:
+            def __call__(self, input_ids, cache=None, **kwargs):
+                token_scores = mx.array([0.0, 5.0, 4.9, 0.0])
+                logits = mx.broadcast_to(
+                    token_scores, (input_ids.shape[0], input_ids.shape[1], 4)
+                )
+                return MagicMock(logits=logits)
+
+        batch = GenerationBatch(
+            model=FixedLogitModel(),
+            uids=[0, 1, 2],
+            inputs=mx.array([5, 6, 7], dtype=mx.int32),
+            prompt_cache=[],
+            sampler=lambda logprobs: mx.full((logprobs.shape[0],), 3),
+            stop_criteria=lambda token: False,
+            max_tokens=[8, 8, 8],
+            sampling_state=BatchSamplingState(
+                [
+                    SamplingParams(temperature=0.0),
+                    SamplingParams(temperature=1.0, top_k=2, seed=0),
+                    None,
+                ]
+            ),
+        )
+
+        batch.next()
+        for _ in range(4):
+            greedy, sampled, fallback = [r.token for r in batch.next()]
+            assert greedy == 1
+            assert sampled in (1, 2)
+            assert fallback == 3
+
+        batch.filter([1, 2])
+        assert len(batch.sampling_state) == 2
+        assert batch.sampling_state.params[1] is None
+
     def test_remove_from_unprocessed(self, mock_model, mock_processor):
         gen = BatchGenerator(
             model=mock_model.language_model,
@@ -800,6 +861,65 @@ class TestBatchGenerate:
         # All 3 responses should be present
         assert len(response.texts) == 3
 
+    @patch.object(generate_module, "_generate_batch")
+    @patch.object(generate_module, "_prepare_batch_inputs")
+    @patch("mlx_vlm.utils.process_image")
+    def test_packs_vision_encode_across_shape_groups(
+        self,
+        mock_process_image,
+        mock_prepare_inputs,
+        mock_generate_batch,
+        mock_model,
+        mock_processor,
+    ):
+        from PIL import Image
+
+        from mlx_vlm.generate import batch_generate
+
+        sizes = [(224, 224), (336, 336), (224, 224), (448, 448)]
+        images = []
+        for height, width in sizes:
+            img = MagicMock(spec=Image.Image)
+            img.height, img.width = height, width
+            images.append(img)
+        mock_process_image.side_effect = images
+        mock_prepare_inputs.side_effect = lambda model, processor, prompts, *_: {
+            "prompts": prompts
+        }
+        mock_generate_batch.side_effect = lambda model, processor, prompts, *a, **kw: (
+            [f"{p}:{kw['cached_image_features']}" for p in prompts],
+            BatchStats(),
+        )
+        encode_calls = []
+
+        def encode_packed_images(batches):
+            encode_calls.append([b["prompts"] for b in batches])
+            return [mx.array(len(b["prompts"])) for b in batches]
+
+        mock_model.encode_packed_images = encode_packed_images
+
+        response = batch_generate(
+            model=mock_model,
+            processor=mock_processor,
+            images=["a.jpg", "b.jpg", "c.jpg", "d.jpg"],
+            prompts=["p0", "p1", "p2", "p3"],
+            vision_batch_size=3,
+        )
+
+        assert encode_calls == [[["p0", "p2"], ["p1"]], [["p3"]]]
+        assert [t.split(":")[0] for t in response.texts] == ["p0", "p1", "p2", "p3"]
+        assert mock_generate_batch.call_count == 3
+
+    def test_vision_pack_windows_respects_image_budget(self):
+        windows = list(
+            generate_module._vision_pack_windows([[0, 1], [2], [3, 4, 5], [6]], 3)
+        )
+        assert windows == [[[0, 1], [2]], [[3, 4, 5]], [[6]]]
+        assert list(generate_module._vision_pack_windows([[0], [1]], 0)) == [
+            [[0]],
+            [[1]],
+        ]
+
     @patch.object(generate_module, "_generate_batch")
     @patch("mlx_vlm.utils.process_image")
     def test_track_image_sizes(
@@ -1269,6 +1389,7 @@ def test_generate_cli_smoke(capsys):
         draft_model=None,
         draft_kind="dflash",
         draft_block_size=None,
+        draft_tree_budget=None,
     )
     model = SimpleNamespace(config=SimpleNamespace(model_type="demo"))
     processor = SimpleNamespace()
@@ -1511,5 +1632,110 @@ def test_apc_pick_rejects_image_tokens_and_releases_blocks():
     assert all(block.ref_cnt == 0 for block in stored)
 
 
+def test_apc_pick_reuses_image_prefix_and_restores_mrope_positions():
+    block_size = 4
+    image_token_id = 99
+    token_ids = [1, image_token_id, image_token_id, 2, 3, 4]
+    image_hashes = [apc_module.hash_image_payload(image_ref="cat.jpg")]
+    prompt_kwargs = {
+        "inputs_embeds": mx.ones((1, len(token_ids), 4)),
+        "_apc_image_hash": image_hashes[0],
+        "_apc_image_hashes": image_hashes,
+    }
+
+    class MRopeModel:
+        config = SimpleNamespace(image_token_id=image_token_id)
+        layers = [object()]
+        _rope_deltas = None
+        _position_ids = None
+
+        def get_rope_index(self, input_ids, image_grid_thw, video_grid_thw, mask):
+            length = input_ids.shape[1]
+            positions = mx.broadcast_to(
+                mx.arange(length)[None, None] * 10, (3, 1, length)
+            )
+            return positions, mx.array([[-7]])
+
+    manager = apc_module.APCManager(num_blocks=4, block_size=block_size)
+    bg = object.__new__(BatchGenerator)
+    bg.apc_manager = manager
+    bg.model = MRopeModel()
+    bg.prefill_step_size = None
+    bg.kv_bits = None
+    bg.kv_group_size = 64
+    bg.kv_quant_scheme = "affine"
+    bg._wire_stack = None
+    extra_hash = bg._apc_extra_hash(prompt_kwargs, token_ids)
+    layer_keys = [mx.ones((1, 1, block_size, 2))]
+    layer_values = [mx.ones((1, 1, block_size, 2))]
+    manager.release(
+        manager.store_kv_blocks(
+            token_ids[:block_size], layer_keys, layer_values, extra_hash=extra_hash
+        )
+    )
+
+    assert bg._apc_pick_for((1, token_ids, 1, {}, [])) is None
+
+    captured = {}
+
+    def fake_prompt_batch(**kwargs):
+        captured.update(kwargs)
+        return SimpleNamespace(**kwargs)
+
+    with patch.object(generate_module, "PromptProcessingBatch", fake_prompt_batch):
+        batch = bg._build_mixed_prompt_batch([(1, token_ids, 1, prompt_kwargs, [])])
+
+    assert batch is not None
+    assert captured["input_ids"] == [token_ids[block_size:]]
+    assert captured["prompt_kwargs"]["position_ids"].tolist() == [[[40, 50]]] * 3
+    assert captured["rope_deltas"].tolist() == [[-7]]
+    assert "_apc_image_hashes" not in captured["prompt_kwargs"]
+    manager.release(captured["apc_meta"][0]["apc_blocks"])
+
+
+def test_apc_warm_cache_keeps_quantized_kv_format():
+    from mlx_vlm.models.cache import BatchQuantizedKVCache
+
+    block_size = 4
+    token_ids = [1, 2, 3, 4, 5, 6]
+    manager = apc_module.APCManager(num_blocks=4, block_size=block_size)
+    bg = object.__new__(BatchGenerator)
+    bg.apc_manager = manager
+    bg.model = SimpleNamespace(config=SimpleNamespace(), layers=[object(), object()])
+    bg.prefill_step_size = None
+    bg.kv_bits = 4
+    bg.kv_group_size = 32
+    bg.kv_quant_scheme = "uniform"
+    bg._wire_stack = None
+
+    source = [BatchQuantizedKVCache([0], group_size=32, bits=4) for _ in range(2)]
+    for c in source:
+        c.update_and_fetch(mx.ones((1, 1, block_size, 32)), mx.ones((1, 1, 4, 32)))
+    extra_hash = bg._apc_extra_hash({}, token_ids)
+    assert extra_hash != apc_module.tenant_scoped_hash(None, 0)
+    manager.release(
+        apc_module.harvest_blocks_from_batch_cache(
+            manager, source, 0, token_ids[:block_size], extra_hash=extra_hash
+        )
+    )
+
+    captured = {}
+
+    def fake_prompt_batch(**kwargs):
+        captured.update(kwargs)
+        return SimpleNamespace(**kwargs)
+
+    prompt_kwargs = {"inputs_embeds": mx.ones((1, len(token_ids), 4))}
+    with patch.object(generate_module, "PromptProcessingBatch", fake_prompt_batch):
+        batch = bg._build_mixed_prompt_batch([(1, token_ids, 1, prompt_kwargs, [])])
+
+    assert batch is not None
+    warm = captured["warm_cache"]
+    assert all(isinstance(c, BatchQuantizedKVCache) for c in warm)
+    assert warm[0]._idx == block_size
+    assert mx.array_equal(warm[0].keys[0], source[0].keys[0][..., :4, :]).item()
+    manager.release(captured["apc_meta"][0]["apc_blocks"])
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
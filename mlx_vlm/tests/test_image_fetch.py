@@ -0,0 +1,266 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import mlx.core as mx
+import pytest
+from PIL import Image
+
+from mlx_vlm import image_fetch
+from mlx_vlm.image_fetch import ImageFetcher
+from mlx_vlm.utils import load_image
+from mlx_vlm.vision_cache import VisionFeatureCache
+
+
+def _png(color, size=(4, 3)):
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class _ImageServer:
+    def __init__(self):
+        self.bodies = {
+            "/red.png": _png("red"),
+            "/blue.png": _png("blue"),
+            "/red-copy.png": _png("red"),
+        }
+        self.extra_headers = {}
+        self.requests = []
+        self.conditional = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests.append(self.path)
+                body = server.bodies.get(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                etag = f'"{self.path}"'
+                if self.headers.get("If-None-Match") == etag:
+                    server.conditional.append(self.path)
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("ETag", etag)
+                for name, value in server.extra_headers.get(self.path, {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self.thread.start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def image_server():
+    server = _ImageServer()
+    yield server
+    server.close()
+
+
+def test_repeated_url_is_served_from_memory(image_server):
+    fetcher = ImageFetcher()
+    first = fetcher.fetch(image_server.url("/red.png"))
+    second = fetcher.fetch(image_server.url("/red.png"))
+
+    assert image_server.requests == ["/red.png"]
+    assert first.getpixel((0, 0)) == (255, 0, 0)
+    assert first is not second
+    assert fetcher.stats()["hits"] == 1
+
+
+def test_identical_bodies_share_one_decoded_image(image_server):
+    fetcher = ImageFetcher()
+    fetcher.fetch(image_server.url("/red.png"))
+    fetcher.fetch(image_server.url("/red-copy.png"))
+
+    assert fetcher.stats()["images"] == 1
+
+
+def test_fetch_many_downloads_concurrently_in_order(image_server):
+    fetcher = ImageFetcher(max_workers=2)
+    urls = [image_server.url(p) for p in ("/red.png", "/blue.png", "/red.png")]
+
+    images = fetcher.fetch_many(urls)
+
+    assert [img.getpixel((0, 0)) for img in images] == [
+        (255, 0, 0),
+        (0, 0, 255),
+        (255, 0, 0),
+    ]
+    assert sorted(image_server.requests) == ["/blue.png", "/red.png"]
+
+
+def test_fetch_many_async_runs_on_the_event_loop(image_server):
+    fetcher = ImageFetcher()
+    urls = [image_server.url("/red.png"), image_server.url("/blue.png")]
+
+    images = asyncio.run(fetcher.fetch_many_async(urls))
+
+    assert [img.size for img in images] == [(4, 3), (4, 3)]
+
+
+def test_disk_tier_survives_a_new_fetcher(image_server, tmp_path):
+    url = image_server.url("/blue.png")
+    ImageFetcher(cache_dir=tmp_path).fetch(url)
+
+    image = ImageFetcher(cache_dir=tmp_path).fetch(url)
+
+    assert image.getpixel((0, 0)) == (0, 0, 255)
+    assert image_server.requests == ["/blue.png"]
+
+
+def test_stale_entries_revalidate_with_etag(image_server):
+    fetcher = ImageFetcher(max_age=0)
+    url = image_server.url("/red.png")
+    fetcher.fetch(url)
+    fetcher._urls[url].fetched_at -= 1
+
+    image = fetcher.fetch(url)
+
+    assert image.getpixel((0, 0)) == (255, 0, 0)
+    assert image_server.conditional == ["/red.png"]
+    assert fetcher.stats()["revalidations"] == 1
+
+
+def test_cached_urls_revalidate_by_default(image_server):
+    fetcher = ImageFetcher()
+    url = image_server.url("/red.png")
+    fetcher.fetch(url)
+    fetcher._urls[url].fetched_at -= image_fetch.DEFAULT_IMAGE_CACHE_MAX_AGE + 1
+
+    fetcher.fetch(url)
+
+    assert image_server.conditional == ["/red.png"]
+
+
+def test_cache_control_overrides_max_age(image_server):
+    image_server.extra_headers["/red.png"] = {"Cache-Control": "no-cache"}
+    image_server.extra_headers["/blue.png"] = {"Cache-Control": "public, max-age=60"}
+    fetcher = ImageFetcher(max_age=None)
+    red, blue = image_server.url("/red.png"), image_server.url("/blue.png")
+    fetcher.fetch(red)
+    fetcher.fetch(blue)
+    fetcher._urls[red].fetched_at -= 1
+    fetcher._urls[blue].fetched_at -= 1
+
+    fetcher.fetch(red)
+    fetcher.fetch(blue)
+
+    assert image_server.conditional == ["/red.png"]
+
+
+def test_response_max_age_reads_expires():
+    headers = {
+        "Date": "Sun, 18 Oct 2026 00:00:00 GMT",
+        "Expires": "Sun, 18 Oct 2026 00:02:00 GMT",
+    }
+
+    assert image_fetch.response_max_age(headers) == 120
+    assert image_fetch.response_max_age({"Expires": "0"}) == 0
+    assert image_fetch.response_max_age({}) is None
+
+
+def test_url_entries_are_bounded(image_server):
+    fetcher = ImageFetcher(max_urls=2)
+    for path in ("/red.png", "/blue.png", "/red-copy.png"):
+        fetcher.fetch(image_server.url(path))
+
+    assert list(fetcher._urls) == [
+        image_server.url("/blue.png"),
+        image_server.url("/red-copy.png"),
+    ]
+    assert fetcher.stats()["urls"] == 2
+
+
+def test_memory_budget_evicts_least_recent(image_server):
+    fetcher = ImageFetcher(max_memory_bytes=4 * 3 * 3)
+    fetcher.fetch(image_server.url("/red.png"))
+    fetcher.fetch(image_server.url("/blue.png"))
+
+    assert fetcher.stats()["images"] == 1
+    assert fetcher.stats()["memory_bytes"] == 36
+
+
+def test_disk_budget_is_tracked_without_rescanning(image_server, tmp_path):
+    red, blue = image_server.bodies["/red.png"], image_server.bodies["/blue.png"]
+    budget = max(len(red), len(blue)) + 200
+    fetcher = ImageFetcher(cache_dir=tmp_path, max_disk_bytes=budget)
+    fetcher._scan_disk = None  # stores must not walk the directory again
+    fetcher.fetch(image_server.url("/red.png"))
+    fetcher.fetch(image_server.url("/blue.png"))
+
+    on_disk = sum(p.stat().st_size for p in tmp_path.iterdir())
+    assert [p.stat().st_size for p in tmp_path.glob("*.img")] == [len(blue)]
+    assert len(list(tmp_path.glob("*.url"))) == 1
+    assert fetcher.stats()["disk_bytes"] == on_disk <= budget
+    assert ImageFetcher(cache_dir=tmp_path).stats()["disk_bytes"] == on_disk
+
+
+def test_url_index_files_count_against_the_disk_budget(image_server, tmp_path):
+    body = image_server.bodies["/red.png"]
+    for i in range(20):
+        image_server.bodies[f"/red-{i}.png"] = body
+    fetcher = ImageFetcher(cache_dir=tmp_path, max_disk_bytes=len(body) + 1000)
+    for i in range(20):
+        fetcher.fetch(image_server.url(f"/red-{i}.png"))
+
+    on_disk = sum(p.stat().st_size for p in tmp_path.iterdir())
+    assert [p.stat().st_size for p in tmp_path.glob("*.img")] == [len(body)]
+    assert len(list(tmp_path.glob("*.url"))) < 20
+    assert fetcher.stats()["disk_bytes"] == on_disk <= len(body) + 1000
+
+
+def test_load_image_uses_the_shared_fetcher(image_server):
+    image_fetch.set_image_fetcher(ImageFetcher())
+    try:
+        load_image(image_server.url("/red.png"))
+        image = load_image(image_server.url("/red.png"))
+        with pytest.raises(ValueError, match="Failed to load image"):
+            load_image(image_server.url("/missing.png"))
+    finally:
+        image_fetch.set_image_fetcher(None)
+
+    assert image.mode == "RGB"
+    assert image_server.requests == ["/red.png", "/missing.png"]
+
+
+def test_vision_cache_keys_fetched_urls_by_content(image_server, tmp_path):
+    image_fetch.set_image_fetcher(ImageFetcher())
+    try:
+        url = image_server.url("/red.png")
+        load_image(url)
+        local = tmp_path / "red.png"
+        local.write_bytes(image_server.bodies["/red.png"])
+
+        cache = VisionFeatureCache()
+        cache.put(url, mx.ones((1, 4)))
+        assert cache.get(str(local)) is not None
+        assert cache.get(image_server.url("/red-copy.png")) is None
+    finally:
+        image_fetch.set_image_fetcher(None)
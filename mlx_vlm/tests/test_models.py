@@ -1383,6 +1383,73 @@ class TestModels(unittest.TestCase):
 
         self.assertEqual(errors, [])
 
+    def test_varlen_attention_matches_per_segment_attention(self):
+        from mlx_vlm.models.base import varlen_attention, varlen_segments
+
+        mx.random.seed(0)
+        q, k, v = (mx.random.normal((1, 2, 23, 80)) for _ in range(3))
+        for bounds in ([0, 4, 5, 11], [0, 1, 2, 12], [0, 6, 12, 18], [0, 9, 23]):
+            n = bounds[-1]
+            out = varlen_attention(
+                q[:, :, :n],
+                k[:, :, :n],
+                v[:, :, :n],
+                varlen_segments(mx.array(bounds, dtype=mx.int32)),
+                scale=0.1,
+            )
+            expected = mx.concatenate(
+                [
+                    mx.fast.scaled_dot_product_attention(
+                        q[:, :, s:e], k[:, :, s:e], v[:, :, s:e], scale=0.1
+                    )
+                    for s, e in zip(bounds[:-1], bounds[1:])
+                ],
+                axis=2,
+            )
+            self.assertEqual(out.shape, (1, 2, n, 80))
+            self.assertTrue(mx.allclose(out, expected, atol=1e-5).item())
+
+    def test_varlen_segments_bucket_by_length(self):
+        from mlx_vlm.models.base import frame_cu_seqlens, varlen_segments
+
+        # Two frames of a 2x3 grid and one 4x4 image.
+        bounds = frame_cu_seqlens([[2, 2, 3], [1, 4, 4]])
+        self.assertEqual(bounds.tolist(), [0, 6, 12, 28])
+        # 6-token frames would pad to 16 next to the image, so they attend
+        # in a bucket of their own.
+        segments = varlen_segments(bounds)
+        self.assertEqual([width for _, _, width in segments.buckets], [16, 6])
+        self.assertTrue(all(mask is None for _, mask, _ in segments.buckets))
+
+        # Equal consecutive segments attend as one reshaped batch.
+        uniform = varlen_segments([0, 4, 8, 12])
+        self.assertIsNone(uniform.scatter)
+        self.assertEqual(uniform.buckets, [(None, None, 4)])
+
+        # Many small windows next to a large one stay in a few calls.
+        ragged = varlen_segments(np.cumsum([0, 64] + [1, 2, 3, 4, 5] * 20))
+        self.assertLessEqual(len(ragged.buckets), 5)
+
+    def test_vision_grid_indices_are_cached_per_grid(self):
+        from mlx_vlm.models.base import grid_position_ids, vision_position_ids
+        from mlx_vlm.models.qwen2_5_vl.vision import grid_window_index
+
+        pos_ids = grid_position_ids(1, 2, 4, 2)
+        self.assertIs(grid_position_ids(1, 2, 4, 2), pos_ids)
+        self.assertEqual(
+            pos_ids.tolist(),
+            [[0, 0], [0, 1], [1, 0], [1, 1], [0, 2], [0, 3], [1, 2], [1, 3]],
+        )
+        batch = vision_position_ids([[1, 2, 4], [2, 2, 2]], 2)
+        self.assertEqual(batch.shape, (16, 2))
+        self.assertEqual(batch[8:].tolist(), [[0, 0], [0, 1], [1, 0], [1, 1]] * 2)
+
+        # 3x2 merged patches in 2x2 windows: one full, one half, two empty.
+        index, cu_seqlens = grid_window_index(1, 6, 4, 2, 2)
+        self.assertIs(grid_window_index(1, 6, 4, 2, 2)[0], index)
+        self.assertEqual(index.tolist(), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(cu_seqlens, (16, 24))
+
     def test_qwen3_5_model_config_promotes_text_eos_token_id(self):
         from mlx_vlm.models import qwen3_5, qwen3_5_moe
 
@@ -4171,6 +4238,64 @@ class TestGetInputEmbeddings(unittest.TestCase):
         )
         self._check_returns_input_embeddings_features(model, "qwen3_vl")
 
+    def test_qwen3_vl_packed_image_encode_matches_per_batch(self):
+        from mlx_vlm.models import qwen3_vl
+
+        model = qwen3_vl.Model(
+            qwen3_vl.ModelConfig(
+                text_config=qwen3_vl.TextConfig(
+                    model_type="qwen3_vl_text",
+                    hidden_size=16,
+                    num_hidden_layers=1,
+                    intermediate_size=32,
+                    num_attention_heads=2,
+                    vocab_size=32,
+                    num_key_value_heads=2,
+                    rms_norm_eps=1e-5,
+                    head_dim=8,
+                    rope_theta=1000.0,
+                    max_position_embeddings=1000,
+                    rope_scaling={"rope_type": "mrope", "mrope_section": [2, 1, 1]},
+                ),
+                vision_config=qwen3_vl.VisionConfig(
+                    model_type="qwen3_vl",
+                    depth=2,
+                    hidden_size=16,
+                    num_heads=2,
+                    out_hidden_size=16,
+                    patch_size=14,
+                    in_channels=3,
+                    num_position_embeddings=4,
+                    deepstack_visual_indexes=[0],
+                ),
+                model_type="qwen3_vl",
+                image_token_id=31,
+                vocab_size=32,
+            )
+        )
+        patch_dim = 3 * 2 * 14 * 14
+        batches = []
+        for grids in ([[1, 2, 2]], [[1, 2, 4], [1, 2, 2]]):
+            grid_thw = mx.array(grids)
+            num_patches = int(grid_thw.prod(axis=-1).sum().item())
+            batches.append(
+                {
+                    "pixel_values": mx.random.normal((num_patches, patch_dim)),
+                    "image_grid_thw": grid_thw,
+                }
+            )
+
+        packed = model.encode_packed_images(batches)
+
+        self.assertEqual(len(packed), 2)
+        for batch, (features, deepstack) in zip(batches, packed):
+            expected, expected_deepstack = model.vision_tower(
+                batch["pixel_values"], batch["image_grid_thw"]
+            )
+            self.assertEqual(features.shape, expected.shape)
+            self.assertTrue(mx.allclose(features, expected, atol=1e-4))
+            self.assertTrue(mx.allclose(deepstack[0], expected_deepstack[0], atol=1e-4))
+
     def test_paligemma_input_embeddings(self):
         from mlx_vlm.models import paligemma
 
@@ -5407,6 +5532,39 @@ class TestGetInputEmbeddings(unittest.TestCase):
         self.assertIsInstance(result, InputEmbeddingsFeatures)
         self.assertIsNotNone(result.inputs_embeds)
 
+    def test_call_forwards_cached_image_features(self):
+        import importlib
+        from unittest.mock import MagicMock
+
+        features = mx.zeros((1, 4, 8))
+        for name in (
+            "deepseek_vl_v2",
+            "fastvlm",
+            "gemma3",
+            "granite_vision",
+            "internvl_chat",
+            "lfm2_vl",
+            "llava",
+            "llava_bunny",
+            "llava_next",
+            "multi_modality",
+            "paligemma",
+        ):
+            with self.subTest(model=name):
+                module = importlib.import_module(f"mlx_vlm.models.{name}")
+                model = MagicMock()
+                model.get_input_embeddings.side_effect = StopIteration
+                with self.assertRaises(StopIteration):
+                    module.Model.__call__(
+                        model,
+                        mx.array([[1, 2]]),
+                        mx.zeros((1, 3, 4, 4)),
+                        mx.ones((1, 2)),
+                        cached_image_features=features,
+                    )
+                kwargs = model.get_input_embeddings.call_args.kwargs
+                self.assertIs(kwargs["cached_image_features"], features)
+
 
 class TestChunkedPrefillRoPE(unittest.TestCase):
     """Test chunked prefill RoPE position ID generation for vision-language models."""
@@ -737,6 +737,46 @@ class TestQwen3VLProcessor(_ProcessorTestBase, unittest.TestCase):
         return {"text": ["<|image_pad|> Describe"], "images": [_make_image()]}
 
 
+class TestQwen3VLImageProcessor(unittest.TestCase):
+    @staticmethod
+    def _reference(image, ip):
+        """Unfused pipeline: float rescale/normalize, repeat T, then patchify."""
+        C, H, W = image.shape
+        ps, tps, ms = ip.patch_size, ip.temporal_patch_size, ip.merge_size
+        img = image.astype(np.float32) * ip.rescale_factor
+        mean = np.array(ip.image_mean, dtype=np.float32)[:, None, None]
+        std = np.array(ip.image_std, dtype=np.float32)[:, None, None]
+        img = (img - mean) / std
+        patches = np.repeat(img[None, None], tps, axis=1)
+        gh, gw = H // ps, W // ps
+        patches = patches.reshape(1, 1, tps, C, gh // ms, ms, ps, gw // ms, ms, ps)
+        patches = patches.transpose(0, 1, 4, 7, 5, 8, 3, 2, 6, 9)
+        return patches.reshape(gh * gw, C * tps * ps * ps), [1, gh, gw]
+
+    def test_fused_patchify_matches_reference_across_images(self):
+        from mlx_vlm.models.qwen3_vl.processing_qwen3_vl import Qwen3VLImageProcessor
+
+        ip = Qwen3VLImageProcessor(
+            image_mean=[0.48, 0.46, 0.41], image_std=[0.27, 0.26, 0.28]
+        )
+        images = [
+            np.random.randint(0, 256, (3, 64, 96), dtype=np.uint8),
+            np.random.randint(0, 256, (3, 128, 64), dtype=np.uint8),
+            np.random.randint(0, 256, (3, 64, 64), dtype=np.uint8),
+        ]
+
+        out = ip(images)
+
+        expected = [self._reference(img, ip) for img in images]
+        self.assertEqual(out["pixel_values"].dtype, np.float32)
+        self.assertEqual(out["image_grid_thw"].tolist(), [thw for _, thw in expected])
+        np.testing.assert_allclose(
+            out["pixel_values"],
+            np.concatenate([patches for patches, _ in expected]),
+            atol=1e-5,
+        )
+
+
 class TestQwen3OmniMoeProcessor(_ProcessorTestBase, unittest.TestCase):
     def _make_processor(self):
         from mlx_vlm.models.qwen3_omni_moe.processing_qwen3_omni_moe import (
@@ -2,7 +2,12 @@ import unittest
 
 import mlx.core as mx
 
-from mlx_vlm.sample_utils import top_p_sampling
+from mlx_vlm.sample_utils import (
+    BatchSamplingState,
+    SamplingParams,
+    batched_sample,
+    top_p_sampling,
+)
 
 
 class TestTopPSampling(unittest.TestCase):
@@ -89,5 +94,83 @@ class TestTopPSampling(unittest.TestCase):
         self.assertEqual(tokens.shape, (3,))
 
 
+class TestBatchedSample(unittest.TestCase):
+    @staticmethod
+    def _params(B, temperature=1.0, top_p=1.0, top_k=0, min_p=0.0):
+        return (
+            mx.full((B,), temperature),
+            mx.full((B,), top_p),
+            mx.full((B,), top_k, dtype=mx.int32),
+            mx.full((B,), min_p),
+        )
+
+    def test_greedy_rows_take_argmax(self):
+        logprobs = mx.log(mx.array([[0.1, 0.6, 0.3], [0.5, 0.2, 0.3]]))
+        temperature, top_p, top_k, min_p = self._params(2, temperature=0.0)
+        tokens = batched_sample(logprobs, temperature, top_p, top_k, min_p)
+        self.assertEqual(tokens.tolist(), [1, 0])
+
+    def test_per_row_filters(self):
+        """Each row applies its own top-k / top-p / min-p to a flat distribution."""
+        V = 16
+        logprobs = mx.log(mx.softmax(-mx.arange(V, dtype=mx.float32) * 0.01))
+        logprobs = mx.broadcast_to(logprobs, (3, V))
+        temperature = mx.array([1.0, 1.0, 1.0])
+        top_p = mx.array([1.0, 0.1, 1.0])
+        top_k = mx.array([2, 0, 0], dtype=mx.int32)
+        min_p = mx.array([0.0, 0.0, 0.99])
+        for _ in range(20):
+            tokens = batched_sample(logprobs, temperature, top_p, top_k, min_p)
+            t0, t1, t2 = tokens.tolist()
+            self.assertIn(t0, (0, 1))
+            self.assertLess(t1, 2)
+            self.assertLess(t2, 2)
+
+    def test_unfiltered_path_respects_temperature(self):
+        logprobs = mx.log(mx.array([[0.5, 0.5], [0.5, 0.5]]))
+        temperature, top_p, top_k, min_p = self._params(2)
+        noise = mx.array([[0.0, 1.0], [1.0, 0.0]])
+        tokens = batched_sample(
+            logprobs, temperature, top_p, top_k, min_p, noise=noise, apply_filters=False
+        )
+        self.assertEqual(tokens.tolist(), [1, 0])
+
+
+class TestBatchSamplingState(unittest.TestCase):
+    def test_mixed_rows_use_fallback_for_rows_without_params(self):
+        logprobs = mx.log(mx.array([[0.1, 0.9], [0.9, 0.1]]))
+        state = BatchSamplingState([None, SamplingParams(temperature=0.0)])
+        tokens = state.sample(logprobs, lambda x: mx.full((x.shape[0],), 7))
+        self.assertEqual(tokens.tolist(), [7, 0])
+
+    def test_seeded_rows_are_independent_of_batch_composition(self):
+        V = 64
+        logprobs = mx.zeros((1, V)) - mx.log(mx.array(float(V)))
+        params = SamplingParams(temperature=1.0, seed=123)
+
+        alone = BatchSamplingState([params])
+        solo = [alone.sample(logprobs).item() for _ in range(5)]
+
+        shared = BatchSamplingState([SamplingParams(temperature=1.0), params])
+        pair = mx.concatenate([logprobs, logprobs])
+        together = [shared.sample(pair)[1].item() for _ in range(5)]
+        self.assertEqual(solo, together)
+
+    def test_extend_and_filter_follow_rows(self):
+        a = BatchSamplingState([SamplingParams(temperature=0.0)])
+        b = BatchSamplingState([None, SamplingParams(temperature=0.5, seed=1)])
+        a.extend(b)
+        self.assertEqual(len(a), 3)
+        a.filter([0, 2])
+        self.assertEqual(a.params[1].temperature, 0.5)
+        self.assertIsNone(a._keys[0])
+        self.assertIsNotNone(a._keys[1])
+
+    def test_row_count_mismatch_raises(self):
+        state = BatchSamplingState([SamplingParams(temperature=0.0)])
+        with self.assertRaises(ValueError):
+            state.sample(mx.zeros((2, 4)))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,13 @@
+import json
 import time
+from collections import OrderedDict
 from queue import Queue
-from threading import Event, Lock, Thread
+from threading import Event, Lock, Thread, get_ident
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 import mlx.core as mx
+import mlx.nn as nn
 import pytest
 from fastapi.testclient import TestClient
 
@@ -66,6 +69,15 @@ def test_speculative_server_keeps_dflash_default_batch_loop():
     )
 
 
+def test_speculative_server_dispatches_ngram_batch_loop():
+    assert (
+        speculative_utils.get_speculative_rounds_batch("ngram")
+        is speculative_utils._ngram_rounds_batch
+    )
+    assert speculative_utils.speculative_prefill_kwargs("ngram", None) == {}
+    assert speculative_utils.speculative_hidden_state("ngram", None) is None
+
+
 def test_speculative_server_rejects_unknown_draft_kind():
     with pytest.raises(ValueError):
         speculative_utils.get_speculative_rounds_batch("nope")
@@ -167,6 +179,315 @@ def test_speculative_server_reads_batch_coalesce_env(monkeypatch):
     assert server.get_speculative_batch_coalesce_s() == pytest.approx(0.005)
 
 
+def test_speculative_server_reads_max_cohorts_env(monkeypatch):
+    monkeypatch.delenv("MLX_VLM_SPEC_MAX_COHORTS", raising=False)
+    assert server.get_speculative_max_cohorts() == 2
+
+    monkeypatch.setenv("MLX_VLM_SPEC_MAX_COHORTS", "0")
+    assert server.get_speculative_max_cohorts() == 1
+
+    monkeypatch.setenv("MLX_VLM_SPEC_MAX_COHORTS", "bad")
+    assert server.get_speculative_max_cohorts() == 2
+
+
+def test_speculative_groups_waiting_requests_by_sampler():
+    def item(name, temperature, top_p=1.0):
+        args = server.GenerationArguments(temperature=temperature, top_p=top_p)
+        return (name, None, 0, args, None)
+
+    waiting = server.deque(
+        [item("a", 0.0), item("b", 0.7), item("c", 0.0, 0.5), item("d", 0.7)]
+    )
+
+    group = server._take_speculative_group(waiting)
+    assert [entry[0] for entry in group] == ["a", "c"]
+    assert [entry[0] for entry in waiting] == ["b", "d"]
+
+
+def _encode_item(name, *, image_size=None, prompt_len=4):
+    raw_inputs = {"input_ids": mx.zeros((1, prompt_len), dtype=mx.int32)}
+    if image_size is not None:
+        raw_inputs["pixel_values"] = mx.zeros((1, 3, image_size, image_size))
+    return (name, raw_inputs, 4, server.GenerationArguments(), None)
+
+
+def test_vision_encode_stage_releases_one_image_group_per_decode_step():
+    encoded = []
+
+    def encode(raw_inputs, images):
+        encoded.append(raw_inputs)
+        return raw_inputs["input_ids"], {}
+
+    stage = server.VisionEncodeStage(encode, max_batch_size=2)
+    stage.submit(
+        [
+            _encode_item("img-a", image_size=8),
+            _encode_item("text"),
+            _encode_item("img-b", image_size=16),
+            _encode_item("img-c", image_size=8, prompt_len=9),
+            _encode_item("img-d", image_size=8),
+        ]
+    )
+
+    released = stage.step(decoding=True)
+    assert [item[0] for item, _ in released] == ["text", "img-a", "img-c"]
+    assert len(stage) == 2
+
+    released = stage.step(decoding=False)
+    assert [item[0] for item, _ in released] == ["img-b", "img-d"]
+    assert len(stage) == 0
+    assert len(encoded) == 5
+
+
+def test_vision_encode_stage_batches_groups_and_falls_back_per_request():
+    batch_calls = []
+
+    def encode(raw_inputs, images):
+        if images == "broken.png":
+            raise ValueError("bad image")
+        return raw_inputs["input_ids"], {"single": True}
+
+    def encode_batch(raw_inputs_list, images_list):
+        batch_calls.append(len(raw_inputs_list))
+        if len(batch_calls) > 1:
+            return None
+        return [(raw["input_ids"], {"single": False}) for raw in raw_inputs_list]
+
+    stage = server.VisionEncodeStage(encode, encode_batch)
+    stage.submit([_encode_item("a", image_size=8), _encode_item("b", image_size=8)])
+    released = stage.step(decoding=False)
+    assert [kwargs["single"] for _, (_, kwargs) in released] == [False, False]
+
+    failing = _encode_item("c", image_size=8)[:4] + ("broken.png",)
+    stage.submit([failing, _encode_item("d", image_size=8)])
+    released = stage.step(decoding=False)
+    assert batch_calls == [2, 2]
+    assert isinstance(released[0][1], ValueError)
+    assert released[1][1][1] == {"single": True}
+
+
+def _cancelled_item(name, *, image_size=None):
+    _, raw_inputs, prompt_tokens, args, images = _encode_item(
+        name, image_size=image_size
+    )
+    args.trace = server.RequestTrace(cancelled=True)
+    return (Queue(), raw_inputs, prompt_tokens, args, images)
+
+
+def _cancellation_gen():
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    gen.requests = Queue()
+    gen._stop = False
+    gen._cancelled = set()
+    gen._cancel_lock = Lock()
+    return gen
+
+
+def test_vision_encode_stage_drains_cancelled_requests():
+    stage = server.VisionEncodeStage(lambda raw, images: (raw["input_ids"], {}))
+    kept = _encode_item("kept", image_size=8)
+    dropped = _cancelled_item("dropped", image_size=8)
+    stage.submit([kept, dropped])
+
+    drained = stage.drain_cancelled()
+    server._fail_cancelled_requests(drained)
+
+    assert drained == [dropped]
+    assert isinstance(dropped[0].get_nowait(), RuntimeError)
+    assert [item[0] for item, _ in stage.step(decoding=False)] == ["kept"]
+
+
+def test_abandon_marks_the_request_trace_cancelled(monkeypatch):
+    woken = []
+    monkeypatch.setattr(server._gpu_worker, "wake", lambda: woken.append(True))
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    args = server.GenerationArguments()
+
+    gen.abandon(args)
+
+    assert args.trace.cancelled
+    assert woken == [True]
+
+
+def test_generation_steps_answer_cancelled_requests_before_encoding():
+    gen = _cancellation_gen()
+
+    def never_encode(*args, **kwargs):
+        raise AssertionError("cancelled request reached the vision encoder")
+
+    gen._gpu_embed = never_encode
+    gen._gpu_embed_batch = never_encode
+    item = _cancelled_item("gone", image_size=8)
+    gen.requests.put(item)
+
+    steps = gen._generation_steps(idle_timeout=0.0)
+    assert next(steps) is False
+
+    error = item[0].get_nowait()
+    assert isinstance(error, RuntimeError)
+    assert "cancelled" in str(error)
+
+
+def test_speculative_steps_drop_cancelled_waiting_requests(monkeypatch):
+    gen = _cancellation_gen()
+    gen.model = SimpleNamespace(language_model=object())
+    gen.draft_model = object()
+    prefilled = []
+    gen._prefill_speculative_cohort = lambda pending, stream: prefilled.append(
+        [item[0] for item in pending]
+    )
+    monkeypatch.setattr(server, "get_speculative_batch_coalesce_s", lambda: 0.0)
+
+    kept = _admission_item("a")
+    dropped = _cancelled_item("b")
+    gen.requests.put(dropped)
+    gen.requests.put(kept)
+
+    steps = gen._speculative_steps(idle_timeout=0.0)
+    next(steps)
+
+    assert prefilled == [[kept[0]]]
+    assert isinstance(dropped[0].get_nowait(), RuntimeError)
+
+
+def test_generate_in_thread_abandons_the_request_when_cancelled():
+    import asyncio
+
+    started, release = Event(), Event()
+    generator = MagicMock()
+    args = server.GenerationArguments()
+
+    def blocking():
+        started.set()
+        release.wait(timeout=5)
+
+    async def main():
+        task = asyncio.create_task(
+            server._generate_in_thread(generator, args, blocking)
+        )
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+    generator.abandon.assert_called_once_with(args)
+
+
+def test_gpu_embed_batch_encodes_images_once_and_embeds_per_request():
+    class Embeddings:
+        def __init__(self, inputs_embeds):
+            self.inputs_embeds = inputs_embeds
+
+        def to_dict(self):
+            return {"inputs_embeds": self.inputs_embeds}
+
+    class Model:
+        def __init__(self):
+            self.language_model = SimpleNamespace(_position_ids=None)
+            self.packed_calls = []
+            self.embed_calls = []
+
+        def encode_packed_images(self, batches):
+            self.packed_calls.append(len(batches))
+            return [batch["pixel_values"][0, 0, 0, 0] for batch in batches]
+
+        def get_input_embeddings(self, input_ids, pixel_values, mask=None, **kw):
+            features = kw["cached_image_features"]
+            if features.item() < 0:
+                raise ValueError("bad image")
+            self.embed_calls.append((input_ids.shape[1], features.item()))
+            # mRoPE models leave per-prompt positions on the language model.
+            self.language_model._position_ids = input_ids.shape[1]
+            embeds = mx.broadcast_to(features, (1, input_ids.shape[1], 2))
+            return Embeddings(embeds)
+
+    def raw(prompt_len, pixel):
+        return {
+            "input_ids": mx.zeros((1, prompt_len), dtype=mx.int32),
+            "pixel_values": mx.full((1, 3, 4, 4), pixel),
+        }
+
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    gen.model = Model()
+    gen.vision_cache = None
+
+    encoded = gen._gpu_embed_batch(
+        [raw(3, 1.0), raw(5, 2.0), raw(4, 7.0), raw(2, -1.0)],
+        ["a.png", "b.png", "c.png", None],
+    )
+
+    assert gen.model.packed_calls == [4]
+    assert gen.model.embed_calls == [(3, 1.0), (5, 2.0), (4, 7.0)]
+    assert [e[1]["inputs_embeds"].shape for e in encoded[:3]] == [
+        (1, 3, 2),
+        (1, 5, 2),
+        (1, 4, 2),
+    ]
+    assert "cached_image_features" not in encoded[0][1]
+    assert isinstance(encoded[3], ValueError)
+    assert gen.model.language_model._position_ids == 4
+
+    gen.model = SimpleNamespace(language_model=SimpleNamespace())
+    assert gen._gpu_embed_batch([raw(3, 1.0), raw(3, 2.0)], [None, None]) is None
+
+
+def test_gpu_embed_batch_reuses_and_fills_the_vision_cache():
+    class Model:
+        def __init__(self):
+            self.packed = []
+
+        def encode_packed_images(self, batches):
+            self.packed.append([b["pixel_values"].item() for b in batches])
+            return [b["pixel_values"] * 10 for b in batches]
+
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    gen.model = Model()
+    gen.vision_cache = server.VisionFeatureCache()
+    gen.vision_cache.put("seen.png", mx.array(7.0))
+    embedded = []
+    gen._gpu_embed = lambda raw, images, cached_image_features: embedded.append(
+        (images, cached_image_features.item())
+    )
+
+    def raw(pixel):
+        return {"input_ids": mx.zeros((1, 2)), "pixel_values": mx.array(pixel)}
+
+    gen._gpu_embed_batch([raw(1.0), raw(2.0), raw(3.0)], ["seen.png", "new.png", None])
+
+    assert gen.model.packed == [[2.0, 3.0]]
+    assert embedded == [("seen.png", 7.0), ("new.png", 20.0), (None, 30.0)]
+    assert gen.vision_cache.get("new.png").item() == 20.0
+    assert len(gen.vision_cache) == 2
+
+
+def test_speculative_session_snapshot_round_trips_drafter_state():
+    class Drafter(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.accept_lens = [1]
+            self._cache = ["cohort-a"]
+            self._seed_token = 3
+
+    lm = SimpleNamespace(_position_ids="pos-a", _rope_deltas="rope-a")
+    drafter = Drafter()
+    session = speculative_utils.snapshot_speculative_session(lm, drafter)
+
+    lm._position_ids = "pos-b"
+    drafter.accept_lens = []
+    drafter._cache = ["cohort-b"]
+    drafter._seed_token = None
+
+    speculative_utils.restore_speculative_session(lm, drafter, session)
+    assert lm._position_ids == "pos-a"
+    assert drafter.accept_lens == [1]
+    assert drafter._cache == ["cohort-a"]
+    assert drafter._seed_token == 3
+
+
 def test_models_endpoint_lists_single_file_safetensors_models(client, monkeypatch):
     def repo(repo_id, file_names):
         return SimpleNamespace(
@@ -242,6 +563,88 @@ class _RecordingSpeculativeLM:
         )
 
 
+def test_speculative_steps_bound_the_time_between_a_cohorts_rounds(monkeypatch):
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    gen.model = SimpleNamespace(language_model=object())
+    gen.draft_model = object()
+    gen.requests = Queue()
+    gen._stop = False
+    gen._cancelled = set()
+    gen._cancel_lock = Lock()
+    monkeypatch.setattr(server, "get_speculative_batch_coalesce_s", lambda: 0.0)
+    monkeypatch.setattr(server, "get_speculative_max_cohorts", lambda: 2)
+
+    events = []
+
+    def prefill(pending, stream):
+        name = pending[0][3].temperature
+        events.append(("prefill", name))
+        return SimpleNamespace(name=name, rounds=3)
+
+    def advance(cohort, lm, drafter):
+        events.append(("round", cohort.name))
+        cohort.rounds -= 1
+        return cohort.rounds > 0
+
+    gen._prefill_speculative_cohort = prefill
+    gen._advance_speculative_cohort = advance
+    gen._finish_speculative_cohort = lambda cohort: None
+
+    # Five requests with different samplers would make five cohorts.
+    for temperature in (0.1, 0.2, 0.3, 0.4, 0.5):
+        args = server.GenerationArguments(max_tokens=3, temperature=temperature)
+        gen.requests.put((Queue(), {}, 1, args, None))
+
+    steps = gen._speculative_steps(idle_timeout=0.0)
+    while next(steps):
+        pass
+
+    # Between two rounds of one cohort, the others run at most one round
+    # each and at most one new cohort is prefilled.
+    for name in {name for kind, name in events if kind == "round"}:
+        rounds = [
+            i for i, (kind, n) in enumerate(events) if (kind, n) == ("round", name)
+        ]
+        for start, end in zip(rounds, rounds[1:]):
+            between = events[start + 1 : end]
+            assert sum(kind == "prefill" for kind, _ in between) <= 1
+            assert sum(kind == "round" for kind, _ in between) <= 1
+    assert sum(kind == "round" for kind, _ in events) == 15
+
+
+def test_speculative_steps_coalesce_without_sleeping(monkeypatch):
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    gen.model = SimpleNamespace(language_model=object())
+    gen.draft_model = object()
+    gen.requests = Queue()
+    gen._stop = False
+    gen._cancelled = set()
+    gen._cancel_lock = Lock()
+    prefilled = []
+    gen._prefill_speculative_cohort = lambda pending, stream: prefilled.append(
+        len(pending)
+    )
+    now = [100.0]
+
+    def fail_sleep(seconds):
+        raise AssertionError("speculative loop slept on the GPU worker")
+
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(server.time, "sleep", fail_sleep)
+    monkeypatch.setattr(server, "get_speculative_batch_coalesce_s", lambda: 0.005)
+
+    steps = gen._speculative_steps(idle_timeout=0.0)
+    gen.requests.put(_admission_item("a"))
+    assert next(steps) is True
+    gen.requests.put(_admission_item("a"))
+    assert next(steps) is True
+    assert prefilled == []
+
+    now[0] += 0.01
+    assert next(steps) is False
+    assert prefilled == [2]
+
+
 def _run_speculative_prefill_once(monkeypatch, *, draft_kind, request_specs):
     lm = _RecordingSpeculativeLM(draft_kind)
     gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
@@ -254,6 +657,8 @@ def _run_speculative_prefill_once(monkeypatch, *, draft_kind, request_specs):
     gen.stop_tokens = {99}
     gen.requests = Queue()
     gen._stop = False
+    gen._cancelled = set()
+    gen._cancel_lock = Lock()
     gen._make_sampler = lambda args: None
     gen.tokenizer = SimpleNamespace(
         decode=lambda tokens: "".join(str(tok) for tok in tokens)
@@ -315,6 +720,169 @@ def _run_speculative_prefill_once(monkeypatch, *, draft_kind, request_specs):
     return call
 
 
+def test_speculative_server_admits_requests_while_a_cohort_decodes(monkeypatch):
+    lm = _RecordingSpeculativeLM("dflash")
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    gen.model = SimpleNamespace(language_model=lm)
+    gen.processor = SimpleNamespace()
+    gen.draft_model = SimpleNamespace(
+        config=SimpleNamespace(target_layer_ids=[1, 2]), accept_lens=[]
+    )
+    gen.draft_kind = "dflash"
+    gen.stop_tokens = {99}
+    gen.requests = Queue()
+    gen._stop = False
+    gen._cancelled = set()
+    gen._cancel_lock = Lock()
+    gen._make_sampler = lambda args: None
+    gen.tokenizer = SimpleNamespace()
+    gen._gpu_embed = lambda raw_inputs, images=None: (
+        raw_inputs["input_ids"],
+        {"inputs_embeds": mx.ones((1, 2, 4), dtype=mx.float32)},
+    )
+
+    monkeypatch.setattr(server, "_make_cache", lambda *args, **kwargs: [])
+    monkeypatch.setattr(server, "get_speculative_batch_coalesce_s", lambda: 0.0)
+    names = iter(["long", "short"])
+    monkeypatch.setattr(server, "_ServerTokenStreamer", lambda *args: next(names))
+    monkeypatch.setattr(server, "make_streaming_detokenizer", lambda processor: None)
+    finish_order = []
+
+    def stream_text(self, info, token, finish_reason):
+        if finish_reason is not None:
+            finish_order.append(info["streamer"])
+        return str(token)
+
+    monkeypatch.setattr(server.ResponseGenerator, "_stream_text", stream_text)
+
+    def request(max_tokens):
+        return (
+            Queue(),
+            {"input_ids": mx.array([[1, 2]], dtype=mx.int32)},
+            2,
+            server.GenerationArguments(max_tokens=max_tokens, temperature=0),
+            None,
+        )
+
+    long_request = request(max_tokens=40)
+    short_request = request(max_tokens=3)
+    rounds_started = []
+
+    def fake_rounds(*args, stop_check=None, first_bonus=None, **kwargs):
+        cohort_id = len(rounds_started)
+        rounds_started.append(int(first_bonus.shape[0]))
+        for step in range(100):
+            if cohort_id == 0 and step == 1:
+                gen.requests.put(short_request)
+            yield ([4] * int(first_bonus.shape[0]), None)
+
+    monkeypatch.setattr(server, "run_speculative_server_rounds", fake_rounds)
+
+    gen.requests.put(long_request)
+    worker = Thread(target=gen._run_speculative, daemon=True)
+    worker.start()
+
+    def drain(rqueue):
+        items = []
+        while True:
+            item = rqueue.get(timeout=2)
+            if item is None:
+                return items
+            items.append(item)
+
+    try:
+        short_items = drain(short_request[0])
+        long_items = drain(long_request[0])
+    finally:
+        gen._stop = True
+        gen.requests.put(None)
+        worker.join(timeout=2)
+
+    assert rounds_started == [1, 1]
+    assert short_items[-1].finish_reason == "length"
+    assert len([i for i in short_items if isinstance(i, server.StreamingToken)]) == 3
+    assert finish_order == ["short", "long"]
+    assert long_items[-1].finish_reason == "length"
+
+
+def test_speculative_server_failure_only_fails_its_own_cohort(monkeypatch):
+    lm = _RecordingSpeculativeLM("dflash")
+    gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+    gen.model = SimpleNamespace(language_model=lm)
+    gen.processor = SimpleNamespace()
+    gen.draft_model = SimpleNamespace(
+        config=SimpleNamespace(target_layer_ids=[1, 2]), accept_lens=[]
+    )
+    gen.draft_kind = "dflash"
+    gen.stop_tokens = {99}
+    gen.requests = Queue()
+    gen._stop = False
+    gen._cancelled = set()
+    gen._cancel_lock = Lock()
+    gen._make_sampler = lambda args: None
+    gen.tokenizer = SimpleNamespace()
+    gen._gpu_embed = lambda raw_inputs, images=None: (
+        raw_inputs["input_ids"],
+        {"inputs_embeds": mx.ones((1, 2, 4), dtype=mx.float32)},
+    )
+
+    monkeypatch.setattr(server, "_make_cache", lambda *args, **kwargs: [])
+    monkeypatch.setattr(server, "get_speculative_batch_coalesce_s", lambda: 0.0)
+    monkeypatch.setattr(server, "get_speculative_max_cohorts", lambda: 2)
+    monkeypatch.setattr(server, "_ServerTokenStreamer", lambda *args: None)
+    monkeypatch.setattr(server, "make_streaming_detokenizer", lambda processor: None)
+    monkeypatch.setattr(
+        server.ResponseGenerator,
+        "_stream_text",
+        lambda self, info, token, finish_reason: str(token),
+    )
+
+    def request(temperature):
+        return (
+            Queue(),
+            {"input_ids": mx.array([[1, 2]], dtype=mx.int32)},
+            2,
+            server.GenerationArguments(max_tokens=3, temperature=temperature),
+            None,
+        )
+
+    healthy, broken = request(0), request(0.5)
+    cohorts_started = []
+
+    def fake_rounds(*args, first_bonus=None, **kwargs):
+        cohorts_started.append(len(cohorts_started))
+        if len(cohorts_started) == 2:
+            raise RuntimeError("draft failed")
+        for _ in range(100):
+            yield ([4] * int(first_bonus.shape[0]), None)
+
+    monkeypatch.setattr(server, "run_speculative_server_rounds", fake_rounds)
+
+    gen.requests.put(healthy)
+    gen.requests.put(broken)
+    worker = Thread(target=gen._run_speculative, daemon=True)
+    worker.start()
+
+    def drain(rqueue):
+        items = []
+        while True:
+            item = rqueue.get(timeout=2)
+            if item is None:
+                return items
+            items.append(item)
+
+    try:
+        broken_items = drain(broken[0])
+        healthy_items = drain(healthy[0])
+    finally:
+        gen._stop = True
+        gen.requests.put(None)
+        worker.join(timeout=2)
+
+    assert isinstance(broken_items[-1], RuntimeError)
+    assert healthy_items[-1].finish_reason == "length"
+
+
 def test_speculative_server_threads_greedy_flag_to_mtp_loop(monkeypatch):
     call = _run_speculative_prefill_once(
         monkeypatch,
@@ -657,6 +1225,94 @@ def test_chat_completions_streaming_forwards_explicit_sampling_args(
     assert captured["args"].logit_bias == {12: -1.5}
 
 
+def test_chat_completions_hot_swaps_lora_adapter_over_base_model(client, monkeypatch):
+    processor = SimpleNamespace()
+    config = SimpleNamespace(model_type="qwen2_vl")
+    captured = {}
+
+    class FakeResponseGenerator:
+        tokenizer = SimpleNamespace(decode=lambda tokens: "")
+
+        def validate_context_budget(self, prompt, images=None, audio=None, args=None):
+            return None
+
+        def generate(self, prompt, images=None, audio=None, args=None):
+            captured["args"] = args
+            return server.GenerationContext(uid=1, prompt_tokens=8), iter(
+                [
+                    server.StreamingToken(
+                        text="done", token=1, logprobs=0.0, finish_reason="stop"
+                    )
+                ]
+            )
+
+    monkeypatch.setenv("MLX_VLM_LORA_HOT_SWAP", "1")
+    monkeypatch.setattr(server, "response_generator", FakeResponseGenerator())
+
+    with (
+        patch.object(
+            server,
+            "get_cached_model",
+            return_value=(SimpleNamespace(), processor, config),
+        ) as mock_get_model,
+        patch.object(server, "apply_chat_template", return_value="prompt"),
+    ):
+        response = client.post(
+            "/chat/completions",
+            json={
+                "model": "demo",
+                "adapter_path": "/adapters/tenant-a",
+                "messages": [{"role": "user", "content": "Hello"}],
+                "stream": True,
+            },
+        )
+
+    assert response.status_code == 200
+    mock_get_model.assert_called_once_with("demo", None)
+    assert captured["args"].lora_adapter == "/adapters/tenant-a"
+
+
+def test_responses_hot_swaps_lora_adapter_over_base_model(client, monkeypatch):
+    processor = SimpleNamespace()
+    config = SimpleNamespace(model_type="qwen2_vl")
+    captured = {}
+
+    class FakeResponseGenerator:
+        def generate(self, prompt, images=None, audio=None, args=None):
+            captured["args"] = args
+            return server.GenerationContext(uid=1, prompt_tokens=8), iter(
+                [
+                    server.StreamingToken(
+                        text="done", token=1, logprobs=0.0, finish_reason="stop"
+                    )
+                ]
+            )
+
+    monkeypatch.setenv("MLX_VLM_LORA_HOT_SWAP", "1")
+    monkeypatch.setattr(server, "response_generator", FakeResponseGenerator())
+
+    with (
+        patch.object(
+            server,
+            "get_cached_model",
+            return_value=(SimpleNamespace(), processor, config),
+        ) as mock_get_model,
+        patch.object(server, "apply_chat_template", return_value="prompt"),
+    ):
+        response = client.post(
+            "/responses",
+            json={
+                "model": "demo",
+                "adapter_path": "/adapters/tenant-a",
+                "input": "Hello",
+            },
+        )
+
+    assert response.status_code == 200
+    mock_get_model.assert_called_once_with("demo", None)
+    assert captured["args"].lora_adapter == "/adapters/tenant-a"
+
+
 def test_chat_completions_endpoint_flattens_text_content_parts(client):
     model = SimpleNamespace()
     processor = SimpleNamespace()
@@ -732,6 +1388,390 @@ def test_cache_endpoints_report_disabled_stats_and_reset(client, monkeypatch):
     manager.clear.assert_called_once_with()
 
 
+class _PooledGenerator:
+    def __init__(self, model_path, adapter_path=None, **kwargs):
+        self.model_path = model_path
+        self.adapter_path = adapter_path
+        self.requests = Queue()
+        self.in_use = False
+        self.stopped = False
+        self.retired = False
+        self.resident_at_init = list(server.model_pool)
+        weights = {"w": mx.zeros((256,), dtype=mx.float32)}
+        self.model = SimpleNamespace(parameters=lambda: weights)
+
+    def wait_until_ready(self):
+        return self.model, SimpleNamespace(), SimpleNamespace()
+
+    def stop_and_join(self):
+        self.stopped = True
+
+    def retire(self):
+        self.retired = True
+
+
+@pytest.fixture
+def model_pool(monkeypatch):
+    monkeypatch.setattr(server, "ResponseGenerator", _PooledGenerator)
+    monkeypatch.setattr(server, "model_pool", OrderedDict())
+    monkeypatch.setattr(server, "model_cache", {})
+    monkeypatch.setattr(server, "response_generator", None)
+    monkeypatch.setattr(server, "apc_manager", None)
+    monkeypatch.setattr(server, "_estimate_model_nbytes", lambda path: 1024)
+    monkeypatch.setenv("MLX_VLM_MODEL_POOL_BYTES", str(1 << 30))
+    monkeypatch.delenv("MLX_VLM_MAX_RESIDENT_MODELS", raising=False)
+    return server.model_pool
+
+
+def test_model_pool_keeps_alternating_models_resident(model_pool):
+    server.get_cached_model("model-a")
+    first = server.response_generator
+    server.get_cached_model("model-b")
+    server.get_cached_model("model-a")
+
+    assert server.response_generator is first
+    assert not first.stopped
+    assert list(model_pool) == [("model-b", None), ("model-a", None)]
+    assert server.model_cache["model_path"] == "model-a"
+    assert model_pool[("model-a", None)].nbytes == 1024
+
+
+def test_model_pool_evicts_least_recently_used_over_count(model_pool, monkeypatch):
+    monkeypatch.setenv("MLX_VLM_MAX_RESIDENT_MODELS", "2")
+    server.get_cached_model("model-a")
+    server.model_cache["vision_cache"].put("a.png", mx.ones((1, 4)))
+    server.get_cached_model("model-b")
+    evicted = server.response_generator
+    server.get_cached_model("model-a")
+    server.get_cached_model("model-c")
+
+    assert evicted.stopped
+    assert list(model_pool) == [("model-a", None), ("model-c", None)]
+    assert len(model_pool[("model-a", None)].cache["vision_cache"]) == 1
+
+
+def test_model_pool_evicts_over_byte_budget(model_pool, monkeypatch):
+    monkeypatch.setenv("MLX_VLM_MODEL_POOL_BYTES", "1500")
+    server.get_cached_model("model-a")
+    evicted = server.response_generator
+    server.get_cached_model("model-b")
+
+    assert evicted.stopped
+    # The estimate from model-b's checkpoint evicts model-a before loading.
+    assert server.response_generator.resident_at_init == []
+    assert list(model_pool) == [("model-b", None)]
+    assert server.response_generator.model_path == "model-b"
+
+
+def test_estimate_model_nbytes_sums_safetensors(tmp_path):
+    (tmp_path / "model-00001.safetensors").write_bytes(b"x" * 300)
+    (tmp_path / "model-00002.safetensors").write_bytes(b"x" * 200)
+    (tmp_path / "config.json").write_text("{}")
+
+    assert server._estimate_model_nbytes(str(tmp_path)) == 500
+
+
+def test_response_generator_loads_before_joining_the_gpu_worker(monkeypatch):
+    added = []
+    release = Event()
+    load_threads = []
+
+    def slow_initialize_model(self):
+        load_threads.append(get_ident())
+        assert release.wait(timeout=2)
+        self.model, self.processor, self.config = "model", "processor", "config"
+        self.draft_model = None
+
+    monkeypatch.setattr(
+        server.ResponseGenerator, "_initialize_model", slow_initialize_model
+    )
+    monkeypatch.setattr(
+        server._gpu_worker, "add", lambda steps, on_exit: added.append(steps)
+    )
+
+    gen = server.ResponseGenerator("model-a")
+    time.sleep(0.05)
+    assert added == []
+    release.set()
+
+    assert gen.wait_until_ready(timeout=2) == ("model", "processor", "config")
+    for _ in range(100):
+        if added:
+            break
+        time.sleep(0.01)
+    assert len(added) == 1
+    assert load_threads[0] != get_ident()
+
+
+def test_model_pool_evicts_idle_models_before_draining_busy_ones(
+    model_pool, monkeypatch
+):
+    monkeypatch.setenv("MLX_VLM_MAX_RESIDENT_MODELS", "2")
+    server.get_cached_model("model-a")
+    busy = server.response_generator
+    busy.in_use = True
+    server.get_cached_model("model-b")
+    idle = server.response_generator
+    server.get_cached_model("model-c")
+
+    assert idle.stopped
+    assert not busy.stopped and not busy.retired
+    assert list(model_pool) == [("model-a", None), ("model-c", None)]
+
+    server.response_generator.in_use = True
+    server.get_cached_model("model-d")
+
+    assert busy.retired and not busy.stopped
+    assert list(model_pool) == [("model-c", None), ("model-d", None)]
+
+
+def test_unload_releases_every_resident_model(model_pool):
+    server.get_cached_model("model-a")
+    server.get_cached_model("model-b", "adapter")
+    generators = [entry.generator for entry in model_pool.values()]
+
+    snapshot = server._server_runtime_snapshot()
+    assert [m["model"] for m in snapshot["resident_models"]] == ["model-b", "model-a"]
+    assert server.unload_model_sync() is True
+
+    assert all(generator.stopped for generator in generators)
+    assert not model_pool
+    assert server.model_cache == {}
+    assert server.response_generator is None
+    assert server.unload_model_sync() is False
+
+
+def _admission_item(tenant, prompt_tokens=10, priority="default"):
+    args = server.GenerationArguments(max_tokens=0, tenant_id=tenant, priority=priority)
+    return (Queue(), {}, prompt_tokens, args, None)
+
+
+def test_admission_queue_shares_fairly_across_tenants():
+    queue = server.AdmissionQueue(weights={})
+    flood = [_admission_item("batch-tenant", prompt_tokens=1000) for _ in range(5)]
+    for item in flood:
+        queue.put(item)
+    interactive = _admission_item("chat-tenant", prompt_tokens=100)
+    queue.put(interactive)
+
+    assert queue.get_nowait() is interactive
+    assert [queue.get_nowait() for _ in range(5)] == flood
+    with pytest.raises(server.QueueEmpty):
+        queue.get_nowait()
+
+
+def test_admission_queue_serves_priority_classes_in_order():
+    queue = server.AdmissionQueue(weights={})
+    backfill = _admission_item("a", priority="batch")
+    default = _admission_item("a")
+    urgent = _admission_item("b", prompt_tokens=10_000, priority="interactive")
+    for item in (backfill, default, urgent):
+        queue.put(item)
+    queue.put(None)
+
+    assert queue.get_nowait() is None
+    assert [queue.get_nowait() for _ in range(3)] == [urgent, default, backfill]
+
+
+def test_admission_queue_caps_rows_per_tenant_until_release():
+    queue = server.AdmissionQueue(max_tenant_rows=1, weights={})
+    first, second = _admission_item("a"), _admission_item("a")
+    other = _admission_item("b", prompt_tokens=500)
+    for item in (first, second, other):
+        queue.put(item)
+
+    assert queue.get_nowait() is first
+    assert queue.get_nowait() is other
+    with pytest.raises(server.QueueEmpty):
+        queue.get(timeout=0.01)
+    queue.release(first[0])
+    assert queue.get_nowait() is second
+    assert queue.stats()["active_rows_by_tenant"] == {"a": 1, "b": 1}
+
+
+def test_admission_queue_rejects_past_its_bounds():
+    queue = server.AdmissionQueue(max_queued=2, max_queued_per_tenant=1, weights={})
+    queue.put(_admission_item("a"))
+    with pytest.raises(server.QueueFullError):
+        queue.put(_admission_item("a"))
+    queue.put(_admission_item("b"))
+    with pytest.raises(server.QueueFullError):
+        queue.check_admission("c")
+    assert queue.stats()["rejected"] == 2
+
+
+def test_admission_queue_counts_only_rejected_requests():
+    queue = server.AdmissionQueue(max_queued=2, max_queued_per_tenant=2, weights={})
+    for _ in range(2):
+        queue.check_admission("a")
+        queue.put(_admission_item("a"))
+    assert queue.stats()["rejected"] == 0
+
+    with pytest.raises(server.QueueFullError):
+        queue.put(_admission_item("a"))
+    assert queue.stats()["rejected"] == 1
+
+
+def test_admission_queue_closes_only_once_idle():
+    queue = server.AdmissionQueue(weights={})
+    item = _admission_item("a")
+    queue.put(item)
+    assert queue.in_use()
+    assert not queue.close_if_idle()
+
+    assert queue.get_nowait() is item
+    assert not queue.close_if_idle()
+    queue.release(item[0])
+    assert not queue.in_use()
+    assert queue.close_if_idle()
+
+    with pytest.raises(server.QueueFullError, match="unloaded"):
+        queue.put(_admission_item("a"))
+
+
+def test_gpu_worker_interleaves_loops_on_one_thread():
+    worker = server._GPUWorker(idle_timeout=0.01)
+    seen = []
+    finished = []
+    both_added = Event()
+    done = Event()
+
+    def loop(name, steps):
+        for step in range(steps):
+            both_added.wait(timeout=2)
+            seen.append((name, step, get_ident()))
+            yield True
+
+    def on_exit(name):
+        finished.append(name)
+        if len(finished) == 2:
+            done.set()
+
+    worker.add(loop("a", 3), lambda: on_exit("a"))
+    worker.add(loop("b", 2), lambda: on_exit("b"))
+    both_added.set()
+    assert done.wait(timeout=2)
+
+    assert {ident for *_, ident in seen} != {get_ident()}
+    assert len({ident for *_, ident in seen}) == 1
+    order = [(name, step) for name, step, _ in seen]
+    assert order.index(("b", 0)) < order.index(("a", 2))
+    assert sorted(finished) == ["a", "b"]
+
+
+def test_chat_completions_stream_returns_429_when_queue_is_full(client, monkeypatch):
+    class FullResponseGenerator:
+        def check_admission(self, args=None):
+            raise server.QueueFullError("Server queue is full")
+
+    monkeypatch.setattr(server, "response_generator", FullResponseGenerator())
+
+    with (
+        patch.object(
+            server,
+            "get_cached_model",
+            return_value=(SimpleNamespace(), SimpleNamespace(), SimpleNamespace()),
+        ),
+        patch.object(server, "apply_chat_template", return_value="prompt"),
+    ):
+        response = client.post(
+            "/chat/completions",
+            headers={"X-Priority": "batch"},
+            json={
+                "model": "demo",
+                "messages": [{"role": "user", "content": "Hello"}],
+                "stream": True,
+            },
+        )
+
+    assert response.status_code == 429
+    assert response.json()["detail"] == "Server queue is full"
+
+
+def test_latency_histogram_buckets_and_quantiles():
+    histogram = server.LatencyHistogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.quantile(0.5) == pytest.approx(0.1)
+    assert histogram.quantile(0.75) == pytest.approx(1.0)
+    assert histogram.quantile(0.99) == 1.0
+
+
+def test_metrics_histograms_record_phases_and_render_prometheus(
+    client, monkeypatch, tmp_path
+):
+    store = server.ServerMetricsStore()
+    monkeypatch.setattr(server, "server_metrics", store)
+    monkeypatch.setattr(server, "response_generator", None)
+    monkeypatch.setattr(server, "model_cache", {})
+    trace_file = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("MLX_VLM_TRACE_FILE", str(trace_file))
+    trace = server.RequestTrace(enqueued_at=10.0)
+    trace.vision_encode_s = 0.2
+    trace.admitted_at = 10.5
+    trace.prefill_s = 0.4
+    token_times = [101.0, 101.02, 101.05]
+
+    envelope = server._build_metrics_envelope(
+        endpoint="/chat/completions",
+        model="demo",
+        stream=True,
+        backend="continuous_batching",
+        prompt_tokens=8,
+        completion_tokens=3,
+        generated_tokens=3,
+        request_elapsed_s=1.5,
+        request_started_s=100.0,
+        token_times=token_times,
+        trace=trace,
+    )
+    store.record_success(envelope, token_times=token_times)
+
+    assert envelope["queue_wait_s"] == pytest.approx(0.3)
+    assert envelope["prompt_eval_time_s"] == 0.4
+    histograms = client.get("/metrics").json()["histograms"]
+    assert histograms["ttft_seconds"][0]["count"] == 1
+    assert histograms["inter_token_latency_seconds"][0]["count"] == 2
+    assert histograms["vision_encode_seconds"][0]["p50"] is not None
+
+    response = client.get("/metrics?format=prometheus")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "mlx_vlm_requests_completed_total 1" in response.text
+    assert (
+        'mlx_vlm_ttft_seconds_bucket{endpoint="/chat/completions",model="demo",le="1.0"} 1'
+        in response.text
+    )
+    assert (
+        'mlx_vlm_queue_wait_seconds_count{endpoint="/chat/completions",model="demo"} 1'
+        in response.text
+    )
+
+    store.flush_traces()
+    span = json.loads(trace_file.read_text().splitlines()[0])
+    assert [child["name"] for child in span["spans"]] == [
+        "queue",
+        "vision_encode",
+        "prefill",
+        "decode",
+    ]
+
+
+def test_vision_encode_stage_records_encode_time_on_trace():
+    stage = server.VisionEncodeStage(lambda raw, images: (raw["input_ids"], {}))
+    item = _encode_item("img", image_size=8)
+    item[3].trace = server.RequestTrace()
+    text = _encode_item("text")
+    text[3].trace = server.RequestTrace()
+    stage.submit([item, text])
+
+    stage.step(decoding=False)
+
+    assert item[3].trace.vision_encode_s is not None
+    assert text[3].trace.vision_encode_s is None
+
+
 def test_metrics_endpoint_reports_empty_state(client, monkeypatch):
     monkeypatch.setattr(server, "server_metrics", server.ServerMetricsStore())
     monkeypatch.setattr(server, "apc_manager", None)
@@ -1524,6 +2564,27 @@ class TestResponseGenerator:
 
         assert server._build_gen_args(req).enable_thinking is True
 
+    def test_build_gen_args_only_seeds_explicit_requests(self):
+        req = server.ChatRequest(
+            model="demo",
+            messages=[server.ChatMessage(role="user", content="hi")],
+        )
+        assert server._build_gen_args(req).seed is None
+
+        req = server.ChatRequest(
+            model="demo",
+            messages=[server.ChatMessage(role="user", content="hi")],
+            temperature=0.7,
+            top_k=20,
+            seed=11,
+        )
+        args = server._build_gen_args(req)
+        gen = server.ResponseGenerator.__new__(server.ResponseGenerator)
+        params = gen._sampling_params(args)
+        assert params.seed == 11
+        assert params.temperature == 0.7
+        assert params.top_k == 20
+
     def test_gpu_embed_hashes_pixel_values_without_image_ref(self):
         class Embed:
             def to_dict(self):
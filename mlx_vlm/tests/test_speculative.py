@@ -16,7 +16,16 @@ import pytest
 
 import mlx_vlm.models.qwen3_5.language as qwen_language
 import mlx_vlm.speculative.mtp as mtp_utils
-from mlx_vlm.models.cache import ArraysCache, BufferedRotatingKVCache, RotatingKVCache
+from mlx_vlm.models.base import create_tree_attention_mask
+from mlx_vlm.models.cache import (
+    ArraysCache,
+    BufferedRotatingKVCache,
+    KVCache,
+    RotatingKVCache,
+    compact_speculative_cache,
+)
+from mlx_vlm.speculative.ddtree import DDTreeLayout, DDTreeNode, build_ddtree
+from mlx_vlm.speculative.dflash import _dflash_tree_rounds
 from mlx_vlm.speculative.drafters import (
     DEFAULT_DRAFTER_KIND,
     DRAFTER_KIND_BY_MODEL_TYPE,
@@ -42,6 +51,7 @@ from mlx_vlm.speculative.eagle3 import (
     _eagle3_verify_target,
     _eagle3_verify_target_hot,
 )
+from mlx_vlm.speculative.ngram import NGramDrafter, NGramIndex
 from mlx_vlm.speculative.utils import (
     _dflash_next_block_size,
     _effective_mtp_block_size,
@@ -52,6 +62,8 @@ from mlx_vlm.speculative.utils import (
     _mtp_rounds,
     _mtp_shared_kv_from_prompt_cache,
     _mtp_verify_target,
+    _ngram_rounds,
+    _ngram_rounds_batch,
     _speculative_walk,
     _speculative_walk_batch,
     _speculative_walk_batch_deferred_greedy,
@@ -1105,6 +1117,262 @@ def test_speculative_walk_batch_uniform_acceptance_keeps_exact_tokens():
     assert new_tokens == [[10, 99], [20, 21]]
 
 
+def test_ngram_index_drafts_from_latest_longest_match():
+    index = NGramIndex([1, 2, 3, 9, 1, 2, 3, 4, 2, 3], max_ngram=3, min_ngram=2)
+
+    # (2, 3) last continued with 4; the suffix itself is never a match.
+    assert index.draft(3) == [4, 2, 3]
+    index.extend([4])
+    assert index.draft(2) == [2, 3]
+    assert index.draft(0) == []
+    assert NGramIndex([5, 6, 7], min_ngram=2).draft(4) == []
+
+
+class _NGramCache:
+    def __init__(self):
+        self.offset = 0
+        self.trims = []
+
+    def is_trimmable(self):
+        return True
+
+    def trim(self, n):
+        self.offset -= n
+        self.trims.append(n)
+
+
+def _ngram_target(next_token, vocab_size=16):
+    """Target LM whose greedy choice after token ``t`` is ``next_token[t]``."""
+    calls = []
+
+    def lm(inputs, cache=None, **kwargs):
+        calls.append(inputs.tolist())
+        for c in cache:
+            c.offset += inputs.shape[1]
+        nxt = mx.array([[next_token[t] for t in row] for row in inputs.tolist()])
+        return SimpleNamespace(logits=mx.eye(vocab_size)[nxt])
+
+    return lm, calls
+
+
+def _run_ngram_rounds(lm, prompt, first_bonus, max_tokens, cache):
+    return [
+        tok
+        for tok, _ in _ngram_rounds(
+            lm,
+            NGramDrafter(block_size=4),
+            [cache],
+            prompt_tokens=mx.array([prompt], dtype=mx.int32),
+            first_bonus=first_bonus,
+            max_tokens=max_tokens,
+            sampler=lambda logits: mx.argmax(logits, axis=-1),
+        )
+    ]
+
+
+def test_ngram_rounds_accept_repeated_prompt_spans():
+    lm, calls = _ngram_target({5: 6, 6: 7, 7: 5})
+    cache = _NGramCache()
+
+    tokens = _run_ngram_rounds(lm, [5, 6, 7, 5, 6], 7, 9, cache)
+
+    assert tokens == [5, 6, 7, 5, 6, 7, 5, 6]
+    assert len(calls) < len(tokens)
+    assert calls[0] == [[7, 5, 6, 7]]
+    assert cache.trims == []
+
+
+def test_ngram_rounds_trim_rejected_drafts():
+    lm, calls = _ngram_target({t: (t + 1) % 16 for t in range(16)})
+    cache = _NGramCache()
+
+    tokens = _run_ngram_rounds(lm, [2, 3, 9, 2], 3, 3, cache)
+
+    # (2, 3) was followed by 9 in the prompt; the target says 4.
+    assert calls[0] == [[3, 9, 2]]
+    assert tokens == [4, 5]
+    assert cache.trims == [2]
+    assert cache.offset == 2
+
+
+def test_ngram_rounds_batch_pads_short_drafts_per_row():
+    next_token = {t: (t + 1) % 16 for t in range(16)}
+    next_token[7] = 5
+    lm_fn, calls = _ngram_target(next_token)
+    rollbacks = []
+
+    class Target:
+        def __call__(self, inputs, cache=None, **kwargs):
+            return lm_fn(inputs, cache=cache)
+
+        def rollback_speculative_cache(self, caches, gdn_states, accepted, block):
+            rollbacks.append((accepted.tolist(), block))
+
+    cache = _NGramCache()
+    cache.left_padding = [0, 2]
+    rounds = _ngram_rounds_batch(
+        Target(),
+        NGramDrafter(block_size=4),
+        [cache],
+        prompt_tokens=mx.array([[5, 6, 7, 5, 6], [0, 0, 1, 2, 3]], dtype=mx.int32),
+        first_bonus=mx.array([7, 4], dtype=mx.int32),
+        max_tokens=6,
+        sampler=lambda logits: mx.argmax(logits, axis=-1),
+    )
+
+    first_round = [next(rounds)[0] for _ in range(4)]
+    next(rounds)  # rewinds the first round, then verifies the second
+
+    # Row 1 has no lookup match; its filler slots are verified and rejected
+    # without capping row 0's accepted drafts.
+    assert calls[0] == [[7, 5, 6, 7], [4, 0, 0, 0]]
+    assert first_round == [[5, 5], [6, None], [7, None], [5, None]]
+    assert rollbacks == [([3, 0], 4)]
+
+
+def _ddtree_layout():
+    # root 1 -> {5 -> {7}, 6}; built in pop order, laid out by depth.
+    tree = [
+        DDTreeNode(ranks=(1,), token_ids=(5,), log_prob=-0.1, depth=1),
+        DDTreeNode(ranks=(1, 1), token_ids=(5, 7), log_prob=-0.2, depth=2, parent=0),
+        DDTreeNode(ranks=(2,), token_ids=(6,), log_prob=-0.3, depth=1),
+    ]
+    return DDTreeLayout.from_tree(tree, root_token=1)
+
+
+def test_ddtree_layout_groups_slots_by_depth():
+    layout = _ddtree_layout()
+
+    assert layout.tokens == [1, 5, 6, 7]
+    assert layout.parents == [-1, 0, 0, 1]
+    assert layout.depths == [0, 1, 1, 2]
+
+    tree = layout.attention()
+    assert tree.spans == [(0, 1, 0), (1, 3, 1), (3, 4, 2)]
+    assert tree.ancestors.tolist() == [
+        [True, False, False, False],
+        [True, True, False, False],
+        [True, False, True, False],
+        [True, True, False, True],
+    ]
+
+
+def test_ddtree_layout_walk_follows_target_choices():
+    layout = _ddtree_layout()
+
+    # Target picks 5 after the root, 7 after 5, then 9 (not drafted).
+    assert layout.walk([5, 7, 0, 9], budget=8) == ([0, 1, 3], [5, 7, 9])
+    assert layout.walk([6, 0, 4, 0], budget=8) == ([0, 2], [6, 4])
+    assert layout.walk([8, 0, 0, 0], budget=8) == ([0], [8])
+    assert layout.walk([5, 7, 0, 9], budget=2)[1] == [5, 7]
+
+
+def test_build_ddtree_expands_best_first_over_top_k():
+    logits = mx.log(
+        mx.array([[[0.6, 0.3, 0.1, 0.0], [0.1, 0.2, 0.0, 0.7]]], dtype=mx.float32)
+        + 1e-9
+    )
+
+    tree = build_ddtree(logits, budget=3, slot_offset=0)
+
+    assert [node.token_ids for node in tree] == [(0,), (0, 3), (1,)]
+    assert [node.parent for node in tree] == [-1, 0, -1]
+
+
+def test_tree_attention_mask_takes_prefix_row_per_depth():
+    layout = _ddtree_layout()
+    tree = layout.attention()
+    # Distinct prefix rows per query position stand in for a sliding window.
+    prefix = [[j >= i for j in range(3)] for i in range(4)]
+    mask = mx.array([row + [True] * 4 for row in prefix])
+
+    out = create_tree_attention_mask(mask, tree)
+
+    assert out.shape == (4, 7)
+    assert out[:, :3].tolist() == [prefix[d] for d in layout.depths]
+    assert out[:, 3:].tolist() == tree.ancestors.tolist()
+
+
+def test_compact_speculative_cache_keeps_accepted_path():
+    cache = KVCache()
+    keys = mx.arange(6, dtype=mx.float32).reshape(1, 1, 6, 1)
+    cache.update_and_fetch(keys, keys + 10)
+
+    # Two prefix tokens plus a four-slot tree whose path is slots 0, 1, 3.
+    compact_speculative_cache([cache], [0, 1, 3], block_size=4)
+
+    k, v = cache.state
+    assert cache.offset == 5
+    assert k.reshape(-1).tolist() == [0, 1, 2, 3, 5]
+    assert v.reshape(-1).tolist() == [10, 11, 12, 13, 15]
+
+
+def test_dflash_tree_rounds_commit_the_accepted_path():
+    # Target greedy choice after each token; 6 is the second depth-1 branch.
+    next_token = {1: 6, 4: 9, 5: 0, 6: 4, 7: 0, 9: 0}
+    drafter_hidden = []
+    commits = []
+
+    class Drafter:
+        config = SimpleNamespace(target_layer_ids=[0], block_size=3)
+        prefer_requested_block_size = True
+        accept_lens = []
+        draft_lens = []
+
+        def reset(self, model):
+            return None
+
+        def draft_logits(self, b, hidden, cache, bs, token_dtype):
+            drafter_hidden.append(hidden.reshape(-1).tolist())
+            # depth 1: 5 (0.6) or 6 (0.3); depth 2: 7.
+            probs = mx.zeros((1, 2, 10)) + 1e-9
+            probs[0, 0, 5] = 0.6
+            probs[0, 0, 6] = 0.3
+            probs[0, 1, 7] = 0.7
+            return mx.log(probs)
+
+    class Target:
+        def __call__(self, inputs, cache=None, speculative_tree=None, **kwargs):
+            slots = inputs.astype(mx.float32).reshape(1, 1, -1, 1)
+            for c in cache:
+                c.update_and_fetch(slots, slots)
+            nxt = mx.array([[next_token[t] for t in inputs[0].tolist()]])
+            n = inputs.shape[1]
+            return SimpleNamespace(
+                logits=mx.eye(10)[nxt],
+                hidden_states=[mx.arange(n, dtype=mx.float32).reshape(1, n, 1)],
+            )
+
+        def commit_speculative_tree(self, caches, keep, tree_size):
+            compact_speculative_cache(caches, keep, tree_size)
+            keys, _ = caches[0].state
+            commits.append((list(keep), caches[0].offset, keys.reshape(-1).tolist()))
+
+    cache = KVCache()
+    prefix = mx.array([8.0, 8.0]).reshape(1, 1, 2, 1)
+    cache.update_and_fetch(prefix, prefix)
+
+    tokens = [
+        tok
+        for tok, _ in _dflash_tree_rounds(
+            Target(),
+            Drafter(),
+            [cache],
+            mx.zeros((1, 1, 1)),
+            first_bonus=1,
+            max_tokens=4,
+            sampler=lambda logits: mx.argmax(logits, axis=-1),
+            tree_budget=3,
+            draft_block_size=3,
+        )
+    ]
+
+    # Tree slots are [1, 5, 6, 7]; the target takes 6, then 4 off the tree.
+    assert tokens == [6, 4, 9]
+    assert commits == [([0, 2], 4, [8, 8, 1, 6])]
+    assert drafter_hidden[1] == [0, 2]
+
+
 def test_gemma4_assistant_overrides_dflash_to_mtp(tmp_path, caplog):
     path = _make_drafter_dir(tmp_path, "gemma4_assistant")
     with caplog.at_level("WARNING"):
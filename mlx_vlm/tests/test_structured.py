@@ -0,0 +1,160 @@
+import json
+
+import mlx.core as mx
+import numpy as np
+import pytest
+
+llguidance = pytest.importorskip("llguidance")
+
+from mlx_vlm.structured import (
+    CompiledGrammarCache,
+    LLGuidanceLogitsProcessor,
+    apply_token_bitmask,
+    fill_grammar_bitmask,
+    schema_hash,
+)
+
+SCHEMA = '{"type":"object","properties":{"a":{"type":"integer"}},"required":["a"]}'
+
+
+class _ByteTokenizer:
+    eos_token_id = 0
+    bos_token_id = None
+    tokens = [b"<eos>"] + [bytes([c]) for c in range(32, 127)]
+
+    def __call__(self, s):
+        if isinstance(s, str):
+            s = s.encode()
+        return [self.tokens.index(bytes([c])) for c in s]
+
+
+def _token(text):
+    return _ByteTokenizer.tokens.index(text.encode())
+
+
+@pytest.fixture(scope="module")
+def llg_tokenizer():
+    return llguidance.LLTokenizer(llguidance.TokenizerWrapper(_ByteTokenizer()))
+
+
+def _processor(llg_tokenizer):
+    grammar = llguidance.grammar_from("json_schema", SCHEMA)
+    return LLGuidanceLogitsProcessor(grammar, llg_tokenizer)
+
+
+def test_apply_token_bitmask_masks_rows_and_grammar_tail():
+    bitmask = np.zeros((2, 1), dtype=np.int32)
+    bitmask[0, 0] = 0b101
+    bitmask[1, 0] = -1
+    logits = mx.zeros((2, 34))
+
+    out = apply_token_bitmask(logits, bitmask, constrained=[True, False])
+
+    allowed = np.isfinite(np.array(out))
+    assert allowed[0].nonzero()[0].tolist() == [0, 2]
+    assert allowed[1].all()
+
+
+def test_fill_grammar_bitmask_batches_constrained_and_free_rows(llg_tokenizer):
+    first = _processor(llg_tokenizer)
+    second = _processor(llg_tokenizer)
+    processors = [first, None, second]
+    vocab = llg_tokenizer.vocab_size + 4
+
+    bitmask = fill_grammar_bitmask(processors, [0, 0, 0])
+    out = np.array(
+        apply_token_bitmask(mx.zeros((3, vocab)), bitmask, [True, False, True])
+    )
+    assert np.isfinite(out[0, _token("{")])
+    assert not np.isfinite(out[0, _token("}")])
+    assert not np.isfinite(out[0, -1])
+    assert np.isfinite(out[1]).all()
+
+    # The next step consumes each row's own last token.
+    bitmask = fill_grammar_bitmask(processors, [_token("{"), 0, _token("{")])
+    out = np.array(apply_token_bitmask(mx.zeros((3, vocab)), bitmask))
+    assert np.isfinite(out[0, _token('"')])
+    assert not np.isfinite(out[2, _token("{")])
+
+    with pytest.raises(ValueError, match="matcher error"):
+        fill_grammar_bitmask(processors, [_token("}"), 0, _token('"')])
+
+
+def test_process_last_token_matches_batched_mask(llg_tokenizer):
+    single = _processor(llg_tokenizer)
+    batched = _processor(llg_tokenizer)
+    logits = mx.random.normal((1, llg_tokenizer.vocab_size))
+
+    expected = single.process_last_token(0, logits)
+    actual = apply_token_bitmask(logits, fill_grammar_bitmask([batched], [0]))
+
+    assert mx.array_equal(expected, actual).item()
+
+
+def test_generation_rows_mix_grammar_and_plain_processors(llg_tokenizer):
+    from mlx_vlm.generate import _apply_row_logits_processors, _split_grammar_processors
+
+    bias = lambda tokens, logits: logits + 1
+    grammar, rest = _split_grammar_processors(
+        [[_processor(llg_tokenizer), bias], None, [bias]]
+    )
+    assert [g is not None for g in grammar] == [True, False, False]
+
+    logits = mx.zeros((3, llg_tokenizer.vocab_size))
+    out = np.array(_apply_row_logits_processors(logits, grammar, rest, [[], [], []]))
+
+    assert out[0, _token("{")] == 1
+    assert not np.isfinite(out[0, _token("}")])
+    assert (out[1] == 0).all()
+    assert (out[2] == 1).all()
+
+
+def test_schema_hash_ignores_key_order_and_whitespace():
+    reordered = {
+        "required": ["a"],
+        "type": "object",
+        "properties": {"a": {"type": "integer"}},
+    }
+    assert schema_hash(SCHEMA) == schema_hash(reordered)
+    assert schema_hash(SCHEMA) == schema_hash(json.dumps(reordered, indent=2))
+    assert schema_hash(SCHEMA) != schema_hash({"type": "object"})
+
+
+def test_compiled_grammar_cache_hits_and_evicts_lru():
+    cache = CompiledGrammarCache(max_entries=2)
+    builds = []
+
+    def build(name):
+        return lambda: builds.append(name) or name
+
+    assert cache.get_or_build("a", build("a")) == "a"
+    assert cache.get_or_build("b", build("b")) == "b"
+    assert cache.get_or_build("a", build("a")) == "a"
+    cache.get_or_build("c", build("c"))
+    cache.get_or_build("b", build("b"))
+
+    assert builds == ["a", "b", "c", "b"]
+    assert cache.stats() == {
+        "entries": 2,
+        "max_entries": 2,
+        "hits": 1,
+        "misses": 4,
+        "evictions": 2,
+    }
+
+
+def test_matcher_template_copies_match_fresh_matchers(llg_tokenizer):
+    grammar = llguidance.grammar_from("json_schema", SCHEMA)
+    template = llguidance.LLMatcher(llg_tokenizer, grammar)
+    cached = LLGuidanceLogitsProcessor(grammar, llg_tokenizer, template)
+    fresh = _processor(llg_tokenizer)
+    logits = mx.random.normal((1, llg_tokenizer.vocab_size))
+
+    for token in [0, _token("{"), _token('"')]:
+        expected = fresh.process_last_token(token, logits)
+        actual = cached.process_last_token(token, logits)
+        assert mx.array_equal(expected, actual).item()
+
+    # The template itself is never advanced, so new rows start from scratch.
+    assert cached.clone().matcher_template is template
+    assert not template.is_stopped() and not template.get_error()
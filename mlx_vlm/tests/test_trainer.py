@@ -1,4 +1,6 @@
+import tempfile
 import unittest
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 import mlx.core as mx
@@ -130,6 +132,119 @@ class TestDataset(unittest.TestCase):
         self.assertEqual(dataset.processor, self.mock_processor)
 
 
+class TestPreprocessedDataset(unittest.TestCase):
+    class _Source:
+        def __init__(self, fingerprint="abc"):
+            self.dataset = SimpleNamespace(_fingerprint=fingerprint)
+            self.processor = SimpleNamespace(
+                chat_template="t", image_processor=SimpleNamespace(to_dict=dict)
+            )
+            self.config = {"model_type": "test_model", "image_token_index": 1}
+            self.image_resize_shape = None
+            self.calls = 0
+
+        def __len__(self):
+            return 5
+
+        def __getitem__(self, idx):
+            self.calls += 1
+            return {
+                "pixel_values": None if idx % 2 else mx.full((2, 3), idx),
+                "input_ids": mx.arange(idx + 1)[None],
+                "attention_mask": mx.ones((1, idx + 1)),
+                "image_sizes": [idx, idx],
+            }
+
+    def test_samples_round_trip_and_later_runs_skip_processing(self):
+        from mlx_vlm.trainer.datasets import PreprocessedDataset
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source = self._Source()
+            cached = PreprocessedDataset(source, tmp, shard_size=2)
+            self.assertEqual(source.calls, 5)
+            self.assertEqual(len(cached), 5)
+            self.assertEqual(cached.lengths(), [1, 2, 3, 4, 5])
+
+            item = cached[4]
+            self.assertTrue(mx.array_equal(item["pixel_values"], mx.full((2, 3), 4)))
+            self.assertTrue(mx.array_equal(item["input_ids"], mx.arange(5)[None]))
+            self.assertEqual(item["image_sizes"], [4, 4])
+            self.assertIsNone(cached[3]["pixel_values"])
+
+            again = self._Source()
+            PreprocessedDataset(again, tmp, shard_size=2)
+            self.assertEqual(again.calls, 0)
+
+            changed = self._Source(fingerprint="def")
+            PreprocessedDataset(changed, tmp, shard_size=2)
+            self.assertEqual(changed.calls, 5)
+
+
+class TestVisionFeatureDataset(unittest.TestCase):
+    class _Model(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.vision_tower = nn.Linear(3, 4)
+            self.vision_tower.freeze()
+            self.encoded = 0
+
+        def encode_packed_images(self, batches):
+            self.encoded += len(batches)
+            return [self.vision_tower(b["pixel_values"]) for b in batches]
+
+    def _dataset(self):
+        return [
+            {
+                "input_ids": mx.array([[1, 2]]),
+                "pixel_values": None if v is None else mx.full((2, 3), v),
+            }
+            for v in (1.0, 2.0, None, 1.0)
+        ]
+
+    def test_features_are_encoded_once_and_collated(self):
+        from mlx_vlm.trainer.datasets import VisionFeatureDataset
+        from mlx_vlm.vision_cache import VisionFeatureCache
+
+        model = self._Model()
+        cache = VisionFeatureCache()
+        dataset = VisionFeatureDataset(self._dataset(), model, cache, batch_size=2)
+        # Samples 0 and 3 share identical pixels.
+        self.assertEqual(model.encoded, 2)
+        self.assertNotIn("cached_image_features", dataset[2])
+
+        batch = next(iterate_batches(dataset, batch_size=2, max_seq_length=32))
+        pixels = mx.concatenate([mx.full((2, 3), 1.0), mx.full((2, 3), 2.0)])
+        expected = model.vision_tower(pixels)
+        self.assertTrue(mx.allclose(batch["cached_image_features"], expected))
+
+        VisionFeatureDataset(self._dataset(), model, cache)
+        self.assertEqual(model.encoded, 2)
+
+    def test_evicted_features_are_reported_without_a_disk_tier(self):
+        from mlx_vlm.trainer.datasets import VisionFeatureDataset
+        from mlx_vlm.vision_cache import VisionFeatureCache
+
+        # Room for one 2x4 float32 feature only.
+        cache = VisionFeatureCache(max_bytes=40)
+        with self.assertLogs("mlx_vlm.trainer.datasets", level="WARNING"):
+            VisionFeatureDataset(self._dataset(), self._Model(), cache)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = VisionFeatureCache(max_bytes=40, disk_dir=tmp)
+            with self.assertNoLogs("mlx_vlm.trainer.datasets", level="WARNING"):
+                dataset = VisionFeatureDataset(self._dataset(), self._Model(), cache)
+            self.assertIn("cached_image_features", dataset[0])
+
+    def test_trainable_vision_tower_is_rejected(self):
+        from mlx_vlm.trainer.datasets import VisionFeatureDataset
+        from mlx_vlm.vision_cache import VisionFeatureCache
+
+        model = self._Model()
+        model.vision_tower.unfreeze()
+        with self.assertRaises(ValueError):
+            VisionFeatureDataset(self._dataset(), model, VisionFeatureCache())
+
+
 class TestBatchCollation(unittest.TestCase):
     def test_iterate_batches_concatenates_variable_length_pixel_values(self):
         dataset = [
@@ -155,6 +270,73 @@ class TestBatchCollation(unittest.TestCase):
             mx.array_equal(batch["image_grid_thw"], mx.array([[1, 1, 2], [1, 1, 3]]))
         )
 
+    def test_prefetched_batches_match_inline_order_under_seed(self):
+        dataset = [
+            {"input_ids": mx.array([i, i + 1]), "attention_mask": mx.array([1, 1])}
+            for i in range(8)
+        ]
+
+        def first_tokens(num_workers):
+            batches = iterate_batches(
+                dataset,
+                batch_size=2,
+                max_seq_length=32,
+                train=True,
+                num_workers=num_workers,
+                prefetch=3,
+                seed=0,
+            )
+            return [next(batches)["input_ids"][:, 0].tolist() for _ in range(10)]
+
+        inline = first_tokens(0)
+        self.assertEqual(inline, first_tokens(3))
+        self.assertEqual(sorted(inline[:4]), [[0, 1], [2, 3], [4, 5], [6, 7]])
+        self.assertIsInstance(
+            next(iterate_batches(dataset, 2, 32, num_workers=2))["input_ids"],
+            mx.array,
+        )
+
+    def test_bucket_batching_groups_similar_lengths(self):
+        dataset = [{"input_ids": mx.ones((n,), dtype=mx.int32)} for n in (40, 3, 38, 5)]
+
+        batches = list(
+            iterate_batches(dataset, batch_size=2, max_seq_length=64, batching="bucket")
+        )
+
+        self.assertEqual(
+            [b["attention_mask"].sum(axis=1).tolist() for b in batches],
+            [[3, 5], [38, 40]],
+        )
+
+    def test_bucket_batching_rejects_datasets_without_lengths(self):
+        dataset = MagicMock()
+        dataset.__len__.return_value = 4
+        del dataset.lengths
+
+        with self.assertRaises(ValueError):
+            next(iterate_batches(dataset, 2, 64, batching="bucket"))
+        dataset.__getitem__.assert_not_called()
+
+    def test_tuple_cached_features_concatenate_per_leaf(self):
+        dataset = [
+            {
+                "input_ids": mx.array([1, 2]),
+                "cached_image_features": (
+                    mx.full((2, 4), float(i)),
+                    [mx.full((2, 4), i + 10.0), mx.full((2, 4), i + 20.0)],
+                ),
+            }
+            for i in range(2)
+        ]
+
+        batch = next(iterate_batches(dataset, batch_size=2, max_seq_length=32))
+
+        hidden, deepstack = batch["cached_image_features"]
+        self.assertIsInstance(deepstack, list)
+        self.assertEqual(hidden.shape, (4, 4))
+        self.assertEqual(len(deepstack), 2)
+        self.assertEqual(deepstack[1][:, 0].tolist(), [20, 20, 21, 21])
+
 
 class TestTrainer(unittest.TestCase):
     def setUp(self):
@@ -4,14 +4,17 @@ from tempfile import TemporaryDirectory
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
+import mlx.core as mx
 import mlx.nn as nn
 from mlx_lm.tuner.lora import LoRALinear
 
+from mlx_vlm.trainer.lora import LoRaAdapterSet, MultiLoRaLayer
 from mlx_vlm.trainer.utils import (
     apply_lora_layers,
     find_all_linear_names,
     get_module_by_name,
     get_peft_model,
+    load_lora_adapter,
     set_module_by_name,
 )
 
@@ -163,6 +166,102 @@ class TestTrainerUtils(unittest.TestCase):
                 (str(adapter_dir / "adapters.safetensors"), False),
             )
 
+    def test_load_lora_adapter_reads_language_model_layers(self):
+        with TemporaryDirectory() as tmpdir:
+            adapter_dir = Path(tmpdir)
+            (adapter_dir / "adapter_config.json").write_text(
+                '{"fine_tune_type": "lora", "lora_parameters": {"rank": 2, "scale": 4.0}}'
+            )
+            mx.save_safetensors(
+                str(adapter_dir / "adapters.safetensors"),
+                {
+                    "language_model.proj.lora_a": mx.ones((8, 2)),
+                    "language_model.proj.lora_b": mx.zeros((2, 8)),
+                },
+            )
+
+            layers, scale = load_lora_adapter(str(adapter_dir))
+
+            self.assertEqual(scale, 4.0)
+            self.assertEqual(list(layers), ["proj"])
+            self.assertEqual(layers["proj"][0].shape, (8, 2))
+
+            mx.save_safetensors(
+                str(adapter_dir / "adapters.safetensors"),
+                {"vision_tower.proj.lora_a": mx.ones((8, 2))},
+            )
+            with self.assertRaises(ValueError):
+                load_lora_adapter(str(adapter_dir))
+
+    def test_lora_adapter_set_applies_adapters_per_row(self):
+        class DummyLanguageModel(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.proj = nn.Linear(8, 8)
+
+            def __call__(self, x):
+                return self.proj(x)
+
+        model = DummyLanguageModel()
+        base = model.proj
+        a = (mx.random.normal((8, 2)), mx.random.normal((2, 8)))
+        b = (mx.random.normal((8, 4)), mx.random.normal((4, 8)))
+        adapters = LoRaAdapterSet(model)
+        adapters.add("a", {"proj": a}, 2.0)
+        adapters.add("b", {"proj": b}, 0.5)
+        self.assertIsInstance(model.proj, MultiLoRaLayer)
+
+        x = mx.random.normal((3, 5, 8))
+        adapters.select(["a", None, "b"])
+        out = model(x)
+
+        expected = [
+            base(x[0]) + 2.0 * (x[0] @ a[0]) @ a[1],
+            base(x[1]),
+            base(x[2]) + 0.5 * (x[2] @ b[0]) @ b[1],
+        ]
+        for row, ref in zip(out, expected):
+            self.assertTrue(mx.allclose(row, ref, atol=1e-4))
+
+        adapters.remove("a")
+        adapters.select([None, "b", "b"])
+        out = model(x)
+        self.assertTrue(mx.allclose(out[0], base(x[0]), atol=1e-4))
+        self.assertTrue(
+            mx.allclose(out[1], base(x[1]) + 0.5 * (x[1] @ b[0]) @ b[1], atol=1e-4)
+        )
+
+    def test_lora_adapter_set_touch_keeps_row_routing(self):
+        class DummyLanguageModel(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.proj = nn.Linear(8, 8)
+
+            def __call__(self, x):
+                return self.proj(x)
+
+        model = DummyLanguageModel()
+        base = model.proj
+        a = (mx.random.normal((8, 2)), mx.random.normal((2, 8)))
+        b = (mx.random.normal((8, 2)), mx.random.normal((2, 8)))
+        adapters = LoRaAdapterSet(model)
+        adapters.add("a", {"proj": a}, 1.0)
+        adapters.add("b", {"proj": b}, 1.0)
+
+        # Touching reorders the LRU list but must not move stacked slots.
+        adapters.touch("a")
+        self.assertEqual(adapters.least_recent(), "b")
+        x = mx.random.normal((2, 3, 8))
+        adapters.select(["a", "b"])
+        out = model(x)
+
+        self.assertTrue(
+            mx.allclose(out[0], base(x[0]) + (x[0] @ a[0]) @ a[1], atol=1e-4)
+        )
+        self.assertTrue(
+            mx.allclose(out[1], base(x[1]) + (x[1] @ b[0]) @ b[1], atol=1e-4)
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
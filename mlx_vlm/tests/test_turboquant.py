@@ -165,6 +165,20 @@ def test_batch_turboquant_filter_supports_uniform_single_item_offsets():
     assert cache.left_padding.tolist() == [0]
 
 
+def test_batch_turboquant_finalize_rolls_right_padding():
+    cache = BatchTurboQuantKVCache([0, 0], bits=3.5)
+    cache.prepare(right_padding=[0, 2], lengths=[4, 2])
+    cache.update_and_fetch(
+        mx.random.normal((2, 2, 4, 8)), mx.random.normal((2, 2, 4, 8))
+    )
+    before = cache.keys.norms[1, :, :2]
+    cache.finalize()
+
+    assert cache.offset.tolist() == [4, 2]
+    assert cache.left_padding.tolist() == [0, 2]
+    assert mx.array_equal(cache.keys.norms[1, :, 2:4], before).item()
+
+
 def test_batch_turboquant_extend_pads_shorter_uniform_batch():
     longer = BatchTurboQuantKVCache([0], bits=3.5)
     shorter = BatchTurboQuantKVCache([0], bits=3.5)
@@ -9,10 +9,12 @@ import mlx.nn as nn
 import pytest
 from mlx_lm.utils import quantize_model
 
+from mlx_vlm.image_fetch import set_image_fetcher
 from mlx_vlm.models.text_only import TextOnlyModel
 from mlx_vlm.utils import (
     StoppingCriteria,
     get_model_and_args,
+    group_inputs_by_shape,
     load,
     load_image,
     load_model,
@@ -315,6 +317,21 @@ def test_process_inputs_with_fallback():
         raise ImportError("MLX is not installed")
 
 
+def test_group_inputs_by_shape_groups_matching_arrays():
+    inputs = [
+        {"input_ids": mx.zeros((1, 4)), "pixel_values": mx.zeros((1, 3, 8, 8))},
+        {"input_ids": mx.zeros((1, 5)), "pixel_values": mx.zeros((1, 3, 8, 8))},
+        {"input_ids": mx.zeros((1, 4)), "pixel_values": mx.zeros((1, 3, 8, 8))},
+        {"input_ids": mx.zeros((1, 4)), "image_sizes": [[8, 8]]},
+    ]
+
+    grouped_inputs, grouped_indices = group_inputs_by_shape(inputs)
+
+    assert sorted(grouped_indices.values()) == [[0, 2], [1], [3]]
+    for key, indices in grouped_indices.items():
+        assert [id(x) for x in grouped_inputs[key]] == [id(inputs[i]) for i in indices]
+
+
 def test_stopping_criteria():
     class MockProcessor:
         def __init__(self):
@@ -573,13 +590,17 @@ class TestLoadImage:
         mock_response.__enter__.return_value = mock_response
         mock_response.__exit__.return_value = None
 
-        with patch("mlx_vlm.utils.requests.get", return_value=mock_response):
+        set_image_fetcher(None)
+        with patch(
+            "mlx_vlm.image_fetch.requests.Session.get", return_value=mock_response
+        ):
             img = load_image("https://example.com/image.png")
             assert img.mode == "RGB"
+        set_image_fetcher(None)
 
     def test_invalid_url_raises(self):
         with patch(
-            "mlx_vlm.utils.requests.get",
+            "mlx_vlm.image_fetch.requests.Session.get",
             side_effect=Exception("Connection error"),
         ):
             with pytest.raises(
@@ -1,7 +1,13 @@
+from types import SimpleNamespace
+
 import mlx.core as mx
 import pytest
 
-from mlx_vlm.vision_cache import VisionFeatureCache
+from mlx_vlm.vision_cache import (
+    DEFAULT_VISION_CACHE_BYTES,
+    VisionFeatureCache,
+    processor_fingerprint,
+)
 
 
 class TestVisionFeatureCache:
@@ -73,9 +79,118 @@ class TestVisionFeatureCache:
         result = cache.get("a.jpg")
         assert mx.array_equal(result, mx.ones((1, 10, 64)) * 5)
 
-    def test_default_max_size(self):
+    def test_default_budget_is_bytes(self):
+        cache = VisionFeatureCache()
+        assert cache.max_size is None
+        assert cache.max_bytes == DEFAULT_VISION_CACHE_BYTES
+
+    def test_byte_budget_eviction(self):
+        cache = VisionFeatureCache(max_bytes=2 * 10 * 64 * 4)
+        cache.put("a.jpg", mx.ones((1, 10, 64)))
+        cache.put("b.jpg", mx.ones((1, 10, 64)))
+        cache.put("big.jpg", mx.ones((1, 20, 64)))  # evicts a.jpg and b.jpg
+        assert "a.jpg" not in cache
+        assert "b.jpg" not in cache
+        assert cache.get("big.jpg") is not None
+        assert cache.nbytes == 20 * 64 * 4
+
+    def test_oversized_entry_is_not_cached(self):
+        cache = VisionFeatureCache(max_bytes=16)
+        cache.put("a.jpg", mx.ones((1, 10, 64)))
+        assert len(cache) == 0
+
+    def test_same_file_under_two_paths_shares_features(self, tmp_path):
+        first = tmp_path / "a.png"
+        second = tmp_path / "copy.png"
+        first.write_bytes(b"same-bytes")
+        second.write_bytes(b"same-bytes")
+        cache = VisionFeatureCache()
+        cache.put(str(first), mx.ones((1, 4)))
+        assert cache.get(str(second)) is not None
+
+    def test_edited_file_is_a_new_key(self, tmp_path):
+        path = tmp_path / "a.png"
+        path.write_bytes(b"before")
+        cache = VisionFeatureCache()
+        cache.put(str(path), mx.ones((1, 4)))
+        path.write_bytes(b"after!")
+        assert cache.get(str(path)) is None
+
+    def test_pil_images_key_by_pixels(self):
+        from PIL import Image
+
         cache = VisionFeatureCache()
-        assert cache.max_size == 20
+        cache.put(Image.new("RGB", (4, 4), "red"), mx.ones((1, 4)))
+        assert cache.get(Image.new("RGB", (4, 4), "red")) is not None
+        assert cache.get(Image.new("RGB", (4, 4), "blue")) is None
+
+    def test_pixel_arrays_key_by_contents(self):
+        cache = VisionFeatureCache()
+        cache.put(mx.zeros((4, 6)), mx.ones((2, 8)))
+        assert cache.get(mx.zeros((4, 6))) is not None
+        assert cache.get(mx.zeros((6, 4))) is None
+        assert cache.get(mx.ones((4, 6))) is None
+
+    def test_namespace_and_params_separate_entries(self):
+        cache = VisionFeatureCache(namespace="model-a")
+        cache.put("a.jpg", mx.ones((1, 4)), params={"resize_shape": (224, 224)})
+        assert cache.get("a.jpg") is None
+        assert cache.get("a.jpg", params={"resize_shape": (224, 224)}) is not None
+        cache.set_namespace("model-b")
+        assert cache.get("a.jpg", params={"resize_shape": (224, 224)}) is None
+
+    def test_disk_tier_survives_a_new_cache(self, tmp_path):
+        features = mx.arange(12, dtype=mx.float32).reshape(1, 3, 4)
+        cache = VisionFeatureCache(namespace="model-a", disk_dir=tmp_path)
+        cache.put("a.jpg", features)
+        cache.put("pair.jpg", (features, features + 1))
+        cache.flush()
+
+        reloaded = VisionFeatureCache(namespace="model-a", disk_dir=tmp_path)
+        assert mx.array_equal(reloaded.get("a.jpg"), features)
+        pair = reloaded.get("pair.jpg")
+        assert isinstance(pair, tuple) and mx.array_equal(pair[1], features + 1)
+        assert reloaded.disk_hits == 2
+        assert (
+            VisionFeatureCache(namespace="model-b", disk_dir=tmp_path).get("a.jpg")
+            is None
+        )
+
+    def test_nested_tuple_features_count_and_persist(self, tmp_path):
+        hidden = mx.ones((6, 8))
+        deepstack = [mx.zeros((6, 8)), mx.full((6, 8), 2.0)]
+        cache = VisionFeatureCache(disk_dir=tmp_path)
+        cache.put("a.jpg", (hidden, deepstack))
+        cache.flush()
+
+        assert cache.nbytes == 3 * 6 * 8 * 4
+        loaded = VisionFeatureCache(disk_dir=tmp_path).get("a.jpg")
+        assert isinstance(loaded, tuple) and isinstance(loaded[1], list)
+        assert mx.array_equal(loaded[0], hidden)
+        assert len(loaded[1]) == 2
+        assert mx.array_equal(loaded[1][1], deepstack[1])
+
+    def test_disk_budget_evicts_oldest(self, tmp_path):
+        cache = VisionFeatureCache(disk_dir=tmp_path, max_disk_bytes=600)
+        for name in ("a.jpg", "b.jpg", "c.jpg"):
+            cache.put(name, mx.ones((1, 64)))
+            cache.flush()
+        files = list(cache.disk_dir.glob("*.safetensors"))
+        assert 0 < len(files) < 3
+        assert "c.jpg" in cache
+
+    def test_processor_fingerprint_tracks_config(self):
+        class ImageProcessor:
+            def __init__(self, size):
+                self.size = size
+
+            def to_dict(self):
+                return {"size": self.size}
+
+        small = SimpleNamespace(image_processor=ImageProcessor(224))
+        large = SimpleNamespace(image_processor=ImageProcessor(448))
+        assert processor_fingerprint(small) == processor_fingerprint(small)
+        assert processor_fingerprint(small) != processor_fingerprint(large)
 
     def test_clear_releases_all(self):
         cache = VisionFeatureCache()
@@ -1,5 +1,10 @@
-from .datasets import PreferenceVisionDataset, VisionDataset
-from .lora import LoRaLayer, replace_lora_with_linear
+from .datasets import (
+    PreferenceVisionDataset,
+    PreprocessedDataset,
+    VisionDataset,
+    VisionFeatureDataset,
+)
+from .lora import LoRaAdapterSet, LoRaLayer, MultiLoRaLayer, replace_lora_with_linear
 from .orpo_trainer import ORPOTrainingArgs, save_adapter, train_orpo
 from .sft_trainer import TrainingArgs, save_adapter, train
 from .utils import (
@@ -8,6 +13,7 @@ from .utils import (
     count_parameters,
     find_all_linear_names,
     get_peft_model,
+    load_lora_adapter,
     not_supported_for_training,
     print_trainable_parameters,
 )
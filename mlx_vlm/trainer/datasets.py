@@ -1,13 +1,23 @@
+import hashlib
 import json
+import logging
+import os
+import threading
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import mlx.core as mx
+import numpy as np
 
 from ..models.base import to_mlx
 from ..prompt_utils import MODEL_CONFIG, apply_chat_template
 
 NATIVE_PREPROCESS_MODELS = set(MODEL_CONFIG.keys())
 
+logger = logging.getLogger(__name__)
+
 
 class VisionDataset:
     """Simplified dataset class for Vision LLMs"""
@@ -223,3 +233,300 @@ class PreferenceVisionDataset:
                 result[f"{key}_pixel_values"] = inputs["pixel_values"]
 
         return result
+
+
+def _token_length(item):
+    """Longest ``*input_ids`` sequence of a processed sample."""
+    return max(
+        int(np.prod(v.shape))
+        for k, v in item.items()
+        if k.endswith("input_ids") and v is not None
+    )
+
+
+def dataset_cache_key(dataset, fingerprint=None):
+    """Identify a processed dataset by its source data and preprocessing.
+
+    Combines the HF dataset fingerprint (or an explicit ``fingerprint``), the
+    dataset class, the image-token config, ``image_resize_shape`` and the
+    processor's image and tokenizer settings, so a change to any of them
+    builds a fresh cache.
+    """
+    from ..vision_cache import processor_fingerprint
+
+    if fingerprint is None:
+        fingerprint = getattr(dataset.dataset, "_fingerprint", None)
+    if fingerprint is None:
+        raise ValueError(
+            "Dataset has no fingerprint; pass `fingerprint=` to cache it on disk"
+        )
+    tokenizer = getattr(dataset.processor, "tokenizer", dataset.processor)
+    config = dataset.config
+    payload = json.dumps(
+        {
+            "dataset": fingerprint,
+            "kind": type(dataset).__name__,
+            "model_type": config.get("model_type"),
+            "image_token": config.get("image_token_index")
+            or config.get("image_token_id"),
+            "image_resize_shape": dataset.image_resize_shape,
+            "processor": processor_fingerprint(dataset.processor),
+            "tokenizer": getattr(tokenizer, "name_or_path", None),
+            "chat_template": getattr(dataset.processor, "chat_template", None)
+            or getattr(tokenizer, "chat_template", None),
+        },
+        sort_keys=True,
+        default=repr,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+class PreprocessedDataset:
+    """Serve processed samples from sharded safetensors files on disk.
+
+    The first use of a (dataset, preprocessing) pair runs ``process`` for
+    every sample and writes ``shard_size`` samples per safetensors file under
+    ``<cache_dir>/<dataset_cache_key>/``. Later epochs and later runs read
+    arrays back lazily with ``mx.load``, so no chat templating, image decode
+    or processor call is repeated. Shards are written atomically and a run
+    interrupted mid-build resumes from the last finished shard.
+
+    Also exposes ``lengths()`` so bucketed batching needs no extra pass over
+    the data.
+    """
+
+    SUFFIX = ".safetensors"
+
+    def __init__(
+        self,
+        dataset,
+        cache_dir,
+        fingerprint=None,
+        shard_size=256,
+        num_workers=0,
+        max_open_shards=8,
+    ):
+        self.source = dataset
+        self.shard_size = shard_size
+        self.max_open_shards = max_open_shards
+        self.cache_dir = Path(cache_dir) / dataset_cache_key(dataset, fingerprint)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        if self._index is None:
+            self._index = self._build(num_workers)
+
+    def __len__(self):
+        return self._index["num_samples"]
+
+    def lengths(self):
+        return list(self._index["lengths"])
+
+    def _shard_path(self, shard):
+        return self.cache_dir / f"shard_{shard:05d}{self.SUFFIX}"
+
+    def _load_index(self):
+        path = self.cache_dir / "index.json"
+        if not path.exists():
+            return None
+        index = json.loads(path.read_text())
+        if index.get("shard_size") != self.shard_size:
+            return None
+        return index
+
+    def _build(self, num_workers):
+        num_samples = len(self.source)
+        num_shards = (num_samples + self.shard_size - 1) // self.shard_size
+        lengths = []
+        logger.info(
+            "Preprocessing %d samples into %s", num_samples, str(self.cache_dir)
+        )
+        executor = (
+            ThreadPoolExecutor(max_workers=num_workers) if num_workers > 0 else None
+        )
+        try:
+            for shard in range(num_shards):
+                indices = range(
+                    shard * self.shard_size,
+                    min((shard + 1) * self.shard_size, num_samples),
+                )
+                path = self._shard_path(shard)
+                if path.exists():
+                    # Left by an interrupted build with the same settings.
+                    _, metadata = mx.load(str(path), return_metadata=True)
+                    if int(metadata["count"]) == len(indices):
+                        lengths.extend(json.loads(metadata["lengths"]))
+                        continue
+                fetch = self.source.__getitem__
+                items = list(
+                    executor.map(fetch, indices) if executor else map(fetch, indices)
+                )
+                lengths.extend(self._write_shard(path, items))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        index = {
+            "num_samples": num_samples,
+            "shard_size": self.shard_size,
+            "lengths": lengths,
+        }
+        tmp = self.cache_dir / "index.json.tmp"
+        tmp.write_text(json.dumps(index))
+        os.replace(tmp, self.cache_dir / "index.json")
+        return index
+
+    def _write_shard(self, path, items):
+        arrays = {}
+        samples = []
+        lengths = []
+        for i, item in enumerate(items):
+            names, values = [], {}
+            for key, value in item.items():
+                if isinstance(value, np.ndarray):
+                    value = mx.array(value)
+                if isinstance(value, mx.array):
+                    arrays[f"{i}.{key}"] = value
+                    names.append(key)
+                else:
+                    values[key] = value
+            samples.append({"arrays": names, "values": values})
+            lengths.append(_token_length(item))
+
+        tmp = path.with_name(path.stem + ".tmp" + self.SUFFIX)
+        mx.save_safetensors(
+            str(tmp),
+            arrays,
+            metadata={
+                "count": str(len(items)),
+                "samples": json.dumps(samples),
+                "lengths": json.dumps(lengths),
+            },
+        )
+        os.replace(tmp, path)
+        return lengths
+
+    def _open_shard(self, shard):
+        with self._lock:
+            entry = self._shards.get(shard)
+            if entry is not None:
+                self._shards.move_to_end(shard)
+                return entry
+        arrays, metadata = mx.load(str(self._shard_path(shard)), return_metadata=True)
+        entry = (arrays, json.loads(metadata["samples"]))
+        with self._lock:
+            self._shards[shard] = entry
+            while len(self._shards) > self.max_open_shards:
+                self._shards.popitem(last=False)
+        return entry
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= len(self):
+            raise IndexError(idx)
+        shard, offset = divmod(idx, self.shard_size)
+        arrays, samples = self._open_shard(shard)
+        sample = samples[offset]
+        item = dict(sample["values"])
+        for key in sample["arrays"]:
+            item[key] = arrays[f"{offset}.{key}"]
+        return item
+
+
+class VisionFeatureDataset:
+    """Attach precomputed image features to every sample of a dataset.
+
+    For LoRA runs with a frozen vision tower and projector, each image's
+    projected features (the tensors ``VisionFeatureCache`` holds at
+    inference) are computed once up front and served as
+    ``cached_image_features``, so training steps skip the vision forward
+    entirely. Features are keyed by pixel content, so an image shared by
+    several samples is encoded once, and a ``VisionFeatureCache`` with
+    ``disk_dir`` set keeps them across runs. Samples whose features are not
+    in the cache fall back to the regular vision forward.
+
+    Args:
+        dataset: A ``VisionDataset`` or compatible dataset.
+        model: The model whose ``encode_packed_images`` (or
+            ``encode_image``) produces the features.
+        cache: The ``VisionFeatureCache`` to fill and read from.
+        batch_size: Samples encoded per vision forward while precomputing.
+    """
+
+    def __init__(self, dataset, model, cache, batch_size=8):
+        from .utils import trainable_vision_parameters
+
+        if not (
+            hasattr(model, "encode_packed_images") or hasattr(model, "encode_image")
+        ):
+            raise ValueError(
+                f"{type(model).__module__} cannot encode images on their own; "
+                "vision feature caching is not supported for this model"
+            )
+        trainable = trainable_vision_parameters(model)
+        if trainable:
+            raise ValueError(
+                "Vision feature caching requires a frozen vision tower, but "
+                f"{trainable[0]} (and {len(trainable) - 1} more) are trainable"
+            )
+        self.source = dataset
+        self.cache = cache
+        if hasattr(dataset, "lengths"):
+            self.lengths = dataset.lengths
+        self._precompute(model, batch_size)
+
+    def __len__(self):
+        return len(self.source)
+
+    @staticmethod
+    def _params(item):
+        grid = item.get("image_grid_thw")
+        return {"image_grid_thw": grid.tolist()} if grid is not None else None
+
+    @staticmethod
+    def _encode(model, items):
+        if hasattr(model, "encode_packed_images"):
+            return model.encode_packed_images(items)
+        return [model.encode_image(item["pixel_values"]) for item in items]
+
+    def _precompute(self, model, batch_size):
+        evictions = self.cache.evictions
+        pending = []
+        for idx in range(len(self.source)):
+            item = self.source[idx]
+            pixel_values = item.get("pixel_values")
+            if pixel_values is None:
+                continue
+            if self.cache.get(pixel_values, self._params(item)) is None:
+                pending.append(item)
+            if len(pending) >= batch_size:
+                self._store(model, pending)
+                pending = []
+        if pending:
+            self._store(model, pending)
+        self.cache.flush()
+        evicted = self.cache.evictions - evictions
+        if evicted and self.cache.disk_dir is None:
+            logger.warning(
+                "Vision feature cache evicted %d precomputed entries over its "
+                "%d-byte budget; those images are re-encoded every step. Raise "
+                "max_bytes or set disk_dir to keep them.",
+                evicted,
+                self.cache.max_bytes,
+            )
+
+    def _store(self, model, items):
+        features = self._encode(model, items)
+        mx.eval(features)
+        for item, feature in zip(items, features):
+            self.cache.put(item["pixel_values"], feature, self._params(item))
+
+    def __getitem__(self, idx):
+        item = self.source[idx]
+        pixel_values = item.get("pixel_values")
+        if pixel_values is None:
+            return item
+        features = self.cache.get(pixel_values, self._params(item))
+        if features is None:
+            return item
+        return {**item, "cached_image_features": features}
@@ -0,0 +1,133 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import mlx.core as mx
+import numpy as np
+
+
+def _rank_and_size(batch_size):
+    offset, step = mx.distributed.init().rank(), mx.distributed.init().size()
+    if batch_size % step != 0:
+        raise ValueError("Batch size must be divisible by number of workers")
+    return offset, step
+
+
+def batch_index_groups(dataset, batch_size, indices=None):
+    """Split dataset indices into this rank's per-batch index lists.
+
+    ``indices`` fixes the order batches are cut from (e.g. sorted by length
+    for bucketing); it defaults to dataset order.
+    """
+    if len(dataset) < batch_size:
+        raise ValueError(f"Dataset must have at least {batch_size} examples")
+    if indices is None:
+        indices = list(range(len(dataset)))
+
+    offset, step = _rank_and_size(batch_size)
+    return [
+        indices[i + offset : i + offset + batch_size : step]
+        for i in range(0, len(indices) - batch_size + 1, batch_size)
+    ]
+
+
+def bucket_index_groups(lengths, batch_size):
+    """Batch samples of similar length together to minimise padding."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return batch_index_groups(lengths, batch_size, order)
+
+
+def sample_lengths(dataset, length_of):
+    """Token length of every sample, without preprocessing the dataset.
+
+    Lengths come from ``dataset.lengths()`` (``PreprocessedDataset`` records
+    them while building its shards). In-memory lists of processed samples
+    are measured with ``length_of``. Any other dataset would need a full
+    preprocessing pass just to sort it, so it is rejected.
+    """
+    if hasattr(dataset, "lengths"):
+        return list(dataset.lengths())
+    if isinstance(dataset, (list, tuple)):
+        return [length_of(item) for item in dataset]
+    raise ValueError(
+        "Bucketed batching needs sample lengths up front; wrap the dataset in "
+        "a PreprocessedDataset (--preprocessed-cache-dir) to use it"
+    )
+
+
+def to_device(batch):
+    """Wrap the host-side numpy arrays of a collated batch as ``mx.array``."""
+    if isinstance(batch, dict):
+        return {k: to_device(v) for k, v in batch.items()}
+    if isinstance(batch, np.ndarray):
+        return mx.array(batch)
+    return batch
+
+
+class BatchLoader:
+    """Build collated batches ahead of the training step.
+
+    Each batch is produced by ``collate([dataset[i] for i in group])``. With
+    ``num_workers > 0`` that work (chat templating, image decode, processor
+    calls) runs on a thread pool with up to ``prefetch`` batches in flight,
+    so the step loop only waits when preprocessing is slower than compute.
+    Batches are always yielded in the order they were scheduled, and the
+    epoch order comes from ``seed`` when one is given, so runs are
+    reproducible regardless of the worker count.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        batch_indices,
+        collate,
+        train=False,
+        num_workers=0,
+        prefetch=2,
+        seed=None,
+    ):
+        self.dataset = dataset
+        self.batch_indices = batch_indices
+        self.collate = collate
+        self.train = train
+        self.num_workers = max(0, int(num_workers))
+        self.prefetch = max(1, int(prefetch))
+        self._rng = np.random.default_rng(seed) if seed is not None else np.random
+
+    def _order(self):
+        while True:
+            if self.train:
+                yield from self._rng.permutation(len(self.batch_indices))
+            else:
+                yield from range(len(self.batch_indices))
+                return
+
+    def _load(self, b):
+        items = [self.dataset[idx] for idx in self.batch_indices[b]]
+        return self.collate(items)
+
+    def __iter__(self):
+        if self.num_workers == 0:
+            for b in self._order():
+                yield to_device(self._load(b))
+            return
+
+        order = self._order()
+        pending = deque()
+        executor = ThreadPoolExecutor(
+            max_workers=self.num_workers, thread_name_prefix="mlx-vlm-loader"
+        )
+        try:
+            for b in order:
+                pending.append(executor.submit(self._load, b))
+                if len(pending) >= self.prefetch:
+                    break
+            while pending:
+                batch = pending.popleft().result()
+                next_b = next(order, None)
+                if next_b is not None:
+                    pending.append(executor.submit(self._load, next_b))
+                yield to_device(batch)
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,10 @@
 import math
-from typing import Union
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import mlx.core as mx
 import mlx.nn as nn
+from mlx.utils import tree_unflatten
 
 
 class LoRaLayer(nn.Module):
@@ -39,6 +41,157 @@ class LoRaLayer(nn.Module):
         return y + (self.scale * lora_update).astype(x.dtype)
 
 
+class MultiLoRaLayer(nn.Module):
+    """A linear layer carrying several LoRA adapters selected per batch row.
+
+    Adapter weights are stacked along a leading slot axis (slot 0 is the
+    all-zero "no adapter" slot) and applied with a gathered matmul, so rows
+    using different adapters share one forward pass over the base weights.
+    The row-to-slot assignment comes from the owning :class:`LoRaAdapterSet`.
+    """
+
+    def __init__(
+        self,
+        linear: Union[nn.Linear, nn.QuantizedLinear],
+        adapter_set: "LoRaAdapterSet",
+    ):
+        super().__init__()
+
+        self.original_layer = linear
+        self._adapter_set = adapter_set
+        self._A = None
+        self._B = None
+        self._scales = None
+
+    def _dtype(self):
+        if isinstance(self.original_layer, nn.QuantizedLinear):
+            return self.original_layer.scales.dtype
+        return self.original_layer.weight.dtype
+
+    def set_slots(self, slots: Sequence[Optional[Tuple[mx.array, mx.array, float]]]):
+        """Stack ``(A, B, scale)`` per slot; ``None`` leaves a slot empty."""
+        present = [s for s in slots if s is not None]
+        if not present:
+            self._A = self._B = self._scales = None
+            return
+        input_dims = present[0][0].shape[0]
+        output_dims = present[0][1].shape[1]
+        rank = max(a.shape[1] for a, _, _ in present)
+        dtype = self._dtype()
+        A, B, scales = [], [], []
+        for slot in [None, *slots]:
+            if slot is None:
+                A.append(mx.zeros((input_dims, rank), dtype=dtype))
+                B.append(mx.zeros((rank, output_dims), dtype=dtype))
+                scales.append(0.0)
+                continue
+            a, b, scale = slot
+            pad = rank - a.shape[1]
+            A.append(mx.pad(a.astype(dtype), [(0, 0), (0, pad)]))
+            B.append(mx.pad(b.astype(dtype), [(0, pad), (0, 0)]))
+            scales.append(scale)
+        self._A = mx.stack(A)
+        self._B = mx.stack(B)
+        self._scales = mx.array(scales, dtype=dtype)
+
+    def __call__(self, x):
+        y = self.original_layer(x)
+        ids = self._adapter_set.row_ids
+        if ids is None or self._A is None:
+            return y
+        if x.shape[0] != ids.shape[0]:
+            if ids.size and (ids == ids[0]).all().item():
+                ids = mx.broadcast_to(ids[:1], (x.shape[0],))
+            else:
+                raise ValueError(
+                    f"LoRA rows ({ids.shape[0]}) do not match the batch ({x.shape[0]})."
+                )
+        x_lora = x.astype(self._A.dtype)
+        h = mx.gather_mm(x_lora, self._A, rhs_indices=ids)
+        lora_update = mx.gather_mm(h, self._B, rhs_indices=ids)
+        scale = self._scales[ids].reshape((-1,) + (1,) * (x.ndim - 1))
+        return y + (scale * lora_update).astype(x.dtype)
+
+
+class LoRaAdapterSet:
+    """Named LoRA adapters kept resident over one base model.
+
+    ``add`` wraps each targeted linear layer in a :class:`MultiLoRaLayer`
+    (once) and stacks the adapter's weights into it; ``select`` assigns an
+    adapter to every row of the next forward pass. The base weights are
+    shared, so each extra adapter only costs its low-rank matrices.
+    """
+
+    def __init__(self, model: nn.Module):
+        self.model = model
+        self.row_ids: Optional[mx.array] = None
+        self._adapters: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        self._layers: Dict[str, MultiLoRaLayer] = {}
+        # Stacked slot of each adapter, fixed at the last rebuild; the order
+        # of ``_adapters`` is LRU order and changes on ``touch``.
+        self._slots: Dict[str, int] = {}
+
+    def __contains__(self, name) -> bool:
+        return name in self._adapters
+
+    def __len__(self) -> int:
+        return len(self._adapters)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._adapters)
+
+    def add(
+        self, name: str, layers: Dict[str, Tuple[mx.array, mx.array]], scale: float
+    ):
+        """Register adapter ``name`` given ``{module_path: (A, B)}`` weights."""
+        modules = dict(self.model.named_modules())
+        for path in layers:
+            if path in self._layers:
+                continue
+            module = modules.get(path)
+            if not isinstance(module, (nn.Linear, nn.QuantizedLinear)):
+                raise ValueError(f"Can't attach a LoRA adapter to {path!r}")
+            wrapped = MultiLoRaLayer(module, self)
+            self.model.update_modules(tree_unflatten([(path, wrapped)]))
+            self._layers[path] = wrapped
+        self._adapters[name] = (layers, scale)
+        self._rebuild()
+
+    def remove(self, name: str) -> bool:
+        if self._adapters.pop(name, None) is None:
+            return False
+        self._rebuild()
+        return True
+
+    def touch(self, name: str):
+        """Mark ``name`` as most recently used."""
+        self._adapters.move_to_end(name)
+
+    def least_recent(self, exclude=()) -> Optional[str]:
+        return next((n for n in self._adapters if n not in exclude), None)
+
+    def select(self, names: Sequence[Optional[str]]):
+        """Route the rows of the next forward pass to ``names`` (``None`` = base)."""
+        if not any(names):
+            self.row_ids = None
+            return
+        self.row_ids = mx.array(
+            [self._slots[name] if name else 0 for name in names], dtype=mx.uint32
+        )
+
+    def _rebuild(self):
+        self.row_ids = None
+        self._slots = {name: i + 1 for i, name in enumerate(self._adapters)}
+        for path, layer in self._layers.items():
+            layer.set_slots(
+                [
+                    (*weights[path], scale) if path in weights else None
+                    for weights, scale in self._adapters.values()
+                ]
+            )
+
+
 def replace_lora_with_linear(model):
     for i, layer in enumerate(model.layers):
         if isinstance(layer, LoRaLayer):
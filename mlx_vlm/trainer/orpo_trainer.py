@@ -12,7 +12,13 @@ from mlx.nn.utils import average_gradients
 from mlx.utils import tree_map
 from tqdm import tqdm
 
-from .sft_trainer import TrainingArgs, _collate_arrays, _squeeze_leading_batch_dim
+from .loader import BatchLoader, batch_index_groups, bucket_index_groups, sample_lengths
+from .sft_trainer import (
+    TrainingArgs,
+    _collate_arrays,
+    _flat_seq_len,
+    _squeeze_leading_batch_dim,
+)
 from .utils import Colors, grad_checkpoint, save_adapter
 
 
@@ -172,8 +178,8 @@ def _pad_and_collate(items, prefix, max_seq_length):
         )
 
     result = {
-        "input_ids": mx.array(input_ids_batch),
-        "attention_mask": mx.array(attention_mask_batch),
+        "input_ids": input_ids_batch,
+        "attention_mask": attention_mask_batch,
         "pixel_values": pixel_values_batch,
     }
 
@@ -192,38 +198,49 @@ def _pad_and_collate(items, prefix, max_seq_length):
     return result
 
 
-def iterate_batches(dataset, batch_size, max_seq_length, train=False):
-    indices = list(range(len(dataset)))
-    if len(dataset) < batch_size:
-        raise ValueError(f"Dataset must have at least {batch_size} examples")
-
-    offset, step = mx.distributed.init().rank(), mx.distributed.init().size()
-    if batch_size % step != 0:
-        raise ValueError("Batch size must be divisible by number of workers")
+def _collate_preference_batch(items, max_seq_length):
+    return {
+        "chosen": _pad_and_collate(items, "chosen", max_seq_length),
+        "rejected": _pad_and_collate(items, "rejected", max_seq_length),
+    }
 
-    batch_indices = [
-        indices[i + offset : i + offset + batch_size : step]
-        for i in range(0, len(indices) - batch_size + 1, batch_size)
-    ]
 
-    while True:
-        order = (
-            np.random.permutation(len(batch_indices))
-            if train
-            else range(len(batch_indices))
+def iterate_batches(
+    dataset,
+    batch_size,
+    max_seq_length,
+    train=False,
+    num_workers=0,
+    prefetch=2,
+    seed=None,
+    batching="shuffle",
+):
+    if batching == "shuffle":
+        groups = batch_index_groups(dataset, batch_size)
+    elif batching == "bucket":
+        lengths = sample_lengths(
+            dataset,
+            lambda x: max(
+                _flat_seq_len(x["chosen_input_ids"]),
+                _flat_seq_len(x["rejected_input_ids"]),
+            ),
+        )
+        groups = bucket_index_groups(lengths, batch_size)
+    else:
+        raise ValueError(
+            f"ORPO training supports 'shuffle' or 'bucket' batching, not {batching!r}"
         )
-        for b in order:
-            items = [dataset[idx] for idx in batch_indices[b]]
-
-            chosen_batch = _pad_and_collate(items, "chosen", max_seq_length)
-            rejected_batch = _pad_and_collate(items, "rejected", max_seq_length)
 
-            yield {
-                "chosen": chosen_batch,
-                "rejected": rejected_batch,
-            }
-        if not train:
-            break
+    loader = BatchLoader(
+        dataset,
+        groups,
+        partial(_collate_preference_batch, max_seq_length=max_seq_length),
+        train=train,
+        num_workers=num_workers,
+        prefetch=prefetch,
+        seed=seed,
+    )
+    yield from loader
 
 
 def evaluate_orpo(
@@ -235,6 +252,7 @@ def evaluate_orpo(
     loss_fn=orpo_loss,
     train_on_completions=False,
     assistant_id=77091,
+    num_workers=0,
 ):
     """
     Evaluate the model on validation dataset.
@@ -252,6 +270,7 @@ def evaluate_orpo(
                 dataset=dataset,
                 batch_size=batch_size,
                 max_seq_length=max_seq_length,
+                num_workers=num_workers,
             ),
         ),
         desc="Calculating loss...",
@@ -394,6 +413,10 @@ def train_orpo(
             batch_size=args.batch_size,
             max_seq_length=args.max_seq_length,
             train=True,
+            num_workers=args.num_workers,
+            prefetch=args.prefetch_batches,
+            seed=args.seed,
+            batching=args.batching,
         ),
     ):
         chosen_batch = batch["chosen"]
@@ -414,6 +437,7 @@ def train_orpo(
                 loss_fn=loss_fn,
                 train_on_completions=train_on_completions,
                 assistant_id=assistant_id,
+                num_workers=args.num_workers,
             )
             model.train()
             val_time = time.perf_counter() - tic_val
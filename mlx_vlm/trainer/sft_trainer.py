@@ -4,6 +4,7 @@ import time
 from dataclasses import dataclass, field
 from functools import partial
 from pathlib import Path
+from typing import Optional
 
 import mlx.core as mx
 import mlx.nn as nn
@@ -12,6 +13,7 @@ from mlx.nn.utils import average_gradients
 from mlx.utils import tree_map
 from tqdm import tqdm
 
+from .loader import BatchLoader, batch_index_groups, bucket_index_groups, sample_lengths
 from .utils import Colors, grad_checkpoint, save_adapter
 
 
@@ -103,6 +105,24 @@ class TrainingArgs:
         default=1,
         metadata={"help": "Number of steps to accumulate gradients before updating."},
     )
+    num_workers: int = field(
+        default=2,
+        metadata={"help": "Threads preprocessing batches ahead of the step loop."},
+    )
+    prefetch_batches: int = field(
+        default=4,
+        metadata={"help": "Maximum number of batches prepared ahead of training."},
+    )
+    seed: Optional[int] = field(
+        default=None,
+        metadata={"help": "Seed for the batch order; None uses numpy's global RNG."},
+    )
+    batching: str = field(
+        default="shuffle",
+        metadata={
+            "help": "How samples form batches: 'shuffle' or 'bucket' (by length)."
+        },
+    )
 
 
 def vision_language_loss_fn(
@@ -181,85 +201,123 @@ def vision_language_loss_fn(
     return (ce * length_mask).sum() / length_mask.sum()
 
 
-def iterate_batches(dataset, batch_size, max_seq_length, train=False):
-    indices = list(range(len(dataset)))
-    if len(dataset) < batch_size:
-        raise ValueError(f"Dataset must have at least {batch_size} examples")
+def _concatenate_features(features):
+    """Concatenate per-sample vision features leaf by leaf.
+
+    Features are arrays or (nested) tuples/lists of arrays, e.g. Qwen3-VL's
+    ``(hidden, [deepstack...])``; the nesting of the first sample is kept.
+    """
+    first = features[0]
+    if isinstance(first, (tuple, list)):
+        leaves = [
+            _concatenate_features([f[i] for f in features]) for i in range(len(first))
+        ]
+        return type(first)(leaves)
+    return mx.concatenate(features, axis=0)
+
+
+_COLLATED_KEYS = (
+    "input_ids",
+    "attention_mask",
+    "pixel_values",
+    "cached_image_features",
+)
+
+
+def _collate_batch(items, max_seq_length):
+    """Pad token rows into host-side numpy arrays and collate the features."""
+    lengths = [min(_flat_seq_len(x["input_ids"]), max_seq_length) for x in items]
+
+    max_len = min(max(lengths), max_seq_length)
+    pad_to = 32
+    padded_len = 1 + pad_to * ((max_len + pad_to - 1) // pad_to)
+    padded_len = min(padded_len, max_seq_length)
+
+    input_ids_batch = np.zeros((len(items), padded_len), dtype=np.int32)
+    attention_mask_batch = np.zeros((len(items), padded_len), dtype=np.int32)
+
+    for i, item in enumerate(items):
+        arr = np.array(_squeeze_leading_batch_dim(item["input_ids"])).reshape(-1)
+        L = min(len(arr), padded_len)
+        input_ids_batch[i, :L] = arr[:L]
+
+        if "attention_mask" in item:
+            mask = np.array(_squeeze_leading_batch_dim(item["attention_mask"])).reshape(
+                -1
+            )
+            attention_mask_batch[i, :L] = mask[:L]
+        else:
+            attention_mask_batch[i, :L] = 1
 
-    offset, step = mx.distributed.init().rank(), mx.distributed.init().size()
-    if batch_size % step != 0:
-        raise ValueError("Batch size must be divisible by number of workers")
+    pixel_values_batch = None
+    if "pixel_values" in items[0] and items[0]["pixel_values"] is not None:
+        pixel_values_batch = _collate_arrays(
+            [_squeeze_leading_batch_dim(item["pixel_values"]) for item in items]
+        )
 
-    batch_indices = [
-        indices[i + offset : i + offset + batch_size : step]
-        for i in range(0, len(indices) - batch_size + 1, batch_size)
-    ]
+    batch = {
+        "input_ids": input_ids_batch,
+        "attention_mask": attention_mask_batch,
+        "pixel_values": pixel_values_batch,
+    }
 
-    while True:
-        order = (
-            np.random.permutation(len(batch_indices))
-            if train
-            else range(len(batch_indices))
+    features = [item.get("cached_image_features") for item in items]
+    if all(f is not None for f in features):
+        # Per-sample features concatenate in the layout the vision tower
+        # would produce for the whole batch; with any missing, it runs.
+        batch["cached_image_features"] = _concatenate_features(features)
+
+    extra_keys = [k for k in items[0] if k not in _COLLATED_KEYS]
+    for k in extra_keys:
+        vals = [_squeeze_leading_batch_dim(item[k]) for item in items]
+        if isinstance(vals[0], mx.array):
+            try:
+                batch[k] = _collate_arrays(vals)
+            except Exception:
+                batch[k] = vals[0]
+        else:
+            batch[k] = vals[0]
+
+    return batch
+
+
+def iterate_batches(
+    dataset,
+    batch_size,
+    max_seq_length,
+    train=False,
+    num_workers=0,
+    prefetch=2,
+    seed=None,
+    batching="shuffle",
+):
+    """Yield padded batches, optionally prefetched on ``num_workers`` threads.
+
+    ``batching`` selects how samples are grouped: ``"shuffle"`` cuts batches
+    in dataset order and ``"bucket"`` groups samples of similar length.
+    Batch order is shuffled each epoch when ``train``.
+    """
+    collate = partial(_collate_batch, max_seq_length=max_seq_length)
+    if batching == "shuffle":
+        groups = batch_index_groups(dataset, batch_size)
+    elif batching == "bucket":
+        lengths = sample_lengths(dataset, lambda x: _flat_seq_len(x["input_ids"]))
+        groups = bucket_index_groups(lengths, batch_size)
+    else:
+        raise ValueError(
+            f"Unknown batching mode {batching!r}; expected 'shuffle' or 'bucket'"
         )
-        for b in order:
-            items = [dataset[idx] for idx in batch_indices[b]]
-            lengths = [
-                min(_flat_seq_len(x["input_ids"]), max_seq_length) for x in items
-            ]
-
-            max_len = min(max(lengths), max_seq_length)
-            pad_to = 32
-            padded_len = 1 + pad_to * ((max_len + pad_to - 1) // pad_to)
-            padded_len = min(padded_len, max_seq_length)
-
-            input_ids_batch = np.zeros((len(items), padded_len), dtype=np.int32)
-            attention_mask_batch = np.zeros((len(items), padded_len), dtype=np.int32)
-
-            for i, item in enumerate(items):
-                arr = np.array(_squeeze_leading_batch_dim(item["input_ids"])).reshape(
-                    -1
-                )
-                L = min(len(arr), padded_len)
-                input_ids_batch[i, :L] = arr[:L]
-
-                if "attention_mask" in item:
-                    mask = np.array(
-                        _squeeze_leading_batch_dim(item["attention_mask"])
-                    ).reshape(-1)
-                    attention_mask_batch[i, :L] = mask[:L]
-                else:
-                    attention_mask_batch[i, :L] = 1
-
-            pixel_values_batch = None
-            if "pixel_values" in items[0] and items[0]["pixel_values"] is not None:
-                pixel_values_batch = _collate_arrays(
-                    [_squeeze_leading_batch_dim(item["pixel_values"]) for item in items]
-                )
 
-            batch = {
-                "input_ids": mx.array(input_ids_batch),
-                "attention_mask": mx.array(attention_mask_batch),
-                "pixel_values": pixel_values_batch,
-            }
-
-            extra_keys = [
-                k
-                for k in items[0]
-                if k not in ("input_ids", "attention_mask", "pixel_values")
-            ]
-            for k in extra_keys:
-                vals = [_squeeze_leading_batch_dim(item[k]) for item in items]
-                if isinstance(vals[0], mx.array):
-                    try:
-                        batch[k] = _collate_arrays(vals)
-                    except Exception:
-                        batch[k] = vals[0]
-                else:
-                    batch[k] = vals[0]
-
-            yield batch
-        if not train:
-            break
+    loader = BatchLoader(
+        dataset,
+        groups,
+        collate,
+        train=train,
+        num_workers=num_workers,
+        prefetch=prefetch,
+        seed=seed,
+    )
+    yield from loader
 
 
 def evaluate(
@@ -271,6 +329,7 @@ def evaluate(
     loss_fn=vision_language_loss_fn,
     train_on_completions=False,
     assistant_id=77091,
+    num_workers=0,
 ):
     """
     Evaluate the model on validation dataset.
@@ -291,6 +350,7 @@ def evaluate(
                 dataset=dataset,
                 batch_size=batch_size,
                 max_seq_length=max_seq_length,
+                num_workers=num_workers,
             ),
         ),
         desc="Calculating loss...",
@@ -420,6 +480,10 @@ def train(
             batch_size=args.batch_size,
             max_seq_length=args.max_seq_length,
             train=True,
+            num_workers=args.num_workers,
+            prefetch=args.prefetch_batches,
+            seed=args.seed,
+            batching=args.batching,
         ),
     ):
         tic = time.perf_counter()
@@ -438,6 +502,7 @@ def train(
                 loss_fn=loss_fn_partial,
                 train_on_completions=train_on_completions,
                 assistant_id=assistant_id,
+                num_workers=args.num_workers,
             )
             model.train()
             val_time = time.perf_counter() - tic_val
@@ -348,6 +348,56 @@ def apply_lora_layers(model: nn.Module, adapter_path: str) -> nn.Module:
     return model
 
 
+_LORA_WEIGHT_SUFFIXES = {"lora_a": 0, "lora_b": 1, "A": 0, "B": 1}
+
+
+def load_lora_adapter(adapter_path: str, prefix: str = "language_model."):
+    """
+    Read a LoRA adapter without applying it to a model.
+
+    Args:
+        adapter_path (str): Directory with ``adapter_config.json`` and
+            ``adapters.safetensors``.
+        prefix (str): Module prefix the adapter must target; it is stripped
+            from the returned paths.
+
+    Returns:
+        Tuple[dict, float]: ``{module_path: (A, B)}`` and the LoRA scale.
+    """
+    adapter_path = Path(adapter_path)
+
+    if not adapter_path.exists():
+        raise FileNotFoundError(f"The adapter path does not exist: {adapter_path}")
+
+    with open(adapter_path / "adapter_config.json", "r") as f:
+        config = json.load(f)
+
+    if "lora_parameters" in config:
+        if config.get("fine_tune_type", "lora") != "lora":
+            raise ValueError(
+                f"Only LoRA adapters can be hot-swapped, got {config['fine_tune_type']!r}"
+            )
+        scale = config["lora_parameters"]["scale"]
+    elif "rank" in config:
+        scale = _lora_scale(config.get("alpha", 0.1), config["rank"])
+    else:
+        raise ValueError("The adapter does not have lora params in the config")
+
+    layers = {}
+    weights = mx.load(str(adapter_path / "adapters.safetensors"))
+    for key, value in weights.items():
+        path, _, suffix = key.rpartition(".")
+        if suffix not in _LORA_WEIGHT_SUFFIXES or not path.startswith(prefix):
+            raise ValueError(f"Adapter weight {key!r} can't be hot-swapped")
+        pair = layers.setdefault(path[len(prefix) :], [None, None])
+        pair[_LORA_WEIGHT_SUFFIXES[suffix]] = value
+    incomplete = [path for path, pair in layers.items() if any(w is None for w in pair)]
+    if incomplete:
+        raise ValueError(f"Adapter is missing LoRA weights for {incomplete[0]!r}")
+
+    return {path: tuple(pair) for path, pair in layers.items()}, scale
+
+
 def unfreeze_modules(model: nn.Module, module_names):
     """Unfreeze modules whose qualified names match any of the given patterns.
 
@@ -369,6 +419,27 @@ def unfreeze_modules(model: nn.Module, module_names):
         )
 
 
+VISION_MODULES = (
+    "vision_model",
+    "vision_tower",
+    "mm_projector",
+    "multi_modal_projector",
+    "aligner",
+    "connector",
+    "vision_resampler",
+    "embed_vision",
+)
+
+
+def trainable_vision_parameters(model: nn.Module):
+    """Names of trainable parameters in the vision tower or its projector."""
+    return [
+        name
+        for name, _ in tree_flatten(model.trainable_parameters())
+        if name.split(".")[0] in VISION_MODULES
+    ]
+
+
 def save_adapter(model: nn.Module, adapter_file: Union[str, Path]):
     """Save adapter weights and config."""
     path = Path(adapter_file)
@@ -6,7 +6,7 @@ from typing import NamedTuple, Optional
 
 import mlx.core as mx
 import numpy as np
-from mlx_lm.models.cache import _BaseCache, create_attention_mask
+from mlx_lm.models.cache import _BaseCache, create_attention_mask, dynamic_roll
 
 DEFAULT_TURBOQUANT_SEED = 0
 _EPS = 1e-6
@@ -6075,6 +6075,7 @@ class BatchTurboQuantKVCache(_BaseCache):
         self.left_padding = mx.array(left_padding)
         self.offset = mx.array([-lp for lp in left_padding])
         self._idx = 0
+        self._right_padding = None
 
     # ------------------------------------------------------------------
     # Codec initialisation (deferred until first update)
@@ -6206,6 +6207,33 @@ class BatchTurboQuantKVCache(_BaseCache):
         self.left_padding = mx.concatenate([slp, olp])
         self._idx = max_idx
 
+    def prepare(self, *, left_padding=None, lengths=None, right_padding=None):
+        if left_padding is not None:
+            if self.keys is not None:
+                raise ValueError(
+                    "Left padding can only be added to an empty BatchTurboQuantKVCache"
+                )
+            left_padding = mx.array(left_padding)
+            self.left_padding += left_padding
+            self.offset -= left_padding
+
+        if right_padding is not None and max(right_padding) > 0:
+            self._right_padding = mx.array(right_padding)
+
+    def finalize(self):
+        # Roll right padding into left padding (mirrors BatchKVCache).
+        if self._right_padding is not None:
+            padding = self._right_padding[:, None]
+
+            def _roll(a, ndim):
+                return dynamic_roll(a, padding, axis=2)
+
+            self.keys = _map_state(self.keys, _roll)
+            self.values = _map_state(self.values, _roll)
+            self.offset -= self._right_padding
+            self.left_padding += self._right_padding
+            self._right_padding = None
+
     # ------------------------------------------------------------------
     # Dequantize (for attention fallback)
     # ------------------------------------------------------------------
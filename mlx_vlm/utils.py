@@ -20,6 +20,7 @@ from PIL import Image, ImageOps
 from transformers import AutoProcessor
 from transformers.processing_utils import ProcessorMixin
 
+from .image_fetch import get_image_fetcher, is_remote_image
 from .models.base import BaseImageProcessor
 from .tokenizer_utils import load_tokenizer
 from .trainer.utils import apply_lora_layers
@@ -860,12 +861,9 @@ def load_image(image_source: Union[str, Path, BytesIO], timeout: int = 10):
                 raise ValueError("Invalid data URI format - missing comma separator")
             _, data = image_source.split(",", 1)
             image_source = BytesIO(base64.b64decode(data))
-        if isinstance(image_source, str) and image_source.startswith(
-            ("http://", "https://")
-        ):
-            with requests.get(image_source, stream=True, timeout=timeout) as response:
-                response.raise_for_status()
-                image_source = BytesIO(response.content)
+        if is_remote_image(image_source):
+            # Decoded, EXIF-transposed RGB image from the shared fetch cache.
+            return get_image_fetcher().fetch(image_source, timeout=timeout)
 
         image = Image.open(image_source)
     except ValueError:
@@ -1275,6 +1273,14 @@ def prepare_inputs(
         image_processor = (
             processor.image_processor if hasattr(processor, "image_processor") else None
         )
+        remote = list(dict.fromkeys(img for img in images if is_remote_image(img)))
+        if len(remote) > 1:
+            # Download every URL of the request concurrently; the per-image
+            # loads below then hit the fetch cache.
+            try:
+                get_image_fetcher().fetch_many(remote)
+            except Exception:
+                pass
         images = [process_image(img, resize_shape, image_processor) for img in images]
 
         # For batching, we need uniform image sizes. Instead of padding to the
@@ -1546,6 +1552,55 @@ def group_images_by_shape(
     return grouped_images, grouped_indices
 
 
+def _input_shape_key(inputs: Dict[str, Any], index: int) -> tuple:
+    key = []
+    for name, value in sorted(inputs.items()):
+        if value is None:
+            continue
+        if isinstance(value, mx.array):
+            key.append((name, tuple(value.shape), str(value.dtype)))
+            continue
+        try:
+            hash(value)
+        except TypeError:
+            # Unhashable extras (lists, dicts) can't be compared cheaply, so
+            # the request gets a group of its own.
+            return ("unique", index)
+        key.append((name, value))
+    return tuple(key)
+
+
+def group_inputs_by_shape(
+    inputs: List[Dict[str, Any]],
+) -> Tuple[Dict[tuple, List[Dict[str, Any]]], Dict[tuple, List[int]]]:
+    """
+    Group prepared model inputs whose tensors can be concatenated on axis 0.
+
+    Counterpart of :func:`group_images_by_shape` for the dicts returned by
+    :func:`prepare_inputs`: two requests land in the same group when every
+    array has the same shape and dtype and every other value is equal.
+
+    Args:
+        inputs: List of ``prepare_inputs`` outputs, one per request
+
+    Returns:
+        grouped_inputs: Dict mapping shape key -> list of inputs with that key
+        grouped_indices: Dict mapping shape key -> list of original indices
+    """
+    grouped_inputs: Dict[tuple, List[Dict[str, Any]]] = {}
+    grouped_indices: Dict[tuple, List[int]] = {}
+
+    for i, item in enumerate(inputs):
+        key = _input_shape_key(item, i)
+        if key not in grouped_inputs:
+            grouped_inputs[key] = []
+            grouped_indices[key] = []
+        grouped_inputs[key].append(item)
+        grouped_indices[key].append(i)
+
+    return grouped_inputs, grouped_indices
+
+
 class StoppingCriteria:
     def __init__(self, eos_token_ids: List[int], tokenizer=None):
 
@@ -1,79 +1,409 @@
 """Vision feature cache for multi-turn conversations.
 
 Caches the output of vision_tower + embed_vision (projected image features
-in language model space) keyed by image path or content hash, avoiding
-expensive re-computation when the same image is discussed across turns.
+in language model space) keyed by image content, avoiding expensive
+re-computation when the same image is discussed across turns.
 """
 
 import hashlib
+import json
+import logging
+import os
+import threading
 from collections import OrderedDict
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Iterator, Optional, Tuple, Union
 
 import mlx.core as mx
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VISION_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def _safe_namespace(name: str) -> str:
+    digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+    stem = "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+    return f"{stem.strip('_')[-64:]}-{digest}"
+
+
+def _feature_arrays(features: Any) -> Optional[list]:
+    """Flatten cached features into arrays, or ``None`` if unsupported.
+
+    Tuples and lists are flattened recursively, so Qwen3-style
+    ``(hidden, [deepstack...])`` features count and persist like the rest.
+    """
+    if isinstance(features, mx.array):
+        return [features]
+    if not isinstance(features, (tuple, list)):
+        return None
+    arrays = []
+    for item in features:
+        inner = _feature_arrays(item)
+        if inner is None:
+            return None
+        arrays.extend(inner)
+    return arrays
+
+
+def _feature_structure(features: Any) -> Any:
+    """JSON-able nesting of ``features``, inverted by ``_restore_features``."""
+    if isinstance(features, mx.array):
+        return "array"
+    kind = "tuple" if isinstance(features, tuple) else "list"
+    return {kind: [_feature_structure(item) for item in features]}
+
+
+def _restore_features(arrays: Iterator[mx.array], structure: Any) -> Any:
+    if structure == "array":
+        return next(arrays)
+    ((kind, children),) = structure.items()
+    values = [_restore_features(arrays, child) for child in children]
+    return tuple(values) if kind == "tuple" else values
+
+
+def _feature_nbytes(features: Any) -> int:
+    arrays = _feature_arrays(features)
+    if arrays is None:
+        return 0
+    return sum(a.nbytes for a in arrays)
+
+
+def processor_fingerprint(processor: Any) -> str:
+    """Short hash of an image processor's configuration.
+
+    Folded into the cache namespace so features computed under one set of
+    preprocessing parameters (resolution, patching, normalization) are never
+    served for another.
+    """
+    image_processor = getattr(processor, "image_processor", processor)
+    try:
+        config = image_processor.to_dict()
+    except Exception:
+        config = {
+            k: v for k, v in vars(image_processor).items() if not k.startswith("_")
+        }
+    payload = json.dumps(config, sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
 
 
 class VisionFeatureCache:
     """LRU cache for vision features projected into language model space.
 
-    Cache keys are derived from image paths (for file/URL images) or content
-    hashes (for PIL images). Cached values are mx.array features after
-    vision_tower + embed_vision, ready for masked_scatter.
+    Cache keys are content hashes: file bytes for local paths, the response
+    body for URLs (shared with ``image_fetch``), decoded pixels for PIL
+    images and the payload for data URIs. The same image under two names is
+    encoded once, and a file edited in place is re-encoded. Keys also carry
+    the cache ``namespace`` and optional per-call ``params``, so features are
+    never reused across checkpoints or preprocessing settings. Cached values
+    are mx.array features after vision_tower + embed_vision, ready for
+    masked_scatter.
 
-    Cleanup is handled by three mechanisms:
-    - **LRU eviction**: oldest entry is dropped when max_size is exceeded.
+    Cleanup is handled by these mechanisms:
+    - **LRU eviction**: least recently used entries are dropped once the
+      total feature size exceeds ``max_bytes`` (or ``max_size`` entries, when
+      set).
     - **Model unload**: server calls clear() when the model is swapped.
     - **Process exit**: in-memory cache is freed automatically.
 
+    With ``disk_dir`` set, features are also written as safetensors files
+    under ``<disk_dir>/<namespace>/``, bounded by ``max_disk_bytes``. A
+    memory miss checks disk before the vision tower runs, so features survive
+    restarts and reloads of the same checkpoint.
+
     Args:
-        max_size: Maximum number of cached image features. Default 20.
+        max_size: Optional cap on the number of cached entries.
+        max_bytes: Memory budget for cached features. Default 2 GiB.
+        namespace: Identifies the model and preprocessing the features belong
+            to, e.g. the model path plus ``processor_fingerprint``.
+        disk_dir: Optional directory for the persistent tier.
+        max_disk_bytes: Budget for the persistent tier. ``None`` is unbounded.
     """
 
-    def __init__(self, max_size: int = 20):
+    SUFFIX = ".safetensors"
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        max_bytes: int = DEFAULT_VISION_CACHE_BYTES,
+        namespace: str = "",
+        disk_dir: Optional[Union[str, Path]] = None,
+        max_disk_bytes: Optional[int] = None,
+    ):
         self.max_size = max_size
-        self._cache: OrderedDict[str, mx.array] = OrderedDict()
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_root = Path(disk_dir) if disk_dir is not None else None
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: dict = {}
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        # (path, mtime_ns, size) -> sha256 of the file, so unchanged files
+        # are not re-read on every lookup.
+        self._file_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.set_namespace(namespace)
+
+    # -- keys --
+
+    def set_namespace(self, namespace: str) -> None:
+        self.namespace = namespace
+        self._namespace_hash = hashlib.sha256(namespace.encode()).hexdigest()[:16]
+        self.disk_dir = (
+            self.disk_root / _safe_namespace(namespace or "default")
+            if self.disk_root is not None
+            else None
+        )
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _file_digest(self, path: str) -> Optional[str]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        memo_key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._file_digests.get(memo_key)
+        if digest is not None:
+            return digest
+        h = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        except OSError:
+            return None
+        digest = h.hexdigest()
+        with self._lock:
+            self._file_digests[memo_key] = digest
+            while len(self._file_digests) > 1024:
+                self._file_digests.popitem(last=False)
+        return digest
 
-    def _make_key(self, image_source: Any) -> str:
-        """Derive a cache key from an image source.
+    def _content_key(self, image_source: Any) -> str:
+        """Derive a content key from an image source.
 
-        For str/Path: use the string directly (path or URL).
-        For lists: create a composite key from individual keys.
-        For PIL images: hash the image bytes.
+        For lists: a composite key from individual keys (order matters).
+        For URLs: the body hash recorded by the shared image fetcher, or the
+        URL itself if it has not been fetched.
+        For local paths: the hash of the file bytes. Paths that do not exist
+        fall back to the path string.
+        For PIL images: the hash of the decoded pixels.
+        For mx.array pixel values: the hash of the array contents and shape.
         """
+        if isinstance(image_source, (list, tuple)):
+            return "|".join(self._content_key(img) for img in image_source)
+        if isinstance(image_source, Path):
+            image_source = str(image_source)
         if isinstance(image_source, str):
-            return image_source
-        elif isinstance(image_source, list):
-            return "|".join(self._make_key(img) for img in image_source)
-        else:
-            if hasattr(image_source, "tobytes"):
-                h = hashlib.sha256(image_source.tobytes()).hexdigest()[:16]
-                return f"pil:{h}"
-            return f"obj:{id(image_source)}"
-
-    def get(self, image_source: Any) -> Optional[mx.array]:
+            if image_source.startswith(("http://", "https://")):
+                from .image_fetch import get_image_fetcher
+
+                digest = get_image_fetcher().known_digest(image_source)
+                if digest is not None:
+                    return f"sha256:{digest}"
+                return f"url:{image_source}"
+            if image_source.startswith("data:"):
+                return f"data:{hashlib.sha256(image_source.encode()).hexdigest()}"
+            digest = self._file_digest(image_source)
+            if digest is not None:
+                return f"sha256:{digest}"
+            return f"path:{image_source}"
+        if isinstance(image_source, BytesIO):
+            return f"sha256:{hashlib.sha256(image_source.getvalue()).hexdigest()}"
+        if isinstance(image_source, mx.array):
+            if image_source.dtype == mx.bfloat16:
+                image_source = image_source.astype(mx.float32)
+            h = hashlib.sha256(np.asarray(image_source).tobytes())
+            h.update(repr((image_source.shape, str(image_source.dtype))).encode())
+            return f"pixels:{h.hexdigest()[:32]}"
+        if hasattr(image_source, "tobytes"):
+            h = hashlib.sha256(image_source.tobytes())
+            h.update(repr(getattr(image_source, "size", "")).encode())
+            h.update(repr(getattr(image_source, "mode", "")).encode())
+            return f"pil:{h.hexdigest()[:32]}"
+        return f"obj:{id(image_source)}"
+
+    def make_key(self, image_source: Any, params: Optional[dict] = None) -> str:
+        key = f"{self._namespace_hash}:{self._content_key(image_source)}"
+        if params:
+            payload = json.dumps(params, sort_keys=True, default=repr)
+            key += f"#{hashlib.sha256(payload.encode()).hexdigest()[:16]}"
+        return key
+
+    # -- public API --
+
+    def get(self, image_source: Any, params: Optional[dict] = None) -> Optional[Any]:
         """Look up cached features. Returns None on miss."""
-        key = self._make_key(image_source)
-        if key in self._cache:
-            self._cache.move_to_end(key)
-            return self._cache[key]
+        if image_source is None:
+            return None
+        key = self.make_key(image_source, params)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        features = self._load_disk(key)
+        if features is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._insert(key, features)
+            return features
+        with self._lock:
+            self.misses += 1
         return None
 
-    def put(self, image_source: Any, features: mx.array) -> None:
-        """Store features in the cache, evicting LRU if full."""
-        key = self._make_key(image_source)
-        if key in self._cache:
-            self._cache.move_to_end(key)
-        else:
-            if len(self._cache) >= self.max_size:
-                self._cache.popitem(last=False)
-        self._cache[key] = features
+    def put(
+        self, image_source: Any, features: Any, params: Optional[dict] = None
+    ) -> None:
+        """Store features in the cache, evicting LRU entries over budget."""
+        key = self.make_key(image_source, params)
+        self._insert(key, features)
+        if self.disk_dir is not None:
+            self._submit_disk_write(key, features)
 
-    def clear(self) -> None:
-        """Clear all cached features."""
-        self._cache.clear()
+    def clear(self, disk: bool = False) -> None:
+        """Clear all in-memory features (and the disk tier if ``disk``)."""
+        with self._lock:
+            self._cache.clear()
+            self._sizes.clear()
+            self._nbytes = 0
+        if disk and self.disk_dir is not None:
+            self.flush()
+            for path in self.disk_dir.glob(f"*{self.SUFFIX}"):
+                path.unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        """Wait for pending disk writes."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
 
     def __len__(self) -> int:
         return len(self._cache)
 
     def __contains__(self, image_source: Any) -> bool:
-        key = self._make_key(image_source)
-        return key in self._cache
+        key = self.make_key(image_source)
+        return key in self._cache or (
+            self.disk_dir is not None and self._disk_path(key).exists()
+        )
+
+    # -- internals --
+
+    def _insert(self, key: str, features: Any) -> None:
+        nbytes = _feature_nbytes(features)
+        with self._lock:
+            if key in self._cache:
+                self._nbytes -= self._sizes.pop(key, 0)
+                del self._cache[key]
+            if nbytes > self.max_bytes:
+                return
+            self._cache[key] = features
+            self._sizes[key] = nbytes
+            self._nbytes += nbytes
+            while self._cache and (
+                self._nbytes > self.max_bytes
+                or (self.max_size is not None and len(self._cache) > self.max_size)
+            ):
+                evicted, _ = self._cache.popitem(last=False)
+                self._nbytes -= self._sizes.pop(evicted, 0)
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / (
+            hashlib.sha256(key.encode()).hexdigest()[:32] + self.SUFFIX
+        )
+
+    def _load_disk(self, key: str) -> Optional[Any]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+        try:
+            arrays, metadata = mx.load(str(path), return_metadata=True)
+        except Exception as e:
+            logger.warning("Vision cache: dropping unreadable %s: %s", path, e)
+            path.unlink(missing_ok=True)
+            return None
+        if metadata.get("key") != key:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        count = int(metadata.get("count", len(arrays)))
+        values = [arrays[f"features_{i}"] for i in range(count)]
+        if "structure" in metadata:
+            return _restore_features(iter(values), json.loads(metadata["structure"]))
+        if metadata.get("kind") == "array":
+            return values[0]
+        return tuple(values) if metadata.get("kind") == "tuple" else values
+
+    def _submit_disk_write(self, key: str, features: Any) -> None:
+        arrays = _feature_arrays(features)
+        if arrays is None:
+            return
+        if self.max_disk_bytes is not None and _feature_nbytes(features) > (
+            self.max_disk_bytes
+        ):
+            return
+        structure = json.dumps(_feature_structure(features))
+        mx.eval(arrays)
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="mlx-vlm-vision-cache"
+                )
+            self._writer.submit(self._write_disk, key, arrays, structure)
+
+    def _write_disk(self, key: str, arrays: list, structure: str) -> None:
+        path = self._disk_path(key)
+        tmp = path.with_name(path.stem + ".tmp" + self.SUFFIX)
+        try:
+            mx.save_safetensors(
+                str(tmp),
+                {f"features_{i}": a for i, a in enumerate(arrays)},
+                metadata={
+                    "key": key,
+                    "structure": structure,
+                    "count": str(len(arrays)),
+                },
+            )
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning("Vision cache: failed to write %s: %s", path, e)
+            tmp.unlink(missing_ok=True)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        if self.max_disk_bytes is None:
+            return
+        entries = []
+        total = 0
+        for path in self.disk_dir.glob(f"*{self.SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size